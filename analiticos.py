@@ -0,0 +1,158 @@
+# analiticos.py (Intensidades de chuva, taxas de umidade e API sobre a grade de 10 min)
+#
+# Calculado pelo worker a cada ciclo a partir da grade já montada em memória
+# (processamento.montar_grade), para todas as estações de uma vez. O resultado vai para o
+# status_atual.json (chave "analiticos" de cada ponto), então dashboards e motor de status
+# o exibem sem nenhuma leitura extra do banco.
+
+import threading
+import numpy as np
+import pandas as pd
+
+import processamento
+from config import (
+    ANALITICOS_JANELAS_HORAS, ANALITICOS_PICO_HORAS,
+    ANALITICOS_TAXA_UMIDADE_HORAS, ANALITICOS_API_K,
+    ANALITICOS_PROJECAO_HORAS, ANALITICOS_PROJECAO_INTENSIDADE_HORAS
+)
+
+SLOTS_POR_HORA = 6
+K_SLOT = ANALITICOS_API_K ** (1.0 / (24 * SLOTS_POR_HORA))  # Decaimento do API por slot de 10 min
+
+# { id_ponto: {"slot": Timestamp do último slot FECHADO incorporado ao API, "api": float, "resultado": dict} }
+# O último slot da grade ainda pode receber leituras no próximo ciclo; por isso o estado estável
+# para um slot antes e o valor "atual" é derivado dele a cada ciclo.
+ANALITICOS_CACHE = {}
+ANALITICOS_LOCK = threading.Lock()
+
+
+def _somas_moveis(cumulativa, fim, n_slots):
+    """ Soma dos n_slots que terminam na linha `fim` (por estação), a partir da soma cumulativa com zero inicial. """
+    colunas = np.arange(cumulativa.shape[1])
+    inicio = np.maximum(fim + 1 - n_slots, 0)
+    return cumulativa[fim + 1, colunas] - cumulativa[inicio, colunas]
+
+
+def _api_incremental(chuva, ultimo, grade, pontos):
+    """
+    Índice de Precipitação Antecedente: API_t = k * API_(t-1) + P_t, avançado só pelos slots novos
+    desde o estado em cache. Com G[t] = sum_{i<=t} k^-i P_i, a contribuição de (a, b] é k^b (G[b] - G[a]).
+    Sem cache (worker recém-iniciado), parte de zero no início da grade disponível.
+    """
+    n_slots, n_pontos = chuva.shape
+    expoentes = np.arange(n_slots, dtype=float)
+    crescimento = np.vstack([np.zeros((1, n_pontos)), np.cumsum(chuva * (K_SLOT ** -expoentes)[:, None], axis=0)])
+
+    def avancar(api_a, a, b):
+        # a, b: posições na grade (a pode ser negativo = antes da grade); b >= a
+        colunas = np.arange(n_pontos)
+        a_lim = np.maximum(a, -1)
+        return (api_a * K_SLOT ** (b - a)
+                + K_SLOT ** b * (crescimento[b + 1, colunas] - crescimento[a_lim + 1, colunas]))
+
+    api_estavel = np.zeros(n_pontos)
+    pos_estavel = np.full(n_pontos, -1)
+    for j, id_ponto in enumerate(pontos):
+        estado = ANALITICOS_CACHE.get(id_ponto)
+        if estado is not None:
+            api_estavel[j] = estado["api"]
+            pos_estavel[j] = (estado["slot"] - grade[0]) // pd.Timedelta(minutes=10)
+
+    # Estado mais novo que o último dado (ex.: estação parou): nada a avançar
+    pos_estavel = np.minimum(pos_estavel, ultimo)
+    api_atual = avancar(api_estavel, pos_estavel, ultimo)
+    novo_estavel = np.maximum(ultimo - 1, pos_estavel)
+    api_novo_estavel = avancar(api_estavel, pos_estavel, novo_estavel)
+    return api_atual, api_novo_estavel, novo_estavel
+
+
+def projetar_limiares(cumulativa, ultimo, limites, intensidade, horas_janela=72):
+    """
+    Tempo (min) até cada limite de chuva da janela móvel, mantida a intensidade recente:
+        acumulado(t) = acumulado_atual - chuva que sai da janela até t + intensidade * t
+    A chuva que sai da janela é conhecida (está na grade); tudo vetorizado (passos x estações).
+    Retorna array (S, 3) com os minutos até ATENÇÃO/ALERTA/PARALIZAÇÃO (0 = já atingido, NaN = não
+    atinge no horizonte).
+    """
+    n_pontos = cumulativa.shape[1]
+    colunas = np.arange(n_pontos)
+    n_janela = horas_janela * SLOTS_POR_HORA
+    passos = np.arange(ANALITICOS_PROJECAO_HORAS * SLOTS_POR_HORA + 1)
+
+    base = ultimo + 1 - n_janela  # Primeiro slot da janela atual (negativo se a grade for mais curta)
+    inicio_janela = np.maximum(base, 0)
+    atual = cumulativa[ultimo + 1, colunas] - cumulativa[inicio_janela, colunas]
+    # Slots que saem da janela a cada passo (limitados ao que existe na grade)
+    saida = np.clip(base[None, :] + passos[:, None], 0, (ultimo + 1)[None, :])
+    expirado = cumulativa[saida, colunas[None, :]] - cumulativa[inicio_janela, colunas][None, :]
+    projetado = atual[None, :] - expirado + intensidade[None, :] * passos[:, None] / SLOTS_POR_HORA
+
+    niveis = processamento.classificar_nivel_chuva(np.round(projetado, 1), limites)
+    minutos = np.full((n_pontos, 3), np.nan)
+    for k in (1, 2, 3):
+        atinge = niveis >= k
+        primeiro = atinge.argmax(axis=0)
+        minutos[:, k - 1] = np.where(atinge.any(axis=0), primeiro * 10, np.nan)
+    return minutos
+
+
+def calcular(grade, regras=None):
+    """
+    Analíticos de todas as estações no último slot de cada uma. `grade` vem de
+    processamento.montar_grade; `regras` (regras.TabelaRegras) dá os limites usados na projeção.
+    Retorna {id_ponto: {...}} e atualiza o cache.
+    """
+    chuva, umidade = grade["chuva"], grade["umidade"]
+    ultimo = grade["ultimo"].astype(int)
+    pontos, slots = grade["pontos"], grade["grade"]
+    if chuva.size == 0: return {}
+
+    colunas = np.arange(len(pontos))
+    cumulativa = np.vstack([np.zeros((1, chuva.shape[1])), np.cumsum(chuva, axis=0)])
+    linhas = np.arange(chuva.shape[0])[:, None]
+    na_janela_pico = (linhas <= ultimo[None, :]) & (linhas > (ultimo - ANALITICOS_PICO_HORAS * SLOTS_POR_HORA)[None, :])
+
+    metricas = {}
+    for horas in ANALITICOS_JANELAS_HORAS:
+        n = horas * SLOTS_POR_HORA
+        metricas[f"intensidade_{horas}h"] = _somas_moveis(cumulativa, ultimo, n) / horas
+        moveis = pd.DataFrame(chuva).rolling(n, min_periods=1).sum().to_numpy() / horas
+        metricas[f"pico_{horas}h_{ANALITICOS_PICO_HORAS}h"] = np.where(na_janela_pico, moveis, 0.0).max(axis=0)
+
+    n_taxa = ANALITICOS_TAXA_UMIDADE_HORAS * SLOTS_POR_HORA
+    anterior = np.maximum(ultimo - n_taxa, 0)
+    for i, prof in enumerate(("1m", "2m", "3m")):
+        variacao = umidade[ultimo, colunas, i] - umidade[anterior, colunas, i]
+        metricas[f"taxa_umidade_{prof}"] = np.where(ultimo - anterior == n_taxa, variacao, np.nan) \
+            / ANALITICOS_TAXA_UMIDADE_HORAS
+
+    limites, _, _ = processamento.regras_por_estacao(regras, pontos)
+    intensidade_projecao = metricas.get(f"intensidade_{ANALITICOS_PROJECAO_INTENSIDADE_HORAS}h")
+    if intensidade_projecao is None:
+        n = ANALITICOS_PROJECAO_INTENSIDADE_HORAS * SLOTS_POR_HORA
+        intensidade_projecao = _somas_moveis(cumulativa, ultimo, n) / ANALITICOS_PROJECAO_INTENSIDADE_HORAS
+    projecao = projetar_limiares(cumulativa, ultimo, limites, intensidade_projecao)
+
+    with ANALITICOS_LOCK:
+        api_atual, api_estavel, pos_estavel = _api_incremental(chuva, ultimo, slots, pontos)
+        metricas["api_mm"] = api_atual
+
+        resultado = {}
+        for j, id_ponto in enumerate(pontos):
+            info = {nome: (round(float(valores[j]), 2) if np.isfinite(valores[j]) else None)
+                    for nome, valores in metricas.items()}
+            info["slot"] = slots[ultimo[j]].isoformat()
+            info["projecao_min"] = {processamento.NOMES_NIVEL[k]: (int(projecao[j, k - 1])
+                                                                   if np.isfinite(projecao[j, k - 1]) else None)
+                                    for k in (1, 2, 3)}
+            resultado[id_ponto] = info
+            ANALITICOS_CACHE[id_ponto] = {"slot": slots[0] + pd.Timedelta(minutes=10) * int(pos_estavel[j]),
+                                          "api": float(api_estavel[j]), "resultado": info}
+    return resultado
+
+
+def obter(id_ponto):
+    """ Último resultado calculado neste processo para a estação (ou None). """
+    with ANALITICOS_LOCK:
+        estado = ANALITICOS_CACHE.get(id_ponto)
+        return dict(estado["resultado"]) if estado else None
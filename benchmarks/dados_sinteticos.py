@@ -0,0 +1,50 @@
+# benchmarks/dados_sinteticos.py (Histórico sintético N estações x M dias na grade de 10 min)
+#
+# Usa o gerador do simulador (odômetro com zeragem à meia-noite local + umidade respondendo à
+# chuva) e injeta os defeitos que os caminhos de produção precisam tratar: reinícios do
+# odômetro fora da meia-noite, leituras perdidas e falhas parciais do sensor de umidade.
+
+import numpy as np
+import pandas as pd
+
+import simulador
+from config import COLUNAS_UMIDADE
+
+
+def ids_estacoes(n_estacoes):
+    """ Mesmos ids que o config cria com SIMULADOR_NUM_ESTACOES (SIM-0001...). """
+    return [f"SIM-{i:04d}" for i in range(1, n_estacoes + 1)]
+
+
+def gerar_historico(n_estacoes, dias, fim=None, semente=0, taxa_perda=0.01, reinicios_por_dia=0.05):
+    """
+    DataFrame no esquema do histórico (timestamp UTC, id_ponto, chuva_mm, odômetro, umidades)
+    terminando em `fim` (padrão: slot de 10 min atual), para que as leituras por last_hours funcionem.
+    """
+    fim = fim or pd.Timestamp.now(tz='UTC').floor('10min')
+    inicio = fim - pd.Timedelta(days=dias)
+    rng = np.random.default_rng(semente)
+    frames = []
+    for id_ponto in ids_estacoes(n_estacoes):
+        df = simulador.gerar_serie(id_ponto, inicio, fim)
+
+        # Reinícios da estação: o odômetro recomeça de zero no meio do dia e segue até a meia-noite
+        dia_local = df['timestamp'].dt.tz_convert(simulador.FUSO_LOCAL).dt.date
+        for posicao in np.flatnonzero(rng.random(len(df)) < reinicios_por_dia / simulador.SLOTS_POR_DIA):
+            mesmo_dia = (dia_local == dia_local.iloc[posicao]) & (df.index >= posicao)
+            df.loc[mesmo_dia, 'precipitacao_acumulada_mm'] = (
+                df.loc[mesmo_dia, 'precipitacao_acumulada_mm'] - df.loc[posicao, 'precipitacao_acumulada_mm']
+                + df.loc[posicao, 'chuva_mm']).round(2)
+
+        # Falha parcial da umidade (uma profundidade sem leitura) e leituras perdidas
+        sem_umidade = rng.random(len(df)) < taxa_perda
+        df.loc[sem_umidade, COLUNAS_UMIDADE[rng.integers(0, 3)]] = np.nan
+        frames.append(df[rng.random(len(df)) >= taxa_perda])
+    return pd.concat(frames, ignore_index=True)
+
+
+def leituras_novas(df_historico):
+    """ O último slot de cada estação, como chegaria do coletar_dados_atuais() (chuva_mm a derivar). """
+    ultimas = df_historico.sort_values('timestamp').groupby('id_ponto').tail(1).copy()
+    ultimas['chuva_mm'] = np.nan
+    return ultimas.reset_index(drop=True)
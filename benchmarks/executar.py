@@ -0,0 +1,203 @@
+# benchmarks/executar.py (Tempos dos caminhos quentes de processamento e armazenamento)
+#
+# Uso (a partir da raiz do repositório):
+#   python -m benchmarks.executar                         -> 20 estações x 14 dias, compara com a referência
+#   python -m benchmarks.executar --estacoes 100 --dias 30
+#   python -m benchmarks.executar --referencia            -> grava esta execução como nova referência
+#
+# Cada execução roda num SQLite temporário (nunca toca no banco real), é anexada a
+# HISTORICO_ARQUIVO e comparada com a última referência de mesmos parâmetros. Um caso é
+# regressão quando a mediana passa de LIMIAR_REGRESSAO x a mediana de referência (e a diferença
+# absoluta passa de DIFERENCA_MINIMA_S, para não acusar ruído de casos de milissegundos).
+# Sai com código 1 se houver regressão.
+
+import os
+import sys
+import io
+import json
+import time
+import atexit
+import shutil
+import argparse
+import tempfile
+import datetime
+import subprocess
+import contextlib
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORICO_ARQUIVO = os.path.join(RAIZ, "benchmarks", "historico_benchmarks.json")
+
+LIMIAR_REGRESSAO = 1.25
+LIMIARES_POR_CASO = {  # Casos dominados por disco/SQLite oscilam mais
+    "upsert_janela_worker": 1.5,
+    "leitura_dashboard_72h_1_estacao": 1.5,
+    "leitura_dashboard_7d_1_estacao": 1.5,
+    "leitura_geral_72h_todas": 1.5,
+}
+DIFERENCA_MINIMA_S = 0.005
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(description="Benchmarks dos caminhos quentes.")
+    parser.add_argument("--estacoes", type=int, default=20)
+    parser.add_argument("--dias", type=int, default=14)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--casos", nargs="*", help="Só os casos com esses prefixos")
+    parser.add_argument("--referencia", action="store_true", help="Marca esta execução como referência")
+    parser.add_argument("--nao-salvar", action="store_true", help="Não grava no histórico")
+    return parser.parse_args()
+
+
+ARGS = _argumentos() if __name__ == "__main__" else None
+
+# O config lê o ambiente no import: banco temporário e estações sintéticas ANTES de importar o projeto
+_DIR_TEMP = tempfile.mkdtemp(prefix="bench_tamoios_")
+atexit.register(shutil.rmtree, _DIR_TEMP, ignore_errors=True)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DIR_TEMP, 'bench.db')}"
+os.environ["FONTES_DADOS"] = ""
+os.environ["SIMULADOR_NUM_ESTACOES"] = str(ARGS.estacoes if ARGS else 20)
+sys.path.insert(0, RAIZ)
+os.chdir(_DIR_TEMP)  # Fora do Render, data_source.get_base_path() é o diretório atual: arquivos gerados ficam no temporário
+
+import numpy as np
+import pandas as pd
+
+import data_source
+import processamento
+import gerador_pdf
+import worker
+from config import FUSO_LOCAL, COLUNAS_UMIDADE
+from benchmarks import dados_sinteticos
+
+COLUNAS_DASHBOARD = ['timestamp', 'id_ponto', 'chuva_mm',
+                     'umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc', 'qc_umidade']
+COLUNAS_WORKER = ['timestamp', 'id_ponto', 'chuva_mm', 'precipitacao_acumulada_mm'] + COLUNAS_UMIDADE
+
+
+def _medir(funcao, repeticoes):
+    """ Mediana e mínimo (s) de `repeticoes` chamadas, com a saída dos logs suprimida. """
+    tempos = []
+    for _ in range(repeticoes):
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            funcao()
+            tempos.append(time.perf_counter() - inicio)
+    return {"mediana_s": round(float(np.median(tempos)), 5), "min_s": round(float(np.min(tempos)), 5)}
+
+
+def montar_casos(df_historico):
+    """ [(nome, função sem argumentos)] sobre o banco já carregado com df_historico. """
+    pontos = dados_sinteticos.ids_estacoes(ARGS.estacoes)
+    um_ponto = pontos[0]
+    agora = pd.Timestamp.now(tz='UTC')
+    janela_75h = df_historico[df_historico['timestamp'] >= agora - pd.Timedelta(hours=75)]
+    janela_75h_um = janela_75h[janela_75h['id_ponto'] == um_ponto]
+    novas = dados_sinteticos.leituras_novas(df_historico)
+    df_final = processamento.derivar_chuva_mm(worker.mesclar_leituras(novas, janela_75h))
+
+    hoje = agora.tz_convert(FUSO_LOCAL)
+    inicio_7d = (hoje - pd.Timedelta(days=6)).strftime('%Y-%m-%d')
+    fim_7d = hoje.strftime('%Y-%m-%d')
+
+    return [
+        ("decodificar_odometro_historico", lambda: processamento.decodificar_odometro(df_historico)),
+        ("acumulado_rolling_72h_1_estacao", lambda: processamento.calcular_acumulado_rolling(janela_75h_um, 72)),
+        ("acumulado_rolling_72h_todas", lambda: processamento.calcular_acumulado_rolling(janela_75h, 72)),
+        ("merge_worker_get_first_valid", lambda: worker.mesclar_leituras(novas, janela_75h)),
+        ("derivar_chuva_mm_janela", lambda: processamento.derivar_chuva_mm(df_final)),
+        ("upsert_janela_worker", lambda: data_source.upsert_data(df_final)),
+        ("leitura_dashboard_72h_1_estacao", lambda: data_source.read_data_from_sqlite(
+            id_ponto=um_ponto, last_hours=73, colunas=COLUNAS_DASHBOARD)),
+        ("leitura_dashboard_7d_1_estacao", lambda: data_source.read_data_from_sqlite(
+            id_ponto=um_ponto, last_hours=7 * 24, colunas=COLUNAS_DASHBOARD)),
+        ("leitura_geral_72h_todas", lambda: data_source.read_data_from_sqlite(
+            last_hours=73, colunas=COLUNAS_DASHBOARD)),
+        ("leitura_worker_75h", lambda: data_source.get_recent_data_for_worker(hours=75, colunas=COLUNAS_WORKER)),
+        # Caminho completo de um relatório (leitura do banco + consolidação + geração), sem o cache.
+        # Exportação em fluxo para arquivo (apagado a cada repetição); o PDF usa os fragmentos diários
+        # gravados na primeira repetição, como em produção depois que o worker os pré-renderiza.
+        ("excel_7d", lambda: os.remove(gerador_pdf.gerar_excel(inicio_7d, fim_7d, um_ponto)[0])),
+        ("pdf_7d", lambda: gerador_pdf.gerar_pdf(inicio_7d, fim_7d, um_ponto)),
+    ]
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def carregar_historico():
+    if not os.path.exists(HISTORICO_ARQUIVO): return []
+    with open(HISTORICO_ARQUIVO, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def referencia_para(historico, parametros):
+    """ Última execução marcada como referência com os mesmos parâmetros (senão, a última com eles). """
+    mesmos = [execucao for execucao in historico if execucao["parametros"] == parametros]
+    marcadas = [execucao for execucao in mesmos if execucao.get("referencia")]
+    return (marcadas or mesmos or [None])[-1]
+
+
+def comparar(resultados, referencia):
+    """ {caso: razão} e a lista de regressões em relação à referência. """
+    razoes, regressoes = {}, []
+    if referencia is None: return razoes, regressoes
+    for nome, medida in resultados.items():
+        anterior = referencia["resultados"].get(nome)
+        if not anterior or anterior["mediana_s"] <= 0: continue
+        razao = medida["mediana_s"] / anterior["mediana_s"]
+        razoes[nome] = razao
+        if (razao > LIMIARES_POR_CASO.get(nome, LIMIAR_REGRESSAO)
+                and medida["mediana_s"] - anterior["mediana_s"] > DIFERENCA_MINIMA_S):
+            regressoes.append(nome)
+    return razoes, regressoes
+
+
+def main():
+    parametros = {"estacoes": ARGS.estacoes, "dias": ARGS.dias}
+    print(f"Gerando histórico sintético: {ARGS.estacoes} estações x {ARGS.dias} dias...")
+    df_historico = dados_sinteticos.gerar_historico(ARGS.estacoes, ARGS.dias)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        data_source.setup_disk_paths()
+        data_source.initialize_database()
+        data_source.save_to_sqlite(processamento.derivar_chuva_mm(df_historico))
+    print(f"{len(df_historico)} leituras carregadas em {os.environ['DATABASE_URL']}\n")
+
+    resultados = {}
+    for nome, funcao in montar_casos(df_historico):
+        if ARGS.casos and not any(nome.startswith(prefixo) for prefixo in ARGS.casos): continue
+        resultados[nome] = _medir(funcao, ARGS.repeticoes)
+
+    historico = carregar_historico()
+    referencia = referencia_para(historico, parametros)
+    razoes, regressoes = comparar(resultados, referencia)
+
+    print(f"{'caso':<36}{'mediana (s)':>12}{'mín (s)':>10}{'x ref.':>9}")
+    for nome, medida in resultados.items():
+        razao = f"{razoes[nome]:.2f}" if nome in razoes else "-"
+        marca = "  <-- REGRESSÃO" if nome in regressoes else ""
+        print(f"{nome:<36}{medida['mediana_s']:>12.4f}{medida['min_s']:>10.4f}{razao:>9}{marca}")
+    if referencia:
+        print(f"\nReferência: {referencia['data']} (commit {referencia.get('commit')})")
+
+    if not ARGS.nao_salvar:
+        historico.append({
+            "data": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "commit": _commit_atual(), "parametros": parametros, "repeticoes": ARGS.repeticoes,
+            "referencia": ARGS.referencia or referencia is None, "resultados": resultados,
+        })
+        with open(HISTORICO_ARQUIVO, 'w', encoding='utf-8') as f:
+            json.dump(historico, f, ensure_ascii=False, indent=2)
+
+    if regressoes:
+        print(f"\n{len(regressoes)} regressão(ões): {', '.join(regressoes)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# cache_relatorios.py (Cache de relatórios prontos, endereçado pelo conteúdo)
+#
+# Chave = (tipo, estação, período, versão dos dados): o mesmo pedido com os mesmos dados é servido
+# na hora, sem consultar, desenhar e codificar de novo; qualquer gravação no período muda a versão
+# (data_source.versao_dados) e a entrada antiga deixa de ser encontrada.
+#   - Memória limitada em bytes (RELATORIOS_CACHE_MAX_BYTES), despejo LRU.
+#   - Entradas expiram após RELATORIOS_CACHE_TTL_SEC.
+#   - Despejadas da memória vão para o disco (RELATORIOS_CACHE_DIR), também limitado, se habilitado.
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import data_source
+from config import (
+    RELATORIOS_CACHE_MAX_BYTES, RELATORIOS_CACHE_TTL_SEC,
+    RELATORIOS_CACHE_DISCO, RELATORIOS_CACHE_DISCO_MAX_BYTES, RELATORIOS_CACHE_DIR
+)
+
+# chave -> {"data": bytes, "filename": str, "criado": epoch}; ordem = do menos para o mais recentemente usado
+_CACHE = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+_BYTES_EM_MEMORIA = 0
+
+
+def chave(tipo, id_ponto, start_date, end_date, versao):
+    return hashlib.sha256(f"{tipo}|{id_ponto}|{start_date}|{end_date}|{versao}".encode()).hexdigest()
+
+
+def _diretorio():
+    caminho = os.path.join(data_source.get_base_path(), RELATORIOS_CACHE_DIR)
+    os.makedirs(caminho, exist_ok=True)
+    return caminho
+
+
+# --- DISCO ---
+def _caminhos(k):
+    base = os.path.join(_diretorio(), k)
+    return base + ".bin", base + ".json"
+
+
+def _gravar_disco(k, entrada):
+    try:
+        arquivo_dados, arquivo_meta = _caminhos(k)
+        with open(arquivo_dados, 'wb') as f:
+            f.write(entrada["data"])
+        with open(arquivo_meta, 'w', encoding='utf-8') as f:
+            json.dump({"filename": entrada["filename"], "criado": entrada["criado"]}, f)
+        _limitar_disco()
+    except Exception as e:
+        data_source.adicionar_log("RELATORIOS", f"Erro ao transbordar relatório para o disco: {e}", level="WARN",
+                                  salvar_arquivo=False)
+
+
+def _ler_disco(k):
+    arquivo_dados, arquivo_meta = _caminhos(k)
+    if not os.path.exists(arquivo_meta) or not os.path.exists(arquivo_dados): return None
+    with open(arquivo_meta, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if time.time() - meta["criado"] > RELATORIOS_CACHE_TTL_SEC:
+        _remover_disco(k)
+        return None
+    with open(arquivo_dados, 'rb') as f:
+        return {"data": f.read(), "filename": meta["filename"], "criado": meta["criado"]}
+
+
+def _remover_disco(k):
+    for caminho in _caminhos(k):
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+
+def _limitar_disco():
+    """ Apaga os arquivos expirados e, acima do limite, os de acesso mais antigo. """
+    arquivos = []
+    for nome in os.listdir(_diretorio()):
+        if not nome.endswith(".bin"): continue
+        caminho = os.path.join(_diretorio(), nome)
+        info = os.stat(caminho)
+        arquivos.append((info.st_atime, info.st_size, nome[:-4], info.st_mtime))
+    total = sum(tamanho for _, tamanho, _, _ in arquivos)
+    agora = time.time()
+    for acesso, tamanho, k, modificado in sorted(arquivos):
+        if total <= RELATORIOS_CACHE_DISCO_MAX_BYTES and agora - modificado <= RELATORIOS_CACHE_TTL_SEC: continue
+        _remover_disco(k)
+        total -= tamanho
+
+
+# --- MEMÓRIA ---
+def _despejar():
+    """ Tira da memória os menos usados até caber no limite (com o lock já adquirido). """
+    global _BYTES_EM_MEMORIA
+    while _BYTES_EM_MEMORIA > RELATORIOS_CACHE_MAX_BYTES and _CACHE:
+        k, entrada = _CACHE.popitem(last=False)
+        _BYTES_EM_MEMORIA -= len(entrada["data"])
+        if RELATORIOS_CACHE_DISCO and time.time() - entrada["criado"] <= RELATORIOS_CACHE_TTL_SEC:
+            _gravar_disco(k, entrada)
+
+
+def obter(k):
+    """ (dados, nome_arquivo) do relatório em cache, ou None. """
+    global _BYTES_EM_MEMORIA
+    with _CACHE_LOCK:
+        entrada = _CACHE.get(k)
+        if entrada is not None:
+            if time.time() - entrada["criado"] > RELATORIOS_CACHE_TTL_SEC:
+                del _CACHE[k]
+                _BYTES_EM_MEMORIA -= len(entrada["data"])
+                return None
+            _CACHE.move_to_end(k)
+            return entrada["data"], entrada["filename"]
+
+    if not RELATORIOS_CACHE_DISCO: return None
+    try:
+        entrada = _ler_disco(k)
+    except Exception:
+        return None
+    if entrada is None: return None
+    # Volta para a memória (acesso recente); o arquivo fica até expirar ou ser despejado do disco
+    with _CACHE_LOCK:
+        if k not in _CACHE:
+            _CACHE[k] = entrada
+            _BYTES_EM_MEMORIA += len(entrada["data"])
+            _despejar()
+    return entrada["data"], entrada["filename"]
+
+
+def guardar(k, dados, nome_arquivo):
+    global _BYTES_EM_MEMORIA
+    if len(dados) > RELATORIOS_CACHE_MAX_BYTES: return  # Maior que o cache inteiro: não vale guardar
+    with _CACHE_LOCK:
+        anterior = _CACHE.pop(k, None)
+        if anterior is not None: _BYTES_EM_MEMORIA -= len(anterior["data"])
+        _CACHE[k] = {"data": dados, "filename": nome_arquivo, "criado": time.time()}
+        _BYTES_EM_MEMORIA += len(dados)
+        _despejar()
+
+
+def estatisticas():
+    with _CACHE_LOCK:
+        return {"entradas": len(_CACHE), "bytes": _BYTES_EM_MEMORIA}
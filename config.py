@@ -51,22 +51,133 @@ ID_PONTO_ZENTRA_KM72 = "Ponto-B-KM72"
 # --- FIM DA SEÇÃO (ZENTRA CLOUD) ---
 
 
+# --- FONTES DE DADOS (ADAPTADORES) E SIMULADOR DE CARGA ---
+# Fontes reais ativas. Para testes de carga sem tocar nas APIs: FONTES_DADOS="" e SIMULADOR_NUM_ESTACOES=200
+FONTES_DADOS = [f.strip().lower() for f in os.getenv("FONTES_DADOS", "weatherlink,zentra").split(",") if f.strip()]
+SIMULADOR_NUM_ESTACOES = int(os.getenv("SIMULADOR_NUM_ESTACOES", "0"))
+SIMULADOR_SEMENTE = int(os.getenv("SIMULADOR_SEMENTE", "42"))
+SIMULADOR_TAXA_FALHA = float(os.getenv("SIMULADOR_TAXA_FALHA", "0.0"))  # Fração de leituras "perdidas" (gera lacunas)
+# --- FIM DAS FONTES DE DADOS ---
+
+
 # --- CONFIGURAÇÕES DE DISPARO INTELIGENTE (RENDER KEEPALIVE) ---
 BACKFILL_RUN_TIME_SEC = 20 # Tempo máximo de processamento contínuo para backfill
 RENDER_SLEEP_TIME_SEC = 30 # Tempo de pausa para evitar timeout no Render na inicialização
 # --- FIM DAS CONFIGURAÇÕES DE DISPARO INTELIGENTE ---
 
 
+# --- CONFIGURAÇÕES DE LACUNAS (AUTO-BACKFILL DIRECIONADO) ---
+LACUNAS_JANELA_HORAS = 72  # Janela da grade de 10 min verificada ao final de cada ciclo
+LACUNAS_TOLERANCIA_MIN = 20  # Slots mais recentes que isso ainda podem chegar pela API "current"
+BACKFILL_MAX_TENTATIVAS = 3  # Depois disso a lacuna é considerada irrecuperável (estação offline)
+BACKFILL_INTERVALO_REQ_SEC = 5  # Pausa entre requisições de backfill (throttle das APIs)
+# --- FIM DAS CONFIGURAÇÕES DE LACUNAS ---
+
+
+# --- ANALÍTICOS DA GRADE DE 10 MIN (analiticos.py) ---
+ANALITICOS_JANELAS_HORAS = [1, 3, 6]  # Intensidades móveis (mm/h)
+ANALITICOS_PICO_HORAS = 24  # Picos de intensidade procurados nas últimas N horas
+ANALITICOS_TAXA_UMIDADE_HORAS = 3  # Taxa de variação da umidade (p.p./h) medida nessa janela
+ANALITICOS_API_K = 0.85  # Decaimento DIÁRIO do Índice de Precipitação Antecedente (API)
+ANALITICOS_PROJECAO_HORAS = 24  # Horizonte da projeção "tempo até o próximo limite" de chuva 72h
+ANALITICOS_PROJECAO_INTENSIDADE_HORAS = 1  # Intensidade recente (mm/h) mantida na projeção
+# --- FIM DOS ANALÍTICOS ---
+
+
+# --- DECODIFICADOR DO ODÔMETRO DE CHUVA (processamento.decodificar_odometro) ---
+ODOMETRO_TOLERANCIA_MEIA_NOITE_MIN = 60  # Zeragem até 1h antes/depois da meia-noite local = virada do dia (relógio da estação)
+ODOMETRO_QUEDA_MIN_MM = 1.0  # Fora da meia-noite, só uma queda maior que isso pode ser reinício da estação...
+ODOMETRO_REINICIO_MAX_MM = 5.0  # ...e o valor logo após o reinício precisa ser pequeno; senão é leitura espúria
+ODOMETRO_INTENSIDADE_MAX_MM_H = 150.0  # Subida acima disso (proporcional ao intervalo) = salto implausível
+# --- FIM DO DECODIFICADOR ---
+
+
+# --- CONTROLE DE QUALIDADE DA UMIDADE (qualidade.py) ---
+QC_UMIDADE_MIN = 0.0  # Faixa física aceita (%)
+QC_UMIDADE_MAX = 65.0
+QC_SPIKE_JANELA = 7  # Leituras na mediana móvel centrada
+QC_SPIKE_LIMIAR = 4.0  # Desvio (p.p.) da mediana móvel que caracteriza pico
+QC_TRAVADO_LEITURAS = 72  # Valor idêntico por N leituras seguidas (~12h na grade de 10 min) = sensor travado
+QC_CRUZADO_SUBIDA = 2.0  # Subida (p.p. por hora, pelo tempo decorrido) numa profundidade de 2m/3m...
+QC_CRUZADO_SUPERFICIE = 0.2  # ...sem subida acima disso no 1m nas 6h anteriores (proporcional) = inconsistente
+# --- FIM DO CONTROLE DE QUALIDADE ---
+
+
+# --- FUSO E COLUNAS COMPARTILHADOS (um único lugar para todos os módulos) ---
+FUSO_LOCAL = 'America/Sao_Paulo'  # Dias e horas "locais" (relatórios, odômetro diário, agendamentos, gráficos)
+COLUNAS_UMIDADE = ['umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc']  # 1m, 2m, 3m (nessa ordem)
+# --- FIM DO FUSO E COLUNAS ---
+
+
 # --- CONFIGURAÇÕES DO BANCO DE DADOS ---
 # DATABASE_URL será injetada pelo Render automaticamente se estiver configurada no Environment
 DB_CONNECTION_STRING = os.getenv("DATABASE_URL", "sqlite:///temp_local_db.db")
 DB_TABLE_NAME = "historico_monitoramento"
+DB_TABLE_RISCO = "serie_risco"  # Série derivada de níveis de risco (grade de 10 min), gravada pelo worker
 # --- FIM DA CONFIGURAÇÃO DB ---
 
 
+# --- Configurações do Serviço de Ingestão (worker.py) ---
+INGESTAO_EMBUTIDA = os.getenv("INGESTAO_EMBUTIDA", "0") == "1"  # 1 = thread dentro do processo web (modo antigo)
+INGESTAO_LOCK_ARQUIVO = "ingestao.lock"  # SQLite/local: flock neste arquivo (no disco persistente)
+INGESTAO_LOCK_CHAVE = 7227281  # Postgres: chave do pg_try_advisory_lock
+INGESTAO_RETRY_LIDERANCA_SEC = 60  # Intervalo entre tentativas das instâncias em standby
+
+# --- Relatórios (PDF/Excel) em processos separados (relatorios_jobs.py) ---
+RELATORIOS_PROCESSOS = int(os.getenv("RELATORIOS_PROCESSOS", "2"))  # Processos do pool (núcleos para relatórios)
+RELATORIOS_FILA_MAX = 8  # Relatórios na fila + em execução; acima disso o pedido é recusado
+RELATORIOS_MAX_POR_USUARIO = 2  # Relatórios simultâneos (fila + execução) por sessão
+RELATORIOS_RESULTADO_TTL_SEC = 600  # Resultado não baixado é descartado depois disso
+# Links de download de arquivos (links_download.py): assinados com esta chave e válidos por esse tempo.
+# Defina LINKS_DOWNLOAD_CHAVE em produção (mesma em todos os processos web); sem ela, uma chave aleatória por processo.
+LINKS_DOWNLOAD_CHAVE = os.getenv("LINKS_DOWNLOAD_CHAVE")
+LINKS_DOWNLOAD_VALIDADE_SEC = RELATORIOS_RESULTADO_TTL_SEC
+# Cache de relatórios prontos (cache_relatorios.py), por (tipo, estação, período, versão dos dados)
+RELATORIOS_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Memória; acima disso os menos usados vão para o disco (ou saem)
+RELATORIOS_CACHE_TTL_SEC = 6 * 3600
+RELATORIOS_CACHE_DISCO = os.getenv("RELATORIOS_CACHE_DISCO", "1") == "1"  # 0 = sem transbordo para o disco
+RELATORIOS_CACHE_DISCO_MAX_BYTES = 512 * 1024 * 1024
+RELATORIOS_CACHE_DIR = "cache_relatorios"  # Dentro do disco persistente (data_source.get_base_path())
+# Fragmentos diários (fragmentos_relatorio.py): estatísticas, gráfico e mudanças de status de cada dia fechado
+FRAGMENTOS_DIR = "fragmentos_relatorio"  # Dentro do disco persistente
+FRAGMENTOS_DIAS_RETROATIVOS = 7  # Dias fechados mantidos pelo worker (pega correções do backfill)
+FRAGMENTOS_MAX_POR_CICLO = 4  # Fragmentos renderizados por rodada; o restante fica para as próximas
+FRAGMENTOS_VERIFICACAO_COMPLETA_SEC = 6 * 3600  # Reconfere a versão de todos os dias (mesmo sem marcação) a cada 6h
+# Rodada de relatórios do worker (fragmentos + agendados): thread própria, fora do ciclo de ingestão
+RELATORIOS_RODADA_INTERVALO_MIN_SEC = 300  # No máximo uma rodada a cada 5 min
+# Exportação de dados (Excel/CSV) em fluxo: lotes lidos do cursor do banco e gravados direto num arquivo
+EXPORTACAO_LINHAS_POR_LOTE = 20000  # Linhas por lote lido do banco (memória ~ constante, qualquer período)
+EXPORTACOES_DIR = "exportacoes"  # Arquivos prontos para download, dentro do disco persistente
+# Relatório consolidado de todas as estações (relatorio_consolidado.py)
+RELATORIO_CONSOLIDADO_PROCESSOS_GRAFICOS = int(os.getenv("RELATORIO_CONSOLIDADO_PROCESSOS_GRAFICOS", "2"))  # 1 = em sequência
+# Relatórios pré-gerados pelo worker (relatorios_agendados.py): períodos fechados até ontem, a partir da hora local
+# tipo: "pdf"/"excel" (um por estação) ou "pdf_consolidado"/"excel_consolidado" (todas as estações)
+RELATORIOS_AGENDADOS = [
+    {"nome": "diario", "rotulo": "Ontem", "tipo": "pdf", "dias": 1, "hora": 6},
+    {"nome": "semanal", "rotulo": "Últimos 7 dias", "tipo": "pdf", "dias": 7, "hora": 6},
+    {"nome": "semanal_consolidado", "rotulo": "Últimos 7 dias - todas as estações", "tipo": "pdf_consolidado",
+     "dias": 7, "hora": 6},
+]
+RELATORIOS_AGENDADOS_DIR = "relatorios_agendados"  # Dentro do disco persistente
+RELATORIOS_AGENDADOS_MAX_POR_CICLO = 4  # Relatórios gerados por rodada do worker; o restante fica para as próximas
+RELATORIOS_AGENDADOS_JANELA_HORAS = 4  # Horas a partir de "hora" em que correções (backfill) refazem o relatório
+
+# --- Gráficos do dashboard: redução de pontos no servidor (reducao_pontos.py) ---
+# Largura útil (px) da área de plotagem; séries com mais pontos que isso são reduzidas antes de ir ao navegador
+GRAFICOS_LARGURA_PX_PONTO = 1000  # Página da estação (gráfico na largura toda)
+GRAFICOS_LARGURA_PX_GERAL = 500  # Dashboard geral (dois gráficos por linha)
+GRAFICOS_REDUCAO_CACHE_MAX = 512  # Séries reduzidas guardadas (por estação, horizonte e largura)
+# Página da estação: a cada tick só os pontos novos vão ao navegador (extendData). Série reduzida (horizonte
+# longo) é remontada depois de tantos pontos novos, para a janela de tempo não crescer.
+GRAFICOS_RECONSTRUIR_APOS_PONTOS = 6
+
 # --- Configurações do Worker ---
 # ALTERADO PARA 5 MINUTOS PARA CAPTURAR MELHOR A CHUVA (15 MIN SENSOR)
 FREQUENCIA_API_SEGUNDOS = 60 * 5
+# O ciclo dispara alinhado ao relógio (múltiplos de FREQUENCIA_API_SEGUNDOS, que divide a grade de 10 min)
+# mais esta carência, para dar tempo de a leitura do slot chegar às APIs.
+CICLO_CARENCIA_SEGUNDOS = int(os.getenv("CICLO_CARENCIA_SEGUNDOS", "60"))
+CICLO_METRICAS_MAX = 288  # Ciclos mantidos em metricas_worker.json (~24h a cada 5 min)
 MAX_HISTORICO_PONTOS = (72 * 60 * 60) // FREQUENCIA_API_SEGUNDOS
 
 # --- Configurações dos Pontos de Análise ---
@@ -86,6 +197,13 @@ PONTOS_DE_ANALISE = {
     "Ponto-D-KM81": {"nome": "KM 81", "constantes": CONSTANTES_PADRAO.copy(), "lat_lon": [-23.613498, -45.431119]},
 }
 
+# Estações sintéticas do simulador (apenas quando habilitado). Espalhadas ao longo do trecho de serra.
+for _i in range(1, SIMULADOR_NUM_ESTACOES + 1):
+    PONTOS_DE_ANALISE[f"SIM-{_i:04d}"] = {
+        "nome": f"SIM {_i:03d}", "constantes": CONSTANTES_PADRAO.copy(), "simulado": True,
+        "lat_lon": [-23.58 - 0.04 * (_i % 50) / 50, -45.46 + 0.04 * (_i // 50 % 50) / 50]
+    }
+
 # --- Regras de Negócio (Alertas) ---
 CHUVA_LIMITE_VERDE = 60.0
 CHUVA_LIMITE_AMARELO = 79.0
@@ -93,6 +211,21 @@ CHUVA_LIMITE_LARANJA = 100.0
 
 DELTA_TRIGGER_UMIDADE = 3.0
 
+# Regras por estação (regras.py): estes limites e as bases de CONSTANTES_PADRAO são o padrão; o arquivo
+# REGRAS_ARQUIVO ({"<id_ponto>": {"CHUVA_LIMITE_VERDE": 55.0, "UMIDADE_BASE_1M": 37.5, ...}}) e a tabela
+# REGRAS_TABELA (id_ponto, campo, valor) sobrescrevem por estação, sem reiniciar (o banco tem prioridade).
+REGRAS_ARQUIVO = "regras_pontos.json"
+REGRAS_TABELA = "regras_pontos"
+REGRAS_RECARGA_DB_SEC = 60  # Intervalo mínimo entre consultas à tabela de regras
+
+# Motor de eventos (eventos.py): subir de nível é imediato; para descer, o valor precisa sair da
+# faixa de histerese e permanecer no nível mais baixo pelo tempo mínimo.
+EVENTOS_HISTERESE_CHUVA_MM = 5.0  # Ex.: ATENÇÃO (> 60 mm) só volta a LIVRE abaixo de 55 mm
+EVENTOS_HISTERESE_UMIDADE_PERC = 0.5  # Gatilho de descida = DELTA_TRIGGER_UMIDADE - 0.5
+EVENTOS_PERMANENCIA_MIN_SEC = 30 * 60  # Permanência mínima antes de confirmar uma redução/perda de dados
+EVENTOS_DEDUP_SEC = 60 * 60  # Mesma redução (ponto, tipo, de -> para) não é reemitida nesse intervalo (escaladas sempre)
+EVENTOS_FILE = "eventos_risco.jsonl"  # Eventos estruturados (uma linha JSON por evento)
+
 RISCO_MAP = {
     "LIVRE": 0,
     "ATENÇÃO": 1,
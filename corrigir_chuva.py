@@ -0,0 +1,60 @@
+# corrigir_chuva.py (v1 - Recalcula chuva_mm de todo o histórico a partir do odômetro)
+#
+# Linhas gravadas antes da derivação na ingestão têm chuva_mm = 0.0 (WeatherLink) e só o
+# precipitacao_acumulada_mm. Este script decodifica o odômetro de cada estação
+# (processamento.derivar_chuva_mm) e regrava chuva_mm. Pode ser executado mais de uma vez.
+
+import sys
+import traceback
+import pandas as pd
+from sqlalchemy import text
+
+import data_source
+import processamento
+import config
+
+LINHAS_POR_LOTE = 5000
+
+print("--- SCRIPT DE CORREÇÃO DA CHUVA (v1) ---")
+print("RECALCULA chuva_mm A PARTIR DO ODÔMETRO (precipitacao_acumulada_mm).")
+print("NENHUMA LEITURA SERÁ APAGADA.")
+
+try:
+    # 1. Configurar caminhos e banco
+    data_source.setup_disk_paths()
+    data_source.initialize_database()
+
+    # 2. Estações com odômetro gravado
+    with data_source.DB_ENGINE.connect() as connection:
+        pontos = [linha[0] for linha in connection.execute(text(
+            f"SELECT DISTINCT id_ponto FROM {config.DB_TABLE_NAME} WHERE precipitacao_acumulada_mm IS NOT NULL"
+        )).fetchall()]
+    if not pontos:
+        print("Nenhuma estação com odômetro no banco. Nada para corrigir.")
+        sys.exit()
+
+    total = 0
+    for id_ponto in pontos:
+        # 3. Histórico completo da estação (uma estação por vez: memória limitada)
+        df = data_source.read_data_from_sqlite(id_ponto=id_ponto, colunas=data_source.COLUNAS_HISTORICO)
+        if df.empty: continue
+        df = df.sort_values('timestamp').drop_duplicates(subset=['timestamp'], keep='last').reset_index(drop=True)
+        for col in ['chuva_mm', 'precipitacao_acumulada_mm']:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+        antes = df['chuva_mm'].fillna(0).sum()
+        df = processamento.derivar_chuva_mm(df)
+        print(f"{id_ponto}: {len(df)} linhas | soma chuva_mm {antes:.1f} -> {df['chuva_mm'].fillna(0).sum():.1f} mm")
+
+        # 4. Regrava em lotes (DELETE por timestamp da própria estação + INSERT)
+        for inicio in range(0, len(df), LINHAS_POR_LOTE):
+            data_source.upsert_data(df.iloc[inicio:inicio + LINHAS_POR_LOTE], por_ponto=True)
+        total += len(df)
+
+    print(f"\n--- CORREÇÃO DA CHUVA CONCLUÍDA: {total} linhas regravadas ---")
+    print("Para refazer a série de risco: python serie_risco.py <DIAS>")
+
+except Exception as e:
+    print(f"\n--- ERRO NA CORREÇÃO DA CHUVA (v1) ---")
+    print(f"Ocorreu um erro: {e}")
+    traceback.print_exc()
@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 import json
 import os
 import datetime
@@ -13,6 +14,11 @@ from sqlalchemy import create_engine, inspect, text, bindparam, delete, table, c
 from httpx import HTTPStatusError
 import threading
 
+try:
+    import orjson  # Decodificador JSON rápido (opcional). Sem ele, cai no json da stdlib.
+except ImportError:
+    orjson = None
+
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
 from config import (
@@ -20,10 +26,13 @@ from config import (
     FREQUENCIA_API_SEGUNDOS, BACKFILL_RUN_TIME_SEC,
     MAX_HISTORICO_PONTOS,
     WEATHERLINK_CONFIG,
-    DB_TABLE_NAME,
+    DB_TABLE_NAME, DB_TABLE_RISCO,
     ZENTRA_API_TOKEN, ZENTRA_STATION_SERIAL, ZENTRA_BASE_URL,
     MAPA_ZENTRA_KM72, ID_PONTO_ZENTRA_KM72,
-    RENDER_SLEEP_TIME_SEC
+    RENDER_SLEEP_TIME_SEC,
+    FONTES_DADOS, SIMULADOR_NUM_ESTACOES,
+    EXPORTACAO_LINHAS_POR_LOTE,
+    FUSO_LOCAL
 )
 
 # -----------------------------------------------------------------------------
@@ -33,11 +42,21 @@ DB_CONNECTION_STRING = ""
 STATUS_FILE = "status_atual.json"
 LOG_FILE = "eventos.log"
 DB_ENGINE = None
+# Serializa os gravadores do histórico no processo de ingestão: o ciclo do worker (lê a janela, mescla
+# e regrava) e a thread de backfill. Sem ele, o ciclo regravaria a janela lida antes do backfill por cima
+# das linhas recuperadas (e, no SQLite, os dois gravadores disputariam o banco: "database is locked").
+GRAVACAO_LOCK = threading.Lock()
 
 # CORREÇÃO: Lista compatível com o banco de dados real (sem colunas virtuais)
 COLUNAS_HISTORICO = [
     'timestamp', 'id_ponto', 'chuva_mm', 'precipitacao_acumulada_mm',
-    'umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc'
+    'umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc', 'qc_umidade'
+]
+
+# Série derivada de risco (uma linha por estação e slot de 10 min). Níveis: 0..3, -1 = SEM DADOS.
+COLUNAS_SERIE_RISCO = [
+    'timestamp', 'id_ponto', 'chuva_72h', 'nivel_chuva',
+    'delta_umidade_1m', 'delta_umidade_2m', 'delta_umidade_3m', 'nivel_umidade', 'nivel_risco'
 ]
 
 
@@ -155,6 +174,14 @@ def initialize_database():
             df_vazio.to_sql(DB_TABLE_NAME, DB_ENGINE, index=False)
             adicionar_log("DB", f"Tabela '{DB_TABLE_NAME}' criada.", salvar_arquivo=False)
 
+        # Migração: bancos criados antes do controle de qualidade não têm a coluna qc_umidade
+        colunas_existentes = [c['name'] for c in inspector.get_columns(DB_TABLE_NAME)]
+        if 'qc_umidade' not in colunas_existentes:
+            with DB_ENGINE.connect() as connection:
+                connection.execute(text(f'ALTER TABLE {DB_TABLE_NAME} ADD COLUMN qc_umidade INTEGER DEFAULT 0'))
+                connection.commit()
+            adicionar_log("DB", "Coluna 'qc_umidade' adicionada ao histórico.", salvar_arquivo=False)
+
         existing_indexes = []
         try:
             indexes = inspector.get_indexes(DB_TABLE_NAME);
@@ -174,16 +201,36 @@ def initialize_database():
                 except Exception:
                     pass
             connection.commit()
+
+        if not inspector.has_table(DB_TABLE_RISCO):
+            pd.DataFrame(columns=COLUNAS_SERIE_RISCO).to_sql(DB_TABLE_RISCO, DB_ENGINE, index=False)
+            adicionar_log("DB", f"Tabela '{DB_TABLE_RISCO}' criada.", salvar_arquivo=False)
+            with DB_ENGINE.connect() as connection:
+                try:
+                    connection.execute(text(
+                        f'CREATE INDEX idx_risco_ponto_ts ON {DB_TABLE_RISCO} (id_ponto, timestamp)'))
+                except Exception:
+                    pass
+                connection.commit()
         adicionar_log("DB", "Banco de dados verificado e pronto.", salvar_arquivo=False)
     except Exception as e:
         adicionar_log("SISTEMA", f"ERRO CRÍTICO DB Init: {e}", level="ERROR", salvar_arquivo=True)
         traceback.print_exc()
 
 
-def upsert_data(df_novos_dados):
+def upsert_data(df_novos_dados, por_ponto=False):
+    """
+    Substitui no banco as linhas dos timestamps recebidos.
+    por_ponto=True restringe o DELETE a cada id_ponto (usado pelo backfill, que
+    grava uma estação por vez e não pode apagar as linhas das outras).
+    """
     if df_novos_dados.empty: return
-    timestamps = df_novos_dados['timestamp'].unique()
-    delete_from_sqlite(timestamps)
+    if por_ponto:
+        for id_ponto, df_ponto in df_novos_dados.groupby('id_ponto'):
+            delete_from_sqlite(df_ponto['timestamp'].unique(), id_ponto=id_ponto)
+    else:
+        timestamps = df_novos_dados['timestamp'].unique()
+        delete_from_sqlite(timestamps)
     save_to_sqlite(df_novos_dados)
 
 
@@ -211,22 +258,124 @@ def save_to_sqlite(df_novos_dados):
             adicionar_log("DB", f"ERRO CRÍTICO Salvar DB: {e}", level="ERROR", salvar_arquivo=True)
 
 
-def delete_from_sqlite(timestamps):
+def delete_from_sqlite(timestamps, id_ponto=None):
     global DB_ENGINE
-    if not timestamps: return
+    if len(timestamps) == 0: return
     try:
-        ts_strings = [pd.to_datetime(ts).strftime('%Y-%m-%d %H:%M:%S') for ts in timestamps]
+        ts = pd.Series(pd.to_datetime(timestamps, utc=True))
+        # O SQLite guarda o texto gravado pelo to_sql ('... 10:20:00.000000'); o Postgres compara como
+        # timestamp. Os dois formatos garantem o casamento nos dois bancos (senão o upsert duplica linhas).
+        ts_strings = list(ts.dt.strftime('%Y-%m-%d %H:%M:%S')) + list(ts.dt.strftime('%Y-%m-%d %H:%M:%S.%f'))
         with DB_ENGINE.connect() as connection:
-            t_historico = table(DB_TABLE_NAME, column('timestamp'))
-            stmt = delete(t_historico).where(t_historico.c.timestamp.in_(ts_strings))
-            adicionar_log("DB", f"Deletando {len(ts_strings)} registros antigos.", level="INFO", salvar_arquivo=False)
-            connection.execute(stmt)
+            t_historico = table(DB_TABLE_NAME, column('timestamp'), column('id_ponto'))
+            adicionar_log("DB", f"Deletando {len(ts)} registros antigos.", level="INFO", salvar_arquivo=False)
+            for i in range(0, len(ts_strings), 400):  # Lotes: limite de parâmetros do SQLite
+                stmt = delete(t_historico).where(t_historico.c.timestamp.in_(ts_strings[i:i + 400]))
+                if id_ponto:
+                    stmt = stmt.where(t_historico.c.id_ponto == id_ponto)
+                connection.execute(stmt)
             connection.commit()
     except Exception as e:
         adicionar_log("DB", f"ERRO CRÍTICO Deletar DB: {e}", level="ERROR", salvar_arquivo=True)
         traceback.print_exc()
 
 
+# --- SÉRIE DE RISCO (TABELA DERIVADA) ---
+def upsert_serie_risco(df_risco):
+    """
+    Regrava a série de risco: por estação, apaga o intervalo [primeiro slot, último slot] recebido
+    (DELETE por faixa no índice id_ponto+timestamp) e insere as linhas novas.
+    """
+    global DB_ENGINE
+    if df_risco.empty: return
+    try:
+        df_para_salvar = df_risco[[c for c in COLUNAS_SERIE_RISCO if c in df_risco.columns]].copy()
+        df_para_salvar['timestamp'] = pd.to_datetime(df_para_salvar['timestamp'], utc=True)
+        limites = df_para_salvar.groupby('id_ponto')['timestamp'].agg(['min', 'max'])
+
+        with DB_ENGINE.connect() as connection:
+            t_risco = table(DB_TABLE_RISCO, column('timestamp'), column('id_ponto'))
+            for id_ponto, (inicio, fim) in limites.iterrows():
+                fim_exclusivo = fim + pd.Timedelta(minutes=10)
+                connection.execute(delete(t_risco).where(
+                    (t_risco.c.id_ponto == id_ponto) &
+                    (t_risco.c.timestamp >= inicio.strftime('%Y-%m-%d %H:%M:%S')) &
+                    (t_risco.c.timestamp < fim_exclusivo.strftime('%Y-%m-%d %H:%M:%S'))
+                ))
+            df_para_salvar.to_sql(DB_TABLE_RISCO, connection, if_exists='append', index=False)
+            connection.commit()
+    except Exception as e:
+        adicionar_log("DB", f"ERRO ao gravar série de risco: {e}", level="ERROR", salvar_arquivo=True)
+
+
+def read_serie_risco(id_ponto=None, start_dt=None, end_dt=None, nivel_minimo=None):
+    """ Leitura por faixa da série de risco. nivel_minimo filtra slots com nivel_risco >= valor. """
+    global DB_ENGINE
+    query = f"SELECT * FROM {DB_TABLE_RISCO}"
+    conditions = []
+    params = {}
+    if id_ponto: conditions.append("id_ponto = :ponto"); params["ponto"] = id_ponto
+    if start_dt: conditions.append("timestamp >= :start"); params["start"] = start_dt.strftime('%Y-%m-%d %H:%M:%S')
+    if end_dt: conditions.append("timestamp < :end"); params["end"] = end_dt.strftime('%Y-%m-%d %H:%M:%S')
+    if nivel_minimo is not None: conditions.append("nivel_risco >= :nivel"); params["nivel"] = int(nivel_minimo)
+    if conditions: query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY id_ponto, timestamp ASC"
+
+    try:
+        with DB_ENGINE.connect() as connection:
+            df = pd.read_sql_query(text(query), connection, params=params, parse_dates=["timestamp"])
+        if not df.empty and df['timestamp'].dt.tz is None:
+            df['timestamp'] = df['timestamp'].dt.tz_localize('UTC')
+        return df
+    except Exception as e:
+        adicionar_log("DB", f"ERRO Leitura série de risco: {e}", level="ERROR", salvar_arquivo=True)
+        return pd.DataFrame(columns=COLUNAS_SERIE_RISCO)
+
+
+def versao_dados(id_ponto, start_dt, end_dt):
+    """
+    Impressão digital barata dos dados de uma estação num intervalo (agregados no índice, sem trazer
+    linhas): muda quando qualquer leitura ou a série de risco do período é gravada/corrigida.
+    id_ponto=None: todas as estações.
+    """
+    global DB_ENGINE
+    params = {"ponto": id_ponto, "start": start_dt.strftime('%Y-%m-%d %H:%M:%S'),
+              "end": end_dt.strftime('%Y-%m-%d %H:%M:%S')}
+    filtro = "WHERE timestamp >= :start AND timestamp < :end" + (" AND id_ponto = :ponto" if id_ponto else "")
+    with DB_ENGINE.connect() as connection:
+        medicoes = connection.execute(text(
+            f"SELECT COUNT(*), MAX(timestamp), SUM(chuva_mm), SUM(umidade_1m_perc), SUM(umidade_2m_perc), "
+            f"SUM(umidade_3m_perc), SUM(qc_umidade) FROM {DB_TABLE_NAME} {filtro}"), params).fetchone()
+        risco = connection.execute(text(
+            f"SELECT COUNT(*), SUM(nivel_risco), SUM(nivel_chuva), SUM(nivel_umidade) FROM {DB_TABLE_RISCO} {filtro}"),
+            params).fetchone()
+    return hashlib.sha256(repr((tuple(medicoes), tuple(risco))).encode()).hexdigest()[:16]
+
+
+
+# --- DIAS ALTERADOS (derivados por dia: fragmentos de relatório e relatórios agendados) ---
+# { (id_ponto, 'AAAA-MM-DD' local): epoch da última gravação que pode ter mudado leituras ou risco do dia }
+# Marcado por quem grava no processo de ingestão (ciclo do worker e backfill). Quem mantém um derivado
+# por dia só consulta versao_dados dos dias marcados depois da sua última conferência.
+DIAS_ALTERADOS = {}
+_DIAS_ALTERADOS_LOCK = threading.Lock()
+
+
+def marcar_dias_alterados(id_ponto, start_dt, end_dt):
+    """ Marca os dias locais do intervalo UTC [start_dt, end_dt] da estação como alterados agora. """
+    agora = time.time()
+    dias = pd.date_range(start_dt.tz_convert(FUSO_LOCAL).date(), end_dt.tz_convert(FUSO_LOCAL).date())
+    with _DIAS_ALTERADOS_LOCK:
+        for dia in dias:
+            DIAS_ALTERADOS[(id_ponto, dia.strftime('%Y-%m-%d'))] = agora
+
+
+def dia_alterado_em(id_ponto, dia):
+    """ Epoch da última marcação do dia local 'AAAA-MM-DD' (id_ponto=None: de qualquer estação); 0 se nunca. """
+    with _DIAS_ALTERADOS_LOCK:
+        if id_ponto is not None: return DIAS_ALTERADOS.get((id_ponto, dia), 0.0)
+        return max((t for (_, d), t in DIAS_ALTERADOS.items() if d == dia), default=0.0)
+
 # --- OTIMIZAÇÃO DE LEITURA (SELECT COLUNAS) ---
 def read_data_from_sqlite(id_ponto=None, start_dt=None, end_dt=None, last_hours=None, colunas=None):
     global DB_ENGINE
@@ -268,6 +417,23 @@ def read_data_from_sqlite(id_ponto=None, start_dt=None, end_dt=None, last_hours=
         return pd.DataFrame()
 
 
+def iterar_leituras(id_ponto, start_dt, end_dt, colunas, linhas_por_lote=EXPORTACAO_LINHAS_POR_LOTE):
+    """
+    Leituras de uma estação no intervalo, em lotes (DataFrames) lidos do cursor em ordem de timestamp:
+    a memória fica limitada ao tamanho do lote, qualquer que seja o período (exportações longas).
+    """
+    global DB_ENGINE
+    query = (f"SELECT {', '.join(colunas)} FROM {DB_TABLE_NAME} "
+             f"WHERE id_ponto = :ponto AND timestamp >= :start AND timestamp < :end ORDER BY timestamp ASC")
+    params = {"ponto": id_ponto, "start": start_dt.strftime('%Y-%m-%d %H:%M:%S'),
+              "end": end_dt.strftime('%Y-%m-%d %H:%M:%S')}
+    with DB_ENGINE.connect().execution_options(stream_results=True) as connection:
+        for lote in pd.read_sql_query(text(query), connection, params=params, parse_dates=["timestamp"],
+                                      chunksize=linhas_por_lote):
+            if lote['timestamp'].dt.tz is None: lote['timestamp'] = lote['timestamp'].dt.tz_localize('UTC')
+            yield lote
+
+
 def get_recent_data_for_worker(hours=73, colunas=None):
     return read_data_from_sqlite(last_hours=hours, colunas=colunas)
 
@@ -298,6 +464,75 @@ def calculate_hmac_signature(params, api_secret):
     return hmac.new(api_secret.encode('utf-8'), string_para_assinar.encode('utf-8'), hashlib.sha256).hexdigest()
 
 
+def _decodificar_json(conteudo):
+    """ Decodifica o corpo (bytes) direto, sem passar por str. Usa orjson quando instalado. """
+    if orjson is not None:
+        return orjson.loads(conteudo)
+    return json.loads(conteudo)
+
+
+def _parse_zentra_water_content(payload):
+    """
+    Converte o bloco "Water Content" da Zentra em DataFrame largo (1 linha por slot de 10 min).
+    Faz uma passada contando as leituras, preenche arrays pré-alocados e pivota com NumPy,
+    sem montar dicionários por timestamp (importante nos backfills de vários dias).
+    """
+    wc_data = next((d for n, d in (payload.get('data') or {}).items() if 'water content' in n.lower()), None)
+    if not wc_data: return pd.DataFrame()
+
+    blocos = [(MAPA_ZENTRA_KM72[b.get('metadata', {}).get('port_number')], b.get('readings') or [])
+              for b in wc_data if b.get('metadata', {}).get('port_number') in MAPA_ZENTRA_KM72]
+    total = sum(len(leituras) for _, leituras in blocos)
+    if total == 0: return pd.DataFrame()
+
+    colunas = list(dict.fromkeys(MAPA_ZENTRA_KM72.values()))
+    idx_coluna = {c: i for i, c in enumerate(colunas)}
+
+    ts_epoch = np.full(total, -1, dtype=np.int64)
+    ts_texto = np.empty(total, dtype=object)
+    col_arr = np.empty(total, dtype=np.int8)
+    valores = np.full(total, np.nan, dtype=np.float64)
+
+    n = 0
+    for coluna, leituras in blocos:
+        i_col = idx_coluna[coluna]
+        for reading in leituras:
+            value = reading.get('value')
+            if value is None: continue
+            ts_utc = reading.get('timestamp_utc')
+            if ts_utc is not None:
+                ts_epoch[n] = int(ts_utc)
+            else:
+                ts_iso = reading.get('datetime')
+                if not ts_iso: continue
+                ts_texto[n] = ts_iso
+            col_arr[n] = i_col
+            valores[n] = float(value)
+            n += 1
+
+    if n == 0: return pd.DataFrame()
+    ts_epoch, ts_texto, col_arr, valores = ts_epoch[:n], ts_texto[:n], col_arr[:n], valores[:n]
+
+    # Leituras sem epoch: converte o ISO de uma vez só (vetorizado)
+    sem_epoch = ts_epoch < 0
+    if sem_epoch.any():
+        convertidos = pd.to_datetime(pd.Series(ts_texto[sem_epoch]), utc=True, errors='coerce', format='ISO8601')
+        segundos = (convertidos - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)
+        ts_epoch[sem_epoch] = segundos.fillna(-1).astype(np.int64).to_numpy()
+        validos = ts_epoch >= 0
+        ts_epoch, col_arr, valores = ts_epoch[validos], col_arr[validos], valores[validos]
+
+    slots = (ts_epoch // 600) * 600
+    slots_unicos, posicao = np.unique(slots, return_inverse=True)
+    matriz = np.full((len(slots_unicos), len(colunas)), np.nan)
+    matriz[posicao, col_arr] = valores * 100.0
+
+    df = pd.DataFrame(matriz, columns=colunas)
+    df.insert(0, 'id_ponto', ID_PONTO_ZENTRA_KM72)
+    df.insert(0, 'timestamp', pd.to_datetime(slots_unicos, unit='s', utc=True))
+    return df
+
+
 def arredondar_timestamp_10min(ts_epoch):
     dt_obj = datetime.datetime.fromtimestamp(ts_epoch, datetime.timezone.utc)
     return (dt_obj.replace(second=0, microsecond=0, minute=(dt_obj.minute // 10) * 10)).isoformat()
@@ -320,7 +555,7 @@ def fetch_data_from_weatherlink_api(ultimo_acumulado_chuva=None):
             try:
                 r = client.get(ENDPOINT.format(station_id=config['STATION_ID']), params=params_to_send)
                 r.raise_for_status();
-                response_json = r.json()
+                response_json = _decodificar_json(r.content)
                 s = next((s['data'][0] for s in response_json.get('sensors', []) if
                           (s.get('data_structure_type') == 10 or s.get('sensor_type') == 48) and s.get('data')), None)
 
@@ -336,7 +571,7 @@ def fetch_data_from_weatherlink_api(ultimo_acumulado_chuva=None):
                 dados.append({
                     "timestamp": arredondar_timestamp_10min(s['ts']),
                     "id_ponto": id_ponto,
-                    "chuva_mm": 0.0,
+                    "chuva_mm": None,  # Derivada do odômetro no worker (processamento.derivar_chuva_mm)
                     "precipitacao_acumulada_mm": acumulado_dia
                 })
             except Exception as e:
@@ -359,9 +594,9 @@ def _get_readings_zentra(client, station_serial, start_date, end_date):
         return None
 
 
-def fetch_data_from_zentra_cloud():
-    end_date = datetime.datetime.now(datetime.timezone.utc);
-    start_date = end_date - datetime.timedelta(days=2)
+def fetch_data_from_zentra_cloud(start_date=None, end_date=None):
+    if end_date is None: end_date = datetime.datetime.now(datetime.timezone.utc)
+    if start_date is None: start_date = end_date - datetime.timedelta(days=2)
     adicionar_log(ID_PONTO_ZENTRA_KM72, f"Buscando dados da Zentra Cloud.", level="INFO", salvar_arquivo=False)
     with httpx.Client() as client:
         for attempt in range(3):
@@ -373,30 +608,169 @@ def fetch_data_from_zentra_cloud():
                       salvar_arquivo=True);
         return pd.DataFrame()
     try:
-        wc_data = next((d for n, d in r.json().get('data', {}).items() if 'water content' in n.lower()), None)
-        if not wc_data: return pd.DataFrame()
-        dados_por_timestamp = {}
-        for sensor_block in wc_data:
-            port_num = sensor_block.get('metadata', {}).get('port_number')
-            if port_num in MAPA_ZENTRA_KM72:
-                coluna = MAPA_ZENTRA_KM72[port_num]
-                for reading in sensor_block.get('readings', []):
-                    ts_iso, value = reading.get('datetime'), reading.get('value')
-                    if ts_iso and value is not None:
-                        ts_arr = arredondar_timestamp_10min(datetime.datetime.fromisoformat(ts_iso).timestamp())
-                        if ts_arr not in dados_por_timestamp: dados_por_timestamp[ts_arr] = {}
-                        dados_por_timestamp[ts_arr][coluna] = float(value) * 100.0
-        if not dados_por_timestamp: return pd.DataFrame()
-        df_bloco = pd.DataFrame(
-            [{'timestamp': ts, 'id_ponto': ID_PONTO_ZENTRA_KM72, **v} for ts, v in dados_por_timestamp.items()])
-        df_bloco['timestamp'] = pd.to_datetime(df_bloco['timestamp'], utc=True)
+        df_bloco = _parse_zentra_water_content(_decodificar_json(r.content))
+        if df_bloco.empty: return pd.DataFrame()
         return df_bloco
     except Exception as e:
         adicionar_log(ID_PONTO_ZENTRA_KM72, f"Erro JSON Zentra: {e}", level="ERROR", salvar_arquivo=True);
         return pd.DataFrame()
 
 
-def backfill_zentra_km72_data(): pass
+def fetch_historico_weatherlink(id_ponto, start_dt, end_dt):
+    """
+    Busca registros de arquivo (/historic) da WeatherLink para um intervalo.
+    A API aceita no máximo 24h por requisição; quem chama deve fatiar o intervalo.
+    Retorna a chuva do intervalo de arquivo (rainfall_mm) já na grade de 10 min.
+    """
+    ENDPOINT = "https://api.weatherlink.com/v2/historic/{station_id}"
+    config = WEATHERLINK_CONFIG.get(id_ponto)
+    if not config or "SUA_CHAVE" in config.get('API_KEY', ''): return pd.DataFrame()
+
+    t = str(int(datetime.datetime.now(datetime.timezone.utc).timestamp()))
+    inicio, fim = str(int(start_dt.timestamp())), str(int(end_dt.timestamp()))
+    params_to_sign = {"api-key": config['API_KEY'], "station-id": str(config['STATION_ID']), "t": t,
+                      "start-timestamp": inicio, "end-timestamp": fim}
+    signature = calculate_hmac_signature(params_to_sign, config['API_SECRET'])
+    params_to_send = {"api-key": config['API_KEY'], "t": t, "start-timestamp": inicio, "end-timestamp": fim,
+                      "api-signature": signature}
+    try:
+        with httpx.Client(timeout=30.0) as client:
+            r = client.get(ENDPOINT.format(station_id=config['STATION_ID']), params=params_to_send)
+            r.raise_for_status()
+            response_json = _decodificar_json(r.content)
+    except Exception as e:
+        adicionar_log(id_ponto, f"Erro API WL (historic): {e}", level="ERROR", salvar_arquivo=True)
+        return pd.DataFrame()
+
+    registros = [reg for sensor in response_json.get('sensors', []) for reg in (sensor.get('data') or [])
+                 if 'ts' in reg and reg.get('rainfall_mm') is not None]
+    if not registros: return pd.DataFrame()
+
+    ts_epoch = np.fromiter((reg['ts'] for reg in registros), dtype=np.int64, count=len(registros))
+    chuva = np.fromiter((reg['rainfall_mm'] for reg in registros), dtype=np.float64, count=len(registros))
+
+    # Intervalos de arquivo menores que 10 min caem no mesmo slot: soma a chuva
+    slots, posicao = np.unique((ts_epoch // 600) * 600, return_inverse=True)
+    df = pd.DataFrame({
+        "timestamp": pd.to_datetime(slots, unit='s', utc=True),
+        "id_ponto": id_ponto,
+        "chuva_mm": np.bincount(posicao, weights=chuva, minlength=len(slots))
+    })
+    return df
+
+
+# ==============================================================================
+# --- ADAPTADORES DE FONTES DE DADOS ---
+# ==============================================================================
+
+class AdaptadorFonte:
+    """
+    Interface comum das fontes de ingestão.
+    fetch_current(): leitura mais recente de cada ponto atendido.
+    fetch_range(id_ponto, start_dt, end_dt): histórico de um intervalo (usado no backfill).
+    Ambos retornam DataFrames já no esquema de COLUNAS_HISTORICO (ver normalizar()).
+    """
+    nome = "base"
+    tipos = ()  # "chuva" e/ou "umidade"
+    mapa_colunas = {}  # coluna da origem -> coluna do banco
+
+    def pontos(self):
+        return []
+
+    def fetch_current(self):
+        raise NotImplementedError
+
+    def fetch_range(self, id_ponto, start_dt, end_dt):
+        raise NotImplementedError
 
+    def normalizar(self, df):
+        if df is None or df.empty: return pd.DataFrame()
+        df = df.rename(columns=self.mapa_colunas)
+        df = df[[c for c in COLUNAS_HISTORICO if c in df.columns]].copy()
+        df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True)
+        return df
+
+
+class AdaptadorWeatherLink(AdaptadorFonte):
+    nome = "weatherlink"
+    tipos = ("chuva",)
+    MAX_HORAS_POR_REQ = 24  # Limite da API /historic
+
+    def pontos(self):
+        return [p for p, cfg in WEATHERLINK_CONFIG.items() if "SUA_CHAVE" not in cfg.get('API_KEY', '')]
+
+    def fetch_current(self):
+        df, _ = fetch_data_from_weatherlink_api()
+        return self.normalizar(df)
+
+    def fetch_range(self, id_ponto, start_dt, end_dt):
+        partes = []
+        cursor = start_dt
+        while cursor < end_dt:
+            fim_req = min(cursor + pd.Timedelta(hours=self.MAX_HORAS_POR_REQ), end_dt)
+            df_parte = fetch_historico_weatherlink(id_ponto, cursor, fim_req)
+            if not df_parte.empty: partes.append(df_parte)
+            cursor = fim_req
+        if not partes: return pd.DataFrame()
+        df = pd.concat(partes, ignore_index=True)
+        return self.normalizar(df.groupby(['timestamp', 'id_ponto'], as_index=False)['chuva_mm'].sum())
+
+
+class AdaptadorZentra(AdaptadorFonte):
+    nome = "zentra"
+    tipos = ("umidade",)
+
+    def pontos(self):
+        return [ID_PONTO_ZENTRA_KM72]
+
+    def fetch_current(self):
+        return self.normalizar(fetch_data_from_zentra_cloud())
+
+    def fetch_range(self, id_ponto, start_dt, end_dt):
+        # A Zentra trabalha com datas: pede os dias do intervalo e recorta o pedaço solicitado
+        df = fetch_data_from_zentra_cloud(start_date=start_dt, end_date=end_dt + pd.Timedelta(days=1))
+        if df.empty: return df
+        return self.normalizar(df[(df['timestamp'] >= start_dt) & (df['timestamp'] < end_dt)])
 
-def backfill_weatherlink_data(id_ponto): pass
\ No newline at end of file
+
+_ADAPTADORES = None
+
+
+def obter_adaptadores():
+    """ Adaptadores ativos conforme FONTES_DADOS / SIMULADOR_NUM_ESTACOES (instanciados uma vez). """
+    global _ADAPTADORES
+    if _ADAPTADORES is None:
+        adaptadores = []
+        if "weatherlink" in FONTES_DADOS: adaptadores.append(AdaptadorWeatherLink())
+        if "zentra" in FONTES_DADOS: adaptadores.append(AdaptadorZentra())
+        if SIMULADOR_NUM_ESTACOES > 0:
+            import simulador  # Import tardio: o simulador depende deste módulo
+            adaptadores.append(simulador.AdaptadorSimulador())
+        _ADAPTADORES = adaptadores
+    return _ADAPTADORES
+
+
+def adaptador_do_ponto(id_ponto, tipo):
+    """ Adaptador responsável por (id_ponto, tipo), ou None. """
+    for adaptador in obter_adaptadores():
+        if tipo in adaptador.tipos and id_ponto in adaptador.pontos():
+            return adaptador
+    return None
+
+
+def pontos_por_tipo(tipo):
+    """ Conjunto de estações atendidas por alguma fonte que mede `tipo` ("chuva" / "umidade"). """
+    return {p for a in obter_adaptadores() if tipo in a.tipos for p in a.pontos()}
+
+
+def coletar_dados_atuais():
+    """ Chama fetch_current() de todas as fontes ativas e junta o resultado. """
+    frames = []
+    for adaptador in obter_adaptadores():
+        try:
+            df = adaptador.fetch_current()
+            if df is not None and not df.empty: frames.append(df)
+        except Exception as e:
+            adicionar_log("SISTEMA", f"Erro na fonte '{adaptador.nome}': {e}", level="ERROR", salvar_arquivo=True)
+    if not frames: return pd.DataFrame(columns=COLUNAS_HISTORICO)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,194 @@
+# eventos.py (Motor de eventos de risco: histerese, permanência mínima e deduplicação)
+#
+# Processa, ciclo a ciclo, o status bruto calculado pelo worker e só confirma mudanças de nível que
+# passam pelas regras abaixo. Cada mudança confirmada vira um evento estruturado (EVENTOS_FILE) e
+# a mensagem "MUDANÇA DE STATUS" de sempre no log de eventos.
+#   - Escalada (nível maior, ou saída de SEM DADOS): confirmada no mesmo ciclo.
+#   - Redução (nível menor, ou perda de dados): o valor precisa sair da faixa de histerese e o
+#     nível mais baixo precisa persistir por EVENTOS_PERMANENCIA_MIN_SEC.
+#   - Deduplicação: só reduções. A mesma redução do mesmo ponto não é reemitida dentro de
+#     EVENTOS_DEDUP_SEC, a não ser que uma escalada de volta ao nível de origem tenha sido emitida
+#     depois dela. Escaladas são sempre emitidas: o log nunca termina numa redução com o ponto no nível alto.
+
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+
+import data_source
+import processamento
+import regras
+from config import (
+    PONTOS_DE_ANALISE, RISCO_MAP,
+    EVENTOS_HISTERESE_CHUVA_MM, EVENTOS_HISTERESE_UMIDADE_PERC,
+    EVENTOS_PERMANENCIA_MIN_SEC, EVENTOS_DEDUP_SEC, EVENTOS_FILE
+)
+
+TIPOS = ("chuva", "umidade")
+ROTULOS = {"chuva": "Chuva", "umidade": "Umidade"}
+
+# { (id_ponto, tipo): {"nivel": int, "desde": Timestamp, "candidato": int|None, "candidato_desde": Timestamp|None} }
+ESTADO_EVENTOS = {}
+# { (id_ponto, tipo, de, para): Timestamp da última redução emitida }; apagada quando o ponto volta a subir até 'de'
+ULTIMOS_EVENTOS = {}
+EVENTOS_LOCK = threading.Lock()
+
+
+def _nome(nivel):
+    return processamento.NOMES_NIVEL.get(nivel, "SEM DADOS")
+
+
+def inicializar(status_antigos, agora=None):
+    """
+    Semeia o estado com o último status gravado em disco (evita uma rajada de eventos
+    "INDEFINIDO -> X" a cada reinício do worker). Só preenche chaves ainda desconhecidas.
+    """
+    if not isinstance(status_antigos, dict): return
+    agora = agora or pd.Timestamp.now(tz='UTC')
+    with EVENTOS_LOCK:
+        for id_ponto, info in status_antigos.items():
+            if not isinstance(info, dict): continue
+            for tipo in TIPOS:
+                nome = info.get(tipo)
+                if (id_ponto, tipo) in ESTADO_EVENTOS or nome not in RISCO_MAP or nome == "INDEFINIDO":
+                    continue
+                ESTADO_EVENTOS[(id_ponto, tipo)] = {"nivel": RISCO_MAP[nome], "desde": agora,
+                                                    "candidato": None, "candidato_desde": None}
+
+
+def _nivel_reducao(tipo, info, nivel_bruto, regra):
+    """ Nível de destino de uma redução, já com a faixa de histerese aplicada (>= nível bruto). """
+    if nivel_bruto < 0:
+        return nivel_bruto
+    if tipo == "chuva":
+        valor = info.get("chuva_72h")
+        if valor is None: return nivel_bruto
+        limites = [regra[c] for c in regras.CAMPOS_CHUVA]
+        return int(processamento.classificar_nivel_chuva([valor + EVENTOS_HISTERESE_CHUVA_MM], limites)[0])
+
+    umidades = [info.get(f"umidade_{d}m") for d in (1, 2, 3)]
+    if any(u is None for u in umidades): return nivel_bruto
+    bases = [regra[c] for c in regras.CAMPOS_BASE]
+    nivel = processamento.classificar_nivel_umidade(
+        np.array([umidades], dtype=float), bases,
+        delta=regra[regras.CAMPO_DELTA] - EVENTOS_HISTERESE_UMIDADE_PERC)[0]
+    return max(int(nivel), nivel_bruto)
+
+
+def _avaliar(chave, tipo, info, nivel_bruto, agora, regra):
+    """ Aplica as regras a um (ponto, tipo). Retorna (nivel_anterior, nivel_confirmado). """
+    estado = ESTADO_EVENTOS.get(chave)
+    if estado is None:
+        ESTADO_EVENTOS[chave] = {"nivel": nivel_bruto, "desde": agora, "candidato": None, "candidato_desde": None}
+        return None, nivel_bruto
+
+    atual = estado["nivel"]
+    reducao = _nivel_reducao(tipo, info, nivel_bruto, regra) if nivel_bruto < atual else atual
+    if nivel_bruto > atual:
+        destino = nivel_bruto
+    elif reducao < atual:
+        if estado["candidato_desde"] is None:
+            estado["candidato_desde"] = agora
+        estado["candidato"] = reducao
+        if (agora - estado["candidato_desde"]).total_seconds() < EVENTOS_PERMANENCIA_MIN_SEC:
+            return atual, atual
+        destino = estado["candidato"]
+    else:
+        estado["candidato"], estado["candidato_desde"] = None, None
+        return atual, atual
+
+    estado.update({"nivel": destino, "desde": agora, "candidato": None, "candidato_desde": None})
+    return atual, destino
+
+
+def _duplicado(id_ponto, tipo, de, para, agora):
+    """ Redução já emitida dentro de EVENTOS_DEDUP_SEC, sem escalada de volta a 'de' desde então. """
+    ultimo = ULTIMOS_EVENTOS.get((id_ponto, tipo, de, para))
+    return ultimo is not None and (agora - ultimo).total_seconds() < EVENTOS_DEDUP_SEC
+
+
+def _emitido(id_ponto, tipo, de, para, escalada, agora):
+    if not escalada:
+        ULTIMOS_EVENTOS[(id_ponto, tipo, de, para)] = agora
+        return
+    # Subiu de novo até (ou acima de) a origem de uma redução: a próxima descida é um evento novo
+    nivel = RISCO_MAP.get(para, -1)
+    for chave in [c for c in ULTIMOS_EVENTOS if c[:2] == (id_ponto, tipo) and RISCO_MAP.get(c[2], -1) <= nivel]:
+        del ULTIMOS_EVENTOS[chave]
+
+
+def processar(status_novos, agora=None):
+    """
+    Recebe o status bruto do ciclo ({id_ponto: ponto_info}) e devolve (status_confirmados, eventos).
+    Os ponto_info devolvidos trazem "chuva"/"umidade" com o nível confirmado pelo motor.
+    """
+    agora = agora or pd.Timestamp.now(tz='UTC')
+    tabela = regras.obter_regras()
+    confirmados = {}
+    eventos = []
+    with EVENTOS_LOCK:
+        for id_ponto, info in status_novos.items():
+            info = dict(info)
+            regra = tabela.para(id_ponto)
+            for tipo in TIPOS:
+                nivel_bruto = RISCO_MAP.get(info.get(tipo), -1)
+                estado_antes = ESTADO_EVENTOS.get((id_ponto, tipo))
+                desde = estado_antes["desde"] if estado_antes else None
+                anterior, nivel = _avaliar((id_ponto, tipo), tipo, info, nivel_bruto, agora, regra)
+                info[tipo] = _nome(nivel)
+                if anterior == nivel:
+                    continue
+
+                de = _nome(anterior) if anterior is not None else "INDEFINIDO"
+                escalada = anterior is None or nivel > anterior
+                if not escalada and _duplicado(id_ponto, tipo, de, info[tipo], agora):
+                    continue
+                _emitido(id_ponto, tipo, de, info[tipo], escalada, agora)
+                eventos.append({
+                    "timestamp": agora.isoformat(), "id_ponto": id_ponto, "tipo": tipo,
+                    "de": de, "para": info[tipo], "nivel_de": anterior, "nivel_para": nivel,
+                    "direcao": "escalada" if escalada else "reducao",
+                    "permanencia_anterior_seg": round((agora - desde).total_seconds()) if desde is not None else None,
+                    "chuva_72h": info.get("chuva_72h"),
+                    "umidade": [info.get(f"umidade_{d}m") for d in (1, 2, 3)],
+                })
+            confirmados[id_ponto] = info
+    return confirmados, eventos
+
+
+def descrever_evento(evento):
+    """ Mensagem legível de um evento (a mesma do log de eventos). """
+    nome_ponto = PONTOS_DE_ANALISE.get(evento["id_ponto"], {}).get("nome", evento["id_ponto"])
+    return (f"MUDANÇA DE STATUS ({ROTULOS[evento['tipo']]}): {nome_ponto} "
+            f"de {evento['de']} para {evento['para']}.")
+
+
+def registrar_eventos(eventos):
+    """ Uma escrita por ciclo no arquivo JSONL + a mensagem legível de sempre no log de eventos. """
+    if not eventos: return
+    for evento in eventos:
+        data_source.adicionar_log(evento["id_ponto"], descrever_evento(evento), level="WARN", salvar_arquivo=True)
+    try:
+        linhas = "".join(json.dumps(evento, ensure_ascii=False) + "\n" for evento in eventos)
+        data_source.write_with_timeout(EVENTOS_FILE, linhas, mode='a', timeout=10)
+    except Exception as e:
+        data_source.adicionar_log("EVENTOS", f"Erro ao gravar eventos estruturados: {e}", level="ERROR")
+
+
+def ler_eventos(id_ponto=None, start_dt=None, end_dt=None):
+    """ Eventos estruturados gravados, opcionalmente filtrados por ponto e período (UTC). """
+    caminho = os.path.join(data_source.get_base_path(), EVENTOS_FILE)
+    if not os.path.exists(caminho): return []
+    eventos = []
+    with open(caminho, 'r', encoding='utf-8') as f:
+        for linha in f:
+            try:
+                evento = json.loads(linha)
+            except ValueError:
+                continue
+            if id_ponto and evento.get("id_ponto") != id_ponto: continue
+            ts = pd.Timestamp(evento["timestamp"])
+            if (start_dt and ts < start_dt) or (end_dt and ts >= end_dt): continue
+            eventos.append(evento)
+    return eventos
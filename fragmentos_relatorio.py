@@ -0,0 +1,199 @@
+# fragmentos_relatorio.py (Fragmentos diários pré-renderizados para os relatórios PDF)
+#
+# Para cada estação e dia local já fechado, o worker grava no disco persistente:
+#   <FRAGMENTOS_DIR>/<id_ponto>/<AAAA-MM-DD>.json -> versão dos dados, estatísticas, mudanças de status
+#                                                    e os registros de 10 min do dia (amostra da tabela);
+#   <FRAGMENTOS_DIR>/<id_ponto>/<AAAA-MM-DD>.jpg  -> gráfico do dia.
+# O PDF de qualquer período é montado com esses fragmentos + um gráfico-resumo com um ponto por dia
+# (gerador_pdf.gerar_pdf): o custo deixa de crescer com o número de leituras do intervalo.
+# Um fragmento vale enquanto a versão dos dados do dia (data_source.versao_dados) não muda; se o
+# backfill corrigir um dia, o fragmento é refeito na próxima rodada (ou na hora, se pedido antes).
+# A rodada roda numa thread do worker, fora do ciclo de ingestão, e só consulta a versão dos dias
+# ainda não conferidos neste processo ou marcados como alterados depois da última conferência
+# (data_source.marcar_dias_alterados); a cada FRAGMENTOS_VERIFICACAO_COMPLETA_SEC confere todos
+# (pega correções gravadas por outro processo, ex.: backfill pela linha de comando).
+
+import os
+import json
+import time
+import traceback
+import pandas as pd
+
+import data_source
+import gerador_pdf
+from config import (
+    PONTOS_DE_ANALISE, FRAGMENTOS_DIR, FRAGMENTOS_DIAS_RETROATIVOS, FRAGMENTOS_MAX_POR_CICLO,
+    FRAGMENTOS_VERIFICACAO_COMPLETA_SEC, FUSO_LOCAL, COLUNAS_UMIDADE
+)
+
+FORMATO = 2  # Incrementar quando o conteúdo/desenho do fragmento mudar: os gravados são refeitos
+
+# (id_ponto, dia) -> epoch do início da última conferência de versão neste processo
+_CONFERIDOS = {}
+_ULTIMA_VERIFICACAO_COMPLETA = 0.0
+
+
+def _caminhos(id_ponto, dia):
+    diretorio = os.path.join(data_source.get_base_path(), FRAGMENTOS_DIR, id_ponto)
+    os.makedirs(diretorio, exist_ok=True)
+    base = os.path.join(diretorio, dia)
+    return base + ".json", base + ".jpg"
+
+
+def _hoje_local():
+    return pd.Timestamp.now(tz=FUSO_LOCAL).strftime('%Y-%m-%d')
+
+
+def versao_do_dia(id_ponto, dia):
+    return f"{FORMATO}:{data_source.versao_dados(id_ponto, *gerador_pdf.periodo_utc(dia, dia))}"
+
+
+def _estatisticas(df_dia):
+    """ Resumo numérico do dia (None nos campos sem leitura). """
+    def _ou_none(valor):
+        return None if pd.isna(valor) else round(float(valor), 2)
+
+    idx_max = df_dia['chuva_mm'].idxmax()
+    est = {
+        "chuva_total_mm": round(float(df_dia['chuva_mm'].sum()), 2),
+        "chuva_max_10min_mm": round(float(df_dia['chuva_mm'].max()), 2),
+        "hora_chuva_max": df_dia.loc[idx_max, 'timestamp_local'].strftime('%H:%M')
+        if df_dia.loc[idx_max, 'chuva_mm'] > 0 else None,
+        "registros": int(len(df_dia)),
+    }
+    for d, coluna in zip([1, 2, 3], COLUNAS_UMIDADE):
+        serie = df_dia[coluna] if coluna in df_dia.columns else pd.Series(dtype=float)
+        est[f"umidade_{d}m_media"] = _ou_none(serie.mean())
+        est[f"umidade_{d}m_min"] = _ou_none(serie.min())
+        est[f"umidade_{d}m_max"] = _ou_none(serie.max())
+    return est
+
+
+def calcular(id_ponto, dia, versao=None):
+    """ Fragmento de um dia local ('AAAA-MM-DD'): dicionário com estatísticas, status, registros e imagem. """
+    versao = versao or versao_do_dia(id_ponto, dia)
+    fragmento = {"id_ponto": id_ponto, "dia": dia, "versao": versao, "gerado_em": time.time(),
+                 "estatisticas": None, "status": [], "registros": {}, "imagem": None}
+
+    df_dia = gerador_pdf._get_and_consolidate_data(dia, dia, id_ponto)
+    if df_dia.empty: return fragmento
+
+    status = gerador_pdf._resumo_status_da_serie(id_ponto, dia, dia)
+    if status is None:
+        # Dias anteriores à série de risco: reconstrói pelo log de eventos
+        status = gerador_pdf._extrair_resumo_status(data_source.ler_logs_eventos(id_ponto), dia, dia)
+
+    nome_ponto = PONTOS_DE_ANALISE.get(id_ponto, {}).get("nome", "Desconhecido")
+    registros = df_dia[['timestamp_local', 'chuva_mm'] + COLUNAS_UMIDADE].copy()
+    registros['timestamp_local'] = registros['timestamp_local'].map(lambda ts: ts.isoformat())
+    fragmento.update({
+        "estatisticas": _estatisticas(df_dia),
+        "status": status,
+        "registros": registros.to_dict('list'),
+        "imagem": gerador_pdf.renderizar_grafico_dia(df_dia, nome_ponto),
+    })
+    return fragmento
+
+
+def gravar(fragmento):
+    """ Imagem primeiro, JSON por último (o JSON com a versão é o que torna o fragmento válido). """
+    arquivo_meta, arquivo_imagem = _caminhos(fragmento["id_ponto"], fragmento["dia"])
+    if fragmento["imagem"] is not None:
+        with open(arquivo_imagem + ".tmp", 'wb') as f:
+            f.write(fragmento["imagem"])
+        os.replace(arquivo_imagem + ".tmp", arquivo_imagem)
+    meta = {k: v for k, v in fragmento.items() if k != "imagem"}
+    with open(arquivo_meta + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(arquivo_meta + ".tmp", arquivo_meta)
+
+
+def _ler_meta(id_ponto, dia):
+    arquivo_meta, _ = _caminhos(id_ponto, dia)
+    if not os.path.exists(arquivo_meta): return None
+    try:
+        with open(arquivo_meta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # Arquivo corrompido: é refeito
+
+
+def carregar(id_ponto, dia, versao):
+    """ Fragmento gravado para essa versão dos dados, ou None (ausente ou desatualizado). """
+    meta = _ler_meta(id_ponto, dia)
+    if meta is None or meta.get("versao") != versao: return None
+    meta["imagem"] = None
+    if meta["estatisticas"] is not None:
+        _, arquivo_imagem = _caminhos(id_ponto, dia)
+        try:
+            with open(arquivo_imagem, 'rb') as f:
+                meta["imagem"] = f.read()
+        except OSError:
+            return None
+    return meta
+
+
+def obter(id_ponto, dia):
+    """ Fragmento atualizado do dia: do disco se ainda vale; senão é calculado (e gravado, se o dia já fechou). """
+    versao = versao_do_dia(id_ponto, dia)
+    fragmento = carregar(id_ponto, dia, versao)
+    if fragmento is not None: return fragmento
+    fragmento = calcular(id_ponto, dia, versao)
+    if dia < _hoje_local():
+        try:
+            gravar(fragmento)
+        except Exception as e:
+            data_source.adicionar_log("RELATORIOS", f"Erro ao gravar fragmento {id_ponto} {dia}: {e}", level="WARN",
+                                      salvar_arquivo=False)
+    return fragmento
+
+
+def obter_periodo(id_ponto, start_date, end_date, progresso=None):
+    """ Fragmentos de cada dia do período (datas locais inclusivas), em ordem. progresso(fração 0..1). """
+    dias = [dia.strftime('%Y-%m-%d') for dia in pd.date_range(pd.to_datetime(start_date), pd.to_datetime(end_date))]
+    fragmentos = []
+    for i, dia in enumerate(dias):
+        fragmentos.append(obter(id_ponto, dia))
+        if progresso: progresso((i + 1) / len(dias))
+    return fragmentos
+
+
+def _precisa_conferir(id_ponto, dia):
+    """ Dia nunca conferido neste processo, ou marcado como alterado depois da última conferência. """
+    conferido_em = _CONFERIDOS.get((id_ponto, dia))
+    return conferido_em is None or data_source.dia_alterado_em(id_ponto, dia) >= conferido_em
+
+
+def atualizar_dias_fechados(dias=FRAGMENTOS_DIAS_RETROATIVOS, maximo=FRAGMENTOS_MAX_POR_CICLO):
+    """
+    Chamado pela rodada de relatórios do worker: renderiza os fragmentos ausentes ou desatualizados dos
+    últimos 'dias' dias fechados (do mais recente para trás), no máximo 'maximo' por rodada.
+    Dias já conferidos e não alterados desde então não custam consulta ao banco.
+    """
+    global _ULTIMA_VERIFICACAO_COMPLETA
+    feitos = 0
+    try:
+        if time.time() - _ULTIMA_VERIFICACAO_COMPLETA >= FRAGMENTOS_VERIFICACAO_COMPLETA_SEC:
+            _CONFERIDOS.clear()
+            _ULTIMA_VERIFICACAO_COMPLETA = time.time()
+
+        hoje = pd.Timestamp.now(tz=FUSO_LOCAL).normalize().tz_localize(None)
+        pendentes = [((hoje - pd.Timedelta(days=atraso)).strftime('%Y-%m-%d'), id_ponto)
+                     for atraso in range(1, dias + 1) for id_ponto in PONTOS_DE_ANALISE.keys()]
+        for dia, id_ponto in pendentes:
+            if feitos >= maximo: break
+            if not _precisa_conferir(id_ponto, dia): continue
+            conferido_em = time.time()  # Antes da leitura: gravação durante a conferência marca o dia de novo
+            versao = versao_do_dia(id_ponto, dia)
+            meta = _ler_meta(id_ponto, dia)
+            if meta is None or meta.get("versao") != versao:
+                gravar(calcular(id_ponto, dia, versao))
+                feitos += 1
+            _CONFERIDOS[(id_ponto, dia)] = conferido_em
+    except Exception as e:
+        data_source.adicionar_log("RELATORIOS", f"Erro ao pré-renderizar fragmentos diários: {e}", level="ERROR")
+        traceback.print_exc()
+    if feitos:
+        data_source.adicionar_log("RELATORIOS", f"{feitos} fragmento(s) diário(s) de relatório renderizado(s).",
+                                  salvar_arquivo=False)
+    return feitos
@@ -3,64 +3,59 @@ from fpdf import FPDF
 from datetime import datetime
 import pandas as pd
 import matplotlib.pyplot as plt
-import threading
-import traceback
 import matplotlib
+import matplotlib.dates
 import numpy as np
 import re
+import os
+import uuid
+import threading
+import warnings
+import xlsxwriter
 
 matplotlib.use('Agg')
 
-# ==============================================================================
-# --- DEFINIÇÕES DE CACHE E LOCKS ---
-# ==============================================================================
-
-PDF_CACHE = {}
-PDF_CACHE_LOCK = threading.Lock()
-EXCEL_CACHE = {}
-EXCEL_CACHE_LOCK = threading.Lock()
-
 import data_source
-from config import PONTOS_DE_ANALISE, RISCO_MAP, STATUS_MAP_HIERARQUICO, CORES_ALERTAS_CSS
+import processamento
+import qualidade
+from config import (PONTOS_DE_ANALISE, RISCO_MAP, STATUS_MAP_HIERARQUICO, CORES_ALERTAS_CSS, EXPORTACOES_DIR,
+                    FUSO_LOCAL, COLUNAS_UMIDADE)
 
 
-def _get_and_consolidate_data(start_date, end_date, id_ponto):
-    start_dt = pd.to_datetime(start_date).tz_localize('America/Sao_Paulo').tz_convert('UTC')
-    end_dt = (pd.to_datetime(end_date) + pd.Timedelta(days=1)).tz_localize('America/Sao_Paulo').tz_convert('UTC')
+def periodo_utc(start_date, end_date):
+    """ Datas locais do seletor (início e fim inclusivos) -> intervalo UTC [início, fim). """
+    start_dt = pd.to_datetime(start_date).tz_localize(FUSO_LOCAL).tz_convert('UTC')
+    end_dt = (pd.to_datetime(end_date) + pd.Timedelta(days=1)).tz_localize(FUSO_LOCAL).tz_convert('UTC')
+    return start_dt, end_dt
 
-    cols_necessarias = [
-        'timestamp', 'id_ponto', 'chuva_mm', 'precipitacao_acumulada_mm',
-        'umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc'
-    ]
 
-    df_brutos = data_source.read_data_from_sqlite(
-        id_ponto=id_ponto,
-        start_dt=start_dt,
-        end_dt=end_dt,
-        colunas=cols_necessarias
-    )
+COLUNAS_CONSOLIDACAO = [
+    'timestamp', 'id_ponto', 'chuva_mm',
+    'umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc', 'qc_umidade'
+]
 
-    if df_brutos.empty: return pd.DataFrame()
 
-    cols_para_numeric = ['chuva_mm', 'precipitacao_acumulada_mm', 'umidade_1m_perc', 'umidade_2m_perc',
-                         'umidade_3m_perc']
+def _consolidar_10min(df_brutos, slot_inicial=None, umidade_anterior=None):
+    """
+    Leituras brutas -> série local de 10 min (chuva somada, umidade média preenchida para frente).
+    slot_inicial / umidade_anterior: continuação de um lote anterior (a série começa no slot
+    seguinte a slot_inicial, e a umidade anterior preenche o início do lote).
+    """
+    df_brutos = qualidade.mascarar_umidade(df_brutos)  # Leituras reprovadas no QC não entram no relatório
+
+    cols_para_numeric = ['chuva_mm'] + COLUNAS_UMIDADE
     for col in cols_para_numeric:
         if col in df_brutos.columns:
             df_brutos[col] = pd.to_numeric(df_brutos[col], errors='coerce')
 
     df_brutos = df_brutos.sort_values('timestamp')
 
-    if 'precipitacao_acumulada_mm' in df_brutos.columns:
-        df_brutos['precipitacao_acumulada_mm'] = df_brutos['precipitacao_acumulada_mm'].ffill().fillna(0)
-        df_brutos['chuva_calculada'] = df_brutos['precipitacao_acumulada_mm'].diff().fillna(0)
-        mask_virada = df_brutos['chuva_calculada'] < 0
-        df_brutos.loc[mask_virada, 'chuva_calculada'] = df_brutos.loc[mask_virada, 'precipitacao_acumulada_mm']
-    else:
-        df_brutos['chuva_calculada'] = df_brutos.get('chuva_mm', 0)
+    # Chuva por leitura já derivada do odômetro na ingestão (worker)
+    df_brutos['chuva_calculada'] = processamento.incremento_chuva_por_ponto(df_brutos)
 
-    df_brutos['timestamp_local'] = df_brutos['timestamp'].dt.tz_convert('America/Sao_Paulo')
+    df_brutos['timestamp_local'] = df_brutos['timestamp'].dt.tz_convert(FUSO_LOCAL)
 
-    df_consolidado = df_brutos.set_index('timestamp_local').resample('10T').agg({
+    df_consolidado = df_brutos.set_index('timestamp_local').resample('10min').agg({
         'chuva_calculada': 'sum',
         'umidade_1m_perc': 'mean',
         'umidade_2m_perc': 'mean',
@@ -68,18 +63,59 @@ def _get_and_consolidate_data(start_date, end_date, id_ponto):
     })
 
     df_consolidado.rename(columns={'chuva_calculada': 'chuva_mm'}, inplace=True)
+    if slot_inicial is not None:
+        df_consolidado = df_consolidado.reindex(pd.date_range(
+            slot_inicial + pd.Timedelta(minutes=10), df_consolidado.index[-1], freq='10min', name='timestamp_local'))
+    if umidade_anterior is not None:
+        df_consolidado.iloc[0] = df_consolidado.iloc[0].fillna(umidade_anterior)
 
-    cols_umidade = ['umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc']
-    df_consolidado[cols_umidade] = df_consolidado[cols_umidade].ffill()
+    df_consolidado[COLUNAS_UMIDADE] = df_consolidado[COLUNAS_UMIDADE].ffill()
     df_consolidado['chuva_mm'] = df_consolidado['chuva_mm'].fillna(0)
     df_consolidado['chuva_mm'] = df_consolidado['chuva_mm'].round(2)
 
     return df_consolidado.reset_index()
 
 
+def _get_and_consolidate_data(start_date, end_date, id_ponto):
+    start_dt, end_dt = periodo_utc(start_date, end_date)
+
+    df_brutos = data_source.read_data_from_sqlite(
+        id_ponto=id_ponto,
+        start_dt=start_dt,
+        end_dt=end_dt,
+        colunas=COLUNAS_CONSOLIDACAO
+    )
+
+    if df_brutos.empty: return pd.DataFrame()
+    return _consolidar_10min(df_brutos)
+
+
+def _lotes_consolidados(start_date, end_date, id_ponto):
+    """
+    A mesma série de _get_and_consolidate_data, produzida lote a lote a partir do cursor do banco.
+    As leituras do último slot de cada lote ficam retidas para o lote seguinte (o slot pode continuar
+    nele) e a umidade segue preenchida para frente de um lote para o outro.
+    """
+    start_dt, end_dt = periodo_utc(start_date, end_date)
+    retido, ultimo_slot, ultima_umidade = None, None, None
+    lotes = data_source.iterar_leituras(id_ponto, start_dt, end_dt, COLUNAS_CONSOLIDACAO)
+    for lote in lotes:
+        if lote.empty: continue
+        if retido is not None: lote = pd.concat([retido, lote], ignore_index=True)
+        slots = lote['timestamp'].dt.floor('10min')
+        retido = lote[slots == slots.iloc[-1]]
+        lote = lote[slots < slots.iloc[-1]]
+        if lote.empty: continue
+        df = _consolidar_10min(lote.copy(), ultimo_slot, ultima_umidade)
+        ultimo_slot, ultima_umidade = df['timestamp_local'].iloc[-1], df[COLUNAS_UMIDADE].iloc[-1]
+        yield df
+    if retido is not None and not retido.empty:
+        yield _consolidar_10min(retido.copy(), ultimo_slot, ultima_umidade)
+
+
 def _extrair_resumo_status(logs_raw, start_date_str, end_date_str):
     if not logs_raw:
-        return ["Nenhum registro de mudança de status encontrado no sistema."]
+        return []
 
     mudancas = []
     dt_inicio = pd.to_datetime(start_date_str).date()
@@ -91,7 +127,7 @@ def _extrair_resumo_status(logs_raw, start_date_str, end_date_str):
                 parts = log.split('|')
                 timestamp_str = parts[0].strip()
                 msg = parts[-1].strip()
-                dt_log = pd.to_datetime(timestamp_str).tz_convert('America/Sao_Paulo')
+                dt_log = pd.to_datetime(timestamp_str).tz_convert(FUSO_LOCAL)
                 if dt_inicio <= dt_log.date() <= dt_fim:
                     data_fmt = dt_log.strftime('%d/%m %H:%M')
                     match = re.search(r'\((.*?)\).*de (\w+) para (\w+)', msg, re.IGNORECASE)
@@ -106,34 +142,130 @@ def _extrair_resumo_status(logs_raw, start_date_str, end_date_str):
             except:
                 continue
 
-    if not mudancas:
-        return ["Sem alterações de status registradas neste período."]
-
     return mudancas
 
 
-def criar_relatorio_excel_em_memoria(df_consolidado, nome_ponto):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df_relatorio = df_consolidado.rename(columns={
-            'timestamp_local': 'Data e Hora (Local)', 'chuva_mm': 'Chuva (mm)',
-            'umidade_1m_perc': 'Umidade 1m (%)', 'umidade_2m_perc': 'Umidade 2m (%)',
-            'umidade_3m_perc': 'Umidade 3m (%)'
-        })
-        colunas_export = ['Data e Hora (Local)', 'Chuva (mm)', 'Umidade 1m (%)', 'Umidade 2m (%)', 'Umidade 3m (%)']
-        df_relatorio = df_relatorio[colunas_export]
-        df_relatorio['Data e Hora (Local)'] = df_relatorio['Data e Hora (Local)'].dt.strftime('%Y-%m-%d %H:%M:%S')
-
-        df_relatorio.to_excel(writer, index=False, sheet_name=f'Dados_{nome_ponto}')
-        worksheet = writer.sheets[f'Dados_{nome_ponto}']
-        for i, col in enumerate(df_relatorio.columns):
-            max_len = df_relatorio[col].astype(str).map(len).max()
-            column_len = max(max_len, len(col)) + 2
-            worksheet.set_column(i, i, column_len)
-    return output.getvalue()
-
-
-def criar_relatorio_pdf_em_memoria(df_consolidado, periodo_str, nome_ponto, logs_status_periodo):
+def mudancas_de_status(df_serie):
+    """ [(timestamp, texto)] das mudanças de nível (chuva e umidade) na série de risco de UMA estação. """
+    mudancas = []
+    for coluna, tipo in (('nivel_chuva', 'Chuva'), ('nivel_umidade', 'Umidade')):
+        niveis = df_serie[coluna].astype(int)
+        if tipo == 'Umidade' and (niveis < 0).all():
+            continue  # Estação sem sensores de umidade
+        mudou = niveis.ne(niveis.shift(1)) & niveis.shift(1).notna()
+        for idx in np.flatnonzero(mudou.to_numpy()):
+            data_fmt = df_serie['timestamp'].iloc[idx].tz_convert(FUSO_LOCAL).strftime('%d/%m %H:%M')
+            de_status = STATUS_MAP_HIERARQUICO[niveis.iloc[idx - 1]][0]
+            para_status = STATUS_MAP_HIERARQUICO[niveis.iloc[idx]][0]
+            mudancas.append((df_serie['timestamp'].iloc[idx], f"[{data_fmt}] {tipo}: {de_status} -> {para_status}"))
+    return sorted(mudancas, key=lambda item: item[0])
+
+
+def _resumo_status_da_serie(id_ponto, start_date, end_date):
+    """
+    Mudanças de status do período a partir da série de risco gravada pelo worker (consulta por faixa
+    no índice id_ponto+timestamp). Retorna None se a série não cobre o período (cai no log de eventos).
+    """
+    start_dt, end_dt = periodo_utc(start_date, end_date)
+    # Um slot antes do início: a primeira linha do período só conta como mudança se diferir do anterior
+    df_serie = data_source.read_serie_risco(id_ponto, start_dt - pd.Timedelta(minutes=10), end_dt)
+    if df_serie.empty:
+        return None
+    return [texto for _, texto in mudancas_de_status(df_serie)]
+
+
+# (coluna, cabeçalho, largura fixa): sem varrer todas as células para medir a largura
+COLUNAS_EXPORTACAO = [
+    ('timestamp_local', 'Data e Hora (Local)', 21), ('chuva_mm', 'Chuva (mm)', 12),
+    ('umidade_1m_perc', 'Umidade 1m (%)', 16), ('umidade_2m_perc', 'Umidade 2m (%)', 16),
+    ('umidade_3m_perc', 'Umidade 3m (%)', 16),
+]
+
+
+def escrever_aba(workbook, nome_aba, lotes):
+    """ Uma aba de dados (COLUNAS_EXPORTACAO) escrita linha a linha a partir dos lotes; retorna o nº de linhas. """
+    worksheet = workbook.add_worksheet(nome_aba[:31])
+    formato_cabecalho = workbook.add_format({'bold': True, 'border': 1, 'align': 'center'})
+    formato_data = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+    for i, (_, cabecalho, largura) in enumerate(COLUNAS_EXPORTACAO):
+        worksheet.set_column(i, i, largura)
+        worksheet.write(0, i, cabecalho, formato_cabecalho)
+    linha = 1
+    for df in lotes:
+        datas = df['timestamp_local'].dt.tz_localize(None).dt.to_pydatetime()
+        valores = df[[coluna for coluna, _, _ in COLUNAS_EXPORTACAO[1:]]].astype(object)
+        valores = valores.where(valores.notna(), None).to_numpy().tolist()
+        for data, linha_valores in zip(datas, valores):
+            worksheet.write_datetime(linha, 0, data, formato_data)
+            worksheet.write_row(linha, 1, linha_valores)
+            linha += 1
+    return linha - 1
+
+
+def _escrever_xlsx(caminho, nome_ponto, lotes):
+    """ Grava os lotes num .xlsx em modo constant_memory (cada linha vai para o disco ao ser escrita). """
+    workbook = xlsxwriter.Workbook(caminho, {'constant_memory': True})
+    try:
+        return escrever_aba(workbook, f'Dados_{nome_ponto}', lotes)
+    finally:
+        workbook.close()
+
+
+def _escrever_csv(caminho, lotes):
+    """ CSV no padrão do Excel pt-BR (';' e vírgula decimal), lote a lote. """
+    linhas = 0
+    with open(caminho, 'w', encoding='utf-8-sig', newline='') as f:
+        for df in lotes:
+            df = df[[coluna for coluna, _, _ in COLUNAS_EXPORTACAO]].copy()
+            df['timestamp_local'] = df['timestamp_local'].dt.strftime('%Y-%m-%d %H:%M:%S')
+            df.to_csv(f, header=[cabecalho for _, cabecalho, _ in COLUNAS_EXPORTACAO] if linhas == 0 else False,
+                      index=False, sep=';', decimal=',')
+            linhas += len(df)
+    return linhas
+
+
+def novo_arquivo_exportacao(extensao):
+    diretorio = os.path.join(data_source.get_base_path(), EXPORTACOES_DIR)
+    os.makedirs(diretorio, exist_ok=True)
+    return os.path.join(diretorio, f"{uuid.uuid4()}.{extensao}")
+
+
+def exportar_dados(start_date, end_date, id_ponto, formato="xlsx", progresso=None):
+    """
+    Série de 10 min do período exportada em fluxo para um arquivo em EXPORTACOES_DIR: lotes lidos do
+    cursor do banco são consolidados e gravados um a um (memória limitada, qualquer que seja o período).
+    formato: "xlsx" ou "csv". Retorna (caminho do arquivo, nome para download).
+    """
+    progresso = progresso or (lambda fracao, etapa: None)
+    nome_ponto = PONTOS_DE_ANALISE.get(id_ponto, {}).get("nome", "Desconhecido")
+    start_dt, end_dt = periodo_utc(start_date, end_date)
+    caminho = novo_arquivo_exportacao(formato)
+
+    def lotes_com_progresso():
+        for df in _lotes_consolidados(start_date, end_date, id_ponto):
+            feito = (df['timestamp_local'].iloc[-1] - start_dt) / (end_dt - start_dt)
+            progresso(0.05 + 0.9 * min(max(feito, 0.0), 1.0), "Exportando dados")
+            yield df
+
+    try:
+        progresso(0.05, "Lendo dados")
+        if formato == "csv":
+            linhas = _escrever_csv(caminho, lotes_com_progresso())
+        else:
+            linhas = _escrever_xlsx(caminho, nome_ponto, lotes_com_progresso())
+        if linhas == 0: raise Exception("Sem dados no período selecionado.")
+    except BaseException:
+        # Sem dados, erro ou cancelamento: não deixa arquivo parcial no disco
+        if os.path.exists(caminho): os.remove(caminho)
+        raise
+    return caminho, f"Dados_{nome_ponto}_{datetime.now().strftime('%Y%m%d')}.{formato}"
+
+
+def criar_relatorio_pdf_em_memoria(fragmentos, periodo_str, nome_ponto):
+    """
+    PDF do período montado a partir dos fragmentos diários (fragmentos_relatorio): um gráfico-resumo
+    do período (um ponto por dia), a tabela diária, as mudanças de status e os gráficos diários prontos.
+    """
     pdf = FPDF()
     pdf.set_auto_page_break(auto=True, margin=15)
     pdf.add_page()
@@ -146,14 +278,35 @@ def criar_relatorio_pdf_em_memoria(df_consolidado, periodo_str, nome_ponto, logs
     pdf.cell(0, 5, f"Gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", ln=True, align="C")
     pdf.ln(5)
 
-    # --- GRÁFICOS ---
+    # --- GRÁFICO-RESUMO DO PERÍODO ---
     try:
-        fig_chuva, fig_umidade = _criar_graficos_pdf(df_consolidado, nome_ponto)
-        _add_matplotlib_fig(pdf, fig_chuva, "Pluviometria", periodo_str)
-        _add_matplotlib_fig(pdf, fig_umidade, "Umidade do Solo", periodo_str)
+        _add_imagem_jpeg(pdf, renderizar_grafico_periodo(fragmentos, nome_ponto), "Resumo Diário", periodo_str)
     except Exception as e:
         pdf.cell(0, 5, f"Erro ao gerar gráficos: {str(e)}", ln=True)
 
+    # --- TABELA DIÁRIA ---
+    col_widths = [30, 30, 30, 33, 33, 33]
+    headers = ["Data", "Chuva (mm)", "Máx. 10min", "Umidade 1m", "Umidade 2m", "Umidade 3m"]
+    pdf.set_font("Helvetica", "B", 9)
+    for w, h in zip(col_widths, headers):
+        pdf.cell(w, 7, h, border=1, align="C")
+    pdf.ln()
+    pdf.set_font("Helvetica", "", 8)
+    for fragmento in fragmentos:
+        est = fragmento["estatisticas"]
+        pdf.cell(col_widths[0], 6, pd.to_datetime(fragmento["dia"]).strftime('%d/%m/%Y'), border=1, align="C")
+        if est is None:
+            pdf.cell(sum(col_widths[1:]), 6, "Sem dados", border=1, align="C")
+            pdf.ln()
+            continue
+        pdf.set_font("Helvetica", "B" if est["chuva_total_mm"] > 0 else "", 8)
+        pdf.cell(col_widths[1], 6, f"{est['chuva_total_mm']:.2f}", border=1, align="C")
+        pdf.set_font("Helvetica", "", 8)
+        pdf.cell(col_widths[2], 6, f"{est['chuva_max_10min_mm']:.2f}", border=1, align="C")
+        for k, d in enumerate([1, 2, 3]):
+            media = est[f"umidade_{d}m_media"]
+            pdf.cell(col_widths[3 + k], 6, f"{media:.1f}%" if media is not None else '-', border=1, align="C")
+        pdf.ln()
     pdf.ln(5)
 
     # --- SEÇÃO: HISTÓRICO DE STATUS (SMART PAGE BREAK) ---
@@ -175,6 +328,10 @@ def criar_relatorio_pdf_em_memoria(df_consolidado, periodo_str, nome_ponto, logs
     pdf.set_font("Courier", "", 9)
     largura_util = pdf.w - pdf.l_margin - pdf.r_margin
 
+    logs_status_periodo = [linha for fragmento in fragmentos for linha in fragmento["status"]]
+    if not logs_status_periodo:
+        logs_status_periodo = ["Sem alterações de status registradas neste período."]
+
     for linha_status in logs_status_periodo:
         if "PARALIZAÇÃO" in linha_status.upper() or "ALERTA" in linha_status.upper():
             pdf.set_text_color(200, 0, 0)
@@ -191,13 +348,28 @@ def criar_relatorio_pdf_em_memoria(df_consolidado, periodo_str, nome_ponto, logs
     pdf.set_text_color(0, 0, 0)
     pdf.ln(5)
 
+    # --- GRÁFICOS DIÁRIOS (imagens já renderizadas pelo worker) ---
+    pdf.add_page()
+    pdf.set_font("Helvetica", "B", 12)
+    pdf.cell(0, 10, "Gráficos Diários", ln=True, align="L")
+    for fragmento in fragmentos:
+        if fragmento.get("imagem") is None: continue
+        est = fragmento["estatisticas"]
+        pdf.set_font("Helvetica", "B", 10)
+        pdf.cell(0, 5, f"{pd.to_datetime(fragmento['dia']).strftime('%d/%m/%Y')} - Chuva: "
+                       f"{est['chuva_total_mm']:.2f} mm", ln=True, align="L")
+        with io.BytesIO(fragmento["imagem"]) as img_bytes:
+            pdf.image(img_bytes, x=pdf.l_margin, y=None, w=pdf.w - 2 * pdf.l_margin, type='jpeg')
+        pdf.ln(3)
+
     # --- TABELA DE DADOS ---
     pdf.add_page()
     pdf.set_font("Helvetica", "B", 12)
     pdf.cell(0, 10, "Registros Consolidados (Amostra Recente)", ln=True, align="L")
 
-    df_tabela = df_consolidado.tail(60).copy()
-    df_tabela['timestamp_local'] = df_tabela['timestamp_local'].dt.strftime('%d/%m/%y %H:%M')
+    registros = [pd.DataFrame(f["registros"]) for f in fragmentos if f["registros"]][-2:]
+    df_tabela = pd.concat(registros, ignore_index=True).tail(60)
+    df_tabela['timestamp_local'] = pd.to_datetime(df_tabela['timestamp_local']).dt.strftime('%d/%m/%y %H:%M')
     col_widths = [35, 35, 35, 35, 35]
     headers = ["Data/Hora", "Chuva (mm)", "Umidade 1m", "Umidade 2m", "Umidade 3m"]
 
@@ -229,19 +401,186 @@ def criar_relatorio_pdf_em_memoria(df_consolidado, periodo_str, nome_ponto, logs
                  border=1, align="C")
         pdf.ln()
 
-    return pdf.output(dest='S')
+    return pdf.output()
 
 
-def _add_matplotlib_fig(pdf, fig, base_title, periodo_str):
+# ==============================================================================
+# --- GRÁFICOS (CAMINHO RÁPIDO) ---
+# ==============================================================================
+# - Chuva em degraus (ax.stairs): um único polígono por série, em vez de um Rectangle por barra.
+# - Séries com mais pontos que pixels na largura do eixo são agregadas por pixel (máximo do balde
+#   para a chuva, mínimo/máximo para a umidade): o custo de desenho para de crescer com o período.
+# - Figuras-modelo reaproveitadas (criar figura/eixos/fontes custa mais que desenhar os dados),
+#   margens fixas e sem bbox_inches="tight" (que exige uma passada extra de desenho).
+
+DPI_GRAFICOS = 100
+_MODELOS = {}  # nome -> (fig, eixos), um por processo
+_MODELOS_LOCK = threading.Lock()
+
+
+def _numeros_de_data(serie_timestamps):
+    """ Timestamps (com ou sem fuso) -> números de data do matplotlib (dias, UTC). """
+    serie = pd.Series(serie_timestamps)
+    if serie.dt.tz is not None:
+        serie = serie.dt.tz_convert('UTC').dt.tz_localize(None)
+    return matplotlib.dates.date2num(serie.to_numpy())
+
+
+def _pixels_do_eixo(ax):
+    return max(int(ax.get_position().width * ax.figure.get_figwidth() * DPI_GRAFICOS), 1)
+
+
+def agregar_por_pixel(bordas, valores, n_pixels, modo="max"):
+    """
+    Reduz uma série a no máximo n_pixels baldes consecutivos. bordas: n+1 limites (degraus) ou n
+    posições (linhas). modo "max" (chuva: pico preservado) ou "minmax" (linhas: envelope preservado).
+    Retorna (bordas, valores) já reduzidos; séries curtas voltam intactas.
+    """
+    valores = np.asarray(valores, dtype=float)
+    n = len(valores)
+    if n <= n_pixels: return bordas, valores
+    balde = int(np.ceil(n / n_pixels))
+    n_baldes = int(np.ceil(n / balde))
+    completo = np.full(n_baldes * balde, np.nan)
+    completo[:n] = valores
+    blocos = completo.reshape(n_baldes, balde)
+    bordas = np.asarray(bordas)
+    inicio = bordas[:n][::balde]
+    with np.errstate(all='ignore'), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # Baldes só com NaN (sem leitura)
+        if modo == "minmax":
+            # Dois pontos por balde (mínimo e máximo), na posição do início do balde
+            intercalados = np.column_stack([np.nanmin(blocos, axis=1), np.nanmax(blocos, axis=1)]).ravel()
+            return np.repeat(inicio, 2), intercalados
+        maximos = np.nanmax(blocos, axis=1)
+    return np.append(inicio, bordas[-1]), np.nan_to_num(maximos)
+
+
+def _modelo(nome, criar):
+    """ Figura-modelo já formatada, com os dados da renderização anterior removidos (chamar com o lock). """
+    if nome not in _MODELOS:
+        _MODELOS[nome] = criar()
+    fig, eixos = _MODELOS[nome]
+    for ax in eixos:
+        for artista in list(ax.lines) + list(ax.collections) + list(ax.patches):
+            artista.remove()
+        if ax.get_legend() is not None:
+            ax.get_legend().remove()
+    return fig, eixos
+
+
+def _rasterizar(fig):
+    with io.BytesIO() as img_bytes:
+        fig.savefig(img_bytes, format="jpeg", dpi=DPI_GRAFICOS)
+        return img_bytes.getvalue()
+
+
+def _limite_superior(*series):
+    maximo = max((np.nanmax(s) for s in series if len(s) and not np.isnan(s).all()), default=0.0)
+    return maximo * 1.08 if maximo > 0 else 1.0
+
+
+def _criar_modelo_chuva_umidade(altura, formato_data, localizador=None):
+    """ Dois painéis com o eixo x compartilhado: chuva (+ acumulado no eixo gêmeo) e umidade. """
+    fig, (ax1, ax_umidade) = plt.subplots(2, 1, figsize=(10, altura), sharex=True)
+    ax2 = ax1.twinx()
+    for ax in (ax1, ax_umidade):
+        ax.grid(True, linestyle='--', alpha=0.6)
+    ax2.set_ylabel("Acumulado (mm)", color='#007BFF')
+    ax_umidade.set_ylabel("Umidade do Solo (%)")
+    if localizador is not None: ax_umidade.xaxis.set_major_locator(localizador)
+    ax_umidade.xaxis.set_major_formatter(formato_data)
+    ax_umidade.tick_params(axis='x', labelsize=8)
+    fig.subplots_adjust(left=0.08, right=0.92, top=0.92, bottom=0.08, hspace=0.12)
+    return fig, (ax1, ax2, ax_umidade)
+
+
+def _desenhar_chuva_umidade(eixos, bordas_chuva, chuva, posicoes, umidades, rotulo_chuva, rotulo_acumulado,
+                            rotulo_umidade=""):
+    """ Preenche um modelo de _criar_modelo_chuva_umidade. umidades: {profundidade: valores}. """
+    ax1, ax2, ax_umidade = eixos
+    chuva = np.nan_to_num(np.asarray(chuva, dtype=float))
+    acumulado = chuva.cumsum()
+
+    bordas_ag, chuva_ag = agregar_por_pixel(bordas_chuva, chuva, _pixels_do_eixo(ax1), modo="max")
+    ax1.stairs(chuva_ag, bordas_ag, fill=True, color='#2C3E50', alpha=0.8, label=rotulo_chuva)
+    pos_ag, acum_ag = agregar_por_pixel(bordas_chuva[1:], acumulado, _pixels_do_eixo(ax1), modo="minmax")
+    ax2.plot(pos_ag, acum_ag, color='#007BFF', linewidth=2, label=rotulo_acumulado)
+    ax1.set_ylabel(rotulo_chuva, color='#2C3E50')
+    ax1.set_ylim(0, _limite_superior(chuva_ag))
+    ax2.set_ylim(0, _limite_superior(acumulado))
+
+    desenhadas = []
+    for d, cor in ((1, 'verde'), (2, 'laranja'), (3, 'vermelho')):
+        valores = np.asarray(umidades.get(d, []), dtype=float)
+        if not len(valores) or np.isnan(valores).all(): continue
+        pos_ag, val_ag = agregar_por_pixel(posicoes, valores, _pixels_do_eixo(ax_umidade), modo="minmax")
+        ax_umidade.plot(pos_ag, val_ag, label=f'{d}m{rotulo_umidade}', color=CORES_ALERTAS_CSS[cor], linewidth=1.5)
+        desenhadas.append(val_ag)
+    if desenhadas:
+        minimo = min(np.nanmin(v) for v in desenhadas)
+        maximo = max(np.nanmax(v) for v in desenhadas)
+        folga = max((maximo - minimo) * 0.08, 0.5)
+        ax_umidade.set_ylim(minimo - folga, maximo + folga)
+        ax_umidade.legend(loc='upper right', ncol=3, fontsize=8)
+    ax_umidade.set_xlim(bordas_chuva[0], bordas_chuva[-1])
+
+    linhas, rotulos = ax1.get_legend_handles_labels()
+    linhas2, rotulos2 = ax2.get_legend_handles_labels()
+    ax2.legend(linhas + linhas2, rotulos + rotulos2, loc='upper left', fontsize=8)
+
+
+def _renderizar_serie_10min(nome_modelo, criar_modelo, df, nome_ponto, rotulo_acumulado):
+    posicoes = _numeros_de_data(df['timestamp_local'])
+    bordas = np.append(posicoes, posicoes[-1] + 1 / 144) if len(posicoes) else posicoes
+    umidades = {d: df[f'umidade_{d}m_perc'] for d in (1, 2, 3) if f'umidade_{d}m_perc' in df.columns}
+    with _MODELOS_LOCK:
+        fig, eixos = _modelo(nome_modelo, criar_modelo)
+        fig.suptitle(f"Estação {nome_ponto}", fontsize=10)
+        _desenhar_chuva_umidade(eixos, bordas, df['chuva_mm'], posicoes, umidades,
+                                "Pluv. (mm/10min)", rotulo_acumulado)
+        return _rasterizar(fig)
+
+
+def renderizar_grafico_dia(df_dia, nome_ponto):
+    """ JPEG do gráfico de um dia (10 min): chuva em degraus + acumulado do dia, e umidade por profundidade. """
+    return _renderizar_serie_10min("dia", lambda: _criar_modelo_chuva_umidade(
+        4.5, matplotlib.dates.DateFormatter('%H:%M', tz=FUSO_LOCAL),
+        matplotlib.dates.HourLocator(byhour=range(0, 24, 3), tz=FUSO_LOCAL)), df_dia, nome_ponto, "Acumulado no Dia")
+
+
+def renderizar_grafico_serie(df_serie, nome_ponto):
+    """ Como renderizar_grafico_dia, para uma série de 10 min de vários dias (eixo x com datas). """
+    def criar():
+        localizador = matplotlib.dates.AutoDateLocator(tz=FUSO_LOCAL)
+        return _criar_modelo_chuva_umidade(
+            4.5, matplotlib.dates.ConciseDateFormatter(localizador, tz=FUSO_LOCAL), localizador)
+    return _renderizar_serie_10min("serie", criar, df_serie, nome_ponto, "Acumulado no Período")
+
+
+def renderizar_grafico_periodo(fragmentos, nome_ponto):
+    """ JPEG do resumo do período com um ponto por dia (chuva diária + acumulado, média diária da umidade). """
+    dias = _numeros_de_data(pd.to_datetime([f["dia"] for f in fragmentos]))
+    estatisticas = [f["estatisticas"] or {} for f in fragmentos]
+    chuva = [e.get("chuva_total_mm", 0.0) for e in estatisticas]
+    umidades = {d: [e.get(f"umidade_{d}m_media") for e in estatisticas] for d in (1, 2, 3)}
+    with _MODELOS_LOCK:
+        fig, eixos = _modelo("periodo", lambda: _criar_modelo_chuva_umidade(
+            7, matplotlib.dates.DateFormatter('%d/%m')))
+        fig.suptitle(f"Chuva e Umidade do Solo - Estação {nome_ponto}", fontsize=12)
+        # Degrau de cada dia centrado na data; a média diária da umidade fica no meio do dia
+        _desenhar_chuva_umidade(eixos, np.append(dias, dias[-1] + 1) - 0.5, chuva, dias, umidades,
+                                "Chuva diária (mm)", "Acumulado no Período", " (média diária)")
+        return _rasterizar(fig)
+
+
+def _add_imagem_jpeg(pdf, imagem, base_title, periodo_str):
     full_title = f"{base_title} {periodo_str}"
     pdf.set_font("Helvetica", "B", 10)
     pdf.cell(0, 5, full_title, ln=True, align="L")
     try:
-        with io.BytesIO() as img_bytes:
-            fig.savefig(img_bytes, format="jpeg", dpi=100, bbox_inches="tight")
-            img_bytes.seek(0)
+        with io.BytesIO(imagem) as img_bytes:
             pdf.image(img_bytes, x=pdf.l_margin, y=None, w=pdf.w - 2 * pdf.l_margin, type='jpeg')
-        plt.close(fig)
         pdf.ln(5)
     except Exception as e:
         pdf.set_font("Helvetica", "I", 10)
@@ -249,92 +588,37 @@ def _add_matplotlib_fig(pdf, fig, base_title, periodo_str):
         pdf.ln(5)
 
 
-def _criar_graficos_pdf(df_consolidado, nome_ponto):
-    fig_chuva, ax1 = plt.subplots(figsize=(10, 5))
-    ax1.bar(df_consolidado['timestamp_local'], df_consolidado['chuva_mm'], color='#2C3E50', alpha=0.8,
-            label='Pluv. (mm/10min)', width=0.005)
-    ax1.set_xlabel("Data e Hora")
-    ax1.set_ylabel("Pluviometria (mm/10min)", color='#2C3E50')
-    ax1.tick_params(axis='x', rotation=45, labelsize=8)
-    ax1.grid(True, linestyle='--', alpha=0.6)
-
-    ax2 = ax1.twinx()
-    df_consolidado['chuva_acum_periodo'] = df_consolidado['chuva_mm'].cumsum()
-    ax2.plot(df_consolidado['timestamp_local'], df_consolidado['chuva_acum_periodo'], color='#007BFF', linewidth=2.5,
-             label='Acumulado no Período')
-    ax2.set_ylabel("Acumulado (mm)", color='#007BFF')
-
-    fig_chuva.suptitle(f"Pluviometria - Estação {nome_ponto}", fontsize=12)
-    lines, labels = ax1.get_legend_handles_labels()
-    lines2, labels2 = ax2.get_legend_handles_labels()
-    ax2.legend(lines + lines2, labels + labels2, loc='upper center', ncol=2, fancybox=True, shadow=True,
-               bbox_to_anchor=(0.5, -0.2))
-    fig_chuva.tight_layout(rect=[0, 0.05, 1, 0.95])
-
-    fig_umidade, ax_umidade = plt.subplots(figsize=(10, 5))
-    tem_dados_umidade = False
-    if 'umidade_1m_perc' in df_consolidado.columns and df_consolidado['umidade_1m_perc'].notna().any():
-        ax_umidade.plot(df_consolidado['timestamp_local'], df_consolidado['umidade_1m_perc'], label='1m',
-                        color=CORES_ALERTAS_CSS['verde'], linewidth=2)
-        tem_dados_umidade = True
-    if 'umidade_2m_perc' in df_consolidado.columns and df_consolidado['umidade_2m_perc'].notna().any():
-        ax_umidade.plot(df_consolidado['timestamp_local'], df_consolidado['umidade_2m_perc'], label='2m',
-                        color=CORES_ALERTAS_CSS['laranja'], linewidth=2)
-        tem_dados_umidade = True
-    if 'umidade_3m_perc' in df_consolidado.columns and df_consolidado['umidade_3m_perc'].notna().any():
-        ax_umidade.plot(df_consolidado['timestamp_local'], df_consolidado['umidade_3m_perc'], label='3m',
-                        color=CORES_ALERTAS_CSS['vermelho'], linewidth=2)
-        tem_dados_umidade = True
-
-    ax_umidade.set_title(f"Variação da Umidade do Solo - Estação {nome_ponto}", fontsize=12)
-    ax_umidade.set_xlabel("Data e Hora")
-    ax_umidade.set_ylabel("Umidade do Solo (%)")
-    ax_umidade.grid(True, linestyle='--', alpha=0.6)
-    ax_umidade.tick_params(axis='x', rotation=45, labelsize=8)
-    if tem_dados_umidade:
-        fig_umidade.legend(loc='upper center', ncol=3, fancybox=True, shadow=True, bbox_to_anchor=(0.5, -0.2))
-    fig_umidade.tight_layout(rect=[0, 0.05, 1, 0.95])
-    return fig_chuva, fig_umidade
-
+def gerar_excel(start_date, end_date, id_ponto, progresso=None):
+    """
+    Planilha do período: retorna (caminho do .xlsx em EXPORTACOES_DIR, nome_arquivo). progresso(fração, etapa),
+    se informado, é chamado entre as etapas (e pode interromper a geração levantando exceção).
+    """
+    return exportar_dados(start_date, end_date, id_ponto, "xlsx", progresso)
 
-def thread_gerar_excel(task_id, start_date, end_date, id_ponto):
-    try:
-        df_consolidado = _get_and_consolidate_data(start_date, end_date, id_ponto)
-        if df_consolidado.empty: raise Exception("Sem dados no período selecionado.")
-        nome_ponto = PONTOS_DE_ANALISE.get(id_ponto, {}).get("nome", "Desconhecido")
-        excel_buffer = criar_relatorio_excel_em_memoria(df_consolidado, nome_ponto)
-        nome_arquivo = f"Dados_{nome_ponto}_{datetime.now().strftime('%Y%m%d')}.xlsx"
-        with EXCEL_CACHE_LOCK:
-            EXCEL_CACHE[task_id] = {"status": "concluido", "data": excel_buffer, "filename": nome_arquivo}
-    except Exception as e:
-        traceback.print_exc()
-        with EXCEL_CACHE_LOCK:
-            EXCEL_CACHE[task_id] = {"status": "erro", "message": str(e)}
 
+def gerar_csv(start_date, end_date, id_ponto, progresso=None):
+    """ Como gerar_excel, em CSV (mais leve para períodos de vários meses). """
+    return exportar_dados(start_date, end_date, id_ponto, "csv", progresso)
 
-def thread_gerar_pdf(task_id, start_date, end_date, id_ponto):
-    try:
-        # 1. Busca os dados numéricos
-        df_consolidado = _get_and_consolidate_data(start_date, end_date, id_ponto)
-        if df_consolidado.empty: raise Exception("Sem dados no período selecionado.")
 
-        # 2. Busca e filtra os logs do período para o cabeçalho
-        logs_raw = data_source.ler_logs_eventos(id_ponto)
-        logs_status_formatados = _extrair_resumo_status(logs_raw, start_date, end_date)
+def gerar_pdf(start_date, end_date, id_ponto, progresso=None):
+    """ Relatório PDF do período: retorna (bytes, nome_arquivo). progresso: como em gerar_excel. """
+    import fragmentos_relatorio  # Import tardio: os fragmentos dependem deste módulo
+    progresso = progresso or (lambda fracao, etapa: None)
 
-        nome_ponto = PONTOS_DE_ANALISE.get(id_ponto, {}).get("nome", "Desconhecido")
-        periodo_str = f"{pd.to_datetime(start_date).strftime('%d/%m/%Y')} a {pd.to_datetime(end_date).strftime('%d/%m/%Y')}"
+    # 1. Fragmentos diários (prontos no disco; só os ausentes/desatualizados e o dia corrente são gerados agora)
+    progresso(0.1, "Lendo fragmentos diários")
+    fragmentos = fragmentos_relatorio.obter_periodo(
+        id_ponto, start_date, end_date, progresso=lambda fracao: progresso(0.1 + 0.6 * fracao, "Lendo fragmentos diários"))
+    if not any(f["estatisticas"] for f in fragmentos): raise Exception("Sem dados no período selecionado.")
 
-        # 3. Gera o PDF passando os logs
-        pdf_buffer = criar_relatorio_pdf_em_memoria(df_consolidado, periodo_str, nome_ponto, logs_status_formatados)
+    nome_ponto = PONTOS_DE_ANALISE.get(id_ponto, {}).get("nome", "Desconhecido")
+    periodo_str = f"{pd.to_datetime(start_date).strftime('%d/%m/%Y')} a {pd.to_datetime(end_date).strftime('%d/%m/%Y')}"
 
-        nome_arquivo = f"Relatorio_{nome_ponto}_{datetime.now().strftime('%Y%m%d')}.pdf"
-        with PDF_CACHE_LOCK:
-            PDF_CACHE[task_id] = {"status": "concluido", "data": pdf_buffer, "filename": nome_arquivo}
-    except Exception as e:
-        traceback.print_exc()
-        with PDF_CACHE_LOCK:
-            PDF_CACHE[task_id] = {"status": "erro", "message": f"Erro interno ao gerar PDF: {str(e)}"}
+    # 2. Gráfico-resumo do período + montagem do PDF
+    progresso(0.7, "Gerando gráficos e PDF")
+    pdf_buffer = criar_relatorio_pdf_em_memoria(fragmentos, periodo_str, nome_ponto)
+    return pdf_buffer, f"Relatorio_{nome_ponto}_{datetime.now().strftime('%Y%m%d')}.pdf"
 
 
 def criar_relatorio_logs_em_memoria(nome_ponto, logs_filtrados):
@@ -357,7 +641,7 @@ def criar_relatorio_logs_em_memoria(nome_ponto, logs_filtrados):
             timestamp_str_utc_iso = parts[0].strip()
             ponto_str = parts[1].strip()
             msg_str = "|".join(parts[2:]).strip()
-            dt_local = pd.to_datetime(timestamp_str_utc_iso).tz_convert('America/Sao_Paulo')
+            dt_local = pd.to_datetime(timestamp_str_utc_iso).tz_convert(FUSO_LOCAL)
             timestamp_formatado = dt_local.strftime('%d/%m/%Y %H:%M:%S')
             cor = (0, 0, 0)
             if "ERRO" in msg_str:
@@ -373,4 +657,4 @@ def criar_relatorio_logs_em_memoria(nome_ponto, logs_filtrados):
             pdf.set_text_color(0, 0, 0)
             pdf.set_x(pdf.l_margin)
             pdf.multi_cell(largura, 5, log_str_sanitizado + "\n")
-    return pdf.output(dest='S')
\ No newline at end of file
+    return pdf.output()
\ No newline at end of file
@@ -2,29 +2,17 @@ import dash
 from dash import html, dcc, callback, Input, Output, State
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
-import pandas as pd
-from io import StringIO
 import os
-import json
+import uuid
 from dotenv import load_dotenv
-import time
 from threading import Thread
-import datetime
-from httpx import HTTPStatusError
-import traceback
-import sqlite3
-import sys
 
 load_dotenv()
 
 from app import app, server
 from pages import login as login_page, main_app as main_app_page, map_view, general_dash, specific_dash
 import data_source
-import config
-import processamento
-import alertas
-from config import PONTOS_DE_ANALISE, RISCO_MAP, FREQUENCIA_API_SEGUNDOS, ID_PONTO_ZENTRA_KM72, CONSTANTES_PADRAO
-from config import RENDER_SLEEP_TIME_SEC
+from config import INGESTAO_EMBUTIDA
 
 SENHA_CLIENTE = '@Tamoiosv1'
 SENHA_ADMIN = 'admin456'
@@ -34,176 +22,6 @@ data_source.setup_disk_paths()
 data_source.initialize_database()
 
 
-def get_first_valid(series):
-    """
-    Retorna o primeiro valor VÁLIDO (não nulo).
-    Isso impede que um NaN novo apague um número antigo no banco.
-    """
-    valid_values = series.dropna()
-    if not valid_values.empty:
-        return valid_values.iloc[0]
-    return None
-
-
-# --- FUNÇÕES DO WORKER ---
-
-def worker_verificar_alertas(status_novos, status_antigos):
-    if not status_novos: return status_antigos
-    if not isinstance(status_antigos, dict): status_antigos = {}
-    status_atualizado = status_antigos.copy()
-    for id_ponto in PONTOS_DE_ANALISE.keys():
-        status_novo_ponto = status_novos.get(id_ponto, {"chuva": "SEM DADOS", "umidade": "SEM DADOS"})
-        status_antigo_ponto = status_antigos.get(id_ponto, {"chuva": "INDEFINIDO", "umidade": "INDEFINIDO"})
-        if not isinstance(status_antigo_ponto, dict): status_antigo_ponto = {"chuva": "INDEFINIDO",
-                                                                             "umidade": "INDEFINIDO"}
-
-        if status_novo_ponto.get("chuva") != status_antigo_ponto.get("chuva"):
-            nome_ponto = PONTOS_DE_ANALISE[id_ponto]['nome']
-            msg = f"MUDANÇA DE STATUS (Chuva): {nome_ponto} de {status_antigo_ponto.get('chuva')} para {status_novo_ponto.get('chuva')}."
-            data_source.adicionar_log(id_ponto, msg, level="WARN", salvar_arquivo=True)
-
-        if id_ponto == ID_PONTO_ZENTRA_KM72:
-            if status_novo_ponto.get("umidade") != status_antigo_ponto.get("umidade"):
-                nome_ponto = PONTOS_DE_ANALISE[id_ponto]['nome']
-                msg = f"MUDANÇA DE STATUS (Umidade): {nome_ponto} de {status_antigo_ponto.get('umidade')} para {status_novo_ponto.get('umidade')}."
-                data_source.adicionar_log(id_ponto, msg, level="WARN", salvar_arquivo=True)
-
-        status_atualizado[id_ponto] = status_novo_ponto
-    return status_atualizado
-
-
-def worker_main_loop(memoria_worker):
-    inicio_ciclo = time.time()
-    try:
-        data_source.adicionar_log("WORKER", "Início do ciclo de processamento.", salvar_arquivo=False)
-
-        # OTIMIZAÇÃO: Carrega apenas colunas vitais e reais (sem base_Xm)
-        cols_necessarias_worker = [
-            'timestamp', 'id_ponto', 'chuva_mm', 'precipitacao_acumulada_mm',
-            'umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc'
-        ]
-
-        # 1. Busca histórico
-        historico_recente_df = data_source.get_recent_data_for_worker(
-            hours=75,
-            colunas=cols_necessarias_worker
-        )
-
-        status_antigos_do_disco = data_source.get_status_from_disk()
-
-        # 2. Coleta Novos Dados
-        novos_dados_chuva_df, novos_acumulados_chuva = data_source.fetch_data_from_weatherlink_api()
-        df_umidade_incremental = data_source.fetch_data_from_zentra_cloud()
-
-        # 3. Merge com Proteção
-        df_combinado = pd.concat([novos_dados_chuva_df, df_umidade_incremental, historico_recente_df],
-                                 ignore_index=True)
-        df_combinado['timestamp'] = pd.to_datetime(df_combinado['timestamp'], errors='coerce')
-        df_combinado.dropna(subset=['timestamp'], inplace=True)
-
-        numeric_cols = ['chuva_mm', 'precipitacao_acumulada_mm', 'umidade_1m_perc', 'umidade_2m_perc',
-                        'umidade_3m_perc']
-        for col in numeric_cols:
-            if col in df_combinado.columns:
-                df_combinado[col] = pd.to_numeric(df_combinado[col], errors='coerce')
-
-        # Proteção contra overwrite
-        agg_funcs = {col: get_first_valid for col in df_combinado.columns if col not in ['timestamp', 'id_ponto']}
-        df_final = df_combinado.groupby(['timestamp', 'id_ponto'], as_index=False).agg(agg_funcs)
-
-        # --- CORREÇÃO CRÍTICA AQUI ---
-        # Usamos upsert_data para substituir os dados antigos pelos novos (corrigidos/mergeados)
-        # em vez de adicionar duplicatas infinitas.
-        data_source.upsert_data(df_final)
-        # -----------------------------
-
-        # 5. Cálculo de Status
-        historico_para_calculo = df_final.sort_values('timestamp').reset_index(drop=True)
-        status_atualizado = {}
-
-        if not historico_para_calculo.empty:
-            for id_ponto in PONTOS_DE_ANALISE.keys():
-                df_ponto = historico_para_calculo[historico_para_calculo['id_ponto'] == id_ponto].copy()
-                ponto_info = {"chuva": "SEM DADOS", "umidade": "SEM DADOS", "chuva_72h": 0.0, "umidade_1m": None,
-                              "umidade_2m": None, "umidade_3m": None, "timestamp_local": None}
-
-                if df_ponto.empty:
-                    status_atualizado[id_ponto] = ponto_info
-                    continue
-
-                # Chuva
-                acumulado_72h = processamento.calcular_acumulado_rolling(df_ponto, horas=72)
-                chuva_72h_final = acumulado_72h['chuva_mm'].iloc[-1] if not acumulado_72h.empty else 0.0
-                ponto_info['chuva_72h'] = round(chuva_72h_final, 1) if pd.notna(chuva_72h_final) else 0.0
-                status_chuva, _ = processamento.definir_status_chuva(ponto_info['chuva_72h'])
-                ponto_info['chuva'] = status_chuva
-
-                # Umidade (Apenas KM 72)
-                if id_ponto == ID_PONTO_ZENTRA_KM72:
-                    cols_umidade = ['umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc']
-                    df_com_umidade = df_ponto.dropna(subset=cols_umidade, how='all')
-
-                    if not df_com_umidade.empty:
-                        ultima_leitura_valida = df_com_umidade.sort_values('timestamp').iloc[-1]
-                        ts_leitura = ultima_leitura_valida['timestamp']
-                        agora = pd.Timestamp.now(tz='UTC')
-                        if (agora - ts_leitura) < pd.Timedelta(hours=3):
-                            ponto_info['umidade_1m'] = round(ultima_leitura_valida.get('umidade_1m_perc'),
-                                                             1) if pd.notna(
-                                ultima_leitura_valida.get('umidade_1m_perc')) else None
-                            ponto_info['umidade_2m'] = round(ultima_leitura_valida.get('umidade_2m_perc'),
-                                                             1) if pd.notna(
-                                ultima_leitura_valida.get('umidade_2m_perc')) else None
-                            ponto_info['umidade_3m'] = round(ultima_leitura_valida.get('umidade_3m_perc'),
-                                                             1) if pd.notna(
-                                ultima_leitura_valida.get('umidade_3m_perc')) else None
-                            ponto_info['timestamp_local'] = ts_leitura.tz_convert('America/Sao_Paulo').isoformat()
-
-                            bases = {f'base_{d}m': CONSTANTES_PADRAO[f'UMIDADE_BASE_{d}M'] for d in [1, 2, 3]}
-                            for d in [1, 2, 3]:
-                                if pd.isna(bases[f'base_{d}m']): bases[f'base_{d}m'] = CONSTANTES_PADRAO[
-                                    f'UMIDADE_BASE_{d}M']
-
-                            status_umidade_tuple = processamento.definir_status_umidade_hierarquico(
-                                ponto_info['umidade_1m'], ponto_info['umidade_2m'], ponto_info['umidade_3m'], **bases)
-                            ponto_info['umidade'] = status_umidade_tuple[0] if status_umidade_tuple[
-                                                                                   0] != "SEM DADOS" else "LIVRE"
-                        else:
-                            ponto_info['umidade'] = "SEM DADOS"
-                    else:
-                        ponto_info['umidade'] = "SEM DADOS"
-                else:
-                    ponto_info['umidade'] = "SEM DADOS"
-
-                status_atualizado[id_ponto] = ponto_info
-
-        status_final_completo = worker_verificar_alertas(status_atualizado, status_antigos_do_disco)
-        data_source.write_with_timeout(data_source.STATUS_FILE, status_final_completo, timeout=20)
-        data_source.adicionar_log("WORKER", f"Ciclo concluído em {time.time() - inicio_ciclo:.2f}s.",
-                                  salvar_arquivo=False)
-        return True, memoria_worker
-    except Exception as e:
-        data_source.adicionar_log("WORKER", f"ERRO CRÍTICO NO CICLO: {e}", level="ERROR")
-        traceback.print_exc()
-        return False, memoria_worker
-
-
-def background_task_wrapper():
-    data_source.adicionar_log("SISTEMA", "Processo Worker (Thread) iniciado.", salvar_arquivo=False)
-    time.sleep(RENDER_SLEEP_TIME_SEC)
-    memoria_worker = {}
-    INTERVALO_EM_SEGUNDOS = config.FREQUENCIA_API_SEGUNDOS
-    while True:
-        sucesso, memoria_worker = worker_main_loop(memoria_worker)
-        if not sucesso:
-            data_source.adicionar_log("SISTEMA", f"Ciclo do worker falhou. Reiniciando em {RENDER_SLEEP_TIME_SEC}s.",
-                                      level="ERROR")
-            time.sleep(RENDER_SLEEP_TIME_SEC)
-            continue
-        data_source.adicionar_log("WORKER", f"Dormindo por {INTERVALO_EM_SEGUNDOS}s...", salvar_arquivo=False)
-        time.sleep(INTERVALO_EM_SEGUNDOS)
-
-
 # --- APP E CALLBACKS ---
 
 app.layout = html.Div([
@@ -240,8 +58,9 @@ def login_callback(n_clicks, n_submit, password):
     if not (n_clicks or n_submit): raise PreventUpdate
     if not password: return dash.no_update, "Por favor, digite a senha.", "text-danger mb-3 text-center", ""
     password = password.strip()
-    if password == SENHA_ADMIN: return {'logged_in': True, 'user_type': 'admin'}, "", "", ""
-    if password == SENHA_CLIENTE: return {'logged_in': True, 'user_type': 'client'}, "", "", ""
+    # sessao_id: identifica a sessão (ex.: limite de relatórios simultâneos por usuário)
+    if password == SENHA_ADMIN: return {'logged_in': True, 'user_type': 'admin', 'sessao_id': str(uuid.uuid4())}, "", "", ""
+    if password == SENHA_CLIENTE: return {'logged_in': True, 'user_type': 'client', 'sessao_id': str(uuid.uuid4())}, "", "", ""
     return dash.no_update, "Senha incorreta.", "text-danger mb-3 text-center", ""
 
 
@@ -266,26 +85,25 @@ def update_status_and_logs_from_disk(n_intervals):
 
 
 def iniciar_worker_automatico():
+    """
+    Por padrão o processo web é apenas LEITOR: a ingestão roda em 'python worker.py'.
+    INGESTAO_EMBUTIDA=1 mantém o modo antigo (thread dentro do Dash) para deploys de processo único;
+    mesmo assim só um processo vira líder (lock), então vários workers do gunicorn não duplicam coletas.
+    """
+    if not INGESTAO_EMBUTIDA:
+        data_source.adicionar_log("SISTEMA", "Processo web em modo leitura (ingestão em worker.py).",
+                                  salvar_arquivo=False)
+        return
     if not os.environ.get("WERKZEUG_MAIN"):
-        data_source.adicionar_log("SISTEMA", "Inicializando Worker em Thread (Global Scope).", salvar_arquivo=False)
-        t = Thread(target=background_task_wrapper, daemon=True)
+        import worker
+        data_source.adicionar_log("SISTEMA", "Inicializando Worker em Thread (modo embutido).", salvar_arquivo=False)
+        t = Thread(target=worker.background_task_wrapper, daemon=True)
         t.start()
 
 
 iniciar_worker_automatico()
 
 if __name__ == '__main__':
-    args = sys.argv
-    if len(args) > 1 and args[1].lower() == 'backfill':
-        if len(args) != 4:
-            print("Uso: python index.py backfill <ID> <DIAS>")
-        else:
-            id_ponto = args[2]
-            try:
-                dias = int(args[3])
-                print("Backfill manual")
-            except Exception as e:
-                print(f"Erro backfill: {e}")
-    else:
-        data_source.adicionar_log("SISTEMA", "Iniciando servidor Dash Localmente...", salvar_arquivo=False)
-        app.run(debug=True, host='127.0.0.1', port=8050, use_reloader=False)
\ No newline at end of file
+    # Backfill manual: python worker.py backfill <ID> <DIAS>
+    data_source.adicionar_log("SISTEMA", "Iniciando servidor Dash Localmente...", salvar_arquivo=False)
+    app.run(debug=True, host='127.0.0.1', port=8050, use_reloader=False)
@@ -0,0 +1,280 @@
+# lacunas.py (Índice de lacunas da grade de 10 min + backfill direcionado em segundo plano)
+
+import threading
+import time
+import traceback
+import numpy as np
+import pandas as pd
+
+import data_source
+import serie_risco
+import qualidade
+from config import (
+    PONTOS_DE_ANALISE,
+    LACUNAS_JANELA_HORAS, LACUNAS_TOLERANCIA_MIN,
+    BACKFILL_RUN_TIME_SEC, BACKFILL_MAX_TENTATIVAS, BACKFILL_INTERVALO_REQ_SEC,
+    FUSO_LOCAL, COLUNAS_UMIDADE
+)
+
+# ==============================================================================
+# --- ÍNDICE DE LACUNAS ---
+# ==============================================================================
+# { (id_ponto, tipo): [ {"inicio": Timestamp, "fim": Timestamp, "tentativas": int, ...} ] }
+# tipo = "chuva" ou "umidade", conforme o adaptador da fonte (data_source.AdaptadorFonte). 'fim' é o último slot faltante (inclusivo).
+LACUNAS_INDEX = {}
+LACUNAS_LOCK = threading.Lock()
+
+_BACKFILL_EVENTO = threading.Event()
+_BACKFILL_THREAD = None
+
+
+def _fontes_monitoradas():
+    """ Pares (id_ponto, tipo) atendidos por algum adaptador ativo e, portanto, recuperáveis. """
+    return [(id_ponto, tipo) for adaptador in data_source.obter_adaptadores()
+            for tipo in adaptador.tipos for id_ponto in adaptador.pontos() if id_ponto in PONTOS_DE_ANALISE]
+
+
+def _intervalos_da_mascara(grade, faltantes):
+    """ Converte uma máscara booleana sobre a grade em intervalos contíguos (inicio, fim). """
+    if not faltantes.any():
+        return []
+    borda = np.diff(np.concatenate(([0], faltantes.astype(np.int8), [0])))
+    inicios = np.flatnonzero(borda == 1)
+    fins = np.flatnonzero(borda == -1) - 1
+    return [(grade[i], grade[f]) for i, f in zip(inicios, fins)]
+
+
+def _contexto_odometro(df_valido, inicio, fim):
+    """
+    Acumulado diário conhecido imediatamente antes e depois da lacuna (no mesmo dia local).
+    É usado para reconstruir o odômetro dos dados recuperados sem gerar "viradas" falsas.
+    """
+    base, teto = 0.0, None
+    antes = df_valido[df_valido['timestamp'] < inicio]
+    depois = df_valido[df_valido['timestamp'] > fim]
+    dia_inicio = inicio.tz_convert(FUSO_LOCAL).date()
+    dia_fim = fim.tz_convert(FUSO_LOCAL).date()
+    if not antes.empty:
+        ultimo = antes.iloc[-1]
+        if ultimo['timestamp'].tz_convert(FUSO_LOCAL).date() == dia_inicio:
+            base = float(ultimo['precipitacao_acumulada_mm'])
+    if not depois.empty:
+        proximo = depois.iloc[0]
+        if proximo['timestamp'].tz_convert(FUSO_LOCAL).date() == dia_fim:
+            teto = float(proximo['precipitacao_acumulada_mm'])
+    return base, teto
+
+
+def detectar_lacunas(df, agora=None, janela_horas=LACUNAS_JANELA_HORAS):
+    """
+    Varre a grade de 10 min recente de cada estação e retorna as lacunas encontradas.
+    Os slots mais novos que LACUNAS_TOLERANCIA_MIN são ignorados (ainda podem chegar).
+    """
+    if agora is None:
+        agora = pd.Timestamp.now(tz='UTC')
+    fim_grade = (agora - pd.Timedelta(minutes=LACUNAS_TOLERANCIA_MIN)).floor('10min')
+    inicio_grade = (agora - pd.Timedelta(hours=janela_horas)).ceil('10min')
+    grade = pd.date_range(inicio_grade, fim_grade, freq='10min')
+    if grade.empty:
+        return {}
+
+    if df is None or df.empty:
+        df = pd.DataFrame(columns=['timestamp', 'id_ponto', 'precipitacao_acumulada_mm'] + COLUNAS_UMIDADE)
+
+    lacunas = {}
+    for id_ponto, tipo in _fontes_monitoradas():
+        df_ponto = df[df['id_ponto'] == id_ponto]
+        if tipo == "chuva":
+            col = 'precipitacao_acumulada_mm'
+            df_valido = df_ponto[df_ponto[col].notna()] if col in df_ponto.columns else df_ponto.iloc[0:0]
+        else:
+            cols = [c for c in COLUNAS_UMIDADE if c in df_ponto.columns]
+            df_valido = df_ponto[df_ponto[cols].notna().any(axis=1)] if cols else df_ponto.iloc[0:0]
+
+        presentes = pd.DatetimeIndex(df_valido['timestamp']).floor('10min')
+        faltantes = ~grade.isin(presentes)
+        intervalos = _intervalos_da_mascara(grade, np.asarray(faltantes))
+        if not intervalos:
+            continue
+
+        df_valido = df_valido.sort_values('timestamp')
+        registros = []
+        for inicio, fim in intervalos:
+            registro = {"inicio": inicio, "fim": fim, "tentativas": 0}
+            if tipo == "chuva":
+                registro["base_acumulado"], registro["teto_acumulado"] = _contexto_odometro(df_valido, inicio, fim)
+            registros.append(registro)
+        lacunas[(id_ponto, tipo)] = registros
+    return lacunas
+
+
+def atualizar_indice(df, agora=None):
+    """
+    Recalcula o índice a partir da grade recém-gravada pelo worker.
+    Lacunas preenchidas somem; as que persistem mantêm o contador de tentativas, mesmo com limites
+    novos: a lacuna que cresce (estação ainda offline) ou cujo início é cortado pela janela móvel
+    herda as tentativas de toda lacuna anterior da mesma (estação, tipo) que ela sobrepõe.
+    """
+    try:
+        novas = detectar_lacunas(df, agora)
+        with LACUNAS_LOCK:
+            for chave, registros in novas.items():
+                anteriores = LACUNAS_INDEX.get(chave, [])
+                for r in registros:
+                    r["tentativas"] = max((a["tentativas"] for a in anteriores
+                                           if a["inicio"] <= r["fim"] and a["fim"] >= r["inicio"]), default=0)
+            LACUNAS_INDEX.clear()
+            LACUNAS_INDEX.update(novas)
+
+        total = sum(len(v) for v in novas.values())
+        if total:
+            slots = sum(int((r["fim"] - r["inicio"]) / pd.Timedelta(minutes=10)) + 1
+                        for v in novas.values() for r in v)
+            data_source.adicionar_log("LACUNAS", f"{total} lacuna(s) na grade ({slots} slots de 10 min).",
+                                      salvar_arquivo=False)
+        return novas
+    except Exception as e:
+        data_source.adicionar_log("LACUNAS", f"Erro ao atualizar índice de lacunas: {e}", level="ERROR")
+        traceback.print_exc()
+        return {}
+
+
+# ==============================================================================
+# --- BACKFILL DIRECIONADO ---
+# ==============================================================================
+
+def _mesclar_com_banco(df_recuperado, id_ponto, inicio, fim, margem=pd.Timedelta(0)):
+    """
+    Junta o que veio do backfill com o que já existe no banco para os mesmos slots
+    (ex.: KM 72 tem chuva e umidade na mesma linha). O dado recuperado tem prioridade.
+    margem: leituras do banco antes e depois da lacuna que também entram (contexto do QC).
+    """
+    existentes = data_source.read_data_from_sqlite(
+        id_ponto=id_ponto, start_dt=inicio - margem, end_dt=fim + pd.Timedelta(minutes=10) + margem,
+        colunas=data_source.COLUNAS_HISTORICO
+    )
+    df = pd.concat([df_recuperado, existentes], ignore_index=True)
+    # GroupBy.first() pega o primeiro valor NÃO nulo de cada coluna (mesma regra do get_first_valid)
+    return df.groupby(['timestamp', 'id_ponto'], as_index=False).first()
+
+
+def _reconstruir_odometro(df, base, teto):
+    """ Reconstrói precipitacao_acumulada_mm (odômetro diário) a partir da chuva por intervalo. """
+    df = df.sort_values('timestamp').reset_index(drop=True)
+    dia_local = df['timestamp'].dt.tz_convert(FUSO_LOCAL).dt.date
+    acumulado = df.groupby(dia_local)['chuva_mm'].cumsum()
+    acumulado[dia_local == dia_local.iloc[0]] += base
+    if teto is not None:
+        # Nunca ultrapassa a próxima leitura real do mesmo dia (evitaria um diff negativo = "virada" falsa)
+        mask_ultimo_dia = dia_local == dia_local.iloc[-1]
+        acumulado[mask_ultimo_dia] = acumulado[mask_ultimo_dia].clip(upper=teto)
+    df['precipitacao_acumulada_mm'] = acumulado.round(2)
+    return df
+
+
+def preencher_lacuna(id_ponto, tipo, lacuna):
+    """ Executa o backfill de UMA lacuna. Retorna o número de slots gravados. """
+    adaptador = data_source.adaptador_do_ponto(id_ponto, tipo)
+    if adaptador is None:
+        return 0
+
+    inicio, fim = lacuna["inicio"], lacuna["fim"]
+    df_recuperado = adaptador.fetch_range(id_ponto, inicio, fim + pd.Timedelta(minutes=10))
+    if df_recuperado is None or df_recuperado.empty:
+        return 0
+    df_recuperado = df_recuperado[(df_recuperado['timestamp'] >= inicio) & (df_recuperado['timestamp'] <= fim)]
+    if df_recuperado.empty:
+        return 0
+
+    # Fontes de arquivo (ex.: WeatherLink /historic) só trazem a chuva do intervalo: refaz o odômetro
+    if tipo == "chuva" and 'precipitacao_acumulada_mm' not in df_recuperado.columns:
+        df_recuperado = _reconstruir_odometro(df_recuperado, lacuna.get("base_acumulado", 0.0),
+                                              lacuna.get("teto_acumulado"))
+
+    # Leitura do banco -> regravação sob o lock de gravação: não intercala com o ciclo do worker
+    with data_source.GRAVACAO_LOCK:
+        if tipo == "umidade":
+            # Pico, valor travado e entre profundidades dependem das leituras vizinhas: o QC roda com a
+            # margem de contexto lida do banco, mas só as linhas da lacuna são regravadas
+            df_final = qualidade.aplicar_qc(
+                _mesclar_com_banco(df_recuperado, id_ponto, inicio, fim, qualidade.MARGEM_CONTEXTO))
+            df_final = df_final[(df_final['timestamp'] >= inicio) &
+                                (df_final['timestamp'] < fim + pd.Timedelta(minutes=10))]
+        else:
+            df_final = _mesclar_com_banco(df_recuperado, id_ponto, inicio, fim)
+        data_source.upsert_data(df_final, por_ponto=True)
+    return len(df_recuperado)
+
+
+def _pendentes():
+    """ Lacunas ainda recuperáveis, das mais recentes para as mais antigas (status primeiro). """
+    with LACUNAS_LOCK:
+        pendentes = [(p, t, r) for (p, t), registros in LACUNAS_INDEX.items() for r in registros
+                     if r["tentativas"] < BACKFILL_MAX_TENTATIVAS]
+    return sorted(pendentes, key=lambda item: item[2]["fim"], reverse=True)
+
+
+def executar_rodada_backfill(limite_segundos=BACKFILL_RUN_TIME_SEC):
+    """ Processa lacunas pendentes até esgotar o orçamento de tempo da rodada. """
+    inicio_rodada = time.time()
+    for id_ponto, tipo, lacuna in _pendentes():
+        if time.time() - inicio_rodada > limite_segundos:
+            break
+        with LACUNAS_LOCK:
+            lacuna["tentativas"] += 1
+        try:
+            gravados = preencher_lacuna(id_ponto, tipo, lacuna)
+            msg = (f"Backfill ({tipo}) {lacuna['inicio'].isoformat()} -> {lacuna['fim'].isoformat()}: "
+                   f"{gravados} slot(s) recuperado(s).")
+            data_source.adicionar_log(id_ponto, msg, salvar_arquivo=gravados > 0)
+            if gravados > 0:
+                # Os slots recuperados alteram o acumulado das 72h seguintes: refaz esse trecho da série
+                fim_afetado = min(lacuna["fim"] + pd.Timedelta(hours=serie_risco.HORAS_JANELA, minutes=10),
+                                  pd.Timestamp.now(tz='UTC').ceil('10min'))
+                with data_source.GRAVACAO_LOCK:
+                    serie_risco.recalcular(lacuna["inicio"], fim_afetado, id_ponto=id_ponto)
+                # Dias com leituras ou risco possivelmente mudados (margem do QC antes da lacuna)
+                data_source.marcar_dias_alterados(id_ponto, lacuna["inicio"] - qualidade.MARGEM_CONTEXTO, fim_afetado)
+            if gravados == 0 and lacuna["tentativas"] >= BACKFILL_MAX_TENTATIVAS:
+                data_source.adicionar_log(id_ponto, f"Lacuna ({tipo}) sem dados na origem. Desistindo.",
+                                          level="WARN", salvar_arquivo=True)
+        except Exception as e:
+            data_source.adicionar_log(id_ponto, f"Erro no backfill ({tipo}): {e}", level="ERROR")
+            traceback.print_exc()
+        time.sleep(BACKFILL_INTERVALO_REQ_SEC)
+
+
+def _loop_backfill():
+    while True:
+        _BACKFILL_EVENTO.wait()
+        _BACKFILL_EVENTO.clear()
+        executar_rodada_backfill()
+
+
+def iniciar_backfill_em_segundo_plano():
+    """ Sobe (uma única vez) a thread que atende os pedidos de backfill. """
+    global _BACKFILL_THREAD
+    if _BACKFILL_THREAD is not None and _BACKFILL_THREAD.is_alive():
+        return
+    _BACKFILL_THREAD = threading.Thread(target=_loop_backfill, daemon=True, name="backfill-lacunas")
+    _BACKFILL_THREAD.start()
+
+
+def agendar_backfill():
+    """ Sinaliza a thread de backfill. Não bloqueia o ciclo do worker. """
+    if _pendentes():
+        _BACKFILL_EVENTO.set()
+
+
+def backfill_manual(id_ponto, dias):
+    """ Backfill síncrono usado pela linha de comando (python worker.py backfill <ID> <DIAS>). """
+    agora = pd.Timestamp.now(tz='UTC')
+    df = data_source.read_data_from_sqlite(id_ponto=id_ponto, last_hours=dias * 24,
+                                           colunas=data_source.COLUNAS_HISTORICO)
+    lacunas = {k: v for k, v in detectar_lacunas(df, agora, janela_horas=dias * 24).items() if k[0] == id_ponto}
+    total = 0
+    for (ponto, tipo), registros in lacunas.items():
+        for lacuna in registros:
+            total += preencher_lacuna(ponto, tipo, lacuna)
+            time.sleep(BACKFILL_INTERVALO_REQ_SEC)
+    return total
@@ -0,0 +1,39 @@
+# links_download.py (Links assinados e com validade para as rotas de download de arquivos)
+#
+# As rotas Flask que enviam arquivos do disco (/relatorios/...) não passam pelo login do Dash (o estado
+# de login fica no navegador, no session-store). Por isso o link só é gerado por um callback de uma
+# sessão logada e leva um token assinado (itsdangerous, já dependência do Flask) com o que ele libera:
+#   {"rota": "exportacao", "task_id": ..., "usuario": ...}   -> exportação de um job (só do dono)
+#   {"rota": "agendado", "nome": ..., "id_ponto": ...}        -> relatório agendado
+# A rota confere a assinatura, a validade (LINKS_DOWNLOAD_VALIDADE_SEC) e se o token é daquele arquivo.
+
+import os
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+
+import data_source
+from config import LINKS_DOWNLOAD_CHAVE, LINKS_DOWNLOAD_VALIDADE_SEC
+
+_CHAVE = LINKS_DOWNLOAD_CHAVE
+if not _CHAVE:
+    # Sem chave configurada: aleatória por processo (links de um processo não valem em outro)
+    _CHAVE = os.urandom(32).hex()
+    data_source.adicionar_log("SISTEMA", "LINKS_DOWNLOAD_CHAVE não definida: links de download valem só neste "
+                                         "processo.", level="WARN", salvar_arquivo=False)
+
+_ASSINADOR = URLSafeTimedSerializer(_CHAVE, salt="links-download")
+
+
+def assinar(dados):
+    """ Token (para a query string ?t=) com o dicionário 'dados'. """
+    return _ASSINADOR.dumps(dados)
+
+
+def validar(token, esperado, max_age=LINKS_DOWNLOAD_VALIDADE_SEC):
+    """ Conteúdo do token se a assinatura e a validade conferem e ele contém 'esperado'; senão None. """
+    if not token: return None
+    try:
+        dados = _ASSINADOR.loads(token, max_age=max_age)
+    except BadSignature:  # Inclui SignatureExpired
+        return None
+    if not isinstance(dados, dict) or any(dados.get(k) != v for k, v in esperado.items()): return None
+    return dados
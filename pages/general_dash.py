@@ -7,9 +7,11 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
 from app import app, TEMPLATE_GRAFICO_MODERNO
-from config import PONTOS_DE_ANALISE, CORES_UMIDADE
+from config import PONTOS_DE_ANALISE, CORES_UMIDADE, GRAFICOS_LARGURA_PX_GERAL, FUSO_LOCAL, COLUNAS_UMIDADE
 import processamento
 import data_source
+import qualidade
+import reducao_pontos
 
 
 def get_layout():
@@ -36,6 +38,40 @@ def get_layout():
     ], fluid=True)
 
 
+def _valores(serie):
+    """ float32 -> float64 com 2 casas (as do dado): no JSON, "38.64" em vez de "38.63999938964844". """
+    return serie.astype(float).round(2)
+
+
+def _layouts_base(selected_hours):
+    """
+    Layouts dos gráficos de chuva e de umidade, validados pelo plotly uma vez por atualização e
+    compartilhados por todas as estações: cada figura é só um dicionário com os traços da estação
+    (montar e validar um go.Figure por estação custava mais que todo o processamento dos dados).
+    """
+    fig_chuva = make_subplots(specs=[[{"secondary_y": True}]])
+    fig_chuva.update_layout(
+        template=TEMPLATE_GRAFICO_MODERNO,
+        margin=dict(l=40, r=20, t=50, b=80),
+        legend=dict(orientation="h", yanchor="bottom", y=-0.5, xanchor='center', x=0.5),
+        xaxis_title="Data e Hora", yaxis_title="Pluviometria (mm/15min)",
+        yaxis2_title=f"Acumulada ({selected_hours}h)",
+        hovermode="x unified", bargap=0.1, hoverlabel=dict(bgcolor="white", font_size=12)
+    )
+    fig_chuva.update_xaxes(dtick=3 * 60 * 60 * 1000, tickformat="%d/%m %H:%M", tickangle=-45)
+
+    fig_umidade = go.Figure()
+    fig_umidade.update_layout(
+        template=TEMPLATE_GRAFICO_MODERNO,
+        margin=dict(l=40, r=20, t=40, b=80),
+        legend=dict(orientation="h", yanchor="bottom", y=-0.5, xanchor="center", x=0.5),
+        xaxis_title="Data e Hora", yaxis_title="Umidade do Solo (%)",
+        hovermode="x unified", bargap=0, hoverlabel=dict(bgcolor="white", font_size=12)
+    )
+    fig_umidade.update_xaxes(dtick=3 * 60 * 60 * 1000, tickformat="%d/%m %H:%M", tickangle=-45)
+    return fig_chuva.layout.to_plotly_json(), fig_umidade.layout.to_plotly_json()
+
+
 @app.callback(
     Output('general-dash-content', 'children'),
     [Input('intervalo-atualizacao-dados', 'n_intervals'),
@@ -48,8 +84,8 @@ def update_general_dashboard(n_intervals, selected_hours):
     # OTIMIZAÇÃO: Solicita apenas as colunas necessárias para reduzir consumo de memória
     cols_necessarias = [
         'timestamp', 'id_ponto',
-        'chuva_mm', 'precipitacao_acumulada_mm',
-        'umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc'
+        'chuva_mm',
+        'umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc', 'qc_umidade'
     ]
 
     horas_para_buscar = max(selected_hours, 73)
@@ -67,11 +103,11 @@ def update_general_dashboard(n_intervals, selected_hours):
         df_completo['timestamp'] = pd.to_datetime(df_completo['timestamp'])
         if df_completo['timestamp'].dt.tz is None:
             df_completo['timestamp'] = df_completo['timestamp'].dt.tz_localize('UTC')
-        df_completo['timestamp_local'] = df_completo['timestamp'].dt.tz_convert('America/Sao_Paulo')
+        df_completo['timestamp_local'] = df_completo['timestamp'].dt.tz_convert(FUSO_LOCAL)
+        df_completo = qualidade.mascarar_umidade(df_completo)  # Pontos reprovados no QC fora do gráfico
 
         # OTIMIZAÇÃO: Downcast para float32 (economiza 50% de RAM nos números)
-        numeric_cols = ['chuva_mm', 'umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc',
-                        'precipitacao_acumulada_mm']
+        numeric_cols = ['chuva_mm'] + COLUNAS_UMIDADE
         for col in numeric_cols:
             if col in df_completo.columns:
                 df_completo[col] = pd.to_numeric(df_completo[col], errors='coerce', downcast='float')
@@ -79,95 +115,67 @@ def update_general_dashboard(n_intervals, selected_hours):
     except Exception as e:
         return dbc.Alert(f"Erro ao processar dados: {e}", color="danger")
 
+    # --- PIPELINE AGRUPADO: um sort e operações por id_ponto para todas as estações de uma vez ---
+    umidade_cols = COLUNAS_UMIDADE
+    df_todos = df_completo[df_completo['id_ponto'].isin(PONTOS_DE_ANALISE.keys())]
+    df_todos = df_todos.sort_values(['id_ponto', 'timestamp']).drop_duplicates(
+        subset=['id_ponto', 'timestamp'], keep='last').reset_index(drop=True)
+
+    # --- CHUVA INCREMENTAL (já derivada do odômetro na ingestão) ---
+    df_todos['chuva_incremental'] = processamento.incremento_chuva_por_ponto(df_todos)
+    df_todos[umidade_cols] = df_todos.groupby('id_ponto')[umidade_cols].ffill()
+
+    # 1. Acumulado móvel de todas as estações (uma chamada, agrupada por estação)
+    df_chuva_acumulada = processamento.calcular_acumulado_rolling(df_todos, horas=selected_hours)
+
+    # Janela do período selecionado, contada a partir da última leitura de cada estação
+    limite_tempo = df_todos.groupby('id_ponto')['timestamp_local'].transform('max') - pd.Timedelta(hours=selected_hours)
+    df_plot = df_todos[df_todos['timestamp_local'] >= limite_tempo]
+
+    # Agrega em intervalos de 15 minutos: um resample por estação, todas de uma vez
+    slots = df_plot.set_index('timestamp_local').groupby('id_ponto').resample('15min')
+    df_15min = pd.concat([slots['chuva_incremental'].sum(), slots[umidade_cols].mean()], axis=1).reset_index()
+
+    # 2. Acumulado a partir do início do período de cada estação
+    inicio_plot = df_plot.groupby('id_ponto')['timestamp'].min()
+    df_chuva_acumulada = df_chuva_acumulada[
+        df_chuva_acumulada['timestamp'] >= df_chuva_acumulada['id_ponto'].map(inicio_plot)].copy()
+    if df_chuva_acumulada['timestamp'].dt.tz is None:
+        df_chuva_acumulada['timestamp'] = df_chuva_acumulada['timestamp'].dt.tz_localize('UTC')
+    df_chuva_acumulada['timestamp_local'] = df_chuva_acumulada['timestamp'].dt.tz_convert(FUSO_LOCAL)
+
+    # Linhas de cada estação nos arrays compartilhados (sem filtro booleano + cópia por estação)
+    linhas_15min = df_15min.groupby('id_ponto').indices
+    linhas_acumulada = df_chuva_acumulada.groupby('id_ponto').indices
+
+    layout_chuva, layout_umidade = _layouts_base(selected_hours)
     layout_geral = []
     for id_ponto, config in PONTOS_DE_ANALISE.items():
-        df_ponto = df_completo[df_completo['id_ponto'] == id_ponto].copy()
-        if df_ponto.empty: continue
-
-        df_ponto = df_ponto.sort_values('timestamp').drop_duplicates(subset=['timestamp'], keep='last')
-
-        # --- CÁLCULO DA CHUVA INCREMENTAL ---
-        if 'precipitacao_acumulada_mm' in df_ponto.columns:
-            df_ponto = df_ponto.sort_values('timestamp').reset_index(drop=True)
-            df_ponto['precipitacao_acumulada_mm'] = df_ponto['precipitacao_acumulada_mm'].ffill().fillna(0)
-            df_ponto['chuva_incremental'] = df_ponto['precipitacao_acumulada_mm'].diff().fillna(0)
-            mask_virada_dia = df_ponto['chuva_incremental'] < 0
-            df_ponto.loc[mask_virada_dia, 'chuva_incremental'] = df_ponto.loc[
-                mask_virada_dia, 'precipitacao_acumulada_mm']
-        else:
-            df_ponto['chuva_incremental'] = df_ponto.get('chuva_mm', 0)
-
-        umidade_cols = ['umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc']
-        if all(c in df_ponto.columns for c in umidade_cols):
-            df_ponto[umidade_cols] = df_ponto[umidade_cols].ffill()
-
-        # 1. Calcular o acumulado para a linha do gráfico
-        df_chuva_acumulada = processamento.calcular_acumulado_rolling(df_ponto, horas=selected_hours)
-
-        # Filtra os dados para o período de tempo selecionado
-        ultimo_timestamp_no_df = df_ponto['timestamp_local'].max()
-        limite_tempo = ultimo_timestamp_no_df - pd.Timedelta(hours=selected_hours)
-        df_ponto_plot = df_ponto[df_ponto['timestamp_local'] >= limite_tempo].copy()
-
-        if df_ponto_plot.empty: continue
-
-        # Agrega os dados em intervalos de 15 minutos
-        agg_dict = {'chuva_incremental': 'sum'}
-        if 'umidade_1m_perc' in df_ponto_plot.columns: agg_dict['umidade_1m_perc'] = 'mean'
-        if 'umidade_2m_perc' in df_ponto_plot.columns: agg_dict['umidade_2m_perc'] = 'mean'
-        if 'umidade_3m_perc' in df_ponto_plot.columns: agg_dict['umidade_3m_perc'] = 'mean'
-
-        df_plot_15min = df_ponto_plot.set_index('timestamp_local').resample('15T').agg(agg_dict).reset_index()
-
-        # 2. Filtrar o DataFrame de chuva acumulada para o período de plotagem
-        df_chuva_acumulada_plot = df_chuva_acumulada[
-            df_chuva_acumulada['timestamp'] >= df_ponto_plot['timestamp'].min()].copy()
-
-        if 'timestamp' in df_chuva_acumulada_plot.columns:
-            if df_chuva_acumulada_plot['timestamp'].dt.tz is None: df_chuva_acumulada_plot.loc[:, 'timestamp'] = \
-            df_chuva_acumulada_plot['timestamp'].dt.tz_localize('UTC')
-            df_chuva_acumulada_plot.loc[:, 'timestamp_local'] = df_chuva_acumulada_plot['timestamp'].dt.tz_convert(
-                'America/Sao_Paulo')
+        if id_ponto not in linhas_15min: continue
+        df_plot_15min = df_15min.iloc[linhas_15min[id_ponto]]
+        df_chuva_acumulada_plot = df_chuva_acumulada.iloc[linhas_acumulada.get(id_ponto, [])]
+
+        # Horizontes longos: no máximo ~1 ponto por pixel em cada traço (LTTB nas linhas, mín/máx nas barras)
+        series_plot = reducao_pontos.reduzir(
+            df_plot_15min, 'timestamp_local',
+            {'chuva_incremental': 'minmax', **{c: 'lttb' for c in umidade_cols if c in df_plot_15min.columns}},
+            GRAFICOS_LARGURA_PX_GERAL, chave=(id_ponto, selected_hours))
+        acumulada_plot = reducao_pontos.reduzir(df_chuva_acumulada_plot, 'timestamp_local', {'chuva_mm': 'lttb'},
+                                                GRAFICOS_LARGURA_PX_GERAL, chave=(id_ponto, selected_hours))['chuva_mm']
 
         # --- GRÁFICO DE CHUVA ---
-        fig_chuva = make_subplots(specs=[[{"secondary_y": True}]])
-        # 3. Usar a nova coluna 'chuva_incremental' para as barras
-        fig_chuva.add_trace(
-            go.Bar(x=df_plot_15min['timestamp_local'], y=df_plot_15min['chuva_incremental'], name='Pluv. 15 min',
-                   marker_color='#2C3E50', opacity=0.8), secondary_y=False)
-
-        # 4. Usar o DataFrame de acumulado para a linha
-        fig_chuva.add_trace(
-            go.Scatter(x=df_chuva_acumulada_plot['timestamp_local'], y=df_chuva_acumulada_plot['chuva_mm'],
-                       name=f'Acumulada ({selected_hours}h)', mode='lines',
-                       line=dict(color='#007BFF', width=2.5)), secondary_y=True)
-
-        fig_chuva.update_layout(
-            title_text=f"Pluviometria - {config['nome']}", template=TEMPLATE_GRAFICO_MODERNO,
-            margin=dict(l=40, r=20, t=50, b=80),
-            legend=dict(orientation="h", yanchor="bottom", y=-0.5, xanchor='center', x=0.5),
-            xaxis_title="Data e Hora", yaxis_title="Pluviometria (mm/15min)",
-            yaxis2_title=f"Acumulada ({selected_hours}h)",
-            hovermode="x unified", bargap=0.1, hoverlabel=dict(bgcolor="white", font_size=12)
-        )
-        fig_chuva.update_xaxes(dtick=3 * 60 * 60 * 1000, tickformat="%d/%m %H:%M", tickangle=-45)
+        # 3. Barras da chuva incremental; 4. linha do acumulado no eixo secundário
+        chuva_plot = series_plot['chuva_incremental']
+        fig_chuva = {'data': [
+            {'type': 'bar', 'x': chuva_plot['timestamp_local'], 'y': _valores(chuva_plot['chuva_incremental']),
+             'name': 'Pluv. 15 min', 'marker': {'color': '#2C3E50'}, 'opacity': 0.8, 'xaxis': 'x', 'yaxis': 'y'},
+            {'type': 'scatter', 'x': acumulada_plot['timestamp_local'], 'y': _valores(acumulada_plot['chuva_mm']),
+             'name': f'Acumulada ({selected_hours}h)', 'mode': 'lines', 'line': {'color': '#007BFF', 'width': 2.5},
+             'xaxis': 'x', 'yaxis': 'y2'},
+        ], 'layout': {**layout_chuva, 'title': {'text': f"Pluviometria - {config['nome']}"}}}
 
         # --- GRÁFICO DE UMIDADE ---
-        fig_umidade = go.Figure()
-        if 'umidade_1m_perc' in df_plot_15min.columns:
-            fig_umidade.add_trace(
-                go.Scatter(x=df_plot_15min['timestamp_local'], y=df_plot_15min['umidade_1m_perc'], name='Umidade 1m',
-                           mode='lines', line=dict(color=CORES_UMIDADE['1m'], width=3)))
-        if 'umidade_2m_perc' in df_plot_15min.columns:
-            fig_umidade.add_trace(
-                go.Scatter(x=df_plot_15min['timestamp_local'], y=df_plot_15min['umidade_2m_perc'], name='Umidade 2m',
-                           mode='lines', line=dict(color=CORES_UMIDADE['2m'], width=3)))
-        if 'umidade_3m_perc' in df_plot_15min.columns:
-            fig_umidade.add_trace(
-                go.Scatter(x=df_plot_15min['timestamp_local'], y=df_plot_15min['umidade_3m_perc'], name='Umidade 3m',
-                           mode='lines', line=dict(color=CORES_UMIDADE['3m'], width=3)))
-
-        umidade_cols_existentes = [c for c in ['umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc'] if
+        umidade_cols_existentes = [c for c in COLUNAS_UMIDADE if
                                    c in df_plot_15min.columns]
         max_val_umidade = 0
         if umidade_cols_existentes:
@@ -175,15 +183,13 @@ def update_general_dashboard(n_intervals, selected_hours):
         if pd.isna(max_val_umidade): max_val_umidade = 0
         range_max = max(50, max_val_umidade * 1.1)
 
-        fig_umidade.update_layout(
-            title_text=f"Umidade do Solo - {config['nome']}", template=TEMPLATE_GRAFICO_MODERNO,
-            margin=dict(l=40, r=20, t=40, b=80),
-            legend=dict(orientation="h", yanchor="bottom", y=-0.5, xanchor="center", x=0.5),
-            xaxis_title="Data e Hora", yaxis_title="Umidade do Solo (%)",
-            yaxis=dict(range=[0, range_max]),
-            hovermode="x unified", bargap=0, hoverlabel=dict(bgcolor="white", font_size=12)
-        )
-        fig_umidade.update_xaxes(dtick=3 * 60 * 60 * 1000, tickformat="%d/%m %H:%M", tickangle=-45)
+        fig_umidade = {'data': [
+            {'type': 'scatter', 'x': series_plot[coluna]['timestamp_local'], 'y': _valores(series_plot[coluna][coluna]),
+             'name': f'Umidade {profundidade}', 'mode': 'lines',
+             'line': {'color': CORES_UMIDADE[profundidade], 'width': 3}}
+            for profundidade, coluna in [(p, f'umidade_{p}_perc') for p in ['1m', '2m', '3m']] if coluna in series_plot
+        ], 'layout': {**layout_umidade, 'title': {'text': f"Umidade do Solo - {config['nome']}"},
+                      'yaxis': {**layout_umidade['yaxis'], 'range': [0, range_max]}}}
 
         col_chuva = dbc.Col(dbc.Card(dbc.CardBody(dcc.Graph(figure=fig_chuva)), className="shadow-sm mb-4"), width=12,
                             lg=6)
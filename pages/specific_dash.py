@@ -11,23 +11,28 @@ from matplotlib.figure import Figure
 import numpy as np
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
-import uuid
-from threading import Thread
 import json
+import flask
 
 plt.switch_backend('Agg')
 
 from app import app, TEMPLATE_GRAFICO_MODERNO
 from config import (
-    PONTOS_DE_ANALISE, CONSTANTES_PADRAO,
+    PONTOS_DE_ANALISE,
     RISCO_MAP, STATUS_MAP_HIERARQUICO,
-    CORES_UMIDADE, DELTA_TRIGGER_UMIDADE
+    CORES_UMIDADE, RELATORIOS_AGENDADOS, GRAFICOS_LARGURA_PX_PONTO, GRAFICOS_RECONSTRUIR_APOS_PONTOS,
+    FUSO_LOCAL, COLUNAS_UMIDADE
 )
 import processamento
+import regras
+import qualidade
 import gerador_pdf
+import relatorios_jobs
+import relatorios_agendados
+import reducao_pontos
+import links_download
 import data_source
-
-from gerador_pdf import PDF_CACHE_LOCK, EXCEL_CACHE_LOCK, PDF_CACHE, EXCEL_CACHE
+import eventos
 
 
 # --- FUNÇÃO AUXILIAR DE FILTRO PARA O CLIENTE ---
@@ -56,6 +61,27 @@ def filtrar_logs_cliente(logs_list):
     return logs_limpos
 
 
+def historico_mudancas(id_ponto, logs_ponto):
+    """
+    Linhas do histórico de mudanças da estação: as mudanças de status vêm dos eventos estruturados
+    (eventos.ler_eventos, já com histerese e deduplicação), no formato do log, com o valor que as motivou;
+    do log ficam os demais alertas. Sem eventos gravados (arquivo ainda inexistente), o log inteiro.
+    """
+    mudancas = []
+    for evento in eventos.ler_eventos(id_ponto):
+        detalhe = ""
+        if evento["tipo"] == "chuva" and pd.notna(evento.get("chuva_72h")):
+            detalhe = f" Chuva 72h: {evento['chuva_72h']:.1f} mm."
+        elif evento["tipo"] == "umidade" and any(pd.notna(v) for v in evento.get("umidade") or []):
+            detalhe = " Umidade 1m/2m/3m: " + " / ".join(
+                "--" if pd.isna(v) else f"{v:.1f}" for v in evento["umidade"]) + " %."
+        mudancas.append(f"{evento['timestamp']} | {'WARN':<5} | {id_ponto} | {eventos.descrever_evento(evento)}{detalhe}")
+    if not mudancas:
+        return logs_ponto
+    demais = [log for log in logs_ponto if "MUDANÇA DE STATUS" not in log.upper()]
+    return sorted(demais + mudancas, key=lambda log: log.split(' | ')[0])  # ISO em UTC: ordem do texto = do tempo
+
+
 # ------------------------------------------------
 
 
@@ -83,7 +109,15 @@ def get_layout():
             dbc.Col(html.Div(id='dynamic-accumulated-output'), width=12, lg=4, className="d-flex align-items-center")
         ], align="center", className="my-3"),
 
-        dbc.Row(id='specific-dash-graphs', children=[dbc.Spinner(size="lg")], className="my-4"),
+        # Gráficos criados uma vez por página; update_specific_graphs troca a figura ou só estende os traços
+        dcc.Store(id='store-graficos-especifico'),
+        html.Div(id='specific-dash-graphs-aviso', children=dbc.Spinner(size="lg"), className="my-4"),
+        dbc.Row(id='specific-dash-graphs', style={'display': 'none'}, className="my-4", children=[
+            dbc.Col(dbc.Card(dbc.CardBody(dcc.Graph(id='grafico-chuva-especifico')), className="shadow-sm"), width=12,
+                    className="mb-4"),
+            dbc.Col(dbc.Card(dbc.CardBody(dcc.Graph(id='grafico-umidade-especifico')), className="shadow-sm"),
+                    width=12, className="mb-4"),
+        ]),
 
         dbc.Row([
             dbc.Col([
@@ -94,11 +128,14 @@ def get_layout():
                                         start_date=(pd.Timestamp.now() - pd.Timedelta(days=7)).date(),
                                         end_date=pd.Timestamp.now().date(), display_format='DD/MM/YYYY',
                                         className="mb-3 w-100"),
-                    html.Br(),
+                    dbc.Checkbox(id='check-relatorio-consolidado', value=False, className="mb-2 small",
+                                 label="Todas as estações (relatório consolidado; CSV só por estação)"),
                     html.Div([
                         dbc.Button("Gerar PDF", id='btn-pdf-especifico', color="primary", size="sm", className="me-2"),
                         dcc.Download(id='download-pdf-especifico'),
-                        dbc.Button("Gerar Excel", id='btn-excel-especifico', color="success", size="sm"),
+                        dbc.Button("Gerar Excel", id='btn-excel-especifico', color="success", size="sm",
+                                   className="me-2"),
+                        dbc.Button("Gerar CSV", id='btn-csv-especifico', color="secondary", size="sm"),
                         dcc.Download(id='download-excel-especifico')
                     ], className="d-flex justify-content-center"),
                     html.Div(id='report-status-indicator', children=None,
@@ -107,6 +144,7 @@ def get_layout():
                               color="danger", is_open=False, dismissable=True, className="mt-3"),
                     dbc.Alert("Erro desconhecido ao gerar relatório.", id="alert-pdf-generic-error", color="danger",
                               is_open=False, dismissable=True, className="mt-3"),
+                    html.Div(id='lista-relatorios-agendados', className="mt-3 small"),
                 ]), className="shadow-sm mb-4"),
                 dbc.Card(dbc.CardBody([
                     html.H6("Logs de Eventos (Resumo)", className="card-title"),
@@ -178,12 +216,15 @@ def update_specific_cards(pathname, status_json):
     umidade_2m = status_info.get('umidade_2m')
     umidade_3m = status_info.get('umidade_3m')
 
+    # Bases e gatilho da PRÓPRIA estação (regras.py), não os globais
+    regra = regras.obter_regras().para(id_ponto)
+    delta_trigger = regra[regras.CAMPO_DELTA]
     css_color_s1 = CORES_UMIDADE['1m'] if umidade_1m and (
-                umidade_1m - CONSTANTES_PADRAO.get('UMIDADE_BASE_1M', 39.0)) >= DELTA_TRIGGER_UMIDADE else 'green'
+                umidade_1m - regra['UMIDADE_BASE_1M']) >= delta_trigger else 'green'
     css_color_s2 = CORES_UMIDADE['2m'] if umidade_2m and (
-                umidade_2m - CONSTANTES_PADRAO.get('UMIDADE_BASE_2M', 43.0)) >= DELTA_TRIGGER_UMIDADE else 'green'
+                umidade_2m - regra['UMIDADE_BASE_2M']) >= delta_trigger else 'green'
     css_color_s3 = CORES_UMIDADE['3m'] if umidade_3m and (
-                umidade_3m - CONSTANTES_PADRAO.get('UMIDADE_BASE_3M', 10.0)) >= DELTA_TRIGGER_UMIDADE else 'green'
+                umidade_3m - regra['UMIDADE_BASE_3M']) >= delta_trigger else 'green'
 
     layout_cards = [
         dbc.Col(dbc.Card(dbc.CardBody([html.H5("Status Geral"), html.P(status_geral_texto, className="fs-3 fw-bold")]),
@@ -203,30 +244,52 @@ def update_specific_cards(pathname, status_json):
                  html.Span(" (3m)", className="small")], className="mb-0 text-center"), width=4),
         ])]), className="shadow h-100 bg-white"), xs=12, md=4, className="mb-4"),
     ]
-    return layout_cards
 
+    # Analíticos calculados pelo worker (analiticos.py), já presentes no status: sem leitura do banco
+    analiticos_info = status_info.get('analiticos') or {}
+    if analiticos_info:
+        def _fmt(chave, casas=1):
+            valor = analiticos_info.get(chave)
+            return f"{valor:.{casas}f}" if valor is not None else "--"
+
+        layout_cards.append(dbc.Col(dbc.Card(dbc.CardBody([html.H5("Intensidade (mm/h)"), dbc.Row([
+            dbc.Col(html.P([html.Span(_fmt(f'intensidade_{h}h'), className="fs-4 fw-bold"),
+                            html.Span(f" ({h}h)", className="small")], className="mb-0 text-center"), width=4)
+            for h in (1, 3, 6)
+        ]), html.P(f"Pico 1h (24h): {_fmt('pico_1h_24h')} mm/h", className="small text-muted mb-0 text-center")]),
+            className="shadow h-100 bg-white"), xs=12, md=4, className="mb-4"))
+        layout_cards.append(dbc.Col(dbc.Card(dbc.CardBody([
+            html.H5("Precipitação Antecedente (API)"), html.P(f"{_fmt('api_mm')} mm", className="fs-3 fw-bold")]),
+            className="shadow h-100 bg-white"), xs=12, md=4, className="mb-4"))
+        projecao = analiticos_info.get('projecao_min') or {}
+        if projecao:
+            def _fmt_tempo(minutos):
+                if minutos is None: return "não atinge em 24h"
+                if minutos == 0: return "atingido"
+                return f"em {minutos // 60}h{minutos % 60:02d}"
+
+            layout_cards.append(dbc.Col(dbc.Card(dbc.CardBody([
+                html.H5("Projeção Chuva 72h (intensidade atual)"),
+                *[html.P([html.Span(f"{nivel}: ", className="fw-bold"), _fmt_tempo(minutos)], className="mb-0")
+                  for nivel, minutos in projecao.items()]
+            ]), className="shadow h-100 bg-white"), xs=12, md=4, className="mb-4"))
+        if umidade_1m is not None:
+            layout_cards.append(dbc.Col(dbc.Card(dbc.CardBody([html.H5("Variação da Umidade (p.p./h)"), dbc.Row([
+                dbc.Col(html.P([html.Span(_fmt(f'taxa_umidade_{p}', 2), className="fs-4 fw-bold",
+                                          style={'color': CORES_UMIDADE[p]}),
+                                html.Span(f" ({p})", className="small")], className="mb-0 text-center"), width=4)
+                for p in ('1m', '2m', '3m')
+            ])]), className="shadow h-100 bg-white"), xs=12, md=4, className="mb-4"))
+    return layout_cards
 
-@app.callback(
-    [Output('specific-dash-graphs', 'children'),
-     Output('store-id-ponto-ativo', 'data')],
-    [Input('intervalo-atualizacao-dados', 'n_intervals'),
-     Input('url-raiz', 'pathname'),
-     Input('graph-time-selector', 'value')]
-)
-def update_specific_graphs(n_intervals, pathname, selected_hours):
-    if not pathname.startswith('/ponto/') or selected_hours is None:
-        return dash.no_update, dash.no_update
-
-    id_ponto = pathname.split('/')[-1]
-    config = PONTOS_DE_ANALISE.get(id_ponto)
-    if not config:
-        return dbc.Alert("Ponto não encontrado.", color="danger"), id_ponto
 
+def _dados_graficos(id_ponto, selected_hours):
+    """ (aviso, df_plot_10min, df_chuva_acumulada_plot) da estação; aviso (dbc.Alert) se não há o que desenhar. """
     # OTIMIZAÇÃO 1: Define quais colunas precisamos.
     cols_necessarias = [
         'timestamp', 'id_ponto',
-        'chuva_mm', 'precipitacao_acumulada_mm',
-        'umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc'
+        'chuva_mm',
+        'umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc', 'qc_umidade'
     ]
 
     horas_para_buscar = max(selected_hours, 73)
@@ -240,39 +303,34 @@ def update_specific_graphs(n_intervals, pathname, selected_hours):
 
     try:
         if df_completo.empty or 'timestamp' not in df_completo.columns:
-            return dbc.Alert("Dados históricos indisponíveis no momento.", color="warning"), id_ponto
+            return dbc.Alert("Dados históricos indisponíveis no momento.", color="warning"), None, None
 
         df_completo['timestamp'] = pd.to_datetime(df_completo['timestamp'])
         if df_completo['timestamp'].dt.tz is None:
             df_completo['timestamp'] = df_completo['timestamp'].dt.tz_localize('UTC')
-        df_completo['timestamp_local'] = df_completo['timestamp'].dt.tz_convert('America/Sao_Paulo')
+        df_completo['timestamp_local'] = df_completo['timestamp'].dt.tz_convert(FUSO_LOCAL)
+        df_completo = qualidade.mascarar_umidade(df_completo)  # Pontos reprovados no QC fora do gráfico
 
         # OTIMIZAÇÃO 3: Downcast para float32
-        numeric_cols = ['chuva_mm', 'umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc',
-                        'precipitacao_acumulada_mm']
+        numeric_cols = ['chuva_mm'] + COLUNAS_UMIDADE
         for col in numeric_cols:
             if col in df_completo.columns:
                 df_completo[col] = pd.to_numeric(df_completo[col], errors='coerce', downcast='float')
 
     except Exception as e:
-        return dbc.Alert(f"Erro ao processar dados: {e}", color="danger"), id_ponto
+        return dbc.Alert(f"Erro ao processar dados: {e}", color="danger"), None, None
 
     df_ponto = df_completo.copy()
     if df_ponto.empty:
-        return dbc.Alert("Sem dados históricos para este ponto.", color="warning"), id_ponto
+        return dbc.Alert("Sem dados históricos para este ponto.", color="warning"), None, None
 
     df_ponto = df_ponto.sort_values('timestamp').drop_duplicates(subset=['timestamp'], keep='last')
 
-    if 'precipitacao_acumulada_mm' in df_ponto.columns:
-        df_ponto = df_ponto.sort_values('timestamp').reset_index(drop=True)
-        df_ponto['precipitacao_acumulada_mm'] = df_ponto['precipitacao_acumulada_mm'].ffill().fillna(0)
-        df_ponto['chuva_incremental'] = df_ponto['precipitacao_acumulada_mm'].diff().fillna(0)
-        mask_virada_dia = df_ponto['chuva_incremental'] < 0
-        df_ponto.loc[mask_virada_dia, 'chuva_incremental'] = df_ponto.loc[mask_virada_dia, 'precipitacao_acumulada_mm']
-    else:
-        df_ponto['chuva_incremental'] = df_ponto.get('chuva_mm', 0)
+    # Chuva por leitura já derivada do odômetro na ingestão (worker)
+    df_ponto = df_ponto.reset_index(drop=True)
+    df_ponto['chuva_incremental'] = processamento.incremento_chuva_por_ponto(df_ponto)
 
-    umidade_cols = ['umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc']
+    umidade_cols = COLUNAS_UMIDADE
     if all(c in df_ponto.columns for c in umidade_cols):
         df_ponto[umidade_cols] = df_ponto[umidade_cols].ffill()
 
@@ -299,39 +357,53 @@ def update_specific_graphs(n_intervals, pathname, selected_hours):
         df_chuva_acumulada['timestamp'] >= df_ponto_plot['timestamp'].min()].copy()
 
     if 'timestamp' in df_chuva_acumulada_plot.columns:
-        df_chuva_acumulada_plot.loc[:, 'timestamp_local'] = df_chuva_acumulada_plot['timestamp'].dt.tz_convert(
-            'America/Sao_Paulo')
+        df_chuva_acumulada_plot.loc[:, 'timestamp_local'] = df_chuva_acumulada_plot['timestamp'].dt.tz_convert(FUSO_LOCAL)
+
+    return None, df_plot_10min, df_chuva_acumulada_plot
+
+
+def _montar_figuras(id_ponto, config, selected_hours, df_plot_10min, df_chuva_acumulada_plot):
+    """
+    (fig_chuva, fig_umidade, estado) completos. estado descreve o que foi enviado ao navegador (último ponto
+    de cada série, nº de pontos por traço, reduções) para os ticks seguintes mandarem só os pontos novos.
+    uirevision mantém zoom/pan do usuário quando a figura é reconstruída.
+    """
+    umidade_cols = COLUNAS_UMIDADE
+    # Horizontes longos: no máximo ~1 ponto por pixel em cada traço (LTTB nas linhas, mín/máx nas barras)
+    series_plot = reducao_pontos.reduzir(
+        df_plot_10min, 'timestamp_local',
+        {'chuva_incremental': 'minmax', **{c: 'lttb' for c in umidade_cols if c in df_plot_10min.columns}},
+        GRAFICOS_LARGURA_PX_PONTO, chave=(id_ponto, selected_hours))
+    acumulada_plot = reducao_pontos.reduzir(df_chuva_acumulada_plot, 'timestamp_local', {'chuva_mm': 'lttb'},
+                                            GRAFICOS_LARGURA_PX_PONTO, chave=(id_ponto, selected_hours))['chuva_mm']
 
     axis_style = dict(title="Data e Hora", dtick=10800000, tickformat="%H:%M\n%d/%b", tickangle=-45)
 
     fig_chuva = make_subplots(specs=[[{"secondary_y": True}]])
+    chuva_plot = series_plot['chuva_incremental']
     fig_chuva.add_trace(
-        go.Bar(x=df_plot_10min['timestamp_local'], y=df_plot_10min['chuva_incremental'], name='Pluv. 10 min (mm)',
+        go.Bar(x=chuva_plot['timestamp_local'], y=chuva_plot['chuva_incremental'], name='Pluv. 10 min (mm)',
                marker_color='#2C3E50', opacity=0.8), secondary_y=False)
-    fig_chuva.add_trace(go.Scatter(x=df_chuva_acumulada_plot['timestamp_local'], y=df_chuva_acumulada_plot['chuva_mm'],
+    fig_chuva.add_trace(go.Scatter(x=acumulada_plot['timestamp_local'], y=acumulada_plot['chuva_mm'],
                                    name=f'Acumulada ({selected_hours}h)', mode='lines',
                                    line=dict(color='#007BFF', width=2.5)), secondary_y=True)
     fig_chuva.update_layout(title_text=f"Pluviometria - Estação {config['nome']}", template=TEMPLATE_GRAFICO_MODERNO,
                             margin=dict(l=40, r=20, t=50, b=80),
                             legend=dict(orientation="h", yanchor="bottom", y=-0.5, xanchor='center', x=0.5),
                             xaxis=axis_style, yaxis_title="Pluviometria (mm/10min)",
-                            yaxis2_title=f"Acumulada ({selected_hours}h)", hovermode="x unified")
+                            yaxis2_title=f"Acumulada ({selected_hours}h)", hovermode="x unified",
+                            uirevision=f"{id_ponto}-{selected_hours}")
 
     fig_umidade = go.Figure()
-    if 'umidade_1m_perc' in df_plot_10min.columns:
-        fig_umidade.add_trace(
-            go.Scatter(x=df_plot_10min['timestamp_local'], y=df_plot_10min['umidade_1m_perc'], name='Umidade 1m',
-                       mode='lines', line=dict(color=CORES_UMIDADE['1m'], width=3)))
-    if 'umidade_2m_perc' in df_plot_10min.columns:
-        fig_umidade.add_trace(
-            go.Scatter(x=df_plot_10min['timestamp_local'], y=df_plot_10min['umidade_2m_perc'], name='Umidade 2m',
-                       mode='lines', line=dict(color=CORES_UMIDADE['2m'], width=3)))
-    if 'umidade_3m_perc' in df_plot_10min.columns:
+    for profundidade in ['1m', '2m', '3m']:
+        coluna = f'umidade_{profundidade}_perc'
+        if coluna not in series_plot: continue
         fig_umidade.add_trace(
-            go.Scatter(x=df_plot_10min['timestamp_local'], y=df_plot_10min['umidade_3m_perc'], name='Umidade 3m',
-                       mode='lines', line=dict(color=CORES_UMIDADE['3m'], width=3)))
+            go.Scatter(x=series_plot[coluna]['timestamp_local'], y=series_plot[coluna][coluna],
+                       name=f'Umidade {profundidade}', mode='lines',
+                       line=dict(color=CORES_UMIDADE[profundidade], width=3)))
 
-    umidade_cols_existentes = [c for c in ['umidade_1m_perc', 'umidade_2m_perc', 'umidade_3m_perc'] if
+    umidade_cols_existentes = [c for c in COLUNAS_UMIDADE if
                                c in df_plot_10min.columns]
     max_val_umidade = 0
     if umidade_cols_existentes:
@@ -343,14 +415,121 @@ def update_specific_graphs(n_intervals, pathname, selected_hours):
                               template=TEMPLATE_GRAFICO_MODERNO, margin=dict(l=40, r=20, t=40, b=80),
                               legend=dict(orientation="h", yanchor="bottom", y=-0.5, xanchor="center", x=0.5),
                               xaxis=axis_style, yaxis_title="Umidade do Solo (%)", yaxis=dict(range=[0, range_max]),
-                              hovermode="x unified")
+                              hovermode="x unified", uirevision=f"{id_ponto}-{selected_hours}")
+
+    umidade_traco = [f'umidade_{profundidade}_perc' for profundidade in ['1m', '2m', '3m']
+                      if f'umidade_{profundidade}_perc' in series_plot]
+    estado = {
+        "id_ponto": id_ponto, "horas": selected_hours, "umidade": umidade_traco, "novos_desde_montagem": 0,
+        "ultimo_10min": df_plot_10min['timestamp_local'].max().isoformat() if not df_plot_10min.empty else None,
+        "ultimo_acumulado": df_chuva_acumulada_plot['timestamp_local'].max().isoformat()
+        if not df_chuva_acumulada_plot.empty else None,
+        # Traço com todos os pontos: a janela é mantida pelo nº de pontos (maxPoints do extendData)
+        "pontos_chuva": [len(chuva_plot), len(acumulada_plot)],
+        "pontos_umidade": [len(series_plot[coluna]) for coluna in umidade_traco],
+        "reduzido": len(chuva_plot) < len(df_plot_10min) or len(acumulada_plot) < len(df_chuva_acumulada_plot),
+        "limite_umidade": range_max / 1.1,
+        # Versão dos dados já enviados: o acumulado do primeiro slot olha selected_hours para trás
+        "inicio_versao": (df_plot_10min['timestamp_local'].min() - pd.Timedelta(hours=selected_hours))
+        .tz_convert('UTC').isoformat() if not df_plot_10min.empty else None,
+    }
+    estado["versao"] = _versao_enviada(estado)
+    return fig_chuva, fig_umidade, estado
+
+
+def _versao_enviada(estado):
+    """
+    data_source.versao_dados do que já está no navegador (do início da janela até o fim do último slot
+    enviado): leituras novas não a mudam; backfill de lacuna ou QC regravado dentro dela, sim.
+    """
+    if estado["ultimo_10min"] is None or estado["inicio_versao"] is None: return None
+    fim = pd.Timestamp(estado["ultimo_10min"]).tz_convert('UTC') + pd.Timedelta(minutes=10)
+    return data_source.versao_dados(estado["id_ponto"], pd.Timestamp(estado["inicio_versao"]), fim)
 
-    layout_graficos = [
-        dbc.Col(dbc.Card(dbc.CardBody(dcc.Graph(figure=fig_chuva)), className="shadow-sm"), width=12, className="mb-4"),
-        dbc.Col(dbc.Card(dbc.CardBody(dcc.Graph(figure=fig_umidade)), className="shadow-sm"), width=12,
-                className="mb-4"),
-    ]
-    return layout_graficos, id_ponto
+
+def _pontos_novos(df_plot_10min, df_chuva_acumulada_plot, estado):
+    """
+    extendData (chuva, umidade) só com os slots posteriores aos já enviados, ou None se é preciso reconstruir
+    (série reduzida há muitos ticks, sem referência, dados já enviados alterados ou umidade acima da escala
+    do eixo).
+    """
+    if estado["ultimo_10min"] is None or estado["ultimo_acumulado"] is None: return None
+    if estado.get("versao") is None or _versao_enviada(estado) != estado["versao"]:
+        return None  # Slots antigos preenchidos ou máscara de QC mudou: só a figura inteira mostra
+    novos = df_plot_10min[df_plot_10min['timestamp_local'] > pd.Timestamp(estado["ultimo_10min"])]
+    novos_acumulado = df_chuva_acumulada_plot[
+        df_chuva_acumulada_plot['timestamp_local'] > pd.Timestamp(estado["ultimo_acumulado"])]
+    if estado["reduzido"] and estado["novos_desde_montagem"] + len(novos) > GRAFICOS_RECONSTRUIR_APOS_PONTOS:
+        return None  # A janela de uma série reduzida não é mantida por contagem: refaz (zoom preservado)
+    if estado["umidade"] and novos[estado["umidade"]].max().max() > estado["limite_umidade"]:
+        return None
+
+    def _lista(serie):
+        return [None if pd.isna(v) else float(v) for v in serie]
+
+    x_chuva = [list(novos['timestamp_local']), list(novos_acumulado['timestamp_local'])]
+    y_chuva = [_lista(novos['chuva_incremental']), _lista(novos_acumulado['chuva_mm'])]
+    x_umidade = [list(novos['timestamp_local']) for _ in estado["umidade"]]
+    y_umidade = [_lista(novos[coluna]) for coluna in estado["umidade"]]
+    if estado["reduzido"]:  # Sem corte até a próxima reconstrução
+        extensao_chuva = [dict(x=x_chuva, y=y_chuva), [0, 1]]
+        extensao_umidade = [dict(x=x_umidade, y=y_umidade), list(range(len(estado["umidade"])))]
+    else:
+        extensao_chuva = [dict(x=x_chuva, y=y_chuva), [0, 1],
+                          dict(x=estado["pontos_chuva"], y=estado["pontos_chuva"])]
+        extensao_umidade = [dict(x=x_umidade, y=y_umidade), list(range(len(estado["umidade"]))),
+                            dict(x=estado["pontos_umidade"], y=estado["pontos_umidade"])]
+
+    if not novos.empty: estado["ultimo_10min"] = novos['timestamp_local'].max().isoformat()
+    if not novos_acumulado.empty: estado["ultimo_acumulado"] = novos_acumulado['timestamp_local'].max().isoformat()
+    estado["novos_desde_montagem"] += len(novos)
+    if not novos.empty: estado["versao"] = _versao_enviada(estado)
+    return (extensao_chuva if not (novos.empty and novos_acumulado.empty) else dash.no_update,
+            extensao_umidade if estado["umidade"] and not novos.empty else dash.no_update)
+
+
+@app.callback(
+    [Output('specific-dash-graphs-aviso', 'children'), Output('specific-dash-graphs', 'style'),
+     Output('grafico-chuva-especifico', 'figure'), Output('grafico-umidade-especifico', 'figure'),
+     Output('grafico-chuva-especifico', 'extendData'), Output('grafico-umidade-especifico', 'extendData'),
+     Output('store-graficos-especifico', 'data'), Output('store-id-ponto-ativo', 'data')],
+    [Input('intervalo-atualizacao-dados', 'n_intervals'),
+     Input('url-raiz', 'pathname'),
+     Input('graph-time-selector', 'value')],
+    State('store-graficos-especifico', 'data')
+)
+def update_specific_graphs(n_intervals, pathname, selected_hours, estado):
+    """
+    Figuras montadas uma vez por página/horizonte; a cada tick do intervalo só os pontos novos vão ao
+    navegador (extendData, com janela de pontos), sem refazer os gráficos nem perder o zoom.
+    """
+    if not pathname.startswith('/ponto/') or selected_hours is None:
+        return [dash.no_update] * 8
+
+    def _sem_graficos(aviso):
+        return [aviso, {'display': 'none'}] + [dash.no_update] * 4 + [None, id_ponto]
+
+    id_ponto = pathname.split('/')[-1]
+    config = PONTOS_DE_ANALISE.get(id_ponto)
+    if not config:
+        return _sem_graficos(dbc.Alert("Ponto não encontrado.", color="danger"))
+
+    aviso, df_plot_10min, df_chuva_acumulada_plot = _dados_graficos(id_ponto, selected_hours)
+    if aviso is not None:
+        return _sem_graficos(aviso)
+
+    mesmo_grafico = estado and estado.get("id_ponto") == id_ponto and estado.get("horas") == selected_hours
+    if dash.ctx.triggered_id == 'intervalo-atualizacao-dados' and mesmo_grafico:
+        extensoes = _pontos_novos(df_plot_10min, df_chuva_acumulada_plot, estado)
+        if extensoes == (dash.no_update, dash.no_update):
+            return [dash.no_update] * 8  # Nenhum slot novo desde o último tick
+        if extensoes is not None:
+            return [dash.no_update, dash.no_update, dash.no_update, dash.no_update, *extensoes, estado,
+                    dash.no_update]
+
+    fig_chuva, fig_umidade, estado = _montar_figuras(id_ponto, config, selected_hours, df_plot_10min,
+                                                     df_chuva_acumulada_plot)
+    return [None, {}, fig_chuva, fig_umidade, dash.no_update, dash.no_update, estado, id_ponto]
 
 
 @app.callback(Output('modal-logs', 'is_open'),
@@ -384,7 +563,7 @@ def load_logs_content(is_open, id_ponto, logs_data):
 
         logs_ponto_brutos = [log for log in raw_list if
                              (isinstance(log, str) and (f"| {id_ponto} |" in log or "| GERAL |" in log))]
-        logs_ponto_limpos = filtrar_logs_cliente(logs_ponto_brutos)
+        logs_ponto_limpos = historico_mudancas(id_ponto, filtrar_logs_cliente(logs_ponto_brutos))
 
         if not logs_ponto_limpos:
             return "Nenhuma mudança de status ou alerta registrado recentemente.", []
@@ -412,17 +591,69 @@ def generate_logs_pdf(n_clicks, id_ponto, logs_filtrados):
                           f"Logs_{config['nome']}_{pd.Timestamp.now().strftime('%Y%m%d')}.pdf")
 
 
+# --- RELATÓRIOS (PDF/EXCEL) EM PROCESSOS SEPARADOS (relatorios_jobs) ---
+def _usuario_da_sessao(session_data):
+    session_data = session_data or {}
+    return session_data.get('sessao_id') or session_data.get('user_type', 'guest')
+
+
+def _indicador_progresso(situacao, rotulo):
+    """ Barra de progresso + etapa + botão de cancelar (o botão é criado aqui, dentro do indicador). """
+    progresso = int(round(100 * (situacao.get("progresso") or 0.0)))
+    return html.Div([
+        html.Div([dbc.Spinner(size="sm"), f" Gerando {rotulo}... {situacao.get('etapa') or ''}"]),
+        dbc.Progress(value=max(progresso, 5), label=f"{progresso}%" if progresso else None,
+                     striped=True, animated=True, className="my-2", style={'height': '14px'}),
+        dbc.Button("Cancelar", id='btn-cancelar-relatorio', color="link", size="sm", className="p-0"),
+    ])
+
+
+def _iniciar_relatorio(tipo, rotulo, start_date, end_date, id_ponto, session_data):
+    task_id, motivo = relatorios_jobs.submeter(tipo, _usuario_da_sessao(session_data), start_date, end_date, id_ponto)
+    if task_id is None:
+        return dash.no_update, True, html.Div(motivo, className="text-danger"), False, False
+    situacao = {"progresso": 0.0, "etapa": "Na fila"}
+    return task_id, False, _indicador_progresso(situacao, rotulo), True, True
+
+
+def _verificar_relatorio(task_id, rotulo, session_data):
+    """ Saídas do polling (download, intervalo desabilitado, indicador, alertas e botões). """
+    if not task_id: return dash.no_update, True, dash.no_update, False, False, dash.no_update, dash.no_update
+    situacao = relatorios_jobs.consultar(task_id)
+    status = situacao["status"]
+    if status in ("na_fila", "executando"):
+        return dash.no_update, False, _indicador_progresso(situacao, rotulo), False, False, dash.no_update, dash.no_update
+
+    if status == "concluido" and "arquivo" in situacao:
+        # Exportação em arquivo (Excel/CSV): enviada direto do disco pela rota abaixo, sem passar pelo callback.
+        # O link leva um token assinado com o dono do job (a rota não vê o login do Dash).
+        token = links_download.assinar({"rota": "exportacao", "task_id": task_id,
+                                        "usuario": _usuario_da_sessao(session_data)})
+        link = html.A(f"Baixar {situacao['filename']}", href=f"/relatorios/arquivo/{task_id}?t={token}",
+                      className="btn btn-outline-success btn-sm")
+        return dash.no_update, True, link, False, False, False, False
+
+    relatorios_jobs.retirar(task_id)
+    if status == "concluido":
+        return dcc.send_bytes(lambda f: f.write(situacao["data"]),
+                              situacao["filename"]), True, None, False, False, False, False
+    if status == "cancelado":
+        return dash.no_update, True, "Relatório cancelado.", False, False, False, False
+    is_no_data = "Sem dados" in situacao.get("message", "")
+    return dash.no_update, True, None, is_no_data, not is_no_data, False, False
+
+
 @app.callback([Output('pdf-task-id-store', 'data'), Output('pdf-check-interval', 'disabled'),
                Output('report-status-indicator', 'children'), Output('btn-pdf-especifico', 'disabled'),
                Output('btn-excel-especifico', 'disabled')], Input('btn-pdf-especifico', 'n_clicks'),
               [State('pdf-date-picker', 'start_date'), State('pdf-date-picker', 'end_date'),
-               State('store-id-ponto-ativo', 'data')], prevent_initial_call=True)
-def trigger_pdf_generation(n_clicks, start_date, end_date, id_ponto):
+               State('store-id-ponto-ativo', 'data'), State('session-store', 'data'),
+               State('check-relatorio-consolidado', 'value')], prevent_initial_call=True)
+def trigger_pdf_generation(n_clicks, start_date, end_date, id_ponto, session_data, consolidado):
     if not n_clicks: return dash.no_update, True, dash.no_update, dash.no_update, dash.no_update
-    task_id = str(uuid.uuid4())
-    thread = Thread(target=gerador_pdf.thread_gerar_pdf, args=(task_id, start_date, end_date, id_ponto))
-    thread.start()
-    return task_id, False, html.Div([dbc.Spinner(size="sm"), " Gerando PDF..."]), True, True
+    if consolidado:
+        return _iniciar_relatorio("pdf_consolidado", "PDF consolidado", start_date, end_date, None, session_data)
+    return _iniciar_relatorio("pdf", "PDF", start_date, end_date, id_ponto, session_data)
 
 
 @app.callback(
@@ -430,36 +661,26 @@ def trigger_pdf_generation(n_clicks, start_date, end_date, id_ponto):
      Output('report-status-indicator', 'children', allow_duplicate=True), Output('alert-pdf-error', 'is_open'),
      Output('alert-pdf-generic-error', 'is_open'), Output('btn-pdf-especifico', 'disabled', allow_duplicate=True),
      Output('btn-excel-especifico', 'disabled', allow_duplicate=True)], Input('pdf-check-interval', 'n_intervals'),
-    State('pdf-task-id-store', 'data'), prevent_initial_call=True)
-def check_pdf_status(n, task_id):
-    if not task_id: return dash.no_update, True, dash.no_update, False, False, dash.no_update, dash.no_update
-    with PDF_CACHE_LOCK:
-        task = PDF_CACHE.get(task_id)
-    if task:
-        with PDF_CACHE_LOCK:
-            del PDF_CACHE[task_id]
-        if task["status"] == "concluido":
-            return dcc.send_bytes(lambda f: f.write(task["data"]),
-                                  task["filename"]), True, None, False, False, False, False
-        else:
-            is_no_data = "Sem dados" in task["message"]
-            return dash.no_update, True, None, is_no_data, not is_no_data, False, False
-    return dash.no_update, False, dash.no_update, False, False, dash.no_update, dash.no_update
+    [State('pdf-task-id-store', 'data'), State('session-store', 'data')], prevent_initial_call=True)
+def check_pdf_status(n, task_id, session_data):
+    return _verificar_relatorio(task_id, "PDF", session_data)
 
 
 @app.callback([Output('excel-task-id-store', 'data'), Output('excel-check-interval', 'disabled'),
                Output('report-status-indicator', 'children', allow_duplicate=True),
                Output('btn-pdf-especifico', 'disabled', allow_duplicate=True),
                Output('btn-excel-especifico', 'disabled', allow_duplicate=True)],
-              Input('btn-excel-especifico', 'n_clicks'),
+              [Input('btn-excel-especifico', 'n_clicks'), Input('btn-csv-especifico', 'n_clicks')],
               [State('pdf-date-picker', 'start_date'), State('pdf-date-picker', 'end_date'),
-               State('store-id-ponto-ativo', 'data')], prevent_initial_call=True)
-def trigger_excel_generation(n_clicks, start_date, end_date, id_ponto):
-    if not n_clicks: return dash.no_update, True, dash.no_update, dash.no_update, dash.no_update
-    task_id = str(uuid.uuid4())
-    thread = Thread(target=gerador_pdf.thread_gerar_excel, args=(task_id, start_date, end_date, id_ponto))
-    thread.start()
-    return task_id, False, html.Div([dbc.Spinner(size="sm"), " Gerando Excel..."]), True, True
+               State('store-id-ponto-ativo', 'data'), State('session-store', 'data'),
+               State('check-relatorio-consolidado', 'value')], prevent_initial_call=True)
+def trigger_excel_generation(n_excel, n_csv, start_date, end_date, id_ponto, session_data, consolidado):
+    if not (n_excel or n_csv): return dash.no_update, True, dash.no_update, dash.no_update, dash.no_update
+    if dash.ctx.triggered_id == 'btn-csv-especifico':
+        return _iniciar_relatorio("csv", "CSV", start_date, end_date, id_ponto, session_data)
+    if consolidado:
+        return _iniciar_relatorio("excel_consolidado", "Excel consolidado", start_date, end_date, None, session_data)
+    return _iniciar_relatorio("excel", "Excel", start_date, end_date, id_ponto, session_data)
 
 
 @app.callback(
@@ -469,21 +690,61 @@ def trigger_excel_generation(n_clicks, start_date, end_date, id_ponto):
      Output('alert-pdf-generic-error', 'is_open', allow_duplicate=True),
      Output('btn-pdf-especifico', 'disabled', allow_duplicate=True),
      Output('btn-excel-especifico', 'disabled', allow_duplicate=True)], Input('excel-check-interval', 'n_intervals'),
-    State('excel-task-id-store', 'data'), prevent_initial_call=True)
-def check_excel_status(n, task_id):
-    if not task_id: return dash.no_update, True, dash.no_update, False, False, dash.no_update, dash.no_update
-    with EXCEL_CACHE_LOCK:
-        task = EXCEL_CACHE.get(task_id)
-    if task:
-        with EXCEL_CACHE_LOCK:
-            del EXCEL_CACHE[task_id]
-        if task["status"] == "concluido":
-            return dcc.send_bytes(lambda f: f.write(task["data"]),
-                                  task["filename"]), True, None, False, False, False, False
-        else:
-            is_no_data = "Sem dados" in task["message"]
-            return dash.no_update, True, None, is_no_data, not is_no_data, False, False
-    return dash.no_update, False, dash.no_update, False, False, dash.no_update, dash.no_update
+    [State('excel-task-id-store', 'data'), State('session-store', 'data')], prevent_initial_call=True)
+def check_excel_status(n, task_id, session_data):
+    return _verificar_relatorio(task_id, "exportação", session_data)
+
+
+@app.server.route('/relatorios/arquivo/<task_id>')
+def baixar_exportacao(task_id):
+    """ Exportações Excel/CSV: o arquivo vai do disco para a resposta em blocos (nada inteiro na memória). """
+    token = links_download.validar(flask.request.args.get('t'), {"rota": "exportacao", "task_id": task_id})
+    if token is None: flask.abort(403)
+    arquivo = relatorios_jobs.arquivo_para_download(task_id, token["usuario"])
+    if arquivo is None: flask.abort(404)
+    caminho, nome_arquivo = arquivo
+    return flask.send_file(caminho, as_attachment=True, download_name=nome_arquivo)
+
+
+@app.callback(Output('lista-relatorios-agendados', 'children'),
+              [Input('store-id-ponto-ativo', 'data'), Input('intervalo-atualizacao-dados', 'n_intervals')],
+              State('session-store', 'data'))
+def update_relatorios_agendados(id_ponto, n_intervals, session_data):
+    """
+    Relatórios já gerados pelo worker (relatorios_agendados): download direto do disco, sem fila.
+    Links assinados e com validade (links_download), renovados a cada atualização da página.
+    """
+    if not id_ponto or not (session_data or {}).get('logged_in'): return None
+    rotulos = {agendamento["nome"]: agendamento["rotulo"] for agendamento in RELATORIOS_AGENDADOS}
+    links = []
+    for entrada in relatorios_agendados.disponiveis(id_ponto):
+        inicio, fim = (pd.to_datetime(d).strftime('%d/%m') for d in (entrada["inicio"], entrada["fim"]))
+        periodo = inicio if inicio == fim else f"{inicio} a {fim}"
+        token = links_download.assinar({"rota": "agendado", "nome": entrada["nome"], "id_ponto": entrada["id_ponto"]})
+        links.append(html.Li(html.A(f"{rotulos[entrada['nome']]} ({periodo})",
+                                    href=f"/relatorios/agendado/{entrada['nome']}/{entrada['id_ponto']}?t={token}")))
+    if not links: return None
+    return html.Div([html.Div("Relatórios prontos:", className="fw-bold"), html.Ul(links, className="mb-0")])
+
+
+@app.server.route('/relatorios/agendado/<nome>/<id_ponto>')
+def baixar_relatorio_agendado(nome, id_ponto):
+    esperado = {"rota": "agendado", "nome": nome, "id_ponto": id_ponto}
+    if links_download.validar(flask.request.args.get('t'), esperado) is None: flask.abort(403)
+    arquivo = relatorios_agendados.arquivo_para_download(nome, id_ponto)
+    if arquivo is None: flask.abort(404)
+    caminho, nome_arquivo = arquivo
+    return flask.send_file(caminho, as_attachment=True, download_name=nome_arquivo)
+
+
+@app.callback(Output('report-status-indicator', 'children', allow_duplicate=True),
+              Input('btn-cancelar-relatorio', 'n_clicks'),
+              [State('pdf-task-id-store', 'data'), State('excel-task-id-store', 'data')], prevent_initial_call=True)
+def cancel_report_generation(n_clicks, pdf_task_id, excel_task_id):
+    if not n_clicks: return dash.no_update
+    cancelados = [relatorios_jobs.cancelar(t) for t in (pdf_task_id, excel_task_id) if t]
+    # O polling confirma o cancelamento (o relatório em execução para na próxima etapa)
+    return html.Div([dbc.Spinner(size="sm"), " Cancelando..."]) if any(cancelados) else dash.no_update
 
 
 @app.callback(Output('dynamic-accumulated-output', 'children'),
@@ -495,7 +756,7 @@ def update_dynamic_accumulated_text(selected_hours, pathname):
         id_ponto = pathname.split('/')[-1]
 
         # OTIMIZAÇÃO TEXTO ACUMULADO: Pede só o necessário
-        cols_necessarias = ['timestamp', 'id_ponto', 'chuva_mm', 'precipitacao_acumulada_mm']
+        cols_necessarias = ['timestamp', 'id_ponto', 'chuva_mm']
 
         df_ponto = data_source.read_data_from_sqlite(
             id_ponto=id_ponto,
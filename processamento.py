@@ -7,17 +7,85 @@ import warnings
 
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
+import qualidade
 from config import (
     CHUVA_LIMITE_VERDE, CHUVA_LIMITE_AMARELO, CHUVA_LIMITE_LARANJA,
     DELTA_TRIGGER_UMIDADE, RISCO_MAP, STATUS_MAP_HIERARQUICO,
-    STATUS_MAP_CHUVA, CONSTANTES_PADRAO  # Adicionado CONSTANTES_PADRAO
+    STATUS_MAP_CHUVA, CONSTANTES_PADRAO,  # Adicionado CONSTANTES_PADRAO
+    ODOMETRO_TOLERANCIA_MEIA_NOITE_MIN, ODOMETRO_QUEDA_MIN_MM,
+    ODOMETRO_REINICIO_MAX_MM, ODOMETRO_INTENSIDADE_MAX_MM_H,
+    FUSO_LOCAL, COLUNAS_UMIDADE
 )
 
+# Códigos de anomalia devolvidos por decodificar_odometro
+ODOMETRO_OK, ODOMETRO_REINICIO, ODOMETRO_SALTO, ODOMETRO_RECUO = 0, 1, 2, 3
+
+
+def decodificar_odometro(df, fuso=FUSO_LOCAL):
+    """
+    Decodificador ÚNICO do odômetro diário de chuva (precipitacao_acumulada_mm -> mm por leitura),
+    vetorizado para várias estações de uma vez. Não exige df ordenado; o resultado vem alinhado
+    ao índice de df, com as colunas 'chuva_mm' e 'anomalia_odometro'.
+
+    Regras:
+      - Subida normal: a diferença para a leitura anterior.
+      - Zeragem perto da meia-noite LOCAL (± ODOMETRO_TOLERANCIA_MEIA_NOITE_MIN, cobre relógio
+        adiantado/atrasado): virada do dia, a chuva é o próprio valor novo.
+      - Queda fora da meia-noite: reinício da estação só se a queda for grande e o valor novo
+        pequeno (ODOMETRO_REINICIO); senão é recuo espúrio (ODOMETRO_RECUO), que vale 0 e não
+        gera chuva fantasma quando o odômetro volta ao patamar anterior (máximo acumulado do trecho).
+      - Subida acima de ODOMETRO_INTENSIDADE_MAX_MM_H (proporcional ao intervalo): salto
+        implausível (ODOMETRO_SALTO), descartado.
+    """
+    resultado = pd.DataFrame({'chuva_mm': 0.0, 'anomalia_odometro': ODOMETRO_OK}, index=df.index)
+    if df.empty or 'precipitacao_acumulada_mm' not in df.columns:
+        return resultado
+
+    # Trabalha por posição (o índice de df pode ter rótulos repetidos, ex.: após concat)
+    ordenado = df[['id_ponto', 'timestamp', 'precipitacao_acumulada_mm']].reset_index(drop=True).sort_values(
+        ['id_ponto', 'timestamp'], kind='stable')
+    ids = ordenado['id_ponto']
+    ts = pd.to_datetime(ordenado['timestamp'], utc=True)
+    primeiro = ids.ne(ids.shift())
+    bruto = pd.to_numeric(ordenado['precipitacao_acumulada_mm'], errors='coerce')
+
+    # 1. Saltos implausíveis (comparados à última leitura válida) saem antes de tudo
+    valor = bruto.groupby(ids, sort=False).ffill()
+    horas = ((ts - ts.groupby(ids, sort=False).shift(1)) / pd.Timedelta(hours=1)).clip(lower=1 / 6)
+    salto = ~primeiro & ((bruto - valor.groupby(ids, sort=False).shift(1)) > ODOMETRO_INTENSIDADE_MAX_MM_H * horas)
+    valor = bruto.mask(salto).groupby(ids, sort=False).ffill()
+
+    # 2. Quedas: virada do dia (perto da meia-noite local) ou reinício; as demais são recuo espúrio
+    anterior = valor.groupby(ids, sort=False).shift(1)
+    queda = ~primeiro & (valor < anterior)
+    tolerancia = pd.Timedelta(minutes=ODOMETRO_TOLERANCIA_MEIA_NOITE_MIN)
+    ts_anterior = ts.groupby(ids, sort=False).shift(1)
+    dia_antes = (ts_anterior - tolerancia).dt.tz_convert(fuso).dt.normalize()
+    dia_depois = (ts + tolerancia).dt.tz_convert(fuso).dt.normalize()
+    meia_noite = dia_antes.ne(dia_depois) & ts_anterior.notna()
+    reinicio = queda & ~meia_noite & ((anterior - valor) >= ODOMETRO_QUEDA_MIN_MM) & (valor <= ODOMETRO_REINICIO_MAX_MM)
+    zeragem = queda & (meia_noite | reinicio)
+    recuo = queda & ~zeragem
+
+    # 3. Chuva = subida do máximo acumulado dentro de cada trecho entre zeragens
+    trecho = (primeiro | zeragem).cumsum()
+    referencia = valor.fillna(0).groupby(trecho).cummax()
+    chuva = referencia.groupby(trecho).diff()
+    chuva = chuva.where(~zeragem, valor).where(~primeiro, 0.0).fillna(0.0).clip(lower=0)
+
+    anomalia = np.select([salto, reinicio, recuo], [ODOMETRO_SALTO, ODOMETRO_REINICIO, ODOMETRO_RECUO],
+                         default=ODOMETRO_OK)
+    chuva_mm = np.zeros(len(df))
+    codigos = np.zeros(len(df), dtype='int64')
+    chuva_mm[ordenado.index] = chuva.to_numpy()
+    codigos[ordenado.index] = anomalia
+    return pd.DataFrame({'chuva_mm': chuva_mm, 'anomalia_odometro': codigos}, index=df.index)
+
 
 def calcular_acumulado_rolling(df_ponto, horas=72):
     """
-    Calcula a chuva real usando a diferença do ACUMULADO DIÁRIO (Odômetro),
-    que é à prova de falhas de coleta e sincronia.
+    Acumulado móvel da chuva real. A chuva por leitura (chuva_mm) é derivada do ACUMULADO DIÁRIO
+    (Odômetro) uma única vez, na ingestão, o que é à prova de falhas de coleta e sincronia.
     """
     # Validação básica
     required_cols = ['timestamp', 'id_ponto']
@@ -31,58 +99,279 @@ def calcular_acumulado_rolling(df_ponto, horas=72):
         df_original['timestamp'] = pd.to_datetime(df_original['timestamp'])
         df_original = df_original.set_index('timestamp')
 
-        # Verifica se temos a coluna vital: precipitacao_acumulada_mm
-        if 'precipitacao_acumulada_mm' not in df_original.columns:
-            # Fallback: Se não tiver acumulado, usa a soma simples (legado)
-            df_original['chuva_mm'] = pd.to_numeric(df_original['chuva_mm'], errors='coerce').fillna(0)
-            window_size = int(horas * 6)  # 6 dados por hora (10 min)
-            return df_original['chuva_mm'].rolling(window=window_size, min_periods=1).sum().reset_index()
+        if 'chuva_mm' not in df_original.columns and 'precipitacao_acumulada_mm' not in df_original.columns:
+            return pd.DataFrame(columns=['id_ponto', 'timestamp', 'chuva_mm'])
+
+        # 1-3. Chuva real por leitura: chuva_mm gravado na ingestão (odômetro decodificado só onde falta)
+        df_original['chuva_real_incremental'] = incremento_chuva_por_ponto(df_original.reset_index()).to_numpy()
+
+        # A janela é dinâmica, baseada no parâmetro 'horas' (6 blocos de 10min por hora)
+        window_size = int(horas * 6)
+        ids_ponto = df_original['id_ponto'].unique()
+
+        # 4. Agora temos a chuva exata. Fazemos a soma Rolling.
+        # Resample para 10T (por estação) para garantir a grade temporal correta
+        if len(ids_ponto) == 1:
+            # Uma estação (página da estação): direto, sem o custo fixo do groupby
+            df_resampled = df_original['chuva_real_incremental'].resample('10T').sum().fillna(0)
+            temp_df = df_resampled.rolling(window=window_size, min_periods=1).sum().to_frame(name='chuva_mm')
+            temp_df['id_ponto'] = ids_ponto[0]
+            return temp_df.reset_index()
+
+        # Várias estações: uma passada agrupada (resample e rolling por id_ponto)
+        df_resampled = df_original.groupby('id_ponto')['chuva_real_incremental'].resample('10T').sum().fillna(0)
+        acumulado_rolling = df_resampled.groupby(level='id_ponto').rolling(window=window_size, min_periods=1).sum()
+        acumulado_rolling.index = df_resampled.index
 
-        # Garante numérico
-        df_original['precipitacao_acumulada_mm'] = pd.to_numeric(df_original['precipitacao_acumulada_mm'],
-                                                                 errors='coerce')
+        return acumulado_rolling.rename('chuva_mm').reset_index()[['timestamp', 'chuva_mm', 'id_ponto']]
 
-        lista_dfs = []
+    except Exception as e:
+        print(f"Erro CRÍTICO (Cálculo Acumulado): {e}")
+        traceback.print_exc()
+        return pd.DataFrame(columns=['id_ponto', 'timestamp', 'chuva_mm'])
 
-        for ponto_id in df_original['id_ponto'].unique():
-            df_pt = df_original[df_original['id_ponto'] == ponto_id].copy()
 
-            # 1. Preenche buracos no acumulado (se a net cair, o acumulado do dia se mantém constante)
-            df_pt['precipitacao_acumulada_mm'] = df_pt['precipitacao_acumulada_mm'].ffill().fillna(0)
+# ==============================================================================
+# --- CLASSIFICAÇÃO EM LOTE (TODAS AS ESTAÇÕES DE UMA VEZ) ---
+# ==============================================================================
+NOMES_NIVEL = {nivel: valores[0] for nivel, valores in STATUS_MAP_HIERARQUICO.items()}
 
-            # 2. A MÁGICA: Calcula a chuva real subtraindo o valor atual do anterior (Diferencial)
-            # Ex: 12.4mm (agora) - 10.0mm (antes) = 2.4mm (chuva real)
-            df_pt['chuva_real_incremental'] = df_pt['precipitacao_acumulada_mm'].diff().fillna(0)
 
-            # 3. Correção da Meia-Noite (Reset do Odômetro):
-            # Quando vira o dia, o acumulado vai de ex: 20mm para 0mm. O diff dá -20.
-            # Se o diff for negativo, significa que o dia virou. A chuva real é apenas o novo valor.
-            mask_virada_dia = df_pt['chuva_real_incremental'] < 0
-            df_pt.loc[mask_virada_dia, 'chuva_real_incremental'] = df_pt.loc[
-                mask_virada_dia, 'precipitacao_acumulada_mm']
+def classificar_nivel_chuva(chuva_mm, limites=None):
+    """
+    Versão vetorizada de definir_status_chuva: array de níveis (0..3, -1 = SEM DADOS).
+    limites: (verde, amarelo, laranja) ou um array (..., 3) por estação (ex.: regras.TabelaRegras).
+    """
+    chuva = np.asarray(chuva_mm, dtype=float)
+    if limites is None:
+        limites = [CHUVA_LIMITE_VERDE, CHUVA_LIMITE_AMARELO, CHUVA_LIMITE_LARANJA]
+    limites = np.asarray(limites, dtype=float)
+    niveis = np.select(
+        [chuva >= limites[..., 2], chuva > limites[..., 1], chuva > limites[..., 0]],
+        [3, 2, 1], default=0
+    )
+    return np.where(np.isnan(chuva), -1, niveis)
 
-            # 4. Agora temos a chuva exata. Fazemos a soma Rolling.
-            # Resample para 10T para garantir a grade temporal correta
-            df_resampled = df_pt['chuva_real_incremental'].resample('10T').sum().fillna(0)
 
-            # --- CORREÇÃO APLICADA AQUI ---
-            # A janela agora é dinâmica, baseada no parâmetro 'horas'
-            window_size = int(horas * 6)  # 6 blocos de 10min por hora
-            acumulado_rolling = df_resampled.rolling(window=window_size, min_periods=1).sum()
+def classificar_nivel_umidade(umidades, bases, delta=DELTA_TRIGGER_UMIDADE):
+    """
+    Versão vetorizada de definir_status_umidade_hierarquico.
+    umidades e bases: arrays (n, 3) com as profundidades 1m, 2m e 3m; delta: escalar ou (n,).
+    Qualquer NaN -> -1 (SEM DADOS).
+    """
+    umidades = np.asarray(umidades, dtype=float)
+    bases = np.broadcast_to(np.asarray(bases, dtype=float), umidades.shape)
+    delta = np.asarray(delta, dtype=float)
+    if delta.ndim == 1: delta = delta[:, None]
+    s = (umidades - bases) >= delta
+    s1, s2, s3 = s[:, 0], s[:, 1], s[:, 2]
+    niveis = np.select(
+        [s1 & s2 & s3,
+         (s1 & s2 & ~s3) | (~s1 & s2 & s3),
+         (s1 & ~s2 & ~s3) | (~s1 & ~s2 & s3)],
+        [3, 2, 1], default=0
+    )
+    sem_dados = np.isnan(umidades).any(axis=1) | np.isnan(bases).any(axis=1)
+    return np.where(sem_dados, -1, niveis)
 
-            temp_df = acumulado_rolling.to_frame(name='chuva_mm')
-            temp_df['id_ponto'] = ponto_id
-            lista_dfs.append(temp_df)
 
-        if not lista_dfs:
-            return pd.DataFrame(columns=['id_ponto', 'timestamp', 'chuva_mm'])
+def derivar_chuva_mm(df):
+    """
+    Preenche chuva_mm (mm por leitura, persistida no banco) a partir do odômetro, na ingestão.
+    df é a janela recente do worker (histórico gravado + leituras novas), então cada leitura nova
+    tem a leitura anterior gravada como contexto. A primeira leitura de cada estação na janela e
+    as linhas sem odômetro (ex.: chuva de arquivo do backfill) mantêm o chuva_mm que já tinham.
+    """
+    if df.empty or 'precipitacao_acumulada_mm' not in df.columns: return df
+    df = df.copy()
+    odometro = pd.to_numeric(df['precipitacao_acumulada_mm'], errors='coerce')
+    timestamps = pd.to_datetime(df['timestamp'], utc=True)
+    primeira = timestamps.eq(timestamps.groupby(df['id_ponto']).transform('min'))
+    chuva = pd.to_numeric(df['chuva_mm'], errors='coerce') if 'chuva_mm' in df.columns \
+        else pd.Series(np.nan, index=df.index)
+    derivar = odometro.notna() & ~(primeira & chuva.notna())
+    df['chuva_mm'] = chuva.mask(derivar, decodificar_odometro(df)['chuva_mm']).round(2)
+    return df
 
-        return pd.concat(lista_dfs).reset_index()
 
-    except Exception as e:
-        print(f"Erro CRÍTICO (Cálculo Acumulado): {e}")
-        traceback.print_exc()
-        return pd.DataFrame(columns=['id_ponto', 'timestamp', 'chuva_mm'])
+def incremento_chuva_por_ponto(df):
+    """
+    Chuva incremental (mm por leitura) de várias estações, alinhada ao índice de df.
+    Usa o chuva_mm gravado na ingestão; só decodifica o odômetro onde ele falta (linhas antigas).
+    """
+    if 'chuva_mm' not in df.columns:
+        return decodificar_odometro(df)['chuva_mm']
+    chuva = pd.to_numeric(df['chuva_mm'], errors='coerce')
+    faltando = chuva.isna()
+    if faltando.any() and 'precipitacao_acumulada_mm' in df.columns:
+        chuva = chuva.mask(faltando, decodificar_odometro(df)['chuva_mm'])
+    return chuva.fillna(0)
+
+
+def regras_por_estacao(regras, ids_ponto):
+    """ (limites_chuva, bases_umidade, delta_umidade) alinhados a ids_ponto; sem regras -> padrão global. """
+    n = len(ids_ponto)
+    if regras is None:
+        limites = np.tile([CHUVA_LIMITE_VERDE, CHUVA_LIMITE_AMARELO, CHUVA_LIMITE_LARANJA], (n, 1))
+        bases = np.tile([CONSTANTES_PADRAO[f'UMIDADE_BASE_{d}M'] for d in (1, 2, 3)], (n, 1))
+        return limites.astype(float), bases.astype(float), np.full(n, DELTA_TRIGGER_UMIDADE)
+    idx = regras.indices(ids_ponto)
+    return regras.limites_chuva[idx], regras.bases_umidade[idx], regras.delta_umidade[idx]
+
+
+def classificar_status_lote(df, horas=72, pontos_umidade=None, regras=None, agora=None,
+                            validade_umidade=pd.Timedelta(hours=3)):
+    """
+    Calcula, para TODAS as estações de uma só vez (um sort + operações agrupadas, sem cópias
+    por estação), o acumulado de chuva da janela e os níveis de risco de chuva e umidade.
+    regras: regras.TabelaRegras com limites/bases por estação (None = constantes globais).
+
+    Retorna um DataFrame indexado por id_ponto com: chuva_72h, nivel_chuva, umidade_1m/2m/3m,
+    ts_umidade e nivel_umidade (-1 quando não há leitura de umidade recente).
+    """
+    colunas_saida = ['chuva_72h', 'nivel_chuva', 'umidade_1m', 'umidade_2m', 'umidade_3m', 'ts_umidade',
+                     'nivel_umidade']
+    if df.empty:
+        return pd.DataFrame(columns=colunas_saida)
+    if agora is None:
+        agora = pd.Timestamp.now(tz='UTC')
+
+    df = qualidade.mascarar_umidade(df)  # Leituras reprovadas no QC não entram no status
+    df = df.sort_values(['id_ponto', 'timestamp'], kind='stable').reset_index(drop=True)
+    slot = df['timestamp'].dt.floor('10min')
+
+    # --- Chuva: soma dos incrementos dos slots dentro da janela que termina no último slot de cada estação
+    incremento = incremento_chuva_por_ponto(df)
+    ultimo_slot = slot.groupby(df['id_ponto'], sort=False).transform('max')
+    na_janela = slot > (ultimo_slot - pd.Timedelta(hours=horas))
+    chuva_janela = incremento.where(na_janela, 0.0).groupby(df['id_ponto'], sort=False).sum().round(1)
+
+    resultado = pd.DataFrame(index=chuva_janela.index)
+    resultado['chuva_72h'] = chuva_janela
+    limites, bases, deltas = regras_por_estacao(regras, resultado.index)
+    resultado['nivel_chuva'] = classificar_nivel_chuva(resultado['chuva_72h'].to_numpy(), limites)
+
+    # --- Umidade: última leitura válida de cada estação monitorada, se ainda estiver "fresca"
+    for coluna in ['umidade_1m', 'umidade_2m', 'umidade_3m']:
+        resultado[coluna] = np.nan
+    resultado['ts_umidade'] = pd.Series(pd.NaT, index=resultado.index, dtype='datetime64[ns, UTC]')
+    resultado['nivel_umidade'] = -1
+
+    cols_umidade = [c for c in COLUNAS_UMIDADE if c in df.columns]
+    if cols_umidade:
+        mask = df[cols_umidade].notna().any(axis=1)
+        if pontos_umidade is not None:
+            mask &= df['id_ponto'].isin(pontos_umidade)
+        ultimas = df[mask].groupby('id_ponto', sort=False).tail(1).set_index('id_ponto')
+        ultimas = ultimas[(agora - ultimas['timestamp']) < validade_umidade]
+        if not ultimas.empty:
+            valores = ultimas.reindex(columns=COLUNAS_UMIDADE).astype(float).round(1)
+            resultado.loc[ultimas.index, ['umidade_1m', 'umidade_2m', 'umidade_3m']] = valores.to_numpy()
+            resultado.loc[ultimas.index, 'ts_umidade'] = ultimas['timestamp']
+            pos = resultado.index.get_indexer(ultimas.index)
+            resultado.loc[ultimas.index, 'nivel_umidade'] = classificar_nivel_umidade(
+                valores.to_numpy(), bases[pos], deltas[pos])
+    return resultado
+
+
+def montar_grade(df, pontos_umidade=None, validade_umidade=pd.Timedelta(hours=3)):
+    """
+    Grade de 10 min compartilhada (série de risco, analíticos): um sort e matrizes largas
+    slots x estações, sem cópias por estação.
+
+    Retorna um dict com:
+      grade (DatetimeIndex UTC), pontos (Index), chuva (T, S) em mm por slot,
+      umidade (T, S, 3) com a última leitura de cada slot mantida por `validade_umidade` (ffill limitado),
+      primeiro / ultimo (S,): posição na grade do primeiro e do último slot com dados de cada estação.
+    """
+    df = qualidade.mascarar_umidade(df)
+    df = df.sort_values(['id_ponto', 'timestamp'], kind='stable').reset_index(drop=True)
+    slot = df['timestamp'].dt.floor('10min')
+    grade = pd.date_range(slot.min(), slot.max(), freq='10min')
+
+    # --- Chuva: soma dos incrementos por (slot, estação)
+    incremento = incremento_chuva_por_ponto(df)
+    chuva_wide = incremento.groupby([slot, df['id_ponto']]).sum().unstack('id_ponto')
+    chuva_wide = chuva_wide.reindex(grade).fillna(0.0)
+    pontos = chuva_wide.columns
+
+    # --- Umidade: última leitura por slot
+    umidades = np.full((len(grade), len(pontos), 3), np.nan)
+    if all(c in df.columns for c in COLUNAS_UMIDADE):
+        mask = df[COLUNAS_UMIDADE].notna().any(axis=1)
+        if pontos_umidade is not None:
+            mask &= df['id_ponto'].isin(pontos_umidade)
+        if mask.any():
+            limite_ffill = max(int(validade_umidade / pd.Timedelta(minutes=10)) - 1, 0)
+            ultimas = df.loc[mask, COLUNAS_UMIDADE].groupby([slot[mask], df.loc[mask, 'id_ponto']]).last()
+            for i, coluna in enumerate(COLUNAS_UMIDADE):
+                wide = ultimas[coluna].unstack('id_ponto').reindex(index=grade, columns=pontos)
+                umidades[:, :, i] = wide.ffill(limit=limite_ffill).round(1).to_numpy()
+
+    posicao = pd.Series(((slot - grade[0]) // pd.Timedelta(minutes=10)).to_numpy())
+    return {
+        "grade": grade,
+        "pontos": pontos,
+        "chuva": chuva_wide.to_numpy(),
+        "umidade": umidades,
+        "primeiro": posicao.groupby(df['id_ponto']).min().reindex(pontos).to_numpy(),
+        "ultimo": posicao.groupby(df['id_ponto']).max().reindex(pontos).to_numpy(),
+    }
+
+
+def calcular_serie_risco(df, horas=72, pontos_umidade=None, regras=None,
+                         validade_umidade=pd.Timedelta(hours=3), somente_janela_completa=True, grade=None):
+    """
+    Classificação de risco ao longo de toda a grade de 10 min (não só "agora"), para todas as
+    estações de uma vez: matriz larga (slots x estações) -> rolling de `horas` -> níveis vetorizados.
+
+    somente_janela_completa=True descarta os slots cuja janela começa antes do primeiro dado
+    recebido (o acumulado ali ficaria subestimado). Cada estação só gera linhas entre o seu
+    primeiro e o seu último slot com dados. regras: regras.TabelaRegras (None = constantes globais).
+    grade: resultado de montar_grade(df) já calculado no ciclo (evita refazer o pivot).
+
+    Retorna formato longo: timestamp, id_ponto, chuva_72h, nivel_chuva, delta_umidade_1m/2m/3m,
+    nivel_umidade e nivel_risco (= pior entre chuva e umidade).
+    """
+    colunas_saida = ['timestamp', 'id_ponto', 'chuva_72h', 'nivel_chuva', 'delta_umidade_1m',
+                     'delta_umidade_2m', 'delta_umidade_3m', 'nivel_umidade', 'nivel_risco']
+    if df.empty:
+        return pd.DataFrame(columns=colunas_saida)
+
+    if grade is None:
+        grade = montar_grade(df, pontos_umidade, validade_umidade)
+    slots, pontos, umidades = grade["grade"], grade["pontos"], grade["umidade"]
+    n_slots, n_pontos = len(slots), len(pontos)
+    n_janela = int(horas * 6)
+
+    limites, bases, deltas_trigger = regras_por_estacao(regras, pontos)
+    acumulado = pd.DataFrame(grade["chuva"]).rolling(n_janela, min_periods=1).sum().round(1).to_numpy()
+    nivel_chuva = classificar_nivel_chuva(acumulado, limites)
+
+    deltas = umidades - bases[None, :, :]
+    nivel_umidade = classificar_nivel_umidade(
+        umidades.reshape(-1, 3), np.tile(bases, (n_slots, 1)), np.tile(deltas_trigger, n_slots)
+    ).reshape(n_slots, n_pontos)
+
+    # --- Formato longo (slot-major), restrito ao intervalo de dados de cada estação
+    linhas = np.arange(n_slots)[:, None]
+    valido = (linhas >= grade["primeiro"][None, :]) & (linhas <= grade["ultimo"][None, :])
+    if somente_janela_completa:
+        valido &= linhas >= (n_janela - 1)
+
+    valido = valido.ravel()
+    resultado = pd.DataFrame({
+        'timestamp': np.repeat(slots, n_pontos)[valido],
+        'id_ponto': np.tile(pontos.to_numpy(), n_slots)[valido],
+        'chuva_72h': acumulado.ravel()[valido],
+        'nivel_chuva': nivel_chuva.ravel()[valido],
+        'delta_umidade_1m': deltas[:, :, 0].ravel()[valido].round(2),
+        'delta_umidade_2m': deltas[:, :, 1].ravel()[valido].round(2),
+        'delta_umidade_3m': deltas[:, :, 2].ravel()[valido].round(2),
+        'nivel_umidade': nivel_umidade.ravel()[valido],
+    })
+    resultado['nivel_risco'] = np.maximum(resultado['nivel_chuva'], resultado['nivel_umidade'])
+    return resultado
 
 
 def definir_status_chuva(chuva_mm):
@@ -0,0 +1,136 @@
+# qualidade.py (Controle de qualidade vetorizado das leituras de umidade do solo)
+#
+# Cada linha do histórico recebe em 'qc_umidade' uma máscara de bits compacta:
+#   bit = 4 * profundidade + verificação   (profundidade: 0 = 1m, 1 = 2m, 2 = 3m)
+#   verificação: 0 = fora da faixa, 1 = pico, 2 = valor travado, 3 = inconsistência entre profundidades
+# 0 = leitura boa. Os valores brutos continuam gravados; status e gráficos usam mascarar_umidade().
+
+import numpy as np
+import pandas as pd
+
+from config import (
+    QC_UMIDADE_MIN, QC_UMIDADE_MAX,
+    QC_SPIKE_JANELA, QC_SPIKE_LIMIAR,
+    QC_TRAVADO_LEITURAS,
+    QC_CRUZADO_SUBIDA, QC_CRUZADO_SUPERFICIE,
+    COLUNAS_UMIDADE
+)
+
+QC_FAIXA, QC_PICO, QC_TRAVADO, QC_CRUZADO = 0, 1, 2, 3
+NOMES_VERIFICACAO = {QC_FAIXA: "faixa", QC_PICO: "pico", QC_TRAVADO: "travado", QC_CRUZADO: "cruzado"}
+
+LEITURAS_POR_HORA = 6
+# Leituras vizinhas de que as verificações precisam (pico: janela centrada; travado: sequência; entre
+# profundidades: 6h do 1m). Quem faz o QC de um trecho isolado (ex.: backfill) carrega essa margem em volta.
+MARGEM_CONTEXTO = pd.Timedelta(minutes=10 * max(QC_SPIKE_JANELA, QC_TRAVADO_LEITURAS, 7 * LEITURAS_POR_HORA))
+
+
+def bit(profundidade, verificacao):
+    return 1 << (4 * profundidade + verificacao)
+
+
+def mascara_profundidade(profundidade):
+    """ Todos os bits de uma profundidade (qualquer verificação reprovada). """
+    return 0b1111 << (4 * profundidade)
+
+
+def calcular_qc(df):
+    """
+    Máscara qc_umidade (int) para cada linha de df, alinhada ao índice de df. Precisa de
+    id_ponto, timestamp e das colunas de umidade; as verificações rodam por estação em ordem
+    temporal, com operações agrupadas (sem laço por estação).
+    """
+    qc = pd.Series(0, index=df.index, dtype='int64')
+    if df.empty or not all(c in df.columns for c in COLUNAS_UMIDADE):
+        return qc
+
+    # Só as linhas com alguma leitura de umidade (linhas só de chuva quebrariam sequências e diferenças)
+    ordenado = df[['id_ponto', 'timestamp'] + COLUNAS_UMIDADE].sort_values(['id_ponto', 'timestamp'], kind='stable')
+    valores = ordenado[COLUNAS_UMIDADE].apply(pd.to_numeric, errors='coerce')
+    ordenado, valores = ordenado[valores.notna().any(axis=1)], valores[valores.notna().any(axis=1)]
+    if ordenado.empty:
+        return qc
+    presente = valores.notna()
+    bits = np.zeros(len(ordenado), dtype='int64')
+
+    # 1. Faixa física
+    fora = presente & ((valores < QC_UMIDADE_MIN) | (valores > QC_UMIDADE_MAX))
+
+    # 2. Pico: desvio da mediana móvel centrada (calculada sem os valores fora da faixa)
+    validos = valores.where(~fora)
+    mediana = (validos.groupby(ordenado['id_ponto'], sort=False)
+               .rolling(QC_SPIKE_JANELA, center=True, min_periods=3).median()
+               .reset_index(level=0, drop=True).reindex(ordenado.index))
+    pico = presente & ~fora & ((validos - mediana).abs() > QC_SPIKE_LIMIAR)
+
+    # 3. Valor travado: comprimento da sequência de leituras idênticas
+    travado = pd.DataFrame(False, index=ordenado.index, columns=COLUNAS_UMIDADE)
+    novo_grupo = ordenado['id_ponto'].ne(ordenado['id_ponto'].shift())
+    for coluna in COLUNAS_UMIDADE:
+        mudou = novo_grupo | valores[coluna].ne(valores[coluna].shift())
+        sequencia = mudou.cumsum()
+        tamanho = sequencia.map(sequencia.value_counts())
+        travado[coluna] = presente[coluna] & (tamanho >= QC_TRAVADO_LEITURAS)
+
+    # 4. Entre profundidades: 2m/3m sobem rápido sem nenhuma resposta do 1m antes (infiltração é de cima para baixo).
+    # As diferenças são por número de leituras; divididas pelo tempo decorrido entre elas viram taxas
+    # (p.p. por 1h e por 6h), corretas também com amostragem irregular ou leituras faltando.
+    por_ponto = ordenado['id_ponto']
+    horas = pd.to_datetime(ordenado['timestamp'], utc=True)
+    horas_1h = horas.groupby(por_ponto, sort=False).diff(LEITURAS_POR_HORA).dt.total_seconds() / 3600
+    horas_6h = horas.groupby(por_ponto, sort=False).diff(6 * LEITURAS_POR_HORA).dt.total_seconds() / 3600
+    variacao_1h = (validos.groupby(por_ponto, sort=False).diff(LEITURAS_POR_HORA)
+                   .div(horas_1h.where(horas_1h > 0), axis=0))
+    superficie_6h = (validos[COLUNAS_UMIDADE[0]].groupby(por_ponto, sort=False).diff(6 * LEITURAS_POR_HORA)
+                     * 6 / horas_6h.where(horas_6h > 0))
+    cruzado = pd.DataFrame(False, index=ordenado.index, columns=COLUNAS_UMIDADE)
+    for coluna in COLUNAS_UMIDADE[1:]:
+        cruzado[coluna] = (variacao_1h[coluna] > QC_CRUZADO_SUBIDA) & (superficie_6h <= QC_CRUZADO_SUPERFICIE)
+
+    for profundidade, coluna in enumerate(COLUNAS_UMIDADE):
+        for verificacao, reprovado in ((QC_FAIXA, fora), (QC_PICO, pico), (QC_TRAVADO, travado),
+                                       (QC_CRUZADO, cruzado)):
+            bits |= np.where(reprovado[coluna].to_numpy(), bit(profundidade, verificacao), 0)
+
+    qc.loc[ordenado.index] = bits
+    return qc
+
+
+def aplicar_qc(df, manter_antes_de=None):
+    """
+    Devolve df com a coluna qc_umidade (re)calculada. manter_antes_de (Timestamp UTC): as linhas mais
+    antigas mantêm a máscara já gravada (calculada quando ainda tinham contexto dos dois lados) e só
+    servem de contexto; sem máscara gravada, recebem a recalculada.
+    """
+    df = df.copy()
+    qc = calcular_qc(df)
+    if manter_antes_de is not None and 'qc_umidade' in df.columns:
+        gravado = pd.to_numeric(df['qc_umidade'], errors='coerce')
+        manter = (pd.to_datetime(df['timestamp'], utc=True) < manter_antes_de) & gravado.notna()
+        qc = qc.where(~manter, gravado).astype('int64')
+    df['qc_umidade'] = qc
+    return df
+
+
+def mascarar_umidade(df):
+    """ Substitui por NaN as leituras de umidade reprovadas no QC (sem a coluna, devolve df como está). """
+    if 'qc_umidade' not in df.columns:
+        return df
+    qc = pd.to_numeric(df['qc_umidade'], errors='coerce').fillna(0).astype('int64').to_numpy()
+    if not qc.any():
+        return df
+    df = df.copy()
+    for profundidade, coluna in enumerate(COLUNAS_UMIDADE):
+        if coluna in df.columns:
+            df.loc[(qc & mascara_profundidade(profundidade)) != 0, coluna] = np.nan
+    return df
+
+
+def descrever(qc):
+    """ Texto legível de uma máscara (para logs/planilhas). Ex.: '1m:pico, 3m:travado'. """
+    partes = []
+    for profundidade, nome in enumerate(("1m", "2m", "3m")):
+        for verificacao, descricao in NOMES_VERIFICACAO.items():
+            if int(qc) & bit(profundidade, verificacao):
+                partes.append(f"{nome}:{descricao}")
+    return ", ".join(partes)
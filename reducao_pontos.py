@@ -0,0 +1,117 @@
+# reducao_pontos.py (Redução de pontos das séries dos gráficos do dashboard, no servidor)
+#
+# Com horizontes longos (7 dias) cada traço tem mais pontos do que pixels na tela: tudo vai em JSON
+# para cada navegador a cada atualização e o Plotly desenha pontos que se sobrepõem. Aqui a série é
+# reduzida à largura (px) da área de plotagem antes de montar a figura:
+#   - linhas (umidade, acumulado): LTTB (Largest-Triangle-Three-Buckets), que mantém a forma da curva;
+#   - barras de chuva: mínimo e máximo de cada balde de 2 px (nenhum pico de chuva some).
+# Os pontos escolhidos são leituras reais (o hover mostra valores verdadeiros); cada lacuna (NaN) mantém
+# um ponto NaN, para a linha ser interrompida como na série sem redução. Os índices ficam em
+# cache por (estação, horizonte, largura, série) enquanto a série não muda.
+
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from config import GRAFICOS_REDUCAO_CACHE_MAX
+
+# (chave, nome da série) -> (assinatura da série, índices escolhidos)
+_CACHE = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+
+def lttb(x, y, n_saida):
+    """ Índices dos n_saida pontos escolhidos pelo LTTB (primeiro e último sempre ficam). x, y sem NaN. """
+    n = len(x)
+    if n_saida >= n or n_saida < 3: return np.arange(n)
+    # n_saida - 2 baldes entre o primeiro e o último ponto (todos com ao menos um ponto, pois n_saida < n)
+    bordas = np.linspace(1, n - 1, n_saida - 1).astype(np.int64)
+    indices = np.empty(n_saida, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(n_saida - 2):
+        inicio, fim = bordas[i], bordas[i + 1]
+        # Vértice C do triângulo: média do balde seguinte (no último balde, o último ponto)
+        prox_fim = bordas[i + 2] if i + 2 < len(bordas) else n
+        cx, cy = x[fim:prox_fim].mean(), y[fim:prox_fim].mean()
+        areas = np.abs((x[a] - cx) * (y[inicio:fim] - y[a]) - (x[a] - x[inicio:fim]) * (cy - y[a]))
+        a = inicio + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+
+def minmax(y, n_baldes):
+    """ Índices do mínimo e do máximo de cada um dos n_baldes baldes consecutivos, em ordem. y sem NaN. """
+    n = len(y)
+    if 2 * n_baldes >= n: return np.arange(n)
+    balde = np.repeat(np.arange(n_baldes), np.diff(np.linspace(0, n, n_baldes + 1).astype(np.int64)))
+    ordem = np.lexsort((y, balde))  # Por balde e, dentro dele, por valor
+    fronteiras = np.flatnonzero(np.diff(balde[ordem])) + 1
+    primeiros = np.concatenate(([0], fronteiras))
+    ultimos = np.concatenate((fronteiras - 1, [n - 1]))
+    return np.unique(np.concatenate((ordem[primeiros], ordem[ultimos])))
+
+
+def _numeros(x):
+    """ Eixo x numérico (datas em ns, float) para as contas do LTTB. """
+    if pd.api.types.is_datetime64_any_dtype(x):
+        return pd.DatetimeIndex(x).asi8.astype(float)
+    return np.asarray(x, dtype=float)
+
+
+def _inicios_de_lacuna(y):
+    """ Índice do primeiro NaN de cada trecho sem leitura entre duas leituras válidas. """
+    nan = np.isnan(y)
+    inicios = np.flatnonzero(nan & ~np.concatenate(([True], nan[:-1])))
+    validos = np.flatnonzero(~nan)
+    if len(validos) == 0: return inicios[:0]
+    return inicios[(inicios > validos[0]) & (inicios < validos[-1])]
+
+
+def _indices_validos(x, y, modo, largura_px):
+    """
+    Índices (sobre a série original) dos pontos mantidos. NaN (sem leitura ou reprovado no QC) fica fora
+    da redução, mas o primeiro NaN de cada lacuna volta à saída: o Plotly interrompe a linha ali, como
+    faz com a série curta (sem redução), em vez de ligar os dois lados da lacuna.
+    """
+    validos = np.flatnonzero(~np.isnan(y))
+    if modo == "minmax":
+        escolhidos = minmax(y[validos], max(1, largura_px // 2))
+    else:
+        escolhidos = lttb(x[validos], y[validos], largura_px)
+    return np.union1d(validos[escolhidos], _inicios_de_lacuna(y))
+
+
+def reduzir(df, coluna_x, series, largura_px, chave=None):
+    """
+    Um DataFrame por série, já reduzido: {coluna: df[[coluna_x, coluna]] com ~largura_px pontos, mais um
+    NaN por lacuna}.
+    series: {coluna: "lttb" | "minmax"}. chave: (id_ponto, horizonte) para reaproveitar a redução enquanto
+    a série não muda (mesmo tamanho, extremos e soma). Séries curtas voltam intactas.
+    """
+    if len(df) <= largura_px:
+        return {coluna: df[[coluna_x, coluna]] for coluna in series}
+    x = _numeros(df[coluna_x])
+    reduzidas = {}
+    for coluna, modo in series.items():
+        y = pd.to_numeric(df[coluna], errors='coerce').to_numpy(dtype=float)
+        assinatura = (len(y), x[0], x[-1], float(np.nansum(y)), int(np.isnan(y).sum()))
+        chave_serie = (chave, largura_px, coluna, modo) if chave is not None else None
+        indices = None
+        if chave_serie is not None:
+            with _CACHE_LOCK:
+                guardado = _CACHE.get(chave_serie)
+                if guardado is not None and guardado[0] == assinatura:
+                    _CACHE.move_to_end(chave_serie)
+                    indices = guardado[1]
+        if indices is None:
+            indices = _indices_validos(x, y, modo, largura_px)
+            if chave_serie is not None:
+                with _CACHE_LOCK:
+                    _CACHE[chave_serie] = (assinatura, indices)
+                    _CACHE.move_to_end(chave_serie)
+                    while len(_CACHE) > GRAFICOS_REDUCAO_CACHE_MAX:
+                        _CACHE.popitem(last=False)
+        reduzidas[coluna] = df[[coluna_x, coluna]].iloc[indices]
+    return reduzidas
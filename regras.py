@@ -0,0 +1,153 @@
+# regras.py (Limites de chuva e bases de umidade por estação, compilados em arrays NumPy)
+#
+# Ordem de prioridade (do mais fraco ao mais forte):
+#   1. Padrões globais: CHUVA_LIMITE_*, DELTA_TRIGGER_UMIDADE e CONSTANTES_PADRAO
+#   2. PONTOS_DE_ANALISE[id]["constantes"]
+#   3. Arquivo REGRAS_ARQUIVO (recarregado quando o mtime muda)
+#   4. Tabela REGRAS_TABELA no banco (consultada no máximo a cada REGRAS_RECARGA_DB_SEC)
+# Cada recarga gera uma nova TabelaRegras imutável; quem já tem a referência antiga segue usando-a.
+
+import os
+import json
+import time
+import threading
+import numpy as np
+import pandas as pd
+from sqlalchemy import inspect, text
+
+import data_source
+from config import (
+    PONTOS_DE_ANALISE, CONSTANTES_PADRAO,
+    CHUVA_LIMITE_VERDE, CHUVA_LIMITE_AMARELO, CHUVA_LIMITE_LARANJA, DELTA_TRIGGER_UMIDADE,
+    REGRAS_ARQUIVO, REGRAS_TABELA, REGRAS_RECARGA_DB_SEC
+)
+
+CAMPOS_CHUVA = ["CHUVA_LIMITE_VERDE", "CHUVA_LIMITE_AMARELO", "CHUVA_LIMITE_LARANJA"]
+CAMPOS_BASE = ["UMIDADE_BASE_1M", "UMIDADE_BASE_2M", "UMIDADE_BASE_3M"]
+CAMPO_DELTA = "DELTA_TRIGGER_UMIDADE"
+
+PADRAO_GLOBAL = {
+    "CHUVA_LIMITE_VERDE": CHUVA_LIMITE_VERDE,
+    "CHUVA_LIMITE_AMARELO": CHUVA_LIMITE_AMARELO,
+    "CHUVA_LIMITE_LARANJA": CHUVA_LIMITE_LARANJA,
+    "DELTA_TRIGGER_UMIDADE": DELTA_TRIGGER_UMIDADE,
+    **{campo: CONSTANTES_PADRAO[campo] for campo in CAMPOS_BASE},
+}
+
+
+class TabelaRegras:
+    """
+    Regras compiladas: uma linha por estação (na ordem de `pontos`) e uma linha extra no fim com o
+    padrão global, usada para estações desconhecidas.
+      limites_chuva (n+1, 3): verde, amarelo, laranja
+      bases_umidade (n+1, 3): 1m, 2m, 3m
+      delta_umidade (n+1,)
+    """
+
+    def __init__(self, regras_por_ponto):
+        self.pontos = list(regras_por_ponto.keys())
+        self._posicao = {p: i for i, p in enumerate(self.pontos)}
+        linhas = list(regras_por_ponto.values()) + [PADRAO_GLOBAL]
+        self.limites_chuva = np.array([[r[c] for c in CAMPOS_CHUVA] for r in linhas], dtype=float)
+        self.bases_umidade = np.array([[r[c] for c in CAMPOS_BASE] for r in linhas], dtype=float)
+        self.delta_umidade = np.array([r[CAMPO_DELTA] for r in linhas], dtype=float)
+        self._regras = regras_por_ponto
+
+    def indices(self, ids_ponto):
+        """ Posição de cada id_ponto nos arrays (estações desconhecidas -> linha do padrão global). """
+        padrao = len(self.pontos)
+        return np.fromiter((self._posicao.get(p, padrao) for p in ids_ponto), dtype=np.intp)
+
+    def para(self, id_ponto):
+        """ Regras de uma estação como dicionário (para telas e mensagens). """
+        return dict(self._regras.get(id_ponto, PADRAO_GLOBAL))
+
+
+_REGRAS = None
+_REGRAS_LOCK = threading.Lock()
+_MTIME_ARQUIVO = None
+_REGRAS_ARQUIVO = {}  # Últimas regras VÁLIDAS lidas do arquivo
+_REGRAS_DB = {}
+_ULTIMA_CONSULTA_DB = 0.0
+
+
+def _caminho_arquivo():
+    return os.path.join(data_source.get_base_path(), REGRAS_ARQUIVO)
+
+
+def _ler_arquivo(caminho):
+    """ Regras do arquivo ({"<id_ponto>": {campo: valor}}). JSON inválido ou fora desse formato -> ValueError. """
+    with open(caminho, 'r', encoding='utf-8') as f:
+        regras = json.load(f)
+    if not isinstance(regras, dict) or not all(isinstance(r, dict) for r in regras.values()):
+        raise ValueError('esperado um objeto {"<id_ponto>": {"CAMPO": valor}}')
+    return regras
+
+
+def _ler_tabela():
+    """ Linhas (id_ponto, campo, valor) da tabela de regras, se ela existir. """
+    if data_source.DB_ENGINE is None or not inspect(data_source.DB_ENGINE).has_table(REGRAS_TABELA):
+        return {}
+    with data_source.DB_ENGINE.connect() as connection:
+        linhas = connection.execute(text(f"SELECT id_ponto, campo, valor FROM {REGRAS_TABELA}")).fetchall()
+    regras = {}
+    for id_ponto, campo, valor in linhas:
+        regras.setdefault(id_ponto, {})[str(campo).upper()] = float(valor)
+    return regras
+
+
+def _compilar(regras_arquivo, regras_db):
+    regras_por_ponto = {}
+    for id_ponto, cfg in PONTOS_DE_ANALISE.items():
+        regra = dict(PADRAO_GLOBAL)
+        regra.update({k: v for k, v in cfg.get("constantes", {}).items() if k in PADRAO_GLOBAL})
+        for origem in (regras_arquivo.get(id_ponto, {}), regras_db.get(id_ponto, {})):
+            regra.update({k: float(v) for k, v in origem.items() if k in PADRAO_GLOBAL and pd.notna(v)})
+        if not (regra["CHUVA_LIMITE_VERDE"] <= regra["CHUVA_LIMITE_AMARELO"] <= regra["CHUVA_LIMITE_LARANJA"]):
+            data_source.adicionar_log(id_ponto, "Regras com limites de chuva fora de ordem. Usando o padrão.",
+                                      level="WARN")
+            regra.update({c: PADRAO_GLOBAL[c] for c in CAMPOS_CHUVA})
+        regras_por_ponto[id_ponto] = regra
+    return TabelaRegras(regras_por_ponto)
+
+
+def obter_regras():
+    """
+    Tabela de regras vigente. Barato de chamar a cada ciclo/callback: só recompila quando o arquivo
+    mudou (mtime) ou quando a consulta periódica ao banco trouxe algo diferente.
+    Arquivo inválido: um único ERROR por versão do arquivo e as últimas regras válidas dele continuam valendo.
+    """
+    global _REGRAS, _MTIME_ARQUIVO, _REGRAS_ARQUIVO, _REGRAS_DB, _ULTIMA_CONSULTA_DB
+    with _REGRAS_LOCK:
+        mudou = _REGRAS is None
+        caminho = _caminho_arquivo()
+        try:
+            mtime = os.path.getmtime(caminho) if os.path.exists(caminho) else None
+        except OSError:
+            mtime = _MTIME_ARQUIVO
+        if mtime != _MTIME_ARQUIVO or _REGRAS is None:
+            _MTIME_ARQUIVO = mtime  # Registrado mesmo se a leitura falhar: não relê (nem loga) a cada chamada
+            try:
+                regras_arquivo = _ler_arquivo(caminho) if mtime is not None else {}
+                if regras_arquivo != _REGRAS_ARQUIVO:
+                    _REGRAS_ARQUIVO = regras_arquivo
+                    mudou = True
+            except Exception as e:
+                data_source.adicionar_log("REGRAS", f"Erro ao ler {REGRAS_ARQUIVO}: {e}. Mantidas as últimas "
+                                                    f"regras válidas do arquivo.", level="ERROR")
+
+        if time.time() - _ULTIMA_CONSULTA_DB >= REGRAS_RECARGA_DB_SEC:
+            _ULTIMA_CONSULTA_DB = time.time()
+            try:
+                regras_db = _ler_tabela()
+                if regras_db != _REGRAS_DB:
+                    _REGRAS_DB = regras_db
+                    mudou = True
+            except Exception as e:
+                data_source.adicionar_log("REGRAS", f"Erro ao ler tabela de regras: {e}", level="ERROR")
+
+        if mudou:
+            _REGRAS = _compilar(_REGRAS_ARQUIVO, _REGRAS_DB)
+            data_source.adicionar_log("REGRAS", f"Regras compiladas para {len(_REGRAS.pontos)} estação(ões).",
+                                      salvar_arquivo=False)
+        return _REGRAS
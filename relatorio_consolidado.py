@@ -0,0 +1,236 @@
+# relatorio_consolidado.py (Relatório de todas as estações do corredor em uma passada)
+#
+# Uma consulta traz as leituras de todas as estações do período e outra a série de risco; a
+# consolidação de 10 min, as estatísticas e as mudanças de status saem de operações agrupadas por
+# id_ponto (sem uma consulta e um processamento por estação). Os gráficos de cada estação são
+# rasterizados em paralelo em processos filhos (fork: sem reimportar o projeto) quando disponível.
+
+import os
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import xlsxwriter
+from fpdf import FPDF
+
+import data_source
+import processamento
+import qualidade
+import gerador_pdf
+from config import PONTOS_DE_ANALISE, RELATORIO_CONSOLIDADO_PROCESSOS_GRAFICOS, FUSO_LOCAL, COLUNAS_UMIDADE
+
+SLOTS_24H = 144
+
+# (coluna, cabeçalho, largura) da tabela-resumo (PDF e aba "Resumo" do Excel)
+COLUNAS_RESUMO = [
+    ('nome', 'Estação', 22), ('chuva_total_mm', 'Chuva (mm)', 12), ('chuva_max_10min_mm', 'Máx. 10min', 12),
+    ('chuva_max_24h_mm', 'Máx. 24h', 12), ('umidade_1m_media', 'Umid. 1m', 12), ('umidade_2m_media', 'Umid. 2m', 12),
+    ('umidade_3m_media', 'Umid. 3m', 12), ('mudancas_status', 'Mudanças', 12),
+]
+
+
+def _pontos(pontos):
+    return list(pontos) if pontos else list(PONTOS_DE_ANALISE.keys())
+
+
+def _nome(id_ponto):
+    return PONTOS_DE_ANALISE.get(id_ponto, {}).get("nome", id_ponto)
+
+
+# ==============================================================================
+# --- DADOS (UMA CONSULTA, OPERAÇÕES AGRUPADAS) ---
+# ==============================================================================
+
+def consolidar_estacoes(start_date, end_date, pontos=None):
+    """ Série de 10 min de todas as estações do período (colunas de _consolidar_10min + id_ponto). """
+    start_dt, end_dt = gerador_pdf.periodo_utc(start_date, end_date)
+    df_brutos = data_source.read_data_from_sqlite(start_dt=start_dt, end_dt=end_dt,
+                                                  colunas=gerador_pdf.COLUNAS_CONSOLIDACAO)
+    if df_brutos.empty: return pd.DataFrame()
+    df_brutos = df_brutos[df_brutos['id_ponto'].isin(_pontos(pontos))]
+    if df_brutos.empty: return pd.DataFrame()
+    df_brutos = qualidade.mascarar_umidade(df_brutos)
+
+    for col in ['chuva_mm'] + COLUNAS_UMIDADE:
+        df_brutos[col] = pd.to_numeric(df_brutos[col], errors='coerce')
+    df_brutos = df_brutos.sort_values(['id_ponto', 'timestamp'])
+    df_brutos['chuva_calculada'] = processamento.incremento_chuva_por_ponto(df_brutos)
+    df_brutos['timestamp_local'] = df_brutos['timestamp'].dt.tz_convert(FUSO_LOCAL)
+
+    # Um resample por estação, todas de uma vez (chuva somada, umidade média)
+    slots = df_brutos.set_index('timestamp_local').groupby('id_ponto').resample('10min')
+    df = pd.concat([slots['chuva_calculada'].sum().rename('chuva_mm'), slots[COLUNAS_UMIDADE].mean()], axis=1)
+    df[COLUNAS_UMIDADE] = df.groupby(level='id_ponto')[COLUNAS_UMIDADE].ffill()
+    df['chuva_mm'] = df['chuva_mm'].fillna(0).round(2)
+    return df.reset_index()
+
+
+def estatisticas_estacoes(df):
+    """ Resumo por estação (uma linha por id_ponto), calculado com agregações agrupadas. """
+    por_ponto = df.groupby('id_ponto')
+    resumo = por_ponto.agg(
+        chuva_total_mm=('chuva_mm', 'sum'), chuva_max_10min_mm=('chuva_mm', 'max'), registros=('chuva_mm', 'size'),
+        **{f'umidade_{d}m_media': (col, 'mean') for d, col in zip([1, 2, 3], COLUNAS_UMIDADE)},
+        **{f'umidade_{d}m_max': (col, 'max') for d, col in zip([1, 2, 3], COLUNAS_UMIDADE)},
+    )
+    chuva_24h = por_ponto['chuva_mm'].rolling(SLOTS_24H, min_periods=1).sum()
+    resumo['chuva_max_24h_mm'] = chuva_24h.groupby(level=0).max()
+    return resumo.round(2)
+
+
+def mudancas_estacoes(start_date, end_date, pontos=None):
+    """ {id_ponto: [texto]} das mudanças de status do período, com uma única leitura da série de risco. """
+    start_dt, end_dt = gerador_pdf.periodo_utc(start_date, end_date)
+    df_serie = data_source.read_serie_risco(None, start_dt - pd.Timedelta(minutes=10), end_dt)
+    if df_serie.empty: return {}
+    df_serie = df_serie[df_serie['id_ponto'].isin(_pontos(pontos))].sort_values(['id_ponto', 'timestamp'])
+    return {id_ponto: [texto for _, texto in gerador_pdf.mudancas_de_status(grupo.reset_index(drop=True))]
+            for id_ponto, grupo in df_serie.groupby('id_ponto')}
+
+
+# ==============================================================================
+# --- GRÁFICOS EM PARALELO ---
+# ==============================================================================
+
+def _renderizar_estacao(args):
+    df_ponto, nome = args
+    return gerador_pdf.renderizar_grafico_serie(df_ponto, nome)
+
+
+def renderizar_graficos(df, ids):
+    """
+    {id_ponto: JPEG} das séries de cada estação. Com fork disponível (Linux) e mais de uma estação, os
+    gráficos são rasterizados em processos filhos; senão, em sequência neste processo.
+    """
+    tarefas = [(df[df['id_ponto'] == id_ponto], _nome(id_ponto)) for id_ponto in ids]
+    processos = min(RELATORIO_CONSOLIDADO_PROCESSOS_GRAFICOS, len(tarefas))
+    if processos > 1 and "fork" in multiprocessing.get_all_start_methods():
+        with ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context("fork")) as pool:
+            imagens = list(pool.map(_renderizar_estacao, tarefas))
+    else:
+        imagens = [_renderizar_estacao(tarefa) for tarefa in tarefas]
+    return dict(zip(ids, imagens))
+
+
+# ==============================================================================
+# --- PDF / EXCEL ---
+# ==============================================================================
+
+def _formatar(valor, casas=2, sufixo=""):
+    return f"{valor:.{casas}f}{sufixo}" if pd.notna(valor) else '-'
+
+
+def criar_pdf_consolidado(resumo, graficos, mudancas, periodo_str):
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+
+    # --- CABEÇALHO ---
+    pdf.set_font("Helvetica", "B", 14)
+    pdf.cell(0, 10, "Relatório Consolidado de Monitoramento - Todas as Estações", ln=True, align="C")
+    pdf.set_font("Helvetica", "", 10)
+    pdf.cell(0, 5, f"Período: {periodo_str}", ln=True, align="C")
+    pdf.cell(0, 5, f"Gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", ln=True, align="C")
+    pdf.ln(5)
+
+    # --- TABELA-RESUMO ---
+    largura_util = pdf.w - pdf.l_margin - pdf.r_margin
+    larguras = [largura_util * largura / sum(l for _, _, l in COLUNAS_RESUMO) for _, _, largura in COLUNAS_RESUMO]
+    pdf.set_font("Helvetica", "B", 9)
+    for w, (_, cabecalho, _) in zip(larguras, COLUNAS_RESUMO):
+        pdf.cell(w, 7, cabecalho, border=1, align="C")
+    pdf.ln()
+    pdf.set_font("Helvetica", "", 8)
+    for _, linha in resumo.iterrows():
+        valores = [linha['nome'], _formatar(linha['chuva_total_mm']), _formatar(linha['chuva_max_10min_mm']),
+                   _formatar(linha['chuva_max_24h_mm']), _formatar(linha['umidade_1m_media'], 1, '%'),
+                   _formatar(linha['umidade_2m_media'], 1, '%'), _formatar(linha['umidade_3m_media'], 1, '%'),
+                   str(int(linha['mudancas_status']))]
+        for w, valor in zip(larguras, valores):
+            pdf.cell(w, 6, str(valor).encode('latin-1', 'replace').decode('latin-1'), border=1, align="C")
+        pdf.ln()
+
+    # --- UMA SEÇÃO POR ESTAÇÃO ---
+    for id_ponto, linha in resumo.iterrows():
+        pdf.add_page()
+        pdf.set_fill_color(240, 240, 240)
+        pdf.set_font("Helvetica", "B", 11)
+        pdf.cell(0, 8, f"Estação {linha['nome']}", ln=True, align="L", fill=True)
+        pdf.ln(2)
+        if id_ponto in graficos:
+            gerador_pdf._add_imagem_jpeg(pdf, graficos[id_ponto], "Pluviometria e Umidade do Solo", periodo_str)
+
+        pdf.set_font("Helvetica", "B", 10)
+        pdf.cell(0, 6, "Alterações de Status no Período", ln=True, align="L")
+        pdf.set_font("Courier", "", 9)
+        for linha_status in mudancas.get(id_ponto) or ["Sem alterações de status registradas neste período."]:
+            if "PARALIZAÇÃO" in linha_status.upper() or "ALERTA" in linha_status.upper():
+                pdf.set_text_color(200, 0, 0)
+            elif "ATENÇÃO" in linha_status.upper():
+                pdf.set_text_color(200, 100, 0)
+            else:
+                pdf.set_text_color(0, 0, 0)
+            pdf.set_x(pdf.l_margin)
+            pdf.multi_cell(w=largura_util, h=5, txt=linha_status.encode('latin-1', 'replace').decode('latin-1'))
+        pdf.set_text_color(0, 0, 0)
+
+    return pdf.output()
+
+
+def _escrever_excel_consolidado(caminho, resumo, df):
+    """ Aba "Resumo" + uma aba de dados por estação, em constant_memory. """
+    workbook = xlsxwriter.Workbook(caminho, {'constant_memory': True})
+    try:
+        aba = workbook.add_worksheet("Resumo")
+        formato_cabecalho = workbook.add_format({'bold': True, 'border': 1, 'align': 'center'})
+        for i, (coluna, cabecalho, largura) in enumerate(COLUNAS_RESUMO):
+            aba.set_column(i, i, largura)
+            aba.write(0, i, cabecalho, formato_cabecalho)
+        valores = resumo[[coluna for coluna, _, _ in COLUNAS_RESUMO]].astype(object)
+        for n, linha_valores in enumerate(valores.where(valores.notna(), None).to_numpy().tolist(), start=1):
+            aba.write_row(n, 0, linha_valores)
+        for id_ponto, grupo in df.groupby('id_ponto', sort=False):
+            gerador_pdf.escrever_aba(workbook, f"Dados_{_nome(id_ponto)}", [grupo])
+    finally:
+        workbook.close()
+
+
+def _preparar(start_date, end_date, pontos, progresso):
+    progresso(0.1, "Lendo dados de todas as estações")
+    df = consolidar_estacoes(start_date, end_date, pontos)
+    if df.empty: raise Exception("Sem dados no período selecionado.")
+    progresso(0.3, "Resumindo estações")
+    mudancas = mudancas_estacoes(start_date, end_date, pontos)
+    resumo = estatisticas_estacoes(df)
+    resumo['nome'] = [_nome(id_ponto) for id_ponto in resumo.index]
+    resumo['mudancas_status'] = [len(mudancas.get(id_ponto, [])) for id_ponto in resumo.index]
+    # Ordem do config (a do corredor), não a alfabética dos ids
+    ordem = [id_ponto for id_ponto in _pontos(pontos) if id_ponto in resumo.index]
+    return df, resumo.loc[ordem], mudancas
+
+
+def gerar_pdf_consolidado(start_date, end_date, pontos=None, progresso=None):
+    """ PDF de todas as estações (ou das listadas em 'pontos'): retorna (bytes, nome_arquivo). """
+    progresso = progresso or (lambda fracao, etapa: None)
+    df, resumo, mudancas = _preparar(start_date, end_date, pontos, progresso)
+    progresso(0.4, "Gerando gráficos")
+    graficos = renderizar_graficos(df, list(resumo.index))
+    progresso(0.8, "Montando PDF")
+    periodo_str = f"{pd.to_datetime(start_date).strftime('%d/%m/%Y')} a {pd.to_datetime(end_date).strftime('%d/%m/%Y')}"
+    pdf_buffer = criar_pdf_consolidado(resumo, graficos, mudancas, periodo_str)
+    return pdf_buffer, f"Relatorio_Consolidado_{datetime.now().strftime('%Y%m%d')}.pdf"
+
+
+def gerar_excel_consolidado(start_date, end_date, pontos=None, progresso=None):
+    """ Planilha de todas as estações: retorna (caminho do .xlsx em EXPORTACOES_DIR, nome_arquivo). """
+    progresso = progresso or (lambda fracao, etapa: None)
+    df, resumo, _ = _preparar(start_date, end_date, pontos, progresso)
+    progresso(0.5, "Montando planilha")
+    caminho = gerador_pdf.novo_arquivo_exportacao("xlsx")
+    try:
+        _escrever_excel_consolidado(caminho, resumo, df[df['id_ponto'].isin(resumo.index)])
+    except BaseException:
+        if os.path.exists(caminho): os.remove(caminho)
+        raise
+    return caminho, f"Dados_Consolidados_{datetime.now().strftime('%Y%m%d')}.xlsx"
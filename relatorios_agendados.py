@@ -0,0 +1,190 @@
+# relatorios_agendados.py (Relatórios pré-gerados fora do horário de pico pelo worker)
+#
+# A rodada de relatórios do worker (thread própria, fora do ciclo de ingestão) confere os relatórios de
+# RELATORIOS_AGENDADOS: passada a hora local configurada, gera o relatório do período fechado (até
+# ontem) de cada estação (ou o consolidado) e grava no disco persistente:
+#   <RELATORIOS_AGENDADOS_DIR>/<nome>/<id_ponto>.<ext>  -> só a versão mais recente de cada relatório
+#   <RELATORIOS_AGENDADOS_DIR>/indice.json              -> {"<nome>|<id_ponto>": metadados}
+# O dashboard lista o índice e baixa o arquivo direto do disco, sem fila e sem gerar nada.
+# Se o backfill corrigir um dia do período (muda data_source.versao_dados) dentro da janela fora de pico
+# (RELATORIOS_AGENDADOS_JANELA_HORAS a partir da hora), o relatório é refeito. A versão só é consultada
+# quando o agendamento está devido: período novo, ou dias do período marcados como alterados
+# (data_source.marcar_dias_alterados) depois da última conferência.
+
+import os
+import json
+import time
+import threading
+import traceback
+import pandas as pd
+
+import data_source
+import gerador_pdf
+import relatorio_consolidado
+from config import (
+    PONTOS_DE_ANALISE, RELATORIOS_AGENDADOS, RELATORIOS_AGENDADOS_DIR, RELATORIOS_AGENDADOS_MAX_POR_CICLO,
+    RELATORIOS_AGENDADOS_JANELA_HORAS, FUSO_LOCAL
+)
+
+TODAS = "TODAS"  # id_ponto dos relatórios consolidados no índice
+
+# tipo -> (gerador, extensão). PDF retorna bytes; Excel retorna o caminho de um arquivo em EXPORTACOES_DIR.
+GERADORES = {
+    "pdf": (gerador_pdf.gerar_pdf, "pdf"),
+    "excel": (gerador_pdf.gerar_excel, "xlsx"),
+    "pdf_consolidado": (relatorio_consolidado.gerar_pdf_consolidado, "pdf"),
+    "excel_consolidado": (relatorio_consolidado.gerar_excel_consolidado, "xlsx"),
+}
+
+_INDICE_LOCK = threading.Lock()
+_CONFERIDOS = {}  # "<nome>|<id_ponto>" -> epoch da última conferência de versão sem mudança (neste processo)
+
+
+def _diretorio(*partes):
+    caminho = os.path.join(data_source.get_base_path(), RELATORIOS_AGENDADOS_DIR, *partes)
+    os.makedirs(caminho, exist_ok=True)
+    return caminho
+
+
+def _arquivo_indice():
+    return os.path.join(_diretorio(), "indice.json")
+
+
+def ler_indice():
+    """ {"<nome>|<id_ponto>": {"nome", "tipo", "id_ponto", "inicio", "fim", "versao", "arquivo", "filename", "gerado_em"}} """
+    try:
+        with open(_arquivo_indice(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _gravar_indice(indice):
+    arquivo = _arquivo_indice()
+    with open(arquivo + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(indice, f, ensure_ascii=False, indent=2)
+    os.replace(arquivo + ".tmp", arquivo)
+
+
+def periodo(agendamento, agora=None):
+    """ (início, fim) em datas locais 'AAAA-MM-DD': os 'dias' dias fechados até ontem. """
+    agora = agora or pd.Timestamp.now(tz=FUSO_LOCAL)
+    fim = agora.normalize().tz_localize(None) - pd.Timedelta(days=1)
+    inicio = fim - pd.Timedelta(days=agendamento["dias"] - 1)
+    return inicio.strftime('%Y-%m-%d'), fim.strftime('%Y-%m-%d')
+
+
+def _pontos_do_agendamento(agendamento):
+    return [None] if agendamento["tipo"].endswith("_consolidado") else list(PONTOS_DE_ANALISE.keys())
+
+
+def _alterado_desde(id_ponto, inicio, fim, desde):
+    """ Algum dia do período marcado como alterado a partir de 'desde' (epoch)? id_ponto=None: qualquer estação. """
+    return any(data_source.dia_alterado_em(id_ponto, dia.strftime('%Y-%m-%d')) >= desde
+               for dia in pd.date_range(inicio, fim))
+
+
+def pendentes(agora=None):
+    """
+    [(agendamento, id_ponto, início, fim, versão)] ainda não gerados para o período atual (ou desatualizados).
+    Só consulta a versão dos dados quando o agendamento está devido: período ainda não gerado, ou (na janela
+    fora de pico) dias do período marcados como alterados depois da última geração/conferência.
+    """
+    agora = agora or pd.Timestamp.now(tz=FUSO_LOCAL)
+    indice = ler_indice()
+    lista = []
+    for agendamento in RELATORIOS_AGENDADOS:
+        if agora.hour < agendamento["hora"]: continue  # Antes da hora: fica o relatório do dia anterior
+        na_janela = agora.hour < agendamento["hora"] + RELATORIOS_AGENDADOS_JANELA_HORAS
+        inicio, fim = periodo(agendamento, agora)
+        for id_ponto in _pontos_do_agendamento(agendamento):
+            chave = f"{agendamento['nome']}|{id_ponto or TODAS}"
+            entrada = indice.get(chave)
+            periodo_novo = entrada is None or (entrada["inicio"], entrada["fim"]) != (inicio, fim)
+            if not periodo_novo:
+                desde = max(entrada.get("conferido_em", entrada["gerado_em"]), _CONFERIDOS.get(chave, 0.0))
+                if not na_janela or not _alterado_desde(id_ponto, inicio, fim, desde): continue
+            conferido_em = time.time()
+            versao = data_source.versao_dados(id_ponto, *gerador_pdf.periodo_utc(inicio, fim))
+            if not periodo_novo and entrada["versao"] == versao:
+                _CONFERIDOS[chave] = conferido_em  # Marcação sem mudança real: não confere de novo
+                continue
+            lista.append((agendamento, id_ponto, inicio, fim, versao))
+    return lista
+
+
+def gerar(agendamento, id_ponto, inicio, fim, versao, conferido_em=None):
+    """ Gera um relatório agendado, grava o arquivo (atomicamente) e registra no índice. """
+    gerador, extensao = GERADORES[agendamento["tipo"]]
+    resultado, nome_arquivo = gerador(inicio, fim, id_ponto)
+    destino = os.path.join(_diretorio(agendamento["nome"]), f"{id_ponto or TODAS}.{extensao}")
+    if isinstance(resultado, str):
+        os.replace(resultado, destino)  # Mesmo disco (EXPORTACOES_DIR): só renomeia
+    else:
+        with open(destino + ".tmp", 'wb') as f:
+            f.write(resultado)
+        os.replace(destino + ".tmp", destino)
+
+    _registrar(agendamento, id_ponto, inicio, fim, versao, os.path.relpath(destino, _diretorio()), nome_arquivo,
+               conferido_em)
+
+
+def _registrar(agendamento, id_ponto, inicio, fim, versao, arquivo, nome_arquivo, conferido_em=None):
+    """
+    arquivo=None: não gerado (ex.: sem dados); só é tentado de novo quando a versão dos dados mudar.
+    conferido_em: quando a versão foi lida (marcações de dias alterados a partir daí a reconferem).
+    """
+    with _INDICE_LOCK:
+        indice = ler_indice()
+        indice[f"{agendamento['nome']}|{id_ponto or TODAS}"] = {
+            "nome": agendamento["nome"], "tipo": agendamento["tipo"], "id_ponto": id_ponto or TODAS,
+            "inicio": inicio, "fim": fim, "versao": versao, "arquivo": arquivo,
+            "filename": nome_arquivo, "gerado_em": time.time(), "conferido_em": conferido_em or time.time(),
+        }
+        _gravar_indice(indice)
+
+
+def executar_pendentes(maximo=RELATORIOS_AGENDADOS_MAX_POR_CICLO):
+    """ Chamado pela rodada de relatórios do worker: gera no máximo 'maximo' pendentes (o resto fica para as próximas). """
+    feitos = 0
+    try:
+        conferido_em = time.time()  # Antes de ler as versões: gravações a partir daqui marcam os dias de novo
+        for agendamento, id_ponto, inicio, fim, versao in pendentes():
+            if feitos >= maximo: break
+            try:
+                gerar(agendamento, id_ponto, inicio, fim, versao, conferido_em)
+            except Exception as e:
+                # Sem dados no período (estação parada) etc.: registra e segue para o próximo
+                data_source.adicionar_log("RELATORIOS", f"Relatório agendado '{agendamento['nome']}' "
+                                                        f"({id_ponto or TODAS}) não gerado: {e}", level="WARN",
+                                          salvar_arquivo=False)
+                _registrar(agendamento, id_ponto, inicio, fim, versao, None, None, conferido_em)
+            feitos += 1
+    except Exception as e:
+        data_source.adicionar_log("RELATORIOS", f"Erro nos relatórios agendados: {e}", level="ERROR")
+        traceback.print_exc()
+    if feitos:
+        data_source.adicionar_log("RELATORIOS", f"{feitos} relatório(s) agendado(s) processado(s).",
+                                  salvar_arquivo=False)
+    return feitos
+
+
+# ==============================================================================
+# --- LADO DO PROCESSO WEB ---
+# ==============================================================================
+
+def disponiveis(id_ponto):
+    """ Entradas do índice da estação + as consolidadas, na ordem de RELATORIOS_AGENDADOS. """
+    indice = ler_indice()
+    ordem = {agendamento["nome"]: i for i, agendamento in enumerate(RELATORIOS_AGENDADOS)}
+    entradas = [entrada for entrada in indice.values() if entrada["id_ponto"] in (id_ponto, TODAS)
+                and entrada["nome"] in ordem and entrada["arquivo"]]
+    return sorted(entradas, key=lambda entrada: ordem[entrada["nome"]])
+
+
+def arquivo_para_download(nome, id_ponto):
+    """ (caminho, nome_arquivo) de um relatório agendado, ou None. """
+    entrada = ler_indice().get(f"{nome}|{id_ponto}")
+    if entrada is None or not entrada["arquivo"]: return None
+    caminho = os.path.join(_diretorio(), entrada["arquivo"])
+    return (caminho, entrada["filename"]) if os.path.exists(caminho) else None
@@ -0,0 +1,257 @@
+# relatorios_jobs.py (Fila de relatórios PDF/Excel executados em processos separados)
+#
+# Matplotlib, FPDF e xlsxwriter seguram o GIL: gerados em threads do processo web, deixam todos os
+# callbacks do Dash lentos enquanto rodam. Aqui cada relatório vai para um ProcessPoolExecutor
+# (contexto "spawn": nada de conexões/threads herdadas do processo web), com:
+#   - limite de fila (RELATORIOS_FILA_MAX) e de relatórios simultâneos por sessão (RELATORIOS_MAX_POR_USUARIO);
+#   - progresso (fração + etapa) e cancelamento por um dicionário compartilhado (multiprocessing.Manager);
+#   - resultado guardado até o download (descartado após RELATORIOS_RESULTADO_TTL_SEC): o PDF em memória,
+#     Excel/CSV num arquivo em EXPORTACOES_DIR (exportação em fluxo), enviado do disco por rota própria;
+#   - relatório já gerado com os mesmos dados (cache_relatorios) entregue na hora, sem ocupar a fila.
+
+import os
+import time
+import uuid
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+
+import data_source
+import gerador_pdf
+import cache_relatorios
+import relatorio_consolidado
+from config import (
+    RELATORIOS_PROCESSOS, RELATORIOS_FILA_MAX,
+    RELATORIOS_MAX_POR_USUARIO, RELATORIOS_RESULTADO_TTL_SEC, EXPORTACOES_DIR
+)
+
+# PDF: bytes na memória. Excel/CSV: exportação em fluxo para um arquivo (caminho) baixado por rota própria.
+# Consolidados: id_ponto=None (todas as estações) numa só passada pelo banco.
+GERADORES = {"pdf": gerador_pdf.gerar_pdf, "excel": gerador_pdf.gerar_excel, "csv": gerador_pdf.gerar_csv,
+             "pdf_consolidado": relatorio_consolidado.gerar_pdf_consolidado,
+             "excel_consolidado": relatorio_consolidado.gerar_excel_consolidado}
+
+# { task_id: {"tipo", "usuario", "future", "criado": epoch, "fim": epoch|None} }
+JOBS = {}
+JOBS_LOCK = threading.RLock()  # RLock: add_done_callback pode rodar na própria thread que submete
+_POOL = None
+_MANAGER = None
+# Dicionário do Manager: { task_id: {"progresso": 0..1, "etapa": str} } e { "<task_id>:cancelar": True }.
+# O pedido de cancelamento fica numa chave própria: só o processo web escreve nela (sem corrida com o progresso).
+_ESTADO = None
+
+
+class RelatorioCancelado(Exception):
+    pass
+
+
+# ==============================================================================
+# --- LADO DO PROCESSO DO POOL ---
+# ==============================================================================
+
+def _inicializar_processo():
+    """ Cada processo do pool abre o seu próprio engine do banco. """
+    data_source.setup_disk_paths()
+
+
+def _executar(tipo, task_id, start_date, end_date, id_ponto, estado):
+    def progresso(fracao, etapa):
+        if estado.get(f"{task_id}:cancelar"):
+            raise RelatorioCancelado("Relatório cancelado.")
+        estado[task_id] = {"progresso": fracao, "etapa": etapa}
+
+    progresso(0.0, "Iniciando")
+    return GERADORES[tipo](start_date, end_date, id_ponto, progresso=progresso)
+
+
+# ==============================================================================
+# --- LADO DO PROCESSO WEB ---
+# ==============================================================================
+
+def _garantir_pool():
+    global _POOL, _MANAGER, _ESTADO
+    if _POOL is None:
+        contexto = multiprocessing.get_context("spawn")
+        if _MANAGER is None:
+            _MANAGER = contexto.Manager()
+            _ESTADO = _MANAGER.dict()
+        _POOL = ProcessPoolExecutor(max_workers=RELATORIOS_PROCESSOS, mp_context=contexto,
+                                    initializer=_inicializar_processo)
+        _limpar_exportacoes_orfas()
+        data_source.adicionar_log("RELATORIOS", f"Pool de relatórios iniciado ({RELATORIOS_PROCESSOS} processo(s)).",
+                                  salvar_arquivo=False)
+    return _POOL
+
+
+def _ao_terminar(task_id, future, chave_cache):
+    with JOBS_LOCK:
+        job = JOBS.get(task_id)
+        if job is not None: job["fim"] = time.time()
+    if chave_cache and not future.cancelled() and future.exception() is None:
+        dados, nome_arquivo = future.result()
+        # PDF: o fpdf2 devolve bytearray. Exportações em arquivo (str) não entram no cache (o arquivo é do job)
+        if isinstance(dados, (bytes, bytearray)):
+            cache_relatorios.guardar(chave_cache, bytes(dados), nome_arquivo)
+
+
+def _arquivo_do_job(job):
+    """ Caminho do arquivo exportado pelo job (Excel/CSV), ou None. """
+    future = job["future"]
+    if not future.done() or future.cancelled() or future.exception() is not None: return None
+    dados, _ = future.result()
+    return dados if isinstance(dados, str) else None
+
+
+def _descartar(task_id):
+    """ Tira o job da memória e apaga o arquivo exportado, se houver (com o lock já adquirido). """
+    job = JOBS.pop(task_id, None)
+    caminho = _arquivo_do_job(job) if job is not None else None
+    if caminho:
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+    if _ESTADO is not None:
+        _ESTADO.pop(task_id, None)
+        _ESTADO.pop(f"{task_id}:cancelar", None)
+
+
+def _limpar_exportacoes_orfas():
+    """ Arquivos de exportação antigos sem job (ex.: processo web reiniciado antes do download). """
+    diretorio = os.path.join(data_source.get_base_path(), EXPORTACOES_DIR)
+    if not os.path.isdir(diretorio): return
+    agora = time.time()
+    for nome in os.listdir(diretorio):
+        caminho = os.path.join(diretorio, nome)
+        try:
+            if agora - os.path.getmtime(caminho) > RELATORIOS_RESULTADO_TTL_SEC: os.remove(caminho)
+        except OSError:
+            pass
+
+
+def _chave_cache(tipo, start_date, end_date, id_ponto):
+    """ Chave do relatório no cache, ou None se a versão dos dados não pôde ser lida (gera sem cache). """
+    try:
+        versao = data_source.versao_dados(id_ponto, *gerador_pdf.periodo_utc(start_date, end_date))
+        return cache_relatorios.chave(tipo, id_ponto, start_date, end_date, versao)
+    except Exception as e:
+        data_source.adicionar_log("RELATORIOS", f"Versão dos dados indisponível, gerando sem cache: {e}",
+                                  level="WARN", salvar_arquivo=False)
+        return None
+
+
+def _limpar_expirados():
+    """ Descarta resultados não baixados (aba fechada no meio da geração); o cache continua com eles. """
+    agora = time.time()
+    for task_id in [t for t, job in JOBS.items() if job["fim"] and agora - job["fim"] > RELATORIOS_RESULTADO_TTL_SEC]:
+        _descartar(task_id)
+
+
+def submeter(tipo, usuario, start_date, end_date, id_ponto):
+    """ Enfileira um relatório ("pdf" / "excel"). Retorna (task_id, None) ou (None, motivo da recusa). """
+    global _POOL
+    chave_cache = _chave_cache(tipo, start_date, end_date, id_ponto)
+    em_cache = cache_relatorios.obter(chave_cache) if chave_cache else None
+
+    with JOBS_LOCK:
+        _limpar_expirados()
+        if em_cache is not None:
+            # Mesmo relatório com os mesmos dados: já nasce concluído (não conta na fila nem no limite)
+            task_id = str(uuid.uuid4())
+            future = Future()
+            future.set_result(em_cache)
+            JOBS[task_id] = {"tipo": tipo, "usuario": usuario, "future": future, "criado": time.time(),
+                             "fim": time.time()}
+            return task_id, None
+
+        ativos = [job for job in JOBS.values() if not job["future"].done()]
+        if len(ativos) >= RELATORIOS_FILA_MAX:
+            return None, "Fila de relatórios cheia. Tente novamente em instantes."
+        if sum(1 for job in ativos if job["usuario"] == usuario) >= RELATORIOS_MAX_POR_USUARIO:
+            return None, f"Limite de {RELATORIOS_MAX_POR_USUARIO} relatórios simultâneos por usuário."
+
+        task_id = str(uuid.uuid4())
+        for tentativa in range(2):
+            try:
+                pool = _garantir_pool()
+                _ESTADO[task_id] = {"progresso": 0.0, "etapa": "Na fila"}
+                future = pool.submit(_executar, tipo, task_id, start_date, end_date, id_ponto, _ESTADO)
+                break
+            except BrokenProcessPool:
+                # Um processo do pool morreu (ex.: falta de memória): recria o pool uma vez
+                data_source.adicionar_log("RELATORIOS", "Pool de relatórios quebrado. Recriando.", level="WARN")
+                _POOL = None
+                if tentativa == 1: raise
+        JOBS[task_id] = {"tipo": tipo, "usuario": usuario, "future": future, "criado": time.time(), "fim": None}
+        future.add_done_callback(lambda f, t=task_id, c=chave_cache: _ao_terminar(t, f, c))
+    return task_id, None
+
+
+def consultar(task_id):
+    """
+    Situação de um relatório: {"status": "na_fila" | "executando" | "concluido" | "erro" | "cancelado" |
+    "desconhecido", ...}. "concluido" traz filename e data (bytes) ou arquivo (caminho, baixado por
+    arquivo_para_download); "erro", message; os demais, progresso/etapa.
+    """
+    with JOBS_LOCK:
+        _limpar_expirados()
+        job = JOBS.get(task_id)
+        if job is None: return {"status": "desconhecido"}
+        future = job["future"]
+        anteriores = [t for t, j in JOBS.items() if not j["future"].done() and j["criado"] <= job["criado"]]
+
+    if future.cancelled():
+        return {"status": "cancelado"}
+    if future.done():
+        erro = future.exception()
+        if erro is None:
+            dados, nome_arquivo = future.result()
+            if isinstance(dados, str):
+                return {"status": "concluido", "arquivo": dados, "filename": nome_arquivo}
+            return {"status": "concluido", "data": dados, "filename": nome_arquivo}
+        if isinstance(erro, RelatorioCancelado):
+            return {"status": "cancelado"}
+        return {"status": "erro", "message": str(erro)}
+
+    estado = _ESTADO.get(task_id) or {}
+    if estado.get("etapa", "Na fila") != "Na fila":
+        return {"status": "executando", "progresso": estado.get("progresso", 0.0), "etapa": estado.get("etapa")}
+    posicao = sum(1 for t in anteriores if (_ESTADO.get(t) or {}).get("etapa") == "Na fila")
+    return {"status": "na_fila", "progresso": 0.0, "etapa": f"Na fila (posição {posicao})"}
+
+
+def cancelar(task_id):
+    """ Cancela um relatório: se ainda está na fila, sai dela; se já roda, para na próxima etapa. """
+    with JOBS_LOCK:
+        job = JOBS.get(task_id)
+        if job is None or job["future"].done(): return False
+        if job["future"].cancel():
+            job["fim"] = time.time()
+            return True
+    try:
+        _ESTADO[f"{task_id}:cancelar"] = True
+        return True
+    except Exception:
+        traceback.print_exc()
+        return False
+
+
+def retirar(task_id):
+    """ Libera um relatório já entregue (ou com erro) da memória do processo web (e o arquivo exportado). """
+    with JOBS_LOCK:
+        _descartar(task_id)
+
+
+def arquivo_para_download(task_id, usuario):
+    """
+    (caminho, nome_arquivo) de uma exportação concluída de 'usuario' (quem submeteu o job), para a rota de
+    download enviar direto do disco. O arquivo fica disponível até RELATORIOS_RESULTADO_TTL_SEC após a conclusão.
+    """
+    with JOBS_LOCK:
+        job = JOBS.get(task_id)
+        if job is None or job["usuario"] != usuario: return None
+        caminho = _arquivo_do_job(job)
+        if caminho is None or not os.path.exists(caminho): return None
+        return caminho, job["future"].result()[1]
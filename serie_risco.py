@@ -0,0 +1,75 @@
+# serie_risco.py (Série histórica de níveis de risco na grade de 10 min, gravada ao lado das medições)
+#
+# Uso:
+#   python serie_risco.py <DIAS>     -> recalcula a série dos últimos DIAS (carga inicial / auditoria)
+
+import sys
+import traceback
+import pandas as pd
+
+import data_source
+import processamento
+import regras
+from config import COLUNAS_UMIDADE
+
+HORAS_JANELA = 72
+# Com qc_umidade: montar_grade mascara as leituras reprovadas no QC, como no ciclo do worker
+# (a série não pode depender de qual dos dois caminhos a gravou por último)
+COLUNAS_LEITURA = ['timestamp', 'id_ponto', 'chuva_mm', 'precipitacao_acumulada_mm'] + COLUNAS_UMIDADE + ['qc_umidade']
+
+
+def atualizar_do_ciclo(df_final, grade=None):
+    """
+    Chamado pelo worker com o histórico recente já em memória: grava os slots cuja janela
+    de 72h está completa (os mais recentes), sem nova leitura do banco.
+    grade: processamento.montar_grade(df_final) já montada no ciclo.
+    """
+    try:
+        df_serie = processamento.calcular_serie_risco(
+            df_final, horas=HORAS_JANELA, pontos_umidade=data_source.pontos_por_tipo("umidade"),
+            regras=regras.obter_regras(), grade=grade)
+        data_source.upsert_serie_risco(df_serie)
+        return len(df_serie)
+    except Exception as e:
+        data_source.adicionar_log("RISCO", f"Erro ao atualizar série de risco: {e}", level="ERROR")
+        traceback.print_exc()
+        return 0
+
+
+def recalcular(start_dt, end_dt, id_ponto=None):
+    """
+    Recalcula a série entre start_dt e end_dt (UTC), de uma estação ou de todas. Lê 72h extras antes
+    do início para que todo slot do intervalo tenha a janela completa. Usado após o backfill e na carga inicial.
+    """
+    try:
+        df = data_source.read_data_from_sqlite(
+            id_ponto=id_ponto, start_dt=start_dt - pd.Timedelta(hours=HORAS_JANELA), end_dt=end_dt,
+            colunas=COLUNAS_LEITURA)
+        if df.empty: return 0
+        df_serie = processamento.calcular_serie_risco(
+            df, horas=HORAS_JANELA, pontos_umidade=data_source.pontos_por_tipo("umidade"),
+            regras=regras.obter_regras())
+        df_serie = df_serie[df_serie['timestamp'] >= start_dt.floor('10min')]
+        data_source.upsert_serie_risco(df_serie)
+        return len(df_serie)
+    except Exception as e:
+        data_source.adicionar_log("RISCO", f"Erro ao recalcular série de risco: {e}", level="ERROR")
+        traceback.print_exc()
+        return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Uso: python serie_risco.py <DIAS>")
+        sys.exit(1)
+
+    data_source.setup_disk_paths()
+    data_source.initialize_database()
+
+    agora = pd.Timestamp.now(tz='UTC').floor('10min') + pd.Timedelta(minutes=10)
+    inicio = agora - pd.Timedelta(days=int(sys.argv[1]))
+    total = 0
+    # Um dia por vez: memória limitada mesmo com muitos dias/estações
+    for dia in pd.date_range(inicio, agora, freq='D'):
+        total += recalcular(dia, min(dia + pd.Timedelta(days=1), agora))
+    print(f"Série de risco recalculada: {total} linhas.")
@@ -0,0 +1,108 @@
+# simulador.py (Estações sintéticas para testes de carga do worker, do banco e dos dashboards)
+
+import zlib
+import numpy as np
+import pandas as pd
+
+import data_source
+from config import (
+    PONTOS_DE_ANALISE, CONSTANTES_PADRAO,
+    SIMULADOR_SEMENTE, SIMULADOR_TAXA_FALHA, FUSO_LOCAL
+)
+
+SLOTS_POR_DIA = 144  # Grade de 10 min
+DIAS_MEMORIA_UMIDADE = 5  # Quanto de chuva passada influencia a umidade do solo
+
+# Resposta da umidade por profundidade: (constante de tempo em horas, ganho em % por mm de chuva "retida")
+RESPOSTA_UMIDADE = {
+    'umidade_1m_perc': (24.0, 0.10),
+    'umidade_2m_perc': (48.0, 0.07),
+    'umidade_3m_perc': (96.0, 0.03),
+}
+BASES_UMIDADE = {
+    'umidade_1m_perc': CONSTANTES_PADRAO['UMIDADE_BASE_1M'],
+    'umidade_2m_perc': CONSTANTES_PADRAO['UMIDADE_BASE_2M'],
+    'umidade_3m_perc': CONSTANTES_PADRAO['UMIDADE_BASE_3M'],
+}
+
+
+def _rng(*chave):
+    return np.random.default_rng([SIMULADOR_SEMENTE, *chave])
+
+
+def _chuva_do_dia(idx_estacao, dia_ordinal):
+    """
+    Chuva (mm por slot de 10 min) de um dia local. Determinística por (estação, dia), então
+    fetch_current e fetch_range sempre concordam. Eventos: Poisson por dia, duração de 1 a 12h,
+    intensidade Gama com oscilação dentro do evento.
+    """
+    rng = _rng(idx_estacao, dia_ordinal)
+    chuva = np.zeros(SLOTS_POR_DIA)
+    for _ in range(rng.poisson(0.7)):
+        inicio = rng.integers(0, SLOTS_POR_DIA)
+        duracao = int(rng.integers(6, 72))
+        intensidade = rng.gamma(shape=1.5, scale=0.8)
+        fim = min(inicio + duracao, SLOTS_POR_DIA)
+        forma = np.abs(np.sin(np.linspace(0, np.pi, fim - inicio))) * rng.gamma(2.0, 0.5, fim - inicio)
+        chuva[inicio:fim] += np.round(intensidade * forma, 1)
+    return chuva
+
+
+def _indice_estacao(id_ponto):
+    return int(id_ponto.split('-')[-1]) if id_ponto.startswith("SIM-") else zlib.crc32(id_ponto.encode())
+
+
+def gerar_serie(id_ponto, start_dt, end_dt):
+    """
+    Série completa (grade de 10 min) de uma estação sintética entre start_dt e end_dt (UTC, fim exclusivo):
+    odômetro diário com zeragem à meia-noite local e umidade respondendo à chuva antecedente.
+    """
+    idx = _indice_estacao(id_ponto)
+    inicio_local = (start_dt - pd.Timedelta(days=DIAS_MEMORIA_UMIDADE)).tz_convert(FUSO_LOCAL).normalize()
+    fim_local = end_dt.tz_convert(FUSO_LOCAL).normalize()
+    dias = pd.date_range(inicio_local, fim_local, freq='D')
+
+    chuva_dias = np.stack([_chuva_do_dia(idx, d.toordinal()) for d in dias])
+    odometro = np.round(np.cumsum(chuva_dias, axis=1), 2).ravel()
+    chuva = chuva_dias.ravel()
+    grade = (pd.date_range(dias[0], periods=len(chuva), freq='10min')).tz_convert('UTC')
+
+    df = pd.DataFrame({'timestamp': grade, 'id_ponto': id_ponto, 'chuva_mm': chuva,
+                       'precipitacao_acumulada_mm': odometro})
+
+    # Umidade: filtro exponencial (convolução) da chuva + leve ruído diário
+    ruido = _rng(idx, 999).normal(0, 0.05, len(chuva))
+    for coluna, (tau_horas, ganho) in RESPOSTA_UMIDADE.items():
+        decaimento = np.exp(-1.0 / (tau_horas * 6))
+        kernel = decaimento ** np.arange(int(tau_horas * 6 * 5))
+        retida = np.convolve(chuva, kernel)[:len(chuva)]
+        df[coluna] = np.round(BASES_UMIDADE[coluna] - 1.5 + ganho * retida + ruido, 2)
+
+    mask = (df['timestamp'] >= start_dt) & (df['timestamp'] < end_dt)
+    return df[mask].reset_index(drop=True)
+
+
+class AdaptadorSimulador(data_source.AdaptadorFonte):
+    """ Fonte sintética: atende todas as estações 'simulado' de PONTOS_DE_ANALISE sem tocar em APIs. """
+    nome = "simulador"
+    tipos = ("chuva", "umidade")
+
+    def pontos(self):
+        return [p for p, cfg in PONTOS_DE_ANALISE.items() if cfg.get("simulado")]
+
+    def fetch_current(self):
+        agora = pd.Timestamp.now(tz='UTC')
+        slot = agora.floor('10min') - pd.Timedelta(minutes=10)
+        frames = []
+        for id_ponto in self.pontos():
+            # Falhas simuladas de coleta (exercitam a detecção de lacunas e o backfill)
+            sorteio = _rng(_indice_estacao(id_ponto), int(slot.timestamp())).random()
+            if sorteio < SIMULADOR_TAXA_FALHA:
+                continue
+            frames.append(gerar_serie(id_ponto, slot, slot + pd.Timedelta(minutes=10)))
+        if not frames: return pd.DataFrame()
+        return self.normalizar(pd.concat(frames, ignore_index=True))
+
+    def fetch_range(self, id_ponto, start_dt, end_dt):
+        if id_ponto not in self.pontos(): return pd.DataFrame()
+        return self.normalizar(gerar_serie(id_ponto, start_dt, end_dt))
@@ -0,0 +1,34 @@
+# tests/conftest.py (Ambiente isolado para os testes: banco SQLite e arquivos num diretório temporário)
+#
+# O config lê o ambiente no import: variáveis definidas ANTES de importar qualquer módulo do projeto.
+
+import os
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_DIR_TEMP = tempfile.mkdtemp(prefix="testes_tamoios_")
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DIR_TEMP, 'testes.db')}"
+os.environ["FONTES_DADOS"] = ""
+os.environ["SIMULADOR_NUM_ESTACOES"] = "0"
+os.environ.pop("RENDER", None)
+sys.path.insert(0, RAIZ)
+os.chdir(_DIR_TEMP)  # data_source.get_base_path() = diretório atual: tudo o que for gravado fica no temporário
+
+import pytest
+from sqlalchemy import text
+
+import data_source
+from config import DB_TABLE_NAME, DB_TABLE_RISCO
+
+
+@pytest.fixture
+def banco():
+    """ Banco SQLite de teste inicializado e vazio ao final de cada teste. """
+    data_source.setup_disk_paths()
+    data_source.initialize_database()
+    yield data_source.DB_ENGINE
+    with data_source.DB_ENGINE.begin() as connection:
+        for tabela in (DB_TABLE_NAME, DB_TABLE_RISCO):
+            connection.execute(text(f"DELETE FROM {tabela}"))
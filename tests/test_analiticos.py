@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import analiticos
+import processamento
+from config import CHUVA_LIMITE_VERDE, CHUVA_LIMITE_AMARELO, CHUVA_LIMITE_LARANJA
+
+N_JANELA = 72 * analiticos.SLOTS_POR_HORA
+LIMITES = [CHUVA_LIMITE_VERDE, CHUVA_LIMITE_AMARELO, CHUVA_LIMITE_LARANJA]  # > 60, > 79, >= 100
+
+
+def _projetar(chuva_por_estacao, intensidades, limites=LIMITES, n_slots=N_JANELA):
+    """ chuva_por_estacao: [{posição do slot: mm}] numa grade de n_slots (último slot = agora). """
+    chuva = np.zeros((n_slots, len(chuva_por_estacao)))
+    for j, slots in enumerate(chuva_por_estacao):
+        for pos, mm in slots.items():
+            chuva[pos, j] = mm
+    cumulativa = np.vstack([np.zeros((1, chuva.shape[1])), np.cumsum(chuva, axis=0)])
+    ultimo = np.full(len(chuva_por_estacao), n_slots - 1)
+    return analiticos.projetar_limiares(cumulativa, ultimo, limites, np.asarray(intensidades, dtype=float))
+
+
+def test_sem_chuva_e_intensidade_zero_nao_atinge_nenhum_limite():
+    assert np.isnan(_projetar([{}], [0.0])).all()
+
+
+def test_limite_ja_ultrapassado_e_zero():
+    # 80 mm recentes (não saem da janela em 24h): ATENÇÃO e ALERTA já atingidos; sem chuva nova, não paralisa
+    minutos = _projetar([{N_JANELA - 1: 80.0}], [0.0])[0]
+    assert minutos[0] == 0 and minutos[1] == 0
+    assert np.isnan(minutos[2])
+
+
+def test_intensidade_atual_mantida_ate_cada_limite():
+    # 50 mm recentes + 10 mm/h: > 60 no 7º passo (70 min), > 79 no 18º, >= 100 no 30º
+    minutos = _projetar([{N_JANELA - 1: 50.0}], [10.0])[0]
+    assert minutos.tolist() == [70.0, 180.0, 300.0]
+
+
+def test_chuva_que_sai_da_janela_e_descontada():
+    # 70 mm no 6º slot mais antigo: saem da janela em 60 min. Com 2 mm/h o ALERTA (> 79) seria atingido
+    # em 280 min se nada saísse; como sai antes, não atinge em 24h. A ATENÇÃO já vale agora.
+    minutos = _projetar([{5: 70.0}], [2.0])[0]
+    assert minutos[0] == 0
+    assert np.isnan(minutos[1]) and np.isnan(minutos[2])
+
+
+def test_chuva_que_sai_e_compensada_pela_nova():
+    # 30 mm antigos saindo em 10 min + 25 mm recentes, 12 mm/h (2 mm por passo): sem a saída passaria
+    # de 60 em 30 min; com ela, 25 + 2k > 60 -> k = 18 passos (180 min)
+    minutos = _projetar([{0: 30.0, N_JANELA - 1: 25.0}], [12.0])[0]
+    assert minutos[0] == 180.0
+
+
+def test_estacoes_independentes_e_limites_por_estacao():
+    minutos = _projetar([{N_JANELA - 1: 50.0}, {}], [0.0, 6.0], limites=np.array([LIMITES, [10.0, 20.0, 30.0]]))
+    assert np.isnan(minutos[0]).all()
+    # Segunda estação: 6 mm/h a partir de zero, limites 10/20/30 -> > 10 no 11º passo, > 20 no 21º, >= 30 no 30º
+    assert minutos[1].tolist() == [110.0, 210.0, 300.0]
+
+
+@pytest.fixture
+def cache_limpo():
+    analiticos.ANALITICOS_CACHE.clear()
+    yield
+    analiticos.ANALITICOS_CACHE.clear()
+
+
+def test_calcular_publica_zero_para_atingido_e_none_para_nao_atingido(cache_limpo):
+    grade = pd.date_range("2025-01-10", periods=N_JANELA, freq="10min", tz="UTC")
+    chuva = np.zeros((N_JANELA, 1))
+    chuva[-1, 0] = 65.0  # Só no último slot: intensidade de 1h = 65 mm/h, ATENÇÃO já atingida
+    resultado = analiticos.calcular({
+        "grade": grade, "pontos": pd.Index(["P"]), "chuva": chuva,
+        "umidade": np.full((N_JANELA, 1, 3), np.nan),
+        "primeiro": np.array([0]), "ultimo": np.array([N_JANELA - 1]),
+    })
+    projecao = resultado["P"]["projecao_min"]
+    assert projecao[processamento.NOMES_NIVEL[1]] == 0
+    assert projecao[processamento.NOMES_NIVEL[2]] == 20  # 65 + 2 * 65/6 > 79 no segundo passo
+
+    seca = analiticos.calcular({
+        "grade": grade, "pontos": pd.Index(["Q"]), "chuva": np.zeros((N_JANELA, 1)),
+        "umidade": np.full((N_JANELA, 1, 3), np.nan),
+        "primeiro": np.array([0]), "ultimo": np.array([N_JANELA - 1]),
+    })
+    assert set(seca["Q"]["projecao_min"].values()) == {None}
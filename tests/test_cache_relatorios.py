@@ -0,0 +1,45 @@
+from concurrent.futures import Future
+
+import cache_relatorios
+import relatorios_jobs
+
+
+def _future(resultado):
+    future = Future()
+    future.set_result(resultado)
+    return future
+
+
+def test_pdf_bytearray_entra_no_cache():
+    # O fpdf2 devolve bytearray: o PDF concluído precisa ser guardado (como bytes)
+    k = cache_relatorios.chave("pdf", "Ponto-A-KM67", "2025-01-01", "2025-01-07", "v1")
+    relatorios_jobs._ao_terminar("t1", _future((bytearray(b"%PDF-teste"), "relatorio.pdf")), k)
+    assert cache_relatorios.obter(k) == (b"%PDF-teste", "relatorio.pdf")
+    assert isinstance(cache_relatorios.obter(k)[0], bytes)
+
+
+def test_exportacao_em_arquivo_nao_entra_no_cache():
+    k = cache_relatorios.chave("excel", "Ponto-A-KM67", "2025-01-01", "2025-01-07", "v1")
+    relatorios_jobs._ao_terminar("t2", _future(("/tmp/exportacao.xlsx", "relatorio.xlsx")), k)
+    assert cache_relatorios.obter(k) is None
+
+
+def test_submeter_com_cache_entrega_na_hora_sem_pool(monkeypatch):
+    k = cache_relatorios.chave("pdf", "Ponto-B-KM72", "2025-02-01", "2025-02-07", "v2")
+    cache_relatorios.guardar(k, b"%PDF-pronto", "pronto.pdf")
+    monkeypatch.setattr(relatorios_jobs, "_chave_cache", lambda *args: k)
+    monkeypatch.setattr(relatorios_jobs, "_garantir_pool", lambda: (_ for _ in ()).throw(AssertionError("pool usado")))
+
+    task_id, motivo = relatorios_jobs.submeter("pdf", "sessao-1", "2025-02-01", "2025-02-07", "Ponto-B-KM72")
+    assert motivo is None
+    situacao = relatorios_jobs.consultar(task_id)
+    assert situacao["status"] == "concluido"
+    assert (situacao["data"], situacao["filename"]) == (b"%PDF-pronto", "pronto.pdf")
+    relatorios_jobs.retirar(task_id)
+
+
+def test_entrada_expirada_nao_e_servida(monkeypatch):
+    k = cache_relatorios.chave("pdf", "Ponto-C-KM74", "2025-03-01", "2025-03-07", "v3")
+    cache_relatorios.guardar(k, b"%PDF-velho", "velho.pdf")
+    monkeypatch.setattr(cache_relatorios, "RELATORIOS_CACHE_TTL_SEC", -1)
+    assert cache_relatorios.obter(k) is None
@@ -0,0 +1,118 @@
+import os
+
+import pandas as pd
+import pytest
+
+import eventos
+from config import EVENTOS_FILE, EVENTOS_PERMANENCIA_MIN_SEC, EVENTOS_HISTERESE_CHUVA_MM, CHUVA_LIMITE_VERDE, CHUVA_LIMITE_AMARELO
+
+PONTO = "Ponto-Teste"
+T0 = pd.Timestamp("2025-01-10 12:00", tz="UTC")
+NIVEL_CHUVA = {"LIVRE": 40.0, "ATENÇÃO": 70.0, "ALERTA": 90.0}
+
+
+@pytest.fixture(autouse=True)
+def estado_limpo():
+    eventos.ESTADO_EVENTOS.clear()
+    eventos.ULTIMOS_EVENTOS.clear()
+    yield
+    eventos.ESTADO_EVENTOS.clear()
+    eventos.ULTIMOS_EVENTOS.clear()
+
+
+def _ciclo(status, minutos, chuva_72h=None):
+    """ Um ciclo do worker com o status bruto de chuva; devolve (status confirmado, eventos de chuva). """
+    info = {"chuva": status, "umidade": "LIVRE",
+            "chuva_72h": NIVEL_CHUVA[status] if chuva_72h is None else chuva_72h}
+    confirmados, lista = eventos.processar({PONTO: info}, agora=T0 + pd.Timedelta(minutes=minutos))
+    return confirmados[PONTO]["chuva"], [(e["de"], e["para"]) for e in lista if e["tipo"] == "chuva"]
+
+
+def test_escalada_confirmada_no_mesmo_ciclo():
+    _ciclo("LIVRE", 0)
+    assert _ciclo("ALERTA", 10) == ("ALERTA", [("LIVRE", "ALERTA")])
+
+
+def test_reducao_espera_permanencia_minima():
+    _ciclo("LIVRE", 0)
+    _ciclo("ATENÇÃO", 10)
+    assert _ciclo("LIVRE", 20) == ("ATENÇÃO", [])
+    minutos = 20 + EVENTOS_PERMANENCIA_MIN_SEC // 60
+    assert _ciclo("LIVRE", minutos) == ("LIVRE", [("ATENÇÃO", "LIVRE")])
+
+
+def test_reducao_dentro_da_histerese_nao_confirma():
+    _ciclo("LIVRE", 0)
+    _ciclo("ATENÇÃO", 10)
+    # Abaixo do limite, mas dentro da faixa de histerese: continua ATENÇÃO mesmo após a permanência
+    valor = CHUVA_LIMITE_VERDE - EVENTOS_HISTERESE_CHUVA_MM / 2
+    for minutos in range(20, 20 + 2 * EVENTOS_PERMANENCIA_MIN_SEC // 60, 10):
+        assert _ciclo("LIVRE", minutos, chuva_72h=valor) == ("ATENÇÃO", [])
+
+
+def test_escalada_nunca_e_deduplicada():
+    # ATENÇÃO -> ALERTA, volta a ATENÇÃO após a permanência e sobe de novo antes de EVENTOS_DEDUP_SEC
+    _ciclo("ATENÇÃO", 0)
+    assert _ciclo("ALERTA", 0 + 1)[1] == [("ATENÇÃO", "ALERTA")]
+    _ciclo("ATENÇÃO", 2)
+    assert _ciclo("ATENÇÃO", 32) == ("ATENÇÃO", [("ALERTA", "ATENÇÃO")])
+    assert _ciclo("ALERTA", 40) == ("ALERTA", [("ATENÇÃO", "ALERTA")])
+
+
+def test_reducao_apos_nova_escalada_e_reemitida():
+    _ciclo("ATENÇÃO", 0)
+    _ciclo("ALERTA", 1)
+    _ciclo("ATENÇÃO", 2)
+    _ciclo("ATENÇÃO", 32)
+    _ciclo("ALERTA", 40)
+    _ciclo("ATENÇÃO", 41, chuva_72h=CHUVA_LIMITE_AMARELO - EVENTOS_HISTERESE_CHUVA_MM - 1)
+    # O log precisa terminar no nível em que a estação está
+    assert _ciclo("ATENÇÃO", 71) == ("ATENÇÃO", [("ALERTA", "ATENÇÃO")])
+
+
+def test_reducao_repetida_sem_escalada_de_volta_e_suprimida():
+    eventos.ULTIMOS_EVENTOS[(PONTO, "chuva", "ALERTA", "ATENÇÃO")] = T0
+    eventos.ESTADO_EVENTOS[(PONTO, "chuva")] = {"nivel": 2, "desde": T0, "candidato": None, "candidato_desde": None}
+    _ciclo("ATENÇÃO", 5)
+    assert _ciclo("ATENÇÃO", 35) == ("ATENÇÃO", [])
+
+
+# --- Leitura dos eventos gravados (histórico de mudanças da página da estação) ---
+
+@pytest.fixture
+def arquivo_eventos(monkeypatch):
+    monkeypatch.setattr(eventos.data_source, "adicionar_log", lambda *args, **kwargs: None)
+    caminho = os.path.join(eventos.data_source.get_base_path(), EVENTOS_FILE)
+    yield caminho
+    if os.path.exists(caminho): os.remove(caminho)
+
+
+def test_ler_eventos_filtra_por_ponto_e_periodo(arquivo_eventos):
+    _ciclo("LIVRE", 0)
+    _, gravados = eventos.processar({PONTO: {"chuva": "ALERTA", "umidade": "LIVRE", "chuva_72h": 90.0},
+                                     "Outro": {"chuva": "LIVRE", "umidade": "LIVRE"}},
+                                    agora=T0 + pd.Timedelta(minutes=10))
+    eventos.registrar_eventos(gravados)
+    with open(arquivo_eventos, 'a', encoding='utf-8') as f:
+        f.write('{"linha quebrada\n')
+
+    do_ponto = eventos.ler_eventos(PONTO)
+    assert [(e["de"], e["para"]) for e in do_ponto if e["tipo"] == "chuva"] == [("LIVRE", "ALERTA")]
+    assert {e["id_ponto"] for e in eventos.ler_eventos()} == {PONTO, "Outro"}
+    assert eventos.ler_eventos(PONTO, start_dt=T0 + pd.Timedelta(minutes=11)) == []
+    assert eventos.ler_eventos(PONTO, end_dt=T0 + pd.Timedelta(minutes=10)) == []
+
+
+def test_historico_da_estacao_usa_os_eventos_gravados(arquivo_eventos):
+    from pages.specific_dash import historico_mudancas
+
+    log_mudanca = f"2025-01-10T11:00:00.000000+00:00 | WARN  | {PONTO} | MUDANÇA DE STATUS (Chuva): X de A para B."
+    log_alerta = f"2025-01-10T12:30:00.000000+00:00 | WARN  | {PONTO} | ALERTA de paralização enviado."
+    assert historico_mudancas(PONTO, [log_mudanca, log_alerta]) == [log_mudanca, log_alerta]  # Sem eventos: o log
+
+    _ciclo("LIVRE", 0)
+    eventos.registrar_eventos(eventos.processar({PONTO: {"chuva": "ALERTA", "umidade": "LIVRE", "chuva_72h": 90.0}},
+                                                agora=T0 + pd.Timedelta(minutes=10))[1])
+    historico = historico_mudancas(PONTO, [log_mudanca, log_alerta])
+    assert len(historico) == 2 and historico[1] == log_alerta  # Em ordem de tempo, sem a linha de status do log
+    assert "de LIVRE para ALERTA. Chuva 72h: 90.0 mm." in historico[0]
@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+import data_source
+import fragmentos_relatorio
+from config import PONTOS_DE_ANALISE, FUSO_LOCAL
+
+DIAS = 3
+
+
+@pytest.fixture
+def versoes(monkeypatch):
+    """ Versão fixa por dia e fragmentos gravados só em memória: conta as consultas de versão. """
+    consultas, gravados = [], {}
+
+    def versao_do_dia(id_ponto, dia):
+        consultas.append((id_ponto, dia))
+        return "v1"
+
+    monkeypatch.setattr(fragmentos_relatorio, "versao_do_dia", versao_do_dia)
+    monkeypatch.setattr(fragmentos_relatorio, "_ler_meta", lambda id_ponto, dia: gravados.get((id_ponto, dia)))
+    monkeypatch.setattr(fragmentos_relatorio, "calcular",
+                        lambda id_ponto, dia, versao: {"id_ponto": id_ponto, "dia": dia, "versao": versao})
+    monkeypatch.setattr(fragmentos_relatorio, "gravar",
+                        lambda fragmento: gravados.__setitem__((fragmento["id_ponto"], fragmento["dia"]), fragmento))
+    monkeypatch.setattr(fragmentos_relatorio, "_ULTIMA_VERIFICACAO_COMPLETA", 0.0)
+    fragmentos_relatorio._CONFERIDOS.clear()
+    data_source.DIAS_ALTERADOS.clear()
+    yield consultas
+    fragmentos_relatorio._CONFERIDOS.clear()
+    data_source.DIAS_ALTERADOS.clear()
+
+
+def _ontem():
+    return pd.Timestamp.now(tz=FUSO_LOCAL).normalize() - pd.Timedelta(days=1)
+
+
+def test_primeira_rodada_confere_todos_os_dias(versoes):
+    feitos = fragmentos_relatorio.atualizar_dias_fechados(dias=DIAS, maximo=1000)
+    assert feitos == DIAS * len(PONTOS_DE_ANALISE)
+    assert len(versoes) == DIAS * len(PONTOS_DE_ANALISE)
+
+
+def test_rodada_seguinte_sem_alteracao_nao_consulta_o_banco(versoes):
+    fragmentos_relatorio.atualizar_dias_fechados(dias=DIAS, maximo=1000)
+    versoes.clear()
+    assert fragmentos_relatorio.atualizar_dias_fechados(dias=DIAS, maximo=1000) == 0
+    assert versoes == []
+
+
+def test_so_o_dia_marcado_e_reconferido(versoes):
+    fragmentos_relatorio.atualizar_dias_fechados(dias=DIAS, maximo=1000)
+    versoes.clear()
+    id_ponto = next(iter(PONTOS_DE_ANALISE))
+    ontem = _ontem()
+    data_source.marcar_dias_alterados(id_ponto, ontem.tz_convert("UTC") + pd.Timedelta(hours=12),
+                                      ontem.tz_convert("UTC") + pd.Timedelta(hours=13))
+    fragmentos_relatorio.atualizar_dias_fechados(dias=DIAS, maximo=1000)
+    assert versoes == [(id_ponto, ontem.strftime('%Y-%m-%d'))]
+
+
+def test_limite_por_rodada_deixa_o_resto_para_a_proxima(versoes):
+    total = DIAS * len(PONTOS_DE_ANALISE)
+    assert fragmentos_relatorio.atualizar_dias_fechados(dias=DIAS, maximo=2) == 2
+    versoes.clear()
+    assert fragmentos_relatorio.atualizar_dias_fechados(dias=DIAS, maximo=1000) == total - 2
+    assert len(versoes) == total - 2
+
+
+def test_marcacao_cobre_os_dias_locais_do_intervalo():
+    data_source.DIAS_ALTERADOS.clear()
+    # 02:00 UTC = 23:00 do dia anterior em São Paulo
+    data_source.marcar_dias_alterados("P", pd.Timestamp("2025-01-10 02:00", tz="UTC"),
+                                      pd.Timestamp("2025-01-11 12:00", tz="UTC"))
+    assert sorted(dia for _, dia in data_source.DIAS_ALTERADOS) == ["2025-01-09", "2025-01-10", "2025-01-11"]
+    assert data_source.dia_alterado_em(None, "2025-01-10") > 0
+    assert data_source.dia_alterado_em("P", "2025-01-12") == 0.0
+    data_source.DIAS_ALTERADOS.clear()
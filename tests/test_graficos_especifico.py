@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+import data_source
+from config import PONTOS_DE_ANALISE
+from pages import specific_dash
+
+PONTO, CONFIG = next(iter(PONTOS_DE_ANALISE.items()))
+HORAS = 24
+
+
+def _leituras(timestamps):
+    n = len(timestamps)
+    return pd.DataFrame({"timestamp": timestamps, "id_ponto": PONTO, "chuva_mm": 0.2,
+                         "precipitacao_acumulada_mm": 0.0, "umidade_1m_perc": 30.0 + np.arange(n) * 0.01,
+                         "umidade_2m_perc": 20.0, "umidade_3m_perc": 9.0, "qc_umidade": 0})
+
+
+def _montar():
+    aviso, df_plot_10min, df_acumulada = specific_dash._dados_graficos(PONTO, HORAS)
+    assert aviso is None
+    return specific_dash._montar_figuras(PONTO, CONFIG, HORAS, df_plot_10min, df_acumulada)[2]
+
+
+def _tick(estado):
+    _, df_plot_10min, df_acumulada = specific_dash._dados_graficos(PONTO, HORAS)
+    return specific_dash._pontos_novos(df_plot_10min, df_acumulada, estado)
+
+
+def test_leitura_nova_estende_e_slot_antigo_preenchido_reconstroi(banco):
+    agora = pd.Timestamp.now(tz="UTC").floor("10min")
+    timestamps = pd.date_range(agora - pd.Timedelta(hours=HORAS), agora - pd.Timedelta(minutes=10), freq="10min")
+    lacuna = timestamps[60:66]
+    data_source.save_to_sqlite(_leituras(timestamps.difference(lacuna)))
+    estado = _montar()
+    assert not estado["reduzido"]
+
+    data_source.save_to_sqlite(_leituras(pd.DatetimeIndex([agora])))
+    extensoes = _tick(estado)
+    assert extensoes is not None  # Só um slot novo: extendData
+    assert _tick(estado) is not None  # E a versão acompanhou o que foi enviado
+
+    data_source.save_to_sqlite(_leituras(lacuna))  # Backfill da lacuna, mais antigo que o último enviado
+    assert _tick(estado) is None
+
+
+def test_mascara_de_qc_regravada_reconstroi(banco):
+    agora = pd.Timestamp.now(tz="UTC").floor("10min")
+    timestamps = pd.date_range(agora - pd.Timedelta(hours=HORAS), agora - pd.Timedelta(minutes=10), freq="10min")
+    df = _leituras(timestamps)
+    data_source.save_to_sqlite(df)
+    estado = _montar()
+
+    regravadas = df.iloc[[30]].assign(qc_umidade=1)
+    data_source.delete_from_sqlite(regravadas["timestamp"], id_ponto=PONTO)
+    data_source.save_to_sqlite(regravadas)
+    assert _tick(estado) is None
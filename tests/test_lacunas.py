@@ -0,0 +1,136 @@
+import pandas as pd
+import pytest
+
+import lacunas
+import qualidade
+from config import BACKFILL_MAX_TENTATIVAS, LACUNAS_JANELA_HORAS
+
+PONTO = "Ponto-Teste"
+AGORA = pd.Timestamp("2025-01-10 12:03", tz="UTC")
+
+
+@pytest.fixture(autouse=True)
+def indice_limpo(monkeypatch):
+    monkeypatch.setattr(lacunas, "_fontes_monitoradas", lambda: [(PONTO, "chuva")])
+    lacunas.LACUNAS_INDEX.clear()
+    yield
+    lacunas.LACUNAS_INDEX.clear()
+
+
+def _leituras(inicio, fim):
+    timestamps = pd.date_range(inicio.floor("10min"), fim, freq="10min")
+    return pd.DataFrame({"timestamp": timestamps, "id_ponto": PONTO, "precipitacao_acumulada_mm": 0.0})
+
+
+def _registros():
+    return lacunas.LACUNAS_INDEX.get((PONTO, "chuva"), [])
+
+
+def _desistir_de_todas():
+    for registro in _registros():
+        registro["tentativas"] = BACKFILL_MAX_TENTATIVAS
+
+
+def test_lacuna_no_meio_da_grade():
+    df = pd.concat([_leituras(AGORA - pd.Timedelta(hours=72), AGORA - pd.Timedelta(hours=6)),
+                    _leituras(AGORA - pd.Timedelta(hours=4), AGORA)])
+    lacunas.atualizar_indice(df, AGORA)
+    (registro,) = _registros()
+    assert registro["inicio"] == pd.Timestamp("2025-01-10 06:10", tz="UTC")
+    assert registro["fim"] == pd.Timestamp("2025-01-10 07:50", tz="UTC")
+    assert registro["tentativas"] == 0
+
+
+def test_lacuna_que_cresce_mantem_tentativas():
+    # Estação offline desde 5h atrás: a lacuna ganha um slot novo a cada ciclo
+    df = _leituras(AGORA - pd.Timedelta(hours=72), AGORA - pd.Timedelta(hours=5))
+    lacunas.atualizar_indice(df, AGORA)
+    _desistir_de_todas()
+    for ciclo in range(1, 4):
+        lacunas.atualizar_indice(df, AGORA + pd.Timedelta(minutes=10 * ciclo))
+        (registro,) = _registros()
+        assert registro["tentativas"] == BACKFILL_MAX_TENTATIVAS
+    assert lacunas._pendentes() == []
+
+
+def test_lacuna_cortada_pela_janela_mantem_tentativas():
+    # Lacuna no começo da janela: o início avança junto com a janela móvel
+    df = _leituras(AGORA - pd.Timedelta(hours=LACUNAS_JANELA_HORAS - 3), AGORA + pd.Timedelta(hours=1))
+    lacunas.atualizar_indice(df, AGORA)
+    _desistir_de_todas()
+    inicio_antes = _registros()[0]["inicio"]
+    lacunas.atualizar_indice(df, AGORA + pd.Timedelta(minutes=30))
+    (registro,) = _registros()
+    assert registro["inicio"] > inicio_antes
+    assert registro["tentativas"] == BACKFILL_MAX_TENTATIVAS
+
+
+def test_lacuna_preenchida_sai_do_indice_e_nova_comeca_do_zero():
+    df = pd.concat([_leituras(AGORA - pd.Timedelta(hours=72), AGORA - pd.Timedelta(hours=6)),
+                    _leituras(AGORA - pd.Timedelta(hours=4), AGORA)])
+    lacunas.atualizar_indice(df, AGORA)
+    _desistir_de_todas()
+
+    # Lacuna antiga preenchida; outra, sem relação com ela, aparece mais adiante
+    df = pd.concat([_leituras(AGORA - pd.Timedelta(hours=72), AGORA - pd.Timedelta(hours=2)),
+                    _leituras(AGORA - pd.Timedelta(hours=1), AGORA)])
+    lacunas.atualizar_indice(df, AGORA)
+    (registro,) = _registros()
+    assert registro["inicio"] > AGORA - pd.Timedelta(hours=2)
+    assert registro["tentativas"] == 0
+    assert len(lacunas._pendentes()) == 1
+
+
+class _FonteFalsa:
+    """ Adaptador de umidade que "recupera" as leituras dadas para a lacuna. """
+    tipos = ("umidade",)
+
+    def __init__(self, df):
+        self.df = df
+
+    def fetch_range(self, id_ponto, start_dt, end_dt):
+        return self.df[(self.df["timestamp"] >= start_dt) & (self.df["timestamp"] < end_dt)]
+
+
+def _umidade(inicio, fim, valor_1m):
+    timestamps = pd.date_range(inicio, fim, freq="10min")
+    return pd.DataFrame({"timestamp": timestamps, "id_ponto": PONTO, "umidade_1m_perc": valor_1m,
+                         "umidade_2m_perc": 35.0, "umidade_3m_perc": 9.0})
+
+
+def _preencher(monkeypatch, recuperado, inicio, fim):
+    monkeypatch.setattr(lacunas.data_source, "adaptador_do_ponto", lambda p, t: _FonteFalsa(recuperado))
+    gravados = lacunas.preencher_lacuna(PONTO, "umidade", {"inicio": inicio, "fim": fim, "tentativas": 0})
+    df = lacunas.data_source.read_data_from_sqlite(id_ponto=PONTO)
+    df["qc_umidade"] = pd.to_numeric(df["qc_umidade"]).astype(int)
+    return gravados, df.set_index("timestamp")
+
+
+def test_backfill_de_umidade_faz_qc_com_as_leituras_vizinhas(banco, monkeypatch):
+    lacuna = pd.Timestamp("2025-01-10 12:00", tz="UTC")
+    # Valores variando (nada travado) com um slot faltando no meio
+    vizinhos = pd.concat([_umidade(lacuna - pd.Timedelta(hours=6), lacuna - pd.Timedelta(minutes=10), 30.0),
+                          _umidade(lacuna + pd.Timedelta(minutes=10), lacuna + pd.Timedelta(hours=6), 30.0)],
+                         ignore_index=True)
+    for coluna in ("umidade_1m_perc", "umidade_2m_perc", "umidade_3m_perc"):
+        vizinhos[coluna] += (vizinhos.index % 3) * 0.1
+    lacunas.data_source.save_to_sqlite(qualidade.aplicar_qc(vizinhos))
+    antes = len(vizinhos)
+
+    # Um único slot recuperado, com pico: sozinho ele não teria mediana para comparar
+    gravados, banco_depois = _preencher(monkeypatch, _umidade(lacuna, lacuna, 45.0), lacuna, lacuna)
+    assert gravados == 1
+    assert len(banco_depois) == antes + 1
+    assert banco_depois.loc[lacuna, "qc_umidade"] & qualidade.bit(0, qualidade.QC_PICO)
+    # Só a linha da lacuna foi regravada: as vizinhas mantêm a máscara gravada antes
+    assert (banco_depois.drop(index=lacuna)["qc_umidade"] == 0).all()
+
+
+def test_backfill_de_umidade_detecta_valor_travado_com_o_historico(banco, monkeypatch):
+    lacuna = pd.Timestamp("2025-01-10 12:00", tz="UTC")
+    # Sensor travado em 30.0 há mais de QC_TRAVADO_LEITURAS leituras antes da lacuna
+    antes = _umidade(lacuna - pd.Timedelta(hours=13), lacuna - pd.Timedelta(minutes=10), 30.0)
+    lacunas.data_source.save_to_sqlite(antes.assign(qc_umidade=0))
+    _, banco_depois = _preencher(monkeypatch, _umidade(lacuna, lacuna + pd.Timedelta(minutes=10), 30.0),
+                                 lacuna, lacuna + pd.Timedelta(minutes=10))
+    assert banco_depois.loc[lacuna, "qc_umidade"] & qualidade.bit(0, qualidade.QC_TRAVADO)
@@ -0,0 +1,86 @@
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import links_download
+import relatorios_jobs
+import relatorios_agendados
+import index  # noqa: F401  (layout e páginas registrados, incluindo as rotas /relatorios/...)
+from app import server
+
+
+@pytest.fixture
+def exportacao(tmp_path):
+    caminho = tmp_path / "exportacao.csv"
+    caminho.write_text("timestamp;chuva_mm\n")
+    future = Future()
+    future.set_result((str(caminho), "dados.csv"))
+    with relatorios_jobs.JOBS_LOCK:
+        relatorios_jobs.JOBS["job-1"] = {"tipo": "csv", "usuario": "sessao-dono", "future": future,
+                                         "criado": time.time(), "fim": time.time()}
+    yield "job-1"
+    with relatorios_jobs.JOBS_LOCK:
+        relatorios_jobs.JOBS.pop("job-1", None)
+
+
+def _token(usuario, task_id="job-1"):
+    return links_download.assinar({"rota": "exportacao", "task_id": task_id, "usuario": usuario})
+
+
+def test_exportacao_sem_token_e_recusada(exportacao):
+    assert server.test_client().get(f"/relatorios/arquivo/{exportacao}").status_code == 403
+
+
+def test_exportacao_com_token_adulterado_e_recusada(exportacao):
+    token = _token("sessao-dono")
+    resposta = server.test_client().get(f"/relatorios/arquivo/{exportacao}?t={token[:-2]}xx")
+    assert resposta.status_code == 403
+
+
+def test_exportacao_de_outra_sessao_nao_e_entregue(exportacao):
+    resposta = server.test_client().get(f"/relatorios/arquivo/{exportacao}?t={_token('outra-sessao')}")
+    assert resposta.status_code == 404
+
+
+def test_token_de_outro_job_e_recusado(exportacao):
+    resposta = server.test_client().get(f"/relatorios/arquivo/{exportacao}?t={_token('sessao-dono', 'job-2')}")
+    assert resposta.status_code == 403
+
+
+def test_exportacao_do_dono_e_entregue(exportacao):
+    resposta = server.test_client().get(f"/relatorios/arquivo/{exportacao}?t={_token('sessao-dono')}")
+    assert resposta.status_code == 200
+    assert resposta.data == b"timestamp;chuva_mm\n"
+    resposta.close()
+
+
+def test_token_expirado_e_invalido():
+    token = _token("sessao-dono")
+    assert links_download.validar(token, {"task_id": "job-1"}) is not None
+    assert links_download.validar(token, {"task_id": "job-1"}, max_age=-1) is None
+
+
+@pytest.fixture
+def relatorio_agendado(monkeypatch, tmp_path):
+    caminho = tmp_path / "semanal.pdf"
+    caminho.write_bytes(b"%PDF-agendado")
+    monkeypatch.setattr(relatorios_agendados, "arquivo_para_download",
+                        lambda nome, id_ponto: (str(caminho), "semanal.pdf") if nome == "semanal" else None)
+    return "/relatorios/agendado/semanal/Ponto-A-KM67"
+
+
+def test_relatorio_agendado_sem_token_e_recusado(relatorio_agendado):
+    assert server.test_client().get(relatorio_agendado).status_code == 403
+
+
+def test_token_de_outro_relatorio_agendado_e_recusado(relatorio_agendado):
+    token = links_download.assinar({"rota": "agendado", "nome": "semanal", "id_ponto": "Ponto-B-KM72"})
+    assert server.test_client().get(f"{relatorio_agendado}?t={token}").status_code == 403
+
+
+def test_relatorio_agendado_com_token_e_entregue(relatorio_agendado):
+    token = links_download.assinar({"rota": "agendado", "nome": "semanal", "id_ponto": "Ponto-A-KM67"})
+    resposta = server.test_client().get(f"{relatorio_agendado}?t={token}")
+    assert resposta.status_code == 200 and resposta.data == b"%PDF-agendado"
+    resposta.close()
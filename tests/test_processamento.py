@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+import processamento
+from processamento import ODOMETRO_OK, ODOMETRO_REINICIO, ODOMETRO_SALTO, ODOMETRO_RECUO, NOMES_NIVEL
+from config import (
+    FUSO_LOCAL, CONSTANTES_PADRAO, DELTA_TRIGGER_UMIDADE,
+    CHUVA_LIMITE_VERDE, CHUVA_LIMITE_AMARELO, CHUVA_LIMITE_LARANJA
+)
+
+PONTO = "Ponto-Teste"
+
+
+def _odometro(inicio_local, valores, id_ponto=PONTO):
+    """ Leituras de 10 em 10 min a partir de 'inicio_local' (hora local) com o acumulado diário dado. """
+    timestamps = pd.date_range(pd.Timestamp(inicio_local, tz=FUSO_LOCAL), periods=len(valores), freq="10min")
+    return pd.DataFrame({"timestamp": timestamps.tz_convert("UTC"), "id_ponto": id_ponto,
+                         "precipitacao_acumulada_mm": valores})
+
+
+def _decodificar(df):
+    resultado = processamento.decodificar_odometro(df)
+    return resultado["chuva_mm"].round(2).tolist(), resultado["anomalia_odometro"].tolist()
+
+
+# --- Odômetro (decodificar_odometro) ---
+
+def test_subida_normal_vira_chuva_por_leitura():
+    chuva, anomalias = _decodificar(_odometro("2025-01-10 10:00", [2.0, 2.0, 2.6, 3.0]))
+    assert chuva == [0.0, 0.0, 0.6, 0.4]
+    assert anomalias == [ODOMETRO_OK] * 4
+
+
+def test_zeragem_na_meia_noite_local_e_virada_do_dia():
+    chuva, anomalias = _decodificar(_odometro("2025-01-10 23:40", [12.0, 12.4, 0.3, 0.8]))
+    assert chuva == [0.0, 0.4, 0.3, 0.5]
+    assert anomalias == [ODOMETRO_OK] * 4
+
+
+def test_zeragem_dentro_da_tolerancia_da_meia_noite():
+    # Relógio da estação atrasado: zera às 00:40 locais, ainda dentro da tolerância (60 min)
+    chuva, anomalias = _decodificar(_odometro("2025-01-11 00:20", [12.0, 12.0, 0.2]))
+    assert chuva == [0.0, 0.0, 0.2]
+    assert anomalias == [ODOMETRO_OK] * 3
+
+
+def test_queda_fora_da_meia_noite_com_valor_pequeno_e_reinicio():
+    chuva, anomalias = _decodificar(_odometro("2025-01-10 14:00", [20.0, 20.0, 0.4, 0.9]))
+    assert chuva == [0.0, 0.0, 0.4, 0.5]
+    assert anomalias == [ODOMETRO_OK, ODOMETRO_OK, ODOMETRO_REINICIO, ODOMETRO_OK]
+
+
+def test_recuo_espurio_nao_conta_chuva_duas_vezes():
+    # Queda grande para um valor alto (não é reinício) e queda pequena: ambas recuo, e a volta ao
+    # patamar anterior não gera chuva; só o que passa do máximo (21.0) conta
+    chuva, anomalias = _decodificar(_odometro("2025-01-10 14:00", [20.0, 12.0, 20.0, 19.5, 20.0, 21.0]))
+    assert chuva == [0.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+    assert anomalias == [ODOMETRO_OK, ODOMETRO_RECUO, ODOMETRO_OK, ODOMETRO_RECUO, ODOMETRO_OK, ODOMETRO_OK]
+    assert sum(chuva) == 1.0
+
+
+def test_salto_implausivel_e_descartado():
+    # 490 mm em 10 min (> 150 mm/h): descartado; a leitura seguinte compara com a última válida
+    chuva, anomalias = _decodificar(_odometro("2025-01-10 14:00", [10.0, 500.0, 10.5]))
+    assert chuva == [0.0, 0.0, 0.5]
+    assert anomalias == [ODOMETRO_OK, ODOMETRO_SALTO, ODOMETRO_OK]
+
+
+def test_salto_proporcional_ao_intervalo():
+    # 30 mm depois de 1h sem leitura é plausível (limite 150 mm/h); em 10 min não seria
+    df = _odometro("2025-01-10 14:00", [10.0, 40.0])
+    df.loc[1, "timestamp"] += pd.Timedelta(minutes=50)
+    chuva, anomalias = _decodificar(df)
+    assert chuva == [0.0, 30.0]
+    assert anomalias == [ODOMETRO_OK, ODOMETRO_OK]
+
+
+def test_estacoes_separadas_e_resultado_alinhado_ao_indice():
+    a = _odometro("2025-01-10 14:00", [5.0, 5.5, 6.0], id_ponto="A")
+    b = _odometro("2025-01-10 14:00", [50.0, 50.2, 50.2], id_ponto="B")
+    df = pd.concat([a, b]).sample(frac=1, random_state=3)  # Desordenado, índice com rótulos repetidos
+    resultado = processamento.decodificar_odometro(df)
+    assert resultado.index.equals(df.index)
+
+    por_linha = df.assign(chuva=resultado["chuva_mm"].to_numpy()).sort_values(["id_ponto", "timestamp"])
+    assert np.allclose(por_linha["chuva"], [0.0, 0.5, 0.5, 0.0, 0.2, 0.0])
+    assert (resultado["anomalia_odometro"] == ODOMETRO_OK).all()
+
+
+# --- Classificação em lote x funções escalares (definir_status_*) ---
+
+AGORA = pd.Timestamp("2025-01-10 12:00", tz="UTC")
+BASES = [CONSTANTES_PADRAO[f"UMIDADE_BASE_{d}M"] for d in (1, 2, 3)]
+
+
+def _lote(leituras, pontos_umidade=None):
+    """ leituras: {id_ponto: (chuva_mm, [umidade 1m, 2m, 3m], idade)} -> classificar_status_lote. """
+    df = pd.DataFrame([{"timestamp": AGORA - idade, "id_ponto": id_ponto, "chuva_mm": chuva,
+                        "umidade_1m_perc": umidade[0], "umidade_2m_perc": umidade[1], "umidade_3m_perc": umidade[2]}
+                       for id_ponto, (chuva, umidade, idade) in leituras.items()])
+    return processamento.classificar_status_lote(df, pontos_umidade=pontos_umidade, agora=AGORA)
+
+
+def test_nivel_de_chuva_em_lote_igual_ao_escalar_nos_limites():
+    valores = [0.0, CHUVA_LIMITE_VERDE, CHUVA_LIMITE_VERDE + 0.1, CHUVA_LIMITE_AMARELO, CHUVA_LIMITE_AMARELO + 0.1,
+               CHUVA_LIMITE_LARANJA - 0.1, CHUVA_LIMITE_LARANJA, CHUVA_LIMITE_LARANJA + 50]
+    resultado = _lote({f"P{i}": (valor, BASES, pd.Timedelta(minutes=10)) for i, valor in enumerate(valores)})
+    for i, valor in enumerate(valores):
+        assert resultado.loc[f"P{i}", "chuva_72h"] == valor
+        assert NOMES_NIVEL[resultado.loc[f"P{i}", "nivel_chuva"]] == processamento.definir_status_chuva(valor)[0]
+    assert NOMES_NIVEL[processamento.classificar_nivel_chuva([np.nan])[0]] == \
+        processamento.definir_status_chuva(np.nan)[0]
+
+
+def test_nivel_de_umidade_em_lote_igual_ao_escalar():
+    no_gatilho = [base + DELTA_TRIGGER_UMIDADE for base in BASES]  # Delta exatamente igual ao gatilho
+    abaixo = [base + DELTA_TRIGGER_UMIDADE - 0.1 for base in BASES]
+    casos = {
+        "todas_no_gatilho": no_gatilho,
+        "todas_abaixo": abaixo,
+        "so_1m": [no_gatilho[0], abaixo[1], abaixo[2]],
+        "1m_e_2m": [no_gatilho[0], no_gatilho[1], abaixo[2]],
+        "2m_e_3m": [abaixo[0], no_gatilho[1], no_gatilho[2]],
+        "so_3m": [abaixo[0], abaixo[1], no_gatilho[2]],
+        "so_2m": [abaixo[0], no_gatilho[1], abaixo[2]],
+        "2m_sem_leitura": [no_gatilho[0], np.nan, no_gatilho[2]],
+    }
+    resultado = _lote({id_ponto: (0.0, umidade, pd.Timedelta(minutes=10)) for id_ponto, umidade in casos.items()})
+    for id_ponto, umidade in casos.items():
+        escalar = processamento.definir_status_umidade_hierarquico(*umidade, *BASES)[0]
+        assert NOMES_NIVEL[resultado.loc[id_ponto, "nivel_umidade"]] == escalar, id_ponto
+
+
+def test_estacao_sem_sensor_e_leitura_velha_ficam_sem_dados():
+    no_gatilho = [base + DELTA_TRIGGER_UMIDADE for base in BASES]
+    resultado = _lote({"sem_sensor": (0.0, no_gatilho, pd.Timedelta(minutes=10)),
+                       "velha": (0.0, no_gatilho, pd.Timedelta(hours=3, minutes=10)),
+                       "fresca": (0.0, no_gatilho, pd.Timedelta(hours=2, minutes=50))},
+                      pontos_umidade={"velha", "fresca"})
+    escalar_sem_leitura = processamento.definir_status_umidade_hierarquico(np.nan, np.nan, np.nan, *BASES)[0]
+    for id_ponto in ("sem_sensor", "velha"):
+        assert NOMES_NIVEL[resultado.loc[id_ponto, "nivel_umidade"]] == escalar_sem_leitura
+        assert pd.isna(resultado.loc[id_ponto, "ts_umidade"])
+    assert resultado.loc["fresca", "nivel_umidade"] == 3
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+import qualidade
+
+PONTO = "Ponto-Teste"
+
+
+def _serie(passo_min, subida_2m_por_leitura, n=45):
+    """ 1m parado, 3m com ruído leve, 2m subindo 'subida_2m_por_leitura' p.p. a cada leitura. """
+    timestamps = pd.date_range("2025-01-10", periods=n, freq=f"{passo_min}min", tz="UTC")
+    ruido = (np.arange(n) % 3) * 0.01
+    return pd.DataFrame({"timestamp": timestamps, "id_ponto": PONTO,
+                         "umidade_1m_perc": 30.0 + ruido,
+                         "umidade_2m_perc": 5.0 + subida_2m_por_leitura * np.arange(n),
+                         "umidade_3m_perc": 9.0 + ruido})
+
+
+def _cruzado_2m(df):
+    return (qualidade.calcular_qc(df) & qualidade.bit(1, qualidade.QC_CRUZADO)) != 0
+
+
+def test_subida_rapida_no_2m_sem_resposta_do_1m_e_reprovada():
+    # Grade de 10 min: 0.5 p.p. por leitura = 3 p.p./h
+    # (a partir da leitura 36 há as 6h de histórico do 1m para comparar)
+    assert _cruzado_2m(_serie(10, 0.5)).iloc[36:].all()
+
+
+def test_taxa_usa_o_tempo_decorrido_com_amostragem_irregular():
+    # Leituras a cada 30 min: 0.5 p.p. por leitura = 1 p.p./h (abaixo do limite). Por número de
+    # leituras, as 6 últimas somariam 3 p.p. e seriam reprovadas indevidamente.
+    assert not _cruzado_2m(_serie(30, 0.5)).any()
+    # 2.4 p.p./h com leituras a cada 30 min continua reprovada
+    assert _cruzado_2m(_serie(30, 1.2)).iloc[36:].all()
+
+
+def test_leituras_boas_ficam_com_mascara_zero():
+    df = _serie(10, 0.0)
+    df["umidade_2m_perc"] += (np.arange(len(df)) % 3) * 0.01
+    assert (qualidade.calcular_qc(df) == 0).all()
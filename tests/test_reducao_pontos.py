@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import reducao_pontos
+
+
+@pytest.fixture(autouse=True)
+def cache_limpo():
+    reducao_pontos._CACHE.clear()
+    yield
+    reducao_pontos._CACHE.clear()
+
+
+def _serie(n=1000, semente=0):
+    gerador = np.random.default_rng(semente)
+    x = np.arange(n, dtype=float)
+    y = np.sin(x / 50) + gerador.normal(0, 0.05, n)
+    return x, y
+
+
+def test_lttb_mantem_primeiro_e_ultimo_em_ordem():
+    x, y = _serie()
+    indices = reducao_pontos.lttb(x, y, 100)
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_lttb_mantem_pico_isolado():
+    x, y = _serie()
+    y[537] = 50.0
+    assert 537 in reducao_pontos.lttb(x, y, 100)
+
+
+def test_lttb_serie_curta_volta_inteira():
+    x, y = _serie(50)
+    assert np.array_equal(reducao_pontos.lttb(x, y, 100), np.arange(50))
+    assert np.array_equal(reducao_pontos.lttb(x, y, 2), np.arange(50))
+
+
+def test_minmax_mantem_minimo_e_maximo_de_cada_balde():
+    _, y = _serie()
+    n_baldes = 40
+    indices = reducao_pontos.minmax(y, n_baldes)
+    assert np.all(np.diff(indices) > 0)  # Em ordem e sem repetidos
+    bordas = np.linspace(0, len(y), n_baldes + 1).astype(np.int64)
+    for inicio, fim in zip(bordas[:-1], bordas[1:]):
+        balde = y[inicio:fim]
+        no_balde = indices[(indices >= inicio) & (indices < fim)]
+        assert len(no_balde) == 2
+        assert y[no_balde].min() == balde.min() and y[no_balde].max() == balde.max()
+
+
+def test_minmax_balde_constante_nao_repete_indice():
+    y = np.zeros(100)
+    indices = reducao_pontos.minmax(y, 10)
+    assert len(indices) == len(np.unique(indices))
+
+
+def test_minmax_serie_curta_volta_inteira():
+    _, y = _serie(30)
+    assert np.array_equal(reducao_pontos.minmax(y, 15), np.arange(30))
+
+
+def test_reduzir_usa_leituras_reais_e_mantem_as_lacunas():
+    tempo = pd.date_range("2025-01-01", periods=2000, freq="10min", tz="UTC")
+    _, y = _serie(2000)
+    y[100:300] = np.nan  # Lacuna
+    y[1500] = np.nan  # Leitura isolada reprovada no QC
+    y[:5] = np.nan  # NaN no início não interrompe nada
+    df = pd.DataFrame({"timestamp": tempo, "umidade": y, "chuva": np.abs(y)})
+    reduzidas = reducao_pontos.reduzir(df, "timestamp", {"umidade": "lttb", "chuva": "minmax"}, 200)
+    for coluna, df_reduzido in reduzidas.items():
+        assert len(df_reduzido) <= 200 + 2
+        assert df_reduzido.index.isin(df.index).all()
+        assert df_reduzido.index.is_monotonic_increasing
+        # Um NaN por lacuna interna, no lugar dela (o Plotly interrompe a linha ali, como sem redução)
+        assert df_reduzido.index[df_reduzido[coluna].isna()].tolist() == [100, 1500]
+    assert reduzidas["chuva"]["chuva"].max() == np.nanmax(np.abs(y))
+
+
+def test_reduzir_serie_curta_volta_intacta():
+    df = pd.DataFrame({"timestamp": pd.date_range("2025-01-01", periods=10, freq="10min"), "umidade": range(10)})
+    (df_reduzido,) = reducao_pontos.reduzir(df, "timestamp", {"umidade": "lttb"}, 200).values()
+    assert len(df_reduzido) == 10
+
+
+def test_reduzir_reaproveita_cache_ate_a_serie_mudar(monkeypatch):
+    tempo = pd.date_range("2025-01-01", periods=1000, freq="10min", tz="UTC")
+    _, y = _serie()
+    df = pd.DataFrame({"timestamp": tempo, "umidade": y})
+    chamadas = []
+    original = reducao_pontos._indices_validos
+    monkeypatch.setattr(reducao_pontos, "_indices_validos",
+                        lambda *args: chamadas.append(1) or original(*args))
+
+    primeira = reducao_pontos.reduzir(df, "timestamp", {"umidade": "lttb"}, 100, chave=("P", 24))
+    segunda = reducao_pontos.reduzir(df, "timestamp", {"umidade": "lttb"}, 100, chave=("P", 24))
+    assert len(chamadas) == 1
+    assert segunda["umidade"].index.equals(primeira["umidade"].index)
+
+    df.loc[500, "umidade"] = 99.0  # Série mudou: assinatura diferente, índices recalculados
+    terceira = reducao_pontos.reduzir(df, "timestamp", {"umidade": "lttb"}, 100, chave=("P", 24))
+    assert len(chamadas) == 2
+    assert 500 in terceira["umidade"].index
@@ -0,0 +1,101 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import data_source
+import regras
+from config import PONTOS_DE_ANALISE
+
+PONTO = next(iter(PONTOS_DE_ANALISE))
+
+
+@pytest.fixture
+def estado_limpo(monkeypatch):
+    """ Sem regras compiladas, sem arquivo, tabela do banco controlada pelo teste; conta os ERROR logados. """
+    for nome, valor in (("_REGRAS", None), ("_MTIME_ARQUIVO", None), ("_REGRAS_ARQUIVO", {}),
+                        ("_REGRAS_DB", {}), ("_ULTIMA_CONSULTA_DB", 0.0)):
+        monkeypatch.setattr(regras, nome, valor)
+    tabela = {}
+    monkeypatch.setattr(regras, "_ler_tabela", lambda: dict(tabela))
+    erros = []
+
+    def adicionar_log(id_ponto, mensagem, level="INFO", salvar_arquivo=True):
+        if level == "ERROR": erros.append(mensagem)
+
+    monkeypatch.setattr(data_source, "adicionar_log", adicionar_log)
+    yield tabela, erros
+    if os.path.exists(regras._caminho_arquivo()):
+        os.remove(regras._caminho_arquivo())
+
+
+def _gravar_arquivo(conteudo, mtime):
+    caminho = regras._caminho_arquivo()
+    with open(caminho, 'w', encoding='utf-8') as f:
+        f.write(conteudo if isinstance(conteudo, str) else json.dumps(conteudo))
+    os.utime(caminho, (mtime, mtime))  # mtime explícito: duas gravações no mesmo segundo também contam
+
+
+def _verde(tabela_regras, id_ponto=PONTO):
+    return tabela_regras.limites_chuva[tabela_regras.indices([id_ponto])[0], 0]
+
+
+def test_compilar_prioridade_padrao_arquivo_banco():
+    tabela = regras._compilar({PONTO: {"CHUVA_LIMITE_VERDE": 50, "UMIDADE_BASE_1M": 37.5}},
+                              {PONTO: {"UMIDADE_BASE_1M": 36.0}})
+    assert _verde(tabela) == 50.0
+    assert tabela.para(PONTO)["UMIDADE_BASE_1M"] == 36.0  # Banco vence o arquivo
+    desconhecida = tabela.indices(["Estacao-Desconhecida"])[0]
+    assert desconhecida == len(tabela.pontos)
+    assert np.array_equal(tabela.limites_chuva[desconhecida], [regras.PADRAO_GLOBAL[c] for c in regras.CAMPOS_CHUVA])
+
+
+def test_compilar_limites_fora_de_ordem_voltam_ao_padrao():
+    tabela = regras._compilar({PONTO: {"CHUVA_LIMITE_VERDE": 90, "CHUVA_LIMITE_AMARELO": 80}}, {})
+    assert _verde(tabela) == regras.PADRAO_GLOBAL["CHUVA_LIMITE_VERDE"]
+
+
+def test_arquivo_recarregado_quando_o_mtime_muda(estado_limpo):
+    _gravar_arquivo({PONTO: {"CHUVA_LIMITE_VERDE": 50}}, 1_000_000)
+    primeira = regras.obter_regras()
+    assert _verde(primeira) == 50.0
+    assert regras.obter_regras() is primeira  # Nada mudou: mesma tabela, sem recompilar
+
+    _gravar_arquivo({PONTO: {"CHUVA_LIMITE_VERDE": 45}}, 1_000_100)
+    assert _verde(regras.obter_regras()) == 45.0
+
+
+def test_arquivo_invalido_mantem_as_ultimas_regras_validas_e_loga_uma_vez(estado_limpo):
+    tabela_db, erros = estado_limpo
+    _gravar_arquivo({PONTO: {"CHUVA_LIMITE_VERDE": 50}}, 1_000_000)
+    regras.obter_regras()
+
+    _gravar_arquivo('{"quebrado": ', 1_000_100)
+    for _ in range(5):
+        assert _verde(regras.obter_regras()) == 50.0
+    assert len(erros) == 1
+
+    # Recompilação por mudança no banco não troca as regras do arquivo por {}
+    tabela_db[PONTO] = {"UMIDADE_BASE_1M": 36.0}
+    regras._ULTIMA_CONSULTA_DB = 0.0
+    recompilada = regras.obter_regras()
+    assert recompilada.para(PONTO)["UMIDADE_BASE_1M"] == 36.0
+    assert _verde(recompilada) == 50.0
+    assert len(erros) == 1
+
+    # Arquivo corrigido volta a valer
+    _gravar_arquivo({PONTO: {"CHUVA_LIMITE_VERDE": 40}}, 1_000_200)
+    assert _verde(regras.obter_regras()) == 40.0
+
+
+def test_formato_invalido_e_arquivo_removido(estado_limpo):
+    _, erros = estado_limpo
+    _gravar_arquivo({PONTO: {"CHUVA_LIMITE_VERDE": 50}}, 1_000_000)
+    regras.obter_regras()
+    _gravar_arquivo([1, 2, 3], 1_000_100)
+    assert _verde(regras.obter_regras()) == 50.0
+    assert len(erros) == 1
+
+    os.remove(regras._caminho_arquivo())  # Remover o arquivo é intencional: volta ao padrão
+    assert _verde(regras.obter_regras()) == regras.PADRAO_GLOBAL["CHUVA_LIMITE_VERDE"]
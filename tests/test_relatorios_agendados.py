@@ -0,0 +1,98 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import data_source
+import relatorios_agendados
+from config import PONTOS_DE_ANALISE, FUSO_LOCAL
+
+AGENDAMENTO = {"nome": "diario", "rotulo": "Ontem", "tipo": "pdf", "dias": 1, "hora": 6}
+DIA = pd.Timestamp("2025-01-10", tz=FUSO_LOCAL)
+
+
+@pytest.fixture
+def versoes(monkeypatch):
+    """ Um agendamento diário, índice vazio e versão dos dados controlada pelo teste. """
+    consultas, atual = [], {"versao": "v1"}
+
+    def versao_dados(id_ponto, start_dt, end_dt):
+        consultas.append(id_ponto)
+        return atual["versao"]
+
+    monkeypatch.setattr(relatorios_agendados, "RELATORIOS_AGENDADOS", [AGENDAMENTO])
+    monkeypatch.setattr(data_source, "versao_dados", versao_dados)
+    _limpar()
+    yield consultas, atual
+    _limpar()
+
+
+def _limpar():
+    relatorios_agendados._CONFERIDOS.clear()
+    data_source.DIAS_ALTERADOS.clear()
+    if os.path.exists(relatorios_agendados._arquivo_indice()):
+        os.remove(relatorios_agendados._arquivo_indice())
+
+
+def _registrar_todos(agora):
+    for agendamento, id_ponto, inicio, fim, versao in relatorios_agendados.pendentes(agora):
+        relatorios_agendados._registrar(agendamento, id_ponto, inicio, fim, versao, "arquivo.pdf", "arquivo.pdf")
+
+
+def _marcar_ontem(id_ponto):
+    ontem_utc = (DIA - pd.Timedelta(days=1)).tz_convert("UTC")
+    data_source.marcar_dias_alterados(id_ponto, ontem_utc + pd.Timedelta(hours=12), ontem_utc + pd.Timedelta(hours=13))
+
+
+def test_antes_da_hora_nao_consulta(versoes):
+    consultas, _ = versoes
+    assert relatorios_agendados.pendentes(DIA + pd.Timedelta(hours=5)) == []
+    assert consultas == []
+
+
+def test_periodo_novo_fica_pendente(versoes):
+    consultas, _ = versoes
+    lista = relatorios_agendados.pendentes(DIA + pd.Timedelta(hours=6))
+    assert [id_ponto for _, id_ponto, *_ in lista] == list(PONTOS_DE_ANALISE)
+    assert lista[0][2:4] == ("2025-01-09", "2025-01-09")
+    assert len(consultas) == len(PONTOS_DE_ANALISE)
+
+
+def test_periodo_ja_gerado_sem_marcacao_nao_consulta(versoes):
+    consultas, _ = versoes
+    _registrar_todos(DIA + pd.Timedelta(hours=6))
+    consultas.clear()
+    assert relatorios_agendados.pendentes(DIA + pd.Timedelta(hours=7)) == []
+    assert consultas == []
+
+
+def test_dia_marcado_na_janela_reconfere_so_a_estacao(versoes):
+    consultas, atual = versoes
+    _registrar_todos(DIA + pd.Timedelta(hours=6))
+    consultas.clear()
+    time.sleep(0.01)
+    id_ponto = next(iter(PONTOS_DE_ANALISE))
+    _marcar_ontem(id_ponto)
+
+    # Versão igual: nada a refazer, e a marcação já conferida não é consultada de novo
+    assert relatorios_agendados.pendentes(DIA + pd.Timedelta(hours=7)) == []
+    assert relatorios_agendados.pendentes(DIA + pd.Timedelta(hours=7)) == []
+    assert consultas == [id_ponto]
+
+    time.sleep(0.01)
+    _marcar_ontem(id_ponto)
+    atual["versao"] = "v2"
+    lista = relatorios_agendados.pendentes(DIA + pd.Timedelta(hours=7))
+    assert [(item[1], item[4]) for item in lista] == [(id_ponto, "v2")]
+
+
+def test_correcao_fora_da_janela_espera_o_proximo_periodo(versoes):
+    consultas, atual = versoes
+    _registrar_todos(DIA + pd.Timedelta(hours=6))
+    consultas.clear()
+    time.sleep(0.01)
+    _marcar_ontem(next(iter(PONTOS_DE_ANALISE)))
+    atual["versao"] = "v2"
+    assert relatorios_agendados.pendentes(DIA + pd.Timedelta(hours=14)) == []
+    assert consultas == []
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_source
+import processamento
+import qualidade
+import serie_risco
+
+PONTO = "Ponto-Teste"
+INICIO = pd.Timestamp("2025-01-10 00:00", tz="UTC")
+
+
+@pytest.fixture(autouse=True)
+def ponto_com_umidade(monkeypatch):
+    monkeypatch.setattr(data_source, "pontos_por_tipo", lambda tipo: {PONTO})
+
+
+def _historico():
+    """ 4 dias com umidade estável e, nas últimas 2h, o sensor do 1m reprovado no QC com valores altos. """
+    timestamps = pd.date_range(INICIO - pd.Timedelta(days=3), INICIO + pd.Timedelta(hours=23, minutes=50), freq="10min")
+    df = pd.DataFrame({"timestamp": timestamps, "id_ponto": PONTO, "chuva_mm": 0.0,
+                       "precipitacao_acumulada_mm": 0.0, "umidade_1m_perc": 30.0,
+                       "umidade_2m_perc": 35.0, "umidade_3m_perc": 9.0, "qc_umidade": 0})
+    reprovados = df.index[-12:]
+    df.loc[reprovados, "umidade_1m_perc"] = 60.0
+    df.loc[reprovados, "qc_umidade"] = qualidade.bit(0, qualidade.QC_PICO)
+    return df
+
+
+def test_recalcular_usa_umidade_mascarada_como_o_worker(banco):
+    df = _historico()
+    data_source.save_to_sqlite(df)
+
+    serie_risco.recalcular(INICIO, INICIO + pd.Timedelta(days=1), id_ponto=PONTO)
+    gravada = data_source.read_serie_risco(id_ponto=PONTO).sort_values("timestamp").reset_index(drop=True)
+
+    # Caminho do worker: máscara aplicada pela grade (montar_grade)
+    esperada = processamento.calcular_serie_risco(df, horas=serie_risco.HORAS_JANELA, pontos_umidade={PONTO})
+    esperada = esperada[esperada["timestamp"] >= INICIO].reset_index(drop=True)
+
+    assert len(gravada) == len(esperada) > 0
+    np.testing.assert_allclose(gravada["delta_umidade_1m"].astype(float), esperada["delta_umidade_1m"].astype(float))
+    # Nenhum slot da série enxerga os 60% reprovados
+    assert gravada["delta_umidade_1m"].astype(float).max() < 60.0 - 39.0
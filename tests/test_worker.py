@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_source
+import qualidade
+import worker
+from config import PONTOS_DE_ANALISE
+
+PONTO = next(iter(PONTOS_DE_ANALISE))
+
+
+@pytest.fixture(autouse=True)
+def sem_coleta(monkeypatch):
+    """ Ciclos só com o histórico do banco: nenhuma fonte, nenhum backfill, nenhuma rodada de relatórios. """
+    monkeypatch.setattr(data_source, "coletar_dados_atuais", lambda: pd.DataFrame(columns=data_source.COLUNAS_HISTORICO))
+    monkeypatch.setattr(worker.lacunas, "agendar_backfill", lambda: None)
+    monkeypatch.setattr(worker, "agendar_rodada_relatorios", lambda: None)
+
+
+def _historico_com_salto_no_2m(agora):
+    """ 80h de leituras com o 2m subindo rápido (sem resposta do 1m) perto da borda esquerda da janela de 75h. """
+    timestamps = pd.date_range(agora - pd.Timedelta(hours=80), agora, freq="10min")
+    n = len(timestamps)
+    ruido = (np.arange(n) % 3) * 0.01
+    umidade_2m = 20.0 + ruido
+    salto = (timestamps >= agora - pd.Timedelta(hours=74, minutes=30)) & (timestamps < agora - pd.Timedelta(hours=73))
+    umidade_2m = umidade_2m + np.cumsum(np.where(salto, 0.5, 0.0))
+    df = pd.DataFrame({"timestamp": timestamps, "id_ponto": PONTO, "chuva_mm": 0.0, "precipitacao_acumulada_mm": 0.0,
+                       "umidade_1m_perc": 30.0 + ruido, "umidade_2m_perc": umidade_2m,
+                       "umidade_3m_perc": 9.0 + ruido})
+    return qualidade.aplicar_qc(df)  # Máscara com o contexto completo, como gravada ao longo do tempo
+
+
+def _qc_gravado():
+    df = data_source.read_data_from_sqlite(id_ponto=PONTO, colunas=["timestamp", "qc_umidade"])
+    return pd.to_numeric(df.sort_values("timestamp")["qc_umidade"]).astype("int64").reset_index(drop=True)
+
+
+def test_ciclos_seguidos_mantem_a_mascara_da_borda_da_janela(banco):
+    agora = pd.Timestamp.now(tz="UTC").floor("10min")
+    df = _historico_com_salto_no_2m(agora)
+    assert (df["qc_umidade"] & qualidade.bit(1, qualidade.QC_CRUZADO)).any()
+    data_source.save_to_sqlite(df)
+
+    assert worker.worker_main_loop({})[0]
+    primeiro = _qc_gravado()
+    assert worker.worker_main_loop({})[0]
+    segundo = _qc_gravado()
+
+    assert primeiro.equals(segundo)
+    assert primeiro.equals(df["qc_umidade"].reset_index(drop=True))
@@ -1,209 +1,417 @@
-# worker.py (CORRIGIDO v7: Separação dos Status de Chuva e Umidade)
-
-import pandas as pd
+# worker.py (Serviço de ingestão: processo próprio, fora do Dash, com liderança única)
+#
+# Uso:
+#   python worker.py                      -> roda o ciclo de ingestão (apenas um processo vira líder)
+#   python worker.py backfill <ID> <DIAS> -> backfill manual das lacunas de uma estação
+#
+# Os processos web (gunicorn) apenas LEEM o banco e o status_atual.json.
+
+import os
+import sys
 import time
 import datetime
-import data_source
-import processamento
-import alertas
-import json
+import threading
 import traceback
-from io import StringIO
+from collections import deque
+import pandas as pd
+from sqlalchemy import text
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from config import PONTOS_DE_ANALISE, RISCO_MAP, FREQUENCIA_API_SEGUNDOS
+import data_source
+import processamento
+import lacunas
+import serie_risco
+import eventos
+import regras
+import analiticos
+import qualidade
+import fragmentos_relatorio
+import relatorios_agendados
+from config import PONTOS_DE_ANALISE, FUSO_LOCAL, COLUNAS_UMIDADE
+from config import FREQUENCIA_API_SEGUNDOS, CICLO_CARENCIA_SEGUNDOS, CICLO_METRICAS_MAX
+from config import RENDER_SLEEP_TIME_SEC, INGESTAO_LOCK_ARQUIVO, INGESTAO_LOCK_CHAVE, INGESTAO_RETRY_LIDERANCA_SEC
+from config import RELATORIOS_RODADA_INTERVALO_MIN_SEC
+
+try:
+    import fcntl
+except ImportError:  # Windows (desenvolvimento local)
+    fcntl = None
+
+# ==============================================================================
+# --- LIDERANÇA (INSTÂNCIA ÚNICA DE INGESTÃO) ---
+# ==============================================================================
+# Mantidos abertos durante toda a vida do processo: o lock é liberado pelo SO/banco quando ele morre.
+_LOCK_CONEXAO = None
+_LOCK_ARQUIVO = None
+
+
+def _lideranca_advisory_lock():
+    """ Postgres: pg_try_advisory_lock numa conexão dedicada. """
+    global _LOCK_CONEXAO
+    conexao = data_source.DB_ENGINE.connect()
+    obtido = conexao.execute(text("SELECT pg_try_advisory_lock(:chave)"),
+                             {"chave": INGESTAO_LOCK_CHAVE}).scalar()
+    if obtido:
+        _LOCK_CONEXAO = conexao
+        return True
+    conexao.close()
+    return False
+
+
+def _lideranca_arquivo():
+    """ SQLite / local: flock exclusivo e não bloqueante num arquivo do disco persistente. """
+    global _LOCK_ARQUIVO
+    caminho = os.path.join(data_source.get_base_path(), INGESTAO_LOCK_ARQUIVO)
+    arquivo = open(caminho, 'a+')
+    try:
+        if fcntl is not None:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            import msvcrt
+            msvcrt.locking(arquivo.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        arquivo.close()
+        return False
+    arquivo.seek(0)
+    arquivo.truncate()
+    arquivo.write(f"{os.getpid()}\n")
+    arquivo.flush()
+    _LOCK_ARQUIVO = arquivo
+    return True
+
+
+def adquirir_lideranca():
+    """ True se este processo passou a ser (ou já é) o único responsável pela ingestão. """
+    if _LOCK_CONEXAO is not None or _LOCK_ARQUIVO is not None:
+        return True
+    try:
+        if data_source.DB_ENGINE.dialect.name == "postgresql":
+            return _lideranca_advisory_lock()
+        return _lideranca_arquivo()
+    except Exception as e:
+        data_source.adicionar_log("SISTEMA", f"Erro ao disputar liderança da ingestão: {e}", level="ERROR")
+        return False
+
+
+def aguardar_lideranca():
+    """ Fica em espera (standby) até conseguir o lock. Se o líder cair, outro processo assume. """
+    while not adquirir_lideranca():
+        data_source.adicionar_log("SISTEMA", f"Outra instância já é líder da ingestão. "
+                                             f"Nova tentativa em {INGESTAO_RETRY_LIDERANCA_SEC}s.",
+                                  salvar_arquivo=False)
+        time.sleep(INGESTAO_RETRY_LIDERANCA_SEC)
+    data_source.adicionar_log("SISTEMA", f"Liderança da ingestão adquirida (PID {os.getpid()}).",
+                              salvar_arquivo=False)
 
 
 # ==============================================================================
-# --- FUNÇÕES DE LÓGICA E ALERTA (MODIFICADA) ---
+# --- CICLO DE INGESTÃO ---
 # ==============================================================================
 
-def verificar_alertas(status_novos, status_antigos):
+def get_first_valid(series):
     """
-    Verifica mudanças nos status de CHUVA e UMIDADE de forma independente.
+    Retorna o primeiro valor VÁLIDO (não nulo).
+    Isso impede que um NaN novo apague um número antigo no banco.
     """
-    if not status_novos:
-        print("[Worker] Nenhum status novo recebido para verificação.")
-        return status_antigos
+    valid_values = series.dropna()
+    if not valid_values.empty:
+        return valid_values.iloc[0]
+    return None
 
-    # Garantir que o status antigo tenha a estrutura de dicionário correta para comparação
-    if not isinstance(status_antigos, dict) or not all(isinstance(v, dict) for v in status_antigos.values()):
-        status_antigos = {pid: {"chuva": "INDEFINIDO", "umidade": "INDEFINIDO"} for pid in PONTOS_DE_ANALISE.keys()}
 
-    status_atualizado = status_antigos.copy()
+def mesclar_leituras(novos_dados_df, historico_recente_df):
+    """
+    Junta as leituras novas ao histórico recente: uma linha por (timestamp, id_ponto), com a
+    leitura nova tendo prioridade coluna a coluna (get_first_valid).
+    """
+    df_combinado = pd.concat([novos_dados_df, historico_recente_df], ignore_index=True)
+    df_combinado['timestamp'] = pd.to_datetime(df_combinado['timestamp'], errors='coerce')
+    df_combinado.dropna(subset=['timestamp'], inplace=True)
 
-    for id_ponto in PONTOS_DE_ANALISE.keys():
-        status_novo_ponto = status_novos.get(id_ponto, {"chuva": "SEM DADOS", "umidade": "SEM DADOS"})
-        status_antigo_ponto = status_antigos.get(id_ponto, {"chuva": "INDEFINIDO", "umidade": "INDEFINIDO"})
+    numeric_cols = ['chuva_mm', 'precipitacao_acumulada_mm'] + COLUNAS_UMIDADE
+    for col in numeric_cols:
+        if col in df_combinado.columns:
+            df_combinado[col] = pd.to_numeric(df_combinado[col], errors='coerce')
 
-        # Assegurar que status_antigo_ponto seja um dicionário para evitar erros
-        if not isinstance(status_antigo_ponto, dict):
-            status_antigo_ponto = {"chuva": "INDEFINIDO", "umidade": "INDEFINIDO"}
+    # Proteção contra overwrite
+    agg_funcs = {col: get_first_valid for col in df_combinado.columns if col not in ['timestamp', 'id_ponto']}
+    return df_combinado.groupby(['timestamp', 'id_ponto'], as_index=False).agg(agg_funcs)
 
-        # --- Verificar mudança no status da CHUVA ---
-        status_novo_chuva = status_novo_ponto.get("chuva", "SEM DADOS")
-        status_antigo_chuva = status_antigo_ponto.get("chuva", "INDEFINIDO")
-        if status_novo_chuva != status_antigo_chuva:
-            try:
-                nome_ponto = PONTOS_DE_ANALISE[id_ponto]['nome']
-                mensagem_log = f"MUDANÇA DE STATUS (Chuva): {nome_ponto} mudou de {status_antigo_chuva} para {status_novo_chuva}."
-                data_source.adicionar_log(id_ponto, mensagem_log)
-                print(f"| {id_ponto} | {mensagem_log}")
-                # No futuro: alertas.enviar_alerta(id_ponto, nome_ponto, status_novo_chuva, status_antigo_chuva, tipo="Chuva")
-            except Exception as e:
-                print(f"Erro ao gerar log de mudança de status (Chuva): {e}")
 
-        # --- Verificar mudança no status da UMIDADE ---
-        status_novo_umidade = status_novo_ponto.get("umidade", "SEM DADOS")
-        status_antigo_umidade = status_antigo_ponto.get("umidade", "INDEFINIDO")
-        if status_novo_umidade != status_antigo_umidade:
-            try:
-                nome_ponto = PONTOS_DE_ANALISE[id_ponto]['nome']
-                mensagem_log = f"MUDANÇA DE STATUS (Umidade): {nome_ponto} mudou de {status_antigo_umidade} para {status_novo_umidade}."
-                data_source.adicionar_log(id_ponto, mensagem_log)
-                print(f"| {id_ponto} | {mensagem_log}")
-                # No futuro: alertas.enviar_alerta(id_ponto, nome_ponto, status_novo_umidade, status_antigo_umidade, tipo="Umidade")
-            except Exception as e:
-                print(f"Erro ao gerar log de mudança de status (Umidade): {e}")
+# --- FUNÇÕES DO WORKER ---
 
-        # Atualiza o status do ponto com a nova estrutura completa
-        status_atualizado[id_ponto] = status_novo_ponto
+def worker_verificar_alertas(status_novos, status_antigos):
+    """
+    Passa o status bruto do ciclo pelo motor de eventos (histerese, permanência mínima e
+    deduplicação) e devolve o status confirmado que vai para o disco.
+    """
+    if not status_novos: return status_antigos
+    if not isinstance(status_antigos, dict): status_antigos = {}
+    eventos.inicializar(status_antigos)
+    status_confirmados, novos_eventos = eventos.processar(status_novos)
+    eventos.registrar_eventos(novos_eventos)
 
+    status_atualizado = status_antigos.copy()
+    for id_ponto in PONTOS_DE_ANALISE.keys():
+        status_atualizado[id_ponto] = status_confirmados.get(id_ponto, {"chuva": "SEM DADOS", "umidade": "SEM DADOS"})
     return status_atualizado
 
 
-def main_loop():
+def marcar_dias_das_leituras(novos_dados_df):
     """
-    Executa UM ciclo de coleta e processamento.
-    Retorna True se foi bem-sucedido, False se falhou.
+    Marca como alterados os dias locais das leituras novas de cada estação, recuados da margem do QC
+    (que pode reclassificar leituras vizinhas já gravadas). A série de risco do ciclo só muda a partir daí.
     """
-    inicio_ciclo = time.time()
+    if novos_dados_df is None or novos_dados_df.empty: return
+    timestamps = pd.to_datetime(novos_dados_df['timestamp'], utc=True, errors='coerce')
+    for id_ponto, ts in timestamps.groupby(novos_dados_df['id_ponto']):
+        if ts.notna().any():
+            data_source.marcar_dias_alterados(id_ponto, ts.min() - qualidade.MARGEM_CONTEXTO, ts.max())
 
+
+HORAS_JANELA_WORKER = 75  # Histórico relido a cada ciclo (72h da série de risco + folga)
+
+
+def worker_main_loop(memoria_worker):
+    inicio_ciclo = time.time()
     try:
-        # 1. LER O HISTÓRICO ATUAL DO ARQUIVO CSV
-        historico_df, status_antigos_do_disco, logs = data_source.get_all_data_from_disk()
+        data_source.adicionar_log("WORKER", "Início do ciclo de processamento.", salvar_arquivo=False)
+
+        # OTIMIZAÇÃO: Carrega apenas colunas vitais e reais (sem base_Xm)
+        # qc_umidade: a máscara gravada das linhas antigas da janela é mantida (ver passo 3)
+        cols_necessarias_worker = (['timestamp', 'id_ponto', 'chuva_mm', 'precipitacao_acumulada_mm']
+                                   + COLUNAS_UMIDADE + ['qc_umidade'])
+
+        status_antigos_do_disco = data_source.get_status_from_disk()
+
+        # 1. Coleta Novos Dados (todas as fontes ativas: WeatherLink, Zentra, simulador...)
+        novos_dados_df = data_source.coletar_dados_atuais()
+
+        # 2 a 4. Leitura da janela -> regravação: sob o lock de gravação, para o backfill (outra thread)
+        # não gravar no meio e ter as linhas recuperadas sobrescritas pela janela lida antes dele.
+        pontos_umidade = data_source.pontos_por_tipo("umidade")
+        with data_source.GRAVACAO_LOCK:
+            # 2. Busca histórico
+            inicio_janela = pd.Timestamp.now(tz='UTC') - pd.Timedelta(hours=HORAS_JANELA_WORKER)
+            historico_recente_df = data_source.get_recent_data_for_worker(
+                hours=HORAS_JANELA_WORKER,
+                colunas=cols_necessarias_worker
+            )
+
+            # 3. Merge com Proteção
+            df_final = mesclar_leituras(novos_dados_df, historico_recente_df)
+
+            # Chuva por leitura (chuva_mm) derivada do odômetro UMA vez, aqui; a leitura anterior gravada
+            # está na janela e serve de contexto. Dashboards e relatórios leem chuva_mm direto.
+            df_final = processamento.derivar_chuva_mm(df_final)
+
+            # Controle de qualidade da umidade: recalculado só onde a janela dá contexto completo. As linhas
+            # da borda esquerda (sem histórico antes delas na janela) mantêm a máscara já gravada.
+            df_final = qualidade.aplicar_qc(df_final, manter_antes_de=inicio_janela + qualidade.MARGEM_CONTEXTO)
+
+            # --- CORREÇÃO CRÍTICA AQUI ---
+            # Usamos upsert_data para substituir os dados antigos pelos novos (corrigidos/mergeados)
+            # em vez de adicionar duplicatas infinitas.
+            data_source.upsert_data(df_final)
+            # -----------------------------
+
+            # 4. Grade de 10 min em memória (compartilhada): série histórica de risco e analíticos
+            grade = processamento.montar_grade(df_final, pontos_umidade) if not df_final.empty else None
+            serie_risco.atualizar_do_ciclo(df_final, grade)
+            marcar_dias_das_leituras(novos_dados_df)
+        analiticos_pontos = analiticos.calcular(grade, regras.obter_regras()) if grade is not None else {}
+
+        # 4b. Lacunas na grade de 10 min: indexa e pede backfill só dos intervalos faltantes (em segundo plano)
+        lacunas.atualizar_indice(df_final)
+        lacunas.agendar_backfill()
+
+        # 5. Cálculo de Status (todas as estações em lote: um sort + operações agrupadas)
+        status_atualizado = {}
+
+        if not df_final.empty:
+            df_status = processamento.classificar_status_lote(df_final, horas=72, pontos_umidade=pontos_umidade,
+                                                              regras=regras.obter_regras())
 
-        # Define um padrão inicial com a nova estrutura de dicionário
-        if not status_antigos_do_disco or not isinstance(list(status_antigos_do_disco.values())[0], dict):
-            status_antigos_do_disco = {p: {"chuva": "INDEFINIDO", "umidade": "INDEFINIDO"} for p in PONTOS_DE_ANALISE.keys()}
+            for id_ponto in PONTOS_DE_ANALISE.keys():
+                ponto_info = {"chuva": "SEM DADOS", "umidade": "SEM DADOS", "chuva_72h": 0.0, "umidade_1m": None,
+                              "umidade_2m": None, "umidade_3m": None, "timestamp_local": None}
+                if id_ponto not in df_status.index:
+                    status_atualizado[id_ponto] = ponto_info
+                    continue
+
+                linha = df_status.loc[id_ponto]
+                ponto_info['chuva_72h'] = float(linha['chuva_72h']) if pd.notna(linha['chuva_72h']) else 0.0
+                ponto_info['chuva'] = processamento.NOMES_NIVEL.get(int(linha['nivel_chuva']), "SEM DADOS")
+                ponto_info['analiticos'] = analiticos_pontos.get(id_ponto)
+
+                # Umidade: só há leitura "fresca" (< 3h) para estações com sensores; falha parcial -> LIVRE
+                if pd.notna(linha['ts_umidade']):
+                    for d in [1, 2, 3]:
+                        valor = linha[f'umidade_{d}m']
+                        ponto_info[f'umidade_{d}m'] = float(valor) if pd.notna(valor) else None
+                    ponto_info['timestamp_local'] = linha['ts_umidade'].tz_convert(FUSO_LOCAL).isoformat()
+                    nivel_umidade = int(linha['nivel_umidade'])
+                    ponto_info['umidade'] = processamento.NOMES_NIVEL[nivel_umidade] if nivel_umidade >= 0 else "LIVRE"
+
+                status_atualizado[id_ponto] = ponto_info
+
+        status_final_completo = worker_verificar_alertas(status_atualizado, status_antigos_do_disco)
+        data_source.write_with_timeout(data_source.STATUS_FILE, status_final_completo, timeout=20)
+
+        # 6. Relatórios (fragmentos diários e agendados): thread própria, fora do caminho crítico do ciclo
+        agendar_rodada_relatorios()
+        data_source.adicionar_log("WORKER", f"Ciclo concluído em {time.time() - inicio_ciclo:.2f}s.",
+                                  salvar_arquivo=False)
+        return True, memoria_worker
+    except Exception as e:
+        data_source.adicionar_log("WORKER", f"ERRO CRÍTICO NO CICLO: {e}", level="ERROR")
+        traceback.print_exc()
+        return False, memoria_worker
 
-        print(f"WORKER: Início do ciclo. Histórico lido: {len(historico_df)} entradas.")
 
-        # --- LÓGICA DE BACKFILL ---
-        if historico_df.empty or historico_df[historico_df['id_ponto'] == 'Ponto-A-KM67'].empty:
-            print("[Worker] Histórico do KM 67 (Pro) está vazio. Tentando backfill de 72h...")
-            try:
-                data_source.backfill_km67_pro_data(historico_df)
-                historico_df, _, _ = data_source.get_all_data_from_disk()
-                print(f"[Worker] Backfill concluído. Histórico atual: {len(historico_df)} entradas.")
-            except Exception as e_backfill:
-                data_source.adicionar_log("GERAL", f"ERRO CRÍTICO (Backfill KM 67): {e_backfill}")
+# ==============================================================================
+# --- RODADA DE RELATÓRIOS (SEGUNDO PLANO) ---
+# ==============================================================================
+# O ciclo só sinaliza; a thread roda no máximo uma rodada a cada RELATORIOS_RODADA_INTERVALO_MIN_SEC.
+_RELATORIOS_EVENTO = threading.Event()
+_RELATORIOS_THREAD = None
 
-        # 2. COLETAR NOVOS DADOS DA API
-        novos_dados_df, status_novos_API = data_source.executar_passo_api_e_salvar(historico_df)
 
-        # 3. RECARREGAR O HISTÓRICO COMPLETO APÓS SALVAMENTO
-        historico_completo, _, _ = data_source.get_all_data_from_disk()
+def executar_rodada_relatorios():
+    """ Fragmentos diários dos relatórios PDF e, depois deles, os relatórios agendados (que já os encontram prontos). """
+    fragmentos_relatorio.atualizar_dias_fechados()
+    relatorios_agendados.executar_pendentes()
 
-        if historico_completo.empty:
-            print("AVISO: Histórico vazio, pulando cálculo de status.")
-            status_atualizado = {p: {"chuva": "SEM DADOS", "umidade": "SEM DADOS"} for p in PONTOS_DE_ANALISE.keys()}
-        else:
-            status_atualizado = {}
-            for id_ponto in PONTOS_DE_ANALISE.keys():
-                df_ponto = historico_completo[historico_completo['id_ponto'] == id_ponto].copy()
-                
-                # --- Status da Chuva ---
-                acumulado_72h_df = processamento.calcular_acumulado_rolling(df_ponto, horas=72)
-                chuva_72h_final = 0.0
-                if not acumulado_72h_df.empty:
-                    chuva_72h_final = acumulado_72h_df['chuva_mm'].iloc[-1]
-                    status_chuva, _ = processamento.definir_status_chuva(chuva_72h_final)
-                else:
-                    status_chuva = "SEM DADOS"
-
-                # --- Status da Umidade ---
-                ultima_leitura = df_ponto.sort_values('timestamp').iloc[-1] if not df_ponto.empty else None
-                if ultima_leitura is not None:
-                    status_umidade, _ = processamento.definir_status_umidade_hierarquico(
-                        umidade_1m=ultima_leitura.get('umidade_1m'),
-                        umidade_2m=ultima_leitura.get('umidade_2m'),
-                        umidade_3m=ultima_leitura.get('umidade_3m'),
-                        base_1m=ultima_leitura.get('base_1m'),
-                        base_2m=ultima_leitura.get('base_2m'),
-                        base_3m=ultima_leitura.get('base_3m'),
-                        chuva_acumulada_72h=chuva_72h_final
-                    )
-                else:
-                    status_umidade = "SEM DADOS"
-
-                # --- Armazena os status individuais ---
-                status_atualizado[id_ponto] = {
-                    "chuva": status_chuva,
-                    "umidade": status_umidade
-                }
-
-        # 5. Verificar alertas com base no status final
-        status_final_com_alertas = verificar_alertas(status_atualizado, status_antigos_do_disco)
-
-        # 6. SALVAR O STATUS ATUALIZADO NO DISCO
-        try:
-            with open(data_source.STATUS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(status_final_com_alertas, f, indent=2)
-        except Exception as e:
-            print(f"ERRO CRÍTICO ao salvar status no disco: {e}")
-            traceback.print_exc()
-            data_source.adicionar_log("GERAL", f"ERRO CRÍTICO ao salvar status: {e}")
-
-        print(f"WORKER: Ciclo concluído em {time.time() - inicio_ciclo:.2f}s.")
-        return True
 
-    except Exception as e:
-        print(f"WORKER ERRO CRÍTICO no loop principal: {e}")
-        traceback.print_exc()
-        data_source.adicionar_log("GERAL", f"ERRO CRÍTICO (loop principal): {e}")
-        return False
+def _loop_relatorios():
+    while True:
+        _RELATORIOS_EVENTO.wait()
+        _RELATORIOS_EVENTO.clear()
+        inicio = time.time()
+        executar_rodada_relatorios()
+        time.sleep(max(0.0, RELATORIOS_RODADA_INTERVALO_MIN_SEC - (time.time() - inicio)))
+
+
+def iniciar_relatorios_em_segundo_plano():
+    """ Sobe (uma única vez) a thread da rodada de relatórios. """
+    global _RELATORIOS_THREAD
+    if _RELATORIOS_THREAD is not None and _RELATORIOS_THREAD.is_alive():
+        return
+    _RELATORIOS_THREAD = threading.Thread(target=_loop_relatorios, daemon=True, name="rodada-relatorios")
+    _RELATORIOS_THREAD.start()
+
+
+def agendar_rodada_relatorios():
+    """ Sinaliza a thread de relatórios. Não bloqueia o ciclo do worker. """
+    _RELATORIOS_EVENTO.set()
 
 
 # ==============================================================================
-# --- LÓGICA DE EXECUÇÃO "INTELIGENTE" ---
+# --- AGENDADOR ALINHADO AO RELÓGIO ---
 # ==============================================================================
-if __name__ == "__main__":
-    data_source.setup_disk_paths()
-    print("--- Processo Worker Iniciado (Modo Sincronizado) ---")
-    data_source.adicionar_log("GERAL", "Processo Worker iniciado com sucesso.")
+METRICAS_FILE = "metricas_worker.json"
+METRICAS_CICLO = deque(maxlen=CICLO_METRICAS_MAX)
+_CICLO_LOCK = threading.Lock()
+
+
+def proximo_disparo(agora_epoch, intervalo=FREQUENCIA_API_SEGUNDOS, carencia=CICLO_CARENCIA_SEGUNDOS):
+    """ Próxima fronteira alinhada (múltiplo de 'intervalo' + 'carencia') estritamente depois de agora. """
+    return ((agora_epoch - carencia) // intervalo + 1) * intervalo + carencia
+
+
+def _iso(epoch):
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).isoformat()
+
+
+def _registrar_metricas(alvo, inicio, fim, sucesso, coalescidos):
+    """ Guarda o atraso (início real - horário alvo) e a duração de cada ciclo em metricas_worker.json. """
+    METRICAS_CICLO.append({
+        "alvo": _iso(alvo), "inicio": _iso(inicio),
+        "atraso_s": round(inicio - alvo, 3), "duracao_s": round(fim - inicio, 3),
+        "ciclos_coalescidos": coalescidos, "sucesso": sucesso
+    })
+    atrasos = sorted(m["atraso_s"] for m in METRICAS_CICLO)
+    duracoes = sorted(m["duracao_s"] for m in METRICAS_CICLO)
+    resumo = {
+        "intervalo_s": FREQUENCIA_API_SEGUNDOS, "carencia_s": CICLO_CARENCIA_SEGUNDOS,
+        "ciclos": len(METRICAS_CICLO),
+        "atraso_p50_s": atrasos[len(atrasos) // 2], "atraso_p95_s": atrasos[int(len(atrasos) * 0.95)],
+        "duracao_p50_s": duracoes[len(duracoes) // 2], "duracao_max_s": duracoes[-1],
+        "ciclos_coalescidos_total": sum(m["ciclos_coalescidos"] for m in METRICAS_CICLO),
+    }
+    try:
+        data_source.write_with_timeout(METRICAS_FILE, {"resumo": resumo, "ciclos": list(METRICAS_CICLO)}, timeout=10)
+    except Exception as e:
+        data_source.adicionar_log("WORKER", f"Falha ao gravar métricas do ciclo: {e}", level="WARN",
+                                  salvar_arquivo=False)
+
+
+def executar_ciclo_protegido(memoria_worker):
+    """ Nunca deixa dois ciclos se sobreporem (ex.: backfill manual + agendador no mesmo processo). """
+    if not _CICLO_LOCK.acquire(blocking=False):
+        data_source.adicionar_log("WORKER", "Ciclo anterior ainda em execução. Disparo ignorado.", level="WARN",
+                                  salvar_arquivo=False)
+        return None, memoria_worker
+    try:
+        return worker_main_loop(memoria_worker)
+    finally:
+        _CICLO_LOCK.release()
 
-    INTERVALO_EM_MINUTOS = 15
-    CARENCIA_EM_SEGUNDOS = 60
 
+def background_task_wrapper():
+    data_source.adicionar_log("SISTEMA", "Processo Worker iniciado.", salvar_arquivo=False)
+    aguardar_lideranca()
+    time.sleep(RENDER_SLEEP_TIME_SEC)
+    lacunas.iniciar_backfill_em_segundo_plano()
+    iniciar_relatorios_em_segundo_plano()
+    memoria_worker = {}
+
+    # O primeiro ciclo roda já (status fresco após um deploy); os seguintes seguem a grade do relógio.
+    alvo = time.time()
     while True:
-        inicio_total = time.time()
-        main_loop()
-        tempo_execucao = time.time() - inicio_total
-
-        agora_utc = datetime.datetime.now(datetime.timezone.utc)
-        proximo_minuto_base = (agora_utc.minute // INTERVALO_EM_MINUTOS + 1) * INTERVALO_EM_MINUTOS
-        proxima_hora_utc = agora_utc
-
-        if proximo_minuto_base >= 60:
-            proxima_hora_utc = agora_utc + datetime.timedelta(hours=1)
-            proximo_minuto_base = 0
-
-        proxima_execucao_base_utc = proxima_hora_utc.replace(
-            minute=proximo_minuto_base,
-            second=0,
-            microsecond=0
-        )
-        proxima_execucao_com_carencia_utc = proxima_execucao_base_utc + datetime.timedelta(seconds=CARENCIA_EM_SEGUNDOS)
-        tempo_para_dormir_seg = (proxima_execucao_com_carencia_utc - agora_utc).total_seconds()
-
-        if tempo_para_dormir_seg < 0:
-            print(f"AVISO: O ciclo demorou {tempo_execucao:.1f}s e perdeu a janela. Rodando novamente...")
-            tempo_para_dormir_seg = 1
-
-        print(f"WORKER: Ciclo levou {tempo_execucao:.1f}s.")
-        print(
-            f"WORKER: Próxima execução às {proxima_execucao_com_carencia_utc.isoformat()}. Dormindo por {tempo_para_dormir_seg:.0f}s...")
-        time.sleep(tempo_para_dormir_seg)
+        espera = alvo - time.time()
+        if espera > 0: time.sleep(espera)
+
+        inicio = time.time()
+        sucesso, memoria_worker = executar_ciclo_protegido(memoria_worker)
+        fim = time.time()
+
+        if sucesso is False:
+            data_source.adicionar_log("SISTEMA", f"Ciclo do worker falhou. Reiniciando em {RENDER_SLEEP_TIME_SEC}s.",
+                                      level="ERROR")
+            _registrar_metricas(alvo, inicio, fim, False, 0)
+            alvo = fim + RENDER_SLEEP_TIME_SEC
+            continue
+
+        # Fronteiras que passaram durante um ciclo longo são coalescidas em um único disparo seguinte,
+        # em vez de rodar vários ciclos em sequência para "recuperar o atraso".
+        proximo = proximo_disparo(fim)
+        coalescidos = max(0, int((proximo - proximo_disparo(inicio)) // FREQUENCIA_API_SEGUNDOS))
+        if coalescidos:
+            data_source.adicionar_log("WORKER", f"Ciclo levou {fim - inicio:.1f}s: {coalescidos} disparo(s) "
+                                                f"coalescido(s).", level="WARN", salvar_arquivo=False)
+        _registrar_metricas(alvo, inicio, fim, bool(sucesso), coalescidos)
+
+        alvo = proximo
+        data_source.adicionar_log("WORKER", f"Próximo ciclo às {_iso(alvo)} (em {alvo - time.time():.0f}s).",
+                                  salvar_arquivo=False)
+
+
+if __name__ == "__main__":
+    data_source.setup_disk_paths()
+    data_source.initialize_database()
+
+    args = sys.argv
+    if len(args) > 1 and args[1].lower() == 'backfill':
+        if len(args) != 4:
+            print("Uso: python worker.py backfill <ID> <DIAS>")
+        else:
+            try:
+                total = lacunas.backfill_manual(args[2], int(args[3]))
+                print(f"Backfill concluído: {total} slot(s) recuperado(s).")
+            except Exception as e:
+                print(f"Erro backfill: {e}")
+    else:
+        background_task_wrapper()